@@ -1,20 +1,29 @@
+import asyncio
+import contextlib
+import functools
+import importlib
+import importlib.util
 import json
-import math # Non utilisé directement, mais pourrait l'être
+import math
 import os
 import time
-import tkinter as tk
-from tkinter import Label # tk.Label est plus conventionnel si tk est importé comme 'tk'
-import pyautogui
-from PIL import Image, ImageGrab # Pillow
-from pynput.mouse import Controller as MouseController
+_MODULE_IMPORT_STARTED_AT = time.perf_counter() # Origine du rapport de démarrage
+from PIL import Image, ImageDraw, ImageGrab # Pillow
 from rich import print as rich_print
 from rich.prompt import Prompt
 import base64
+import hashlib
 import io
+import itertools
 import re
 import unicodedata
-import numpy as np # S'assurer que numpy est installé
 import logging
+import queue
+import random
+import sys
+import threading
+from concurrent.futures import FIRST_COMPLETED, CancelledError, Future, ThreadPoolExecutor, TimeoutError as FuturesTimeoutError, wait as wait_for_futures
+from collections import OrderedDict, deque, namedtuple
 
 # --- Configuration du Logging ---
 logging.basicConfig(
@@ -23,6 +32,97 @@ logging.basicConfig(
     datefmt='%Y-%m-%d %H:%M:%S'
 )
 
+# --- Démarrage Rapide (imports différés et rapport de démarrage) ---
+class StartupProfiler:
+    """Rapport de démarrage: phases mesurées depuis le début de l'import du module et durée des imports différés."""
+
+    def __init__(self, started_at):
+        self.started_at = started_at
+        self.phases = [] # (libellé, ms depuis le début de l'import)
+        self.imports = [] # (module, durée en ms, importé en arrière-plan)
+        self._lock = threading.Lock()
+
+    def mark(self, label):
+        self.phases.append((label, (time.perf_counter() - self.started_at) * 1000))
+
+    def record_import(self, name, duration_ms, background=False):
+        with self._lock:
+            self.imports.append((name, duration_ms, background))
+
+    def as_dict(self):
+        with self._lock:
+            imports = list(self.imports)
+        return {"phases_ms": {label: round(ms, 1) for label, ms in self.phases},
+                "lazy_imports_ms": {name: round(ms, 1) for name, ms, _ in imports}}
+
+    def summary(self):
+        with self._lock:
+            imports = list(self.imports)
+        phases = ", ".join(f"{label} à {ms:.0f} ms" for label, ms in self.phases) or "aucune phase"
+        loaded = ", ".join(f"{name} {ms:.0f} ms{' (arrière-plan)' if background else ''}" for name, ms, background in imports) or "aucun"
+        return f"Démarrage: {phases}; imports différés: {loaded}"
+
+startup_profiler = StartupProfiler(_MODULE_IMPORT_STARTED_AT)
+
+class _LazyModule:
+    """Module importé à la première utilisation de l'un de ses attributs (durée enregistrée par startup_profiler).
+
+    Un échec d'import (module absent, pas d'affichage pour pyautogui/pynput) est journalisé une fois puis relancé
+    à chaque utilisation: le module de l'agent reste importable sans backend GUI (CI, rejeu de sessions).
+    """
+
+    def __init__(self, name, on_load=None):
+        self._name = name
+        self._on_load = on_load
+        self._module = None
+        self._error = None
+        self._lock = threading.Lock()
+
+    def _load(self, background=False):
+        if self._module is not None:
+            return self._module
+        with self._lock:
+            if self._module is None:
+                if self._error is not None:
+                    raise self._error
+                t_start = time.perf_counter()
+                try:
+                    module = importlib.import_module(self._name)
+                    if self._on_load is not None:
+                        self._on_load(module)
+                except Exception as e:
+                    self._error = e
+                    logging.warning(f"Module '{self._name}' indisponible: {e}. Les fonctions qui en dépendent échoueront.")
+                    raise
+                startup_profiler.record_import(self._name, (time.perf_counter() - t_start) * 1000, background)
+                self._module = module
+        return self._module
+
+    def _is_loaded(self):
+        return self._module is not None
+
+    def __getattr__(self, attribute):
+        return getattr(self._load(), attribute)
+
+def preload_modules_in_background(*lazy_modules):
+    """Importe des modules différés dans un thread, par ex. pendant que l'utilisateur saisit son objectif."""
+    def preload():
+        for lazy_module in lazy_modules:
+            try:
+                lazy_module._load(background=True)
+            except Exception:
+                pass # Déjà journalisé; l'erreur sera relancée au premier usage réel
+    threading.Thread(target=preload, name="module-preload", daemon=True).start()
+
+# Modules lourds (plusieurs centaines de ms à l'import sur macOS): chargés au premier usage
+np = _LazyModule("numpy")
+tk = _LazyModule("tkinter")
+pyautogui = _LazyModule("pyautogui", on_load=lambda module: setattr(module, "PAUSE", PYAUTOGUI_PAUSE_S)) # Par défaut 0.1 s après chaque appel, quel que soit le profil
+pynput_mouse = _LazyModule("pynput.mouse")
+openai = _LazyModule("openai")
+sounddevice = _LazyModule("sounddevice")
+quartz = _LazyModule("Quartz") # macOS uniquement (pyobjc-framework-Quartz, dépendance de PyAutoGUI sous macOS)
+
 # --- Chargement de la Configuration (Variables d'Environnement avec Fallbacks) ---
 # IMPORTANT: Assurez-vous que ces noms de modèles correspondent EXACTEMENT
 # aux modèles disponibles et chargés sur votre serveur local (ex: LM Studio).
@@ -31,19 +131,615 @@ OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "lm-studio") # Clé API factice pou
 VLM_MODEL_NAME_FOR_API = os.getenv("VLM_MODEL_NAME_FOR_API", "internvl3-8b-instruct") # Ex: Nom du modèle VLM chargé
 QWEN_MODEL_NAME_FOR_API = os.getenv("QWEN_MODEL_NAME_FOR_API", "qwen/qwen3-8b") # Ex: Nom du modèle Qwen chargé
 
+# Endpoints séparés pour le VLM et pour Qwen (listes de réplicas séparées par des virgules). Par défaut, les deux
+# modèles utilisent OPENAI_API_BASE_URL.
+VLM_API_BASE_URLS = [u.strip() for u in os.getenv("VLM_API_BASE_URLS", OPENAI_API_BASE_URL).split(",") if u.strip()]
+VLM_API_KEY = os.getenv("VLM_API_KEY", OPENAI_API_KEY)
+QWEN_API_BASE_URLS = [u.strip() for u in os.getenv("QWEN_API_BASE_URLS", OPENAI_API_BASE_URL).split(",") if u.strip()]
+QWEN_API_KEY = os.getenv("QWEN_API_KEY", OPENAI_API_KEY)
+
+# --- Profils d'exécution: minutage de la couche d'actions (animations, frappe, pauses entre actions) ---
+# "demo": lisible par un humain; "normal": valeurs historiques; "turbo": exécution sans surveillance (curseur téléporté,
+# ni surbrillance ni overlay, pauses minimales).
+ExecutionProfile = namedtuple("ExecutionProfile", [
+    "cursor_animation_s", "highlight_s", "overlay", "overlay_duration_s", "typing_interval_s", "double_click_interval_s",
+    "input_focus_delay_s", "key_chord_delay_s", "pyautogui_pause_s", "pre_capture_delay_s", "post_action_delay_s"])
+EXECUTION_PROFILES = {
+    "demo":   ExecutionProfile(0.5, 0.4, True, 1.5, 0.06, 0.15, 0.3, 0.1, 0.1, 0.5, 1.0),
+    "normal": ExecutionProfile(0.2, 0.15, True, 0.8, 0.03, 0.1, 0.2, 0.05, 0.1, 0.3, 0.6),
+    "turbo":  ExecutionProfile(0.0, 0.0, False, 0.0, 0.0, 0.05, 0.05, 0.01, 0.0, 0.1, 0.15),
+}
+EXECUTION_PROFILE_NAME = os.getenv("EXECUTION_PROFILE", "normal").lower()
+EXECUTION_PROFILE = EXECUTION_PROFILES.get(EXECUTION_PROFILE_NAME, EXECUTION_PROFILES["normal"])
+
 # --- Configuration des Constantes ---
-OVERLAY_DURATION = 0.8        # Durée par défaut de l'overlay d'action
-HIGHLIGHT_DURATION = 0.15     # Durée de surbrillance du clic
-CURSOR_ANIMATION_DURATION = 0.2 # Durée de l'animation du curseur
+OVERLAY_DURATION = EXECUTION_PROFILE.overlay_duration_s # Durée par défaut de l'overlay d'action
+# Overlay d'action: "thread" (fenêtre dans son propre thread UI), "main" (thread principal, défaut sur macOS) ou "off"
+OVERLAY_MODE = os.getenv("OVERLAY_MODE", ("main" if sys.platform == "darwin" else "thread") if EXECUTION_PROFILE.overlay else "off").lower()
+HIGHLIGHT_DURATION = EXECUTION_PROFILE.highlight_s # Durée de surbrillance du clic
+CURSOR_ANIMATION_DURATION = EXECUTION_PROFILE.cursor_animation_s # Durée de l'animation du curseur (0 = curseur téléporté)
+TYPING_INTERVAL_S = EXECUTION_PROFILE.typing_interval_s # Délai entre deux caractères tapés
+DOUBLE_CLICK_INTERVAL_S = EXECUTION_PROFILE.double_click_interval_s
+INPUT_FOCUS_DELAY_S = EXECUTION_PROFILE.input_focus_delay_s # Après le clic qui précède une saisie
+KEY_CHORD_DELAY_S = EXECUTION_PROFILE.key_chord_delay_s # Entre appui des modificateurs et touches d'un raccourci
+PYAUTOGUI_PAUSE_S = EXECUTION_PROFILE.pyautogui_pause_s # Pause implicite de PyAutoGUI après chaque appel
 MAX_AGENT_STEPS = 20          # Nombre maximum d'étapes par tâche globale
 MAX_CONSECUTIVE_VLM_FAILURES_BEFORE_QWEN_MODIFIES = 2 # Seuil pour que Qwen intervienne plus directement
 
+# --- Configuration de l'encodage des captures envoyées aux modèles ---
+# Taille cible: boîte englobante "LARGEURxHAUTEUR" (le ratio est conservé, jamais d'agrandissement) ou "native".
+VLM_IMAGE_MAX_SIZE = os.getenv("VLM_IMAGE_MAX_SIZE", "1280x1280")
+VLM_IMAGE_FORMAT = os.getenv("VLM_IMAGE_FORMAT", "JPEG").upper() # PNG, JPEG ou WEBP
+VLM_IMAGE_QUALITY = int(os.getenv("VLM_IMAGE_QUALITY", "85"))     # Ignoré pour PNG
+VLM_IMAGE_DETAIL = os.getenv("VLM_IMAGE_DETAIL", "high")           # "high", "low" ou "auto"
+# Par défaut, Qwen-VL reçoit le même encodage que le VLM (une seule passe d'encodage par étape).
+QWEN_IMAGE_MAX_SIZE = os.getenv("QWEN_IMAGE_MAX_SIZE", VLM_IMAGE_MAX_SIZE)
+QWEN_IMAGE_FORMAT = os.getenv("QWEN_IMAGE_FORMAT", VLM_IMAGE_FORMAT).upper()
+QWEN_IMAGE_QUALITY = int(os.getenv("QWEN_IMAGE_QUALITY", str(VLM_IMAGE_QUALITY)))
+QWEN_IMAGE_DETAIL = os.getenv("QWEN_IMAGE_DETAIL", VLM_IMAGE_DETAIL)
+# Résolution des captures: "logical" (points de pyautogui.size(), ramène les captures HiDPI/Retina à l'espace des clics),
+# "native" (pixels physiques, comportement historique) ou "LARGEURxHAUTEUR" (boîte englobante, ex: résolution du modèle).
+CAPTURE_RESOLUTION = os.getenv("CAPTURE_RESOLUTION", "logical").strip().lower()
+
+# --- Configuration du raffinement des positions de clic (second passage VLM sur un recadrage zoomé) ---
+# Déclencheurs combinables (ex: "small_targets,after_failure"): "always", "small_targets" (description évoquant une petite
+# cible), "after_failure" (action échouée ou clic sans effet visible à l'étape précédente); "off" (défaut) désactive:
+# chaque raffinement est une requête VLM supplémentaire, non streamée.
+GROUNDING_REFINE_POLICY = set(p.strip() for p in os.getenv("GROUNDING_REFINE_POLICY", "off").lower().split(",") if p.strip())
+GROUNDING_REFINE_CROP_SIZE = int(os.getenv("GROUNDING_REFINE_CROP_SIZE", "320"))  # Côté du recadrage, en pixels de la capture
+GROUNDING_REFINE_ZOOM = float(os.getenv("GROUNDING_REFINE_ZOOM", "2.0"))          # Agrandissement du recadrage envoyé au VLM
+GROUNDING_REFINE_TIMEOUT_S = float(os.getenv("GROUNDING_REFINE_TIMEOUT_S", "20"))
+GROUNDING_REFINE_MAX_PER_STEP = int(os.getenv("GROUNDING_REFINE_MAX_PER_STEP", "3"))
+GROUNDING_REFINE_SMALL_TARGET_KEYWORDS = [k.strip().lower() for k in os.getenv(
+    "GROUNDING_REFINE_SMALL_TARGET_KEYWORDS",
+    "icon,icône,checkbox,case à cocher,radio,toggle,close,fermer,arrow,flèche,link,lien,tab,onglet,menu item,×").split(",") if k.strip()]
+GROUNDING_NO_EFFECT_HAMMING = int(os.getenv("GROUNDING_NO_EFFECT_HAMMING", "2")) # Clic "sans effet": capture suivante quasi identique
+
+# --- Configuration de la saisie de texte (frappe ou collage via le presse-papiers) ---
+INPUT_STRATEGY = os.getenv("INPUT_STRATEGY", "auto").lower()                # "auto", "type" ou "paste"
+INPUT_PASTE_MIN_CHARS = int(os.getenv("INPUT_PASTE_MIN_CHARS", "40"))        # "auto": collage à partir de cette longueur (ou si non ASCII)
+INPUT_PASTE_SETTLE_S = float(os.getenv("INPUT_PASTE_SETTLE_S", "0.15"))      # Attente avant de restaurer le presse-papiers
+INPUT_PASTE_VERIFY = os.getenv("INPUT_PASTE_VERIFY", "1").lower() in ("1", "true", "yes") # Vérifie l'effet du collage, sinon frappe
+INPUT_PASTE_VERIFY_TIMEOUT_S = float(os.getenv("INPUT_PASTE_VERIFY_TIMEOUT_S", "1.0")) # Attente max d'un changement dans la zone du champ
+INPUT_PASTE_VERIFY_MIN_PIXELS = int(os.getenv("INPUT_PASTE_VERIFY_MIN_PIXELS", "12"))  # Pixels modifiés (pleine résolution) = collage visible
+INPUT_COALESCE_ENABLED = os.getenv("INPUT_COALESCE_ENABLED", "1").lower() in ("1", "true", "yes")
+
+# --- Configuration du détecteur de stabilité de l'écran (remplace les pauses fixes) ---
+SETTLE_DETECTOR_ENABLED = os.getenv("SETTLE_DETECTOR_ENABLED", "1").lower() in ("1", "true", "yes")
+SETTLE_STABLE_MS = float(os.getenv("SETTLE_STABLE_MS", "200"))             # Durée sans changement requise
+SETTLE_TIMEOUT_S = float(os.getenv("SETTLE_TIMEOUT_S", "3.0"))             # Avant la capture de l'étape
+SETTLE_ACTION_TIMEOUT_S = float(os.getenv("SETTLE_ACTION_TIMEOUT_S", "2.0")) # Entre deux micro-actions
+SETTLE_MAX_WAIT_UNTIL_STABLE_S = float(os.getenv("SETTLE_MAX_WAIT_UNTIL_STABLE_S", "15.0")) # Plafond pour WAIT_UNTIL_STABLE
+SETTLE_POLL_INTERVAL_S = float(os.getenv("SETTLE_POLL_INTERVAL_S", "0.05"))
+SETTLE_SAMPLE_WIDTH = int(os.getenv("SETTLE_SAMPLE_WIDTH", "160"))         # Largeur des frames basse résolution comparées
+SETTLE_PIXEL_DELTA = int(os.getenv("SETTLE_PIXEL_DELTA", "10"))            # Écart de niveau de gris considéré comme un changement
+SETTLE_CHANGED_RATIO = float(os.getenv("SETTLE_CHANGED_RATIO", "0.002"))   # Part de pixels changés tolérée (curseur clignotant, etc.)
+PRE_CAPTURE_FIXED_DELAY_S = EXECUTION_PROFILE.pre_capture_delay_s  # Pauses fixes utilisées quand le détecteur est désactivé
+POST_ACTION_FIXED_DELAY_S = EXECUTION_PROFILE.post_action_delay_s
+
+# --- Configuration du streaming VLM ---
+VLM_STREAMING_ENABLED = os.getenv("VLM_STREAMING_ENABLED", "1").lower() in ("1", "true", "yes")
+# "qwen_first": Qwen approuve toujours la séquence avant exécution. "allowlist": les premières actions de types
+# autorisés sont exécutées dès leur réception (voir should_dispatch_micro_action_early).
+VLM_EARLY_DISPATCH_POLICY = os.getenv("VLM_EARLY_DISPATCH_POLICY", "qwen_first").lower()
+VLM_EARLY_DISPATCH_ACTION_TYPES = set(t.strip().upper() for t in os.getenv("VLM_EARLY_DISPATCH_ACTION_TYPES", "KEY_PRESS,WAIT_UNTIL_STABLE,PAUSE").split(",") if t.strip())
+
+# --- Configuration du préchargement spéculatif de la requête VLM suivante ---
+VLM_SPECULATIVE_PREFETCH_ENABLED = os.getenv("VLM_SPECULATIVE_PREFETCH_ENABLED", "1").lower() in ("1", "true", "yes")
+
+# --- Configuration du fast-path (approbation locale sans appel à Qwen) ---
+QWEN_FAST_PATH_ENABLED = os.getenv("QWEN_FAST_PATH_ENABLED", "1").lower() in ("1", "true", "yes")
+QWEN_FAST_PATH_ACTION_TYPES = set(t.strip().upper() for t in os.getenv("QWEN_FAST_PATH_ACTION_TYPES", "CLICK,DOUBLE_CLICK,KEY_PRESS,SCROLL,PRESS_ENTER,WAIT_UNTIL_STABLE,PAUSE").split(",") if t.strip())
+QWEN_FAST_PATH_MAX_ACTIONS = int(os.getenv("QWEN_FAST_PATH_MAX_ACTIONS", "3"))
+QWEN_FAST_PATH_ESCALATE_EVERY_N_STEPS = int(os.getenv("QWEN_FAST_PATH_ESCALATE_EVERY_N_STEPS", "3")) # Qwen est consulté aux étapes 1, 1+N, 1+2N...
+QWEN_FAST_PATH_LOOP_WINDOW = int(os.getenv("QWEN_FAST_PATH_LOOP_WINDOW", "2")) # Séquences exécutées récentes comparées pour détecter une boucle
+
+# --- Configuration de l'historique d'interaction ---
+# "0": la partie verbeuse de chaque étape n'est gardée que dans detailed_interaction_log.txt (mémoire constante par étape)
+INTERACTION_HISTORY_KEEP_VERBOSE_IN_MEMORY = os.getenv("INTERACTION_HISTORY_KEEP_VERBOSE_IN_MEMORY", "0").lower() in ("1", "true", "yes")
+
+# --- Configuration de la réutilisation du cache KV côté serveur (préfixe de prompt stable) ---
+# "none" (défaut): aucun indice. "llama_cpp": envoie cache_prompt/id_slot, "openai": envoie prompt_cache_key.
+# À n'activer que pour le serveur concerné: l'API OpenAI refuse (400) les champs cache_prompt/id_slot.
+PROMPT_CACHE_HINTS = os.getenv("PROMPT_CACHE_HINTS", "none").lower()
+VLM_PROMPT_CACHE_SLOT = int(os.getenv("VLM_PROMPT_CACHE_SLOT", "-1"))   # Slot llama.cpp dédié au VLM (-1 = choix du serveur)
+QWEN_PROMPT_CACHE_SLOT = int(os.getenv("QWEN_PROMPT_CACHE_SLOT", "-1")) # Slot llama.cpp dédié à Qwen (-1 = choix du serveur)
+
+# --- Configuration des sorties structurées (décodage contraint, évite les réponses JSON inexploitables) ---
+# "json_schema": response_format avec schéma JSON (OpenAI, vLLM, llama.cpp récent), "gbnf": grammaire llama.cpp
+# (extra_body.grammar), "off": aucune contrainte. Si le serveur refuse la contrainte, le modèle repasse sans contrainte
+# et l'extraction par regex reste utilisée dans tous les cas.
+VLM_STRUCTURED_OUTPUT = os.getenv("VLM_STRUCTURED_OUTPUT", "json_schema").lower()
+QWEN_STRUCTURED_OUTPUT = os.getenv("QWEN_STRUCTURED_OUTPUT", VLM_STRUCTURED_OUTPUT).lower()
+
+# --- Configuration du budget de tokens du prompt Qwen (prefill et décodage dominent l'étape sur un modèle 8B) ---
+QWEN_CONTEXT_TOKENS = int(os.getenv("QWEN_CONTEXT_TOKENS", "8192"))             # Fenêtre de contexte du serveur Qwen
+QWEN_PROMPT_TOKEN_BUDGET = int(os.getenv("QWEN_PROMPT_TOKEN_BUDGET", "1200"))   # Budget de latence: tokens du message utilisateur (texte)
+QWEN_MAX_COMPLETION_TOKENS = int(os.getenv("QWEN_MAX_COMPLETION_TOKENS", "1024")) # Augmenter pour un modèle qui "réfléchit" avant de répondre
+QWEN_CHARS_PER_TOKEN = float(os.getenv("QWEN_CHARS_PER_TOKEN", "3.5"))          # Estimation initiale, recalibrée sur l'usage rapporté
+
+# --- Configuration du cache des réponses VLM (clé: hash perceptuel de la capture + instruction + modèle) ---
+VLM_RESPONSE_CACHE_ENABLED = os.getenv("VLM_RESPONSE_CACHE_ENABLED", "1").lower() in ("1", "true", "yes") # "0" = contournement
+VLM_RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("VLM_RESPONSE_CACHE_MAX_ENTRIES", "256"))
+VLM_RESPONSE_CACHE_MAX_BYTES = int(os.getenv("VLM_RESPONSE_CACHE_MAX_BYTES", str(4 * 1024 * 1024)))
+VLM_RESPONSE_CACHE_HAMMING_TOLERANCE = int(os.getenv("VLM_RESPONSE_CACHE_HAMMING_TOLERANCE", "4")) # Sur 64 bits
+VLM_RESPONSE_CACHE_PATH = os.getenv("VLM_RESPONSE_CACHE_PATH", "") # Fichier JSON persistant (vide = mémoire seule)
+VLM_RESPONSE_CACHE_SAVE_EVERY = int(os.getenv("VLM_RESPONSE_CACHE_SAVE_EVERY", "5")) # Sauvegarde toutes les N insertions
+
+# --- Configuration de la persistance asynchrone (captures d'écran et journal détaillé) ---
+SCREENSHOTS_FOLDER = "agent_gui_screenshots_api"
+SCREENSHOT_SAVE_FORMAT = os.getenv("SCREENSHOT_SAVE_FORMAT", "PNG").upper()          # PNG, JPEG ou WEBP
+SCREENSHOT_SAVE_QUALITY = int(os.getenv("SCREENSHOT_SAVE_QUALITY", "85"))            # JPEG/WEBP
+SCREENSHOT_PNG_COMPRESS_LEVEL = int(os.getenv("SCREENSHOT_PNG_COMPRESS_LEVEL", "1")) # 0-9, 1 = rapide
+PERSISTENCE_QUEUE_SIZE = int(os.getenv("PERSISTENCE_QUEUE_SIZE", "16"))
+PERSISTENCE_BACKPRESSURE_POLICY = os.getenv("PERSISTENCE_BACKPRESSURE_POLICY", "downsample").lower() # "downsample" ou "drop"
+PERSISTENCE_FLUSH_TIMEOUT_S = float(os.getenv("PERSISTENCE_FLUSH_TIMEOUT_S", "10"))
+
+# --- Configuration de l'archive des captures (adressage par contenu, déduplication, deltas par tuiles, rétention) ---
+# "files" (défaut): une image par étape, jamais supprimée. "archive" (optionnel): objets dédupliqués sous
+# SCREENSHOT_ARCHIVE_FOLDER (PNG sans perte), avec la rétention ci-dessous.
+SCREENSHOT_STORAGE_MODE = os.getenv("SCREENSHOT_STORAGE_MODE", "files").lower()
+SCREENSHOT_ARCHIVE_FOLDER = os.getenv("SCREENSHOT_ARCHIVE_FOLDER", os.path.join(SCREENSHOTS_FOLDER, "archive"))
+SCREENSHOT_ARCHIVE_TILE_SIZE = int(os.getenv("SCREENSHOT_ARCHIVE_TILE_SIZE", "64"))
+# Fusion des quasi-doublons avec la trame précédente: AVEC PERTE (les pixels de la trame sont jetés dès que les pHash
+# 64 bits sont à cette distance, même si l'écran diffère réellement). -1 = jamais (défaut, archive sans perte).
+SCREENSHOT_ARCHIVE_NEAR_DUP_HAMMING = int(os.getenv("SCREENSHOT_ARCHIVE_NEAR_DUP_HAMMING", "-1"))
+SCREENSHOT_ARCHIVE_MAX_DELTA_RATIO = float(os.getenv("SCREENSHOT_ARCHIVE_MAX_DELTA_RATIO", "0.5")) # Au-delà: trame complète
+SCREENSHOT_ARCHIVE_KEYFRAME_INTERVAL = int(os.getenv("SCREENSHOT_ARCHIVE_KEYFRAME_INTERVAL", "20")) # Longueur max d'une chaîne de deltas
+# Rétention de l'archive (supprime des captures): désactivée par défaut, à activer explicitement
+SCREENSHOT_RETENTION_MAX_BYTES = int(os.getenv("SCREENSHOT_RETENTION_MAX_BYTES", "0"))          # 0 = sans limite de taille
+SCREENSHOT_RETENTION_MAX_AGE_DAYS = float(os.getenv("SCREENSHOT_RETENTION_MAX_AGE_DAYS", "0")) # 0 = sans limite d'âge
+SCREENSHOT_RETENTION_KEEP_ONLY_FAILED = os.getenv("SCREENSHOT_RETENTION_KEEP_ONLY_FAILED", "0").lower() in ("1", "true", "yes")
+SCREENSHOT_ARCHIVE_COMPACT_EVERY = int(os.getenv("SCREENSHOT_ARCHIVE_COMPACT_EVERY", "50")) # Compactage toutes les N trames
+
+# --- Configuration de l'enregistrement des sessions (rejouables avec replay_benchmark.py) ---
+SESSION_RECORDING_ENABLED = os.getenv("SESSION_RECORDING_ENABLED", "1").lower() in ("1", "true", "yes")
+SESSION_RECORDING_FOLDER = os.getenv("SESSION_RECORDING_FOLDER", os.path.join(SCREENSHOTS_FOLDER, "sessions"))
+
+# --- Configuration de l'auto-réglage des pauses entre actions (appris par application depuis les temps de stabilisation) ---
+EXECUTION_AUTOTUNE_ENABLED = os.getenv("EXECUTION_AUTOTUNE_ENABLED", "0").lower() in ("1", "true", "yes")
+EXECUTION_AUTOTUNE_PATH = os.getenv("EXECUTION_AUTOTUNE_PATH", os.path.join(SCREENSHOTS_FOLDER, "action_timing.json")) # "" = non persistant
+EXECUTION_AUTOTUNE_MIN_SAMPLES = int(os.getenv("EXECUTION_AUTOTUNE_MIN_SAMPLES", "8"))   # Mesures avant d'utiliser la pause apprise
+EXECUTION_AUTOTUNE_MARGIN = float(os.getenv("EXECUTION_AUTOTUNE_MARGIN", "1.5"))         # Multiplicateur de sécurité sur le p95
+EXECUTION_AUTOTUNE_MIN_DELAY_S = float(os.getenv("EXECUTION_AUTOTUNE_MIN_DELAY_S", "0.05"))
+EXECUTION_AUTOTUNE_RECHECK_EVERY = int(os.getenv("EXECUTION_AUTOTUNE_RECHECK_EVERY", "10")) # 1 action sur N remesurée
+EXECUTION_AUTOTUNE_WINDOW = int(os.getenv("EXECUTION_AUTOTUNE_WINDOW", "50"))             # Mesures conservées par clé
+
+# --- Configuration du rejeu de trajectoires (objectifs récurrents ré-exécutés sans appel de modèle) ---
+# Désactivé par défaut: des actions rejouées sans modèle sur un écran mal reconnu ne sont pas vérifiées avant exécution.
+TRAJECTORY_REPLAY_ENABLED = os.getenv("TRAJECTORY_REPLAY_ENABLED", "0").lower() in ("1", "true", "yes")
+TRAJECTORY_STORE_PATH = os.getenv("TRAJECTORY_STORE_PATH", os.path.join(SCREENSHOTS_FOLDER, "trajectories.json")) # "" = mémoire seule
+TRAJECTORY_MAX_ENTRIES = int(os.getenv("TRAJECTORY_MAX_ENTRIES", "200"))                # Objectifs conservés (LRU)
+TRAJECTORY_HAMMING_TOLERANCE = int(os.getenv("TRAJECTORY_HAMMING_TOLERANCE", "0"))       # Empreinte de l'écran avant chaque étape (sur 64 bits), 0 = identique
+
+# --- Configuration du traçage de latence par étape ---
+STAGE_TRACE_ENABLED = os.getenv("STAGE_TRACE_ENABLED", "1").lower() in ("1", "true", "yes")
+STAGE_TRACE_JSONL_PATH = os.getenv("STAGE_TRACE_JSONL_PATH", os.path.join(SCREENSHOTS_FOLDER, "stage_trace.jsonl")) # Vide = pas de JSONL
+STAGE_TRACE_PROMETHEUS_FILE = os.getenv("STAGE_TRACE_PROMETHEUS_FILE", "") # Fichier texte Prometheus (ex: textfile collector)
+STAGE_TRACE_PROMETHEUS_PORT = int(os.getenv("STAGE_TRACE_PROMETHEUS_PORT", "0")) # 0 = pas d'endpoint HTTP /metrics
+STAGE_TRACE_WINDOW_SIZE = int(os.getenv("STAGE_TRACE_WINDOW_SIZE", "1000")) # Mesures récentes par étape pour les quantiles exportés
+
+# --- Configuration des pools d'endpoints ---
+VLM_ENDPOINT_MAX_CONCURRENCY = int(os.getenv("VLM_ENDPOINT_MAX_CONCURRENCY", "2"))   # Par réplica (requête courante + spéculative)
+QWEN_ENDPOINT_MAX_CONCURRENCY = int(os.getenv("QWEN_ENDPOINT_MAX_CONCURRENCY", "1")) # Par réplica
+ENDPOINT_BALANCING = os.getenv("ENDPOINT_BALANCING", "least_outstanding").lower()   # "least_outstanding" ou "latency"
+ENDPOINT_EJECT_AFTER_FAILURES = int(os.getenv("ENDPOINT_EJECT_AFTER_FAILURES", "3"))
+ENDPOINT_EJECT_SECONDS = float(os.getenv("ENDPOINT_EJECT_SECONDS", "30"))
+ENDPOINT_HEALTH_CHECK_INTERVAL_S = float(os.getenv("ENDPOINT_HEALTH_CHECK_INTERVAL_S", "5")) # 0 = pas de sonde active
+ENDPOINT_ACQUIRE_TIMEOUT_S = float(os.getenv("ENDPOINT_ACQUIRE_TIMEOUT_S", "120"))
+ENDPOINT_KEEPALIVE_EXPIRY_S = float(os.getenv("ENDPOINT_KEEPALIVE_EXPIRY_S", "60"))
+
+# --- Configuration des délais, reprises et requêtes couvertes (hedging) ---
+VLM_REQUEST_TIMEOUT_S = float(os.getenv("VLM_REQUEST_TIMEOUT_S", "60"))   # Délai par tentative (et durée max d'un streaming)
+QWEN_REQUEST_TIMEOUT_S = float(os.getenv("QWEN_REQUEST_TIMEOUT_S", "90"))
+VLM_REQUEST_MAX_RETRIES = int(os.getenv("VLM_REQUEST_MAX_RETRIES", "2"))   # Erreurs réessayables uniquement
+QWEN_REQUEST_MAX_RETRIES = int(os.getenv("QWEN_REQUEST_MAX_RETRIES", "2"))
+REQUEST_BACKOFF_BASE_S = float(os.getenv("REQUEST_BACKOFF_BASE_S", "0.5")) # Backoff exponentiel avec jitter
+REQUEST_BACKOFF_MAX_S = float(os.getenv("REQUEST_BACKOFF_MAX_S", "8"))
+REQUEST_HEDGING_ENABLED = os.getenv("REQUEST_HEDGING_ENABLED", "0").lower() in ("1", "true", "yes")
+REQUEST_HEDGE_QUANTILE = float(os.getenv("REQUEST_HEDGE_QUANTILE", "0.95")) # Délai avant la requête de couverture
+REQUEST_HEDGE_MIN_SAMPLES = int(os.getenv("REQUEST_HEDGE_MIN_SAMPLES", "20")) # Mesures nécessaires avant d'activer le hedging
+REQUEST_HEDGE_MIN_DELAY_S = float(os.getenv("REQUEST_HEDGE_MIN_DELAY_S", "0.5"))
+
+# --- Configuration du moteur d'exécution des étapes ---
+# "async": boucle asyncio (étapes sur un pool de threads, délais par étape, annulation, recouvrement des étapes
+# indépendantes); "sync": exécution séquentielle historique (mode de compatibilité).
+AGENT_ENGINE = os.getenv("AGENT_ENGINE", "async").lower()
+AGENT_ENGINE_WORKERS = int(os.getenv("AGENT_ENGINE_WORKERS", "4"))
+# Délais par étape (s), garde-fous au-dessus des délais et reprises de RequestPolicy. AGENT_STAGE_DEADLINES="vlm=120,qwen=60"
+# remplace les valeurs par défaut; 0 = sans délai. Une étape "encode.vlm" utilise le délai de "encode.vlm" ou, à défaut, de "encode".
+AGENT_STAGE_DEADLINES_S = {
+    "capture": 15.0,
+    "encode": 10.0,
+    "phash": 10.0,
+    "vlm": VLM_REQUEST_TIMEOUT_S * (VLM_REQUEST_MAX_RETRIES + 1) + REQUEST_BACKOFF_MAX_S * VLM_REQUEST_MAX_RETRIES + 5,
+    "qwen": QWEN_REQUEST_TIMEOUT_S * (QWEN_REQUEST_MAX_RETRIES + 1) + REQUEST_BACKOFF_MAX_S * QWEN_REQUEST_MAX_RETRIES + 5,
+}
+AGENT_STAGE_DEADLINES_S.update((stage.strip(), float(seconds)) for stage, _, seconds in
+                               (item.partition("=") for item in os.getenv("AGENT_STAGE_DEADLINES", "").split(",") if "=" in item))
+
+# --- Pools d'Endpoints (VLM et Qwen sur des serveurs et réplicas indépendants) ---
+class EndpointReplica:
+    """Un serveur compatible OpenAI: client à connexions keep-alive réutilisées et état de santé."""
+
+    def __init__(self, base_url, api_key, max_concurrency, client_factory):
+        self.base_url = base_url
+        self.name = base_url
+        self._client_factory = functools.partial(client_factory, base_url, api_key, max_concurrency)
+        self._client = None
+        self._client_lock = threading.Lock()
+        self.max_concurrency = max(1, max_concurrency)
+        self.outstanding = 0
+        self.ewma_latency_ms = None
+        self.consecutive_failures = 0
+        self.ejected_until = 0.0
+        self.requests = 0
+        self.failures = 0
+        self.ejections = 0
+
+    @property
+    def client(self):
+        """Client créé à la première requête (la librairie openai n'est importée qu'à ce moment)."""
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    self._client = self._client_factory()
+        return self._client
+
+    def close(self):
+        if self._client is not None:
+            self._client.close()
+
+    def is_ejected(self, now):
+        return now < self.ejected_until
+
+class EndpointPool:
+    """Répartit les requêtes d'un modèle entre ses réplicas.
+
+    Sélection "least_outstanding" (moins de requêtes en cours) ou "latency" (latence EWMA pondérée par la charge),
+    limite de requêtes simultanées par réplica (les appels suivants attendent une place), éjection temporaire
+    après des échecs consécutifs, et sonde de santé en arrière-plan pour réintégrer un réplica éjecté plus tôt.
+    """
+
+    def __init__(self, label, base_urls, api_key, client_factory, max_concurrency=1, balancing=ENDPOINT_BALANCING,
+                 eject_after_failures=ENDPOINT_EJECT_AFTER_FAILURES, eject_seconds=ENDPOINT_EJECT_SECONDS,
+                 health_check_interval_s=ENDPOINT_HEALTH_CHECK_INTERVAL_S, acquire_timeout_s=ENDPOINT_ACQUIRE_TIMEOUT_S):
+        if not base_urls:
+            raise ValueError(f"Aucun endpoint configuré pour {label}.")
+        self.label = label
+        self.replicas = [EndpointReplica(url, api_key, max_concurrency, client_factory) for url in base_urls]
+        self.balancing = balancing
+        self.eject_after_failures = max(1, eject_after_failures)
+        self.eject_seconds = eject_seconds
+        self.health_check_interval_s = health_check_interval_s
+        self.acquire_timeout_s = acquire_timeout_s
+        self._condition = threading.Condition()
+        self._health_thread = None
+        self._closed = False
+
+    def describe(self):
+        return ", ".join(r.base_url for r in self.replicas)
+
+    def _score(self, replica):
+        if self.balancing == "latency":
+            return (replica.ewma_latency_ms or 0.0) * (replica.outstanding + 1), replica.outstanding
+        return replica.outstanding, replica.ewma_latency_ms or 0.0
+
+    def _pick(self, exclude=()):
+        now = time.monotonic()
+        candidates = [r for r in self.replicas if r.name not in exclude]
+        available = [r for r in candidates if r.outstanding < r.max_concurrency]
+        if not available:
+            return None
+        healthy = [r for r in available if not r.is_ejected(now)]
+        if healthy:
+            return min(healthy, key=self._score)
+        if all(r.is_ejected(now) for r in candidates): # Tous éjectés: on tente quand même le premier à revenir
+            return min(available, key=lambda r: r.ejected_until)
+        return None # Des réplicas sains existent mais sont saturés: attendre une place
+
+    def has_available_replica(self, exclude=()):
+        """Vrai si un réplica sain (hors 'exclude') peut accepter une requête immédiatement."""
+        with self._condition:
+            replica = self._pick(exclude)
+            return replica is not None and not replica.is_ejected(time.monotonic())
+
+    @contextlib.contextmanager
+    def acquire(self, exclude=(), timeout_s=None):
+        """Réserve un réplica pour la durée du bloc (streaming compris) et met à jour sa santé et sa latence."""
+        timeout_s = self.acquire_timeout_s if timeout_s is None else timeout_s
+        deadline = time.monotonic() + timeout_s
+        with self._condition:
+            replica = self._pick(exclude)
+            while replica is None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise EndpointSaturatedError(f"{self.label}: aucun endpoint disponible après {timeout_s:.0f}s (limite de concurrence atteinte).")
+                self._condition.wait(remaining)
+                replica = self._pick(exclude)
+            replica.outstanding += 1
+            replica.requests += 1
+        t_start = time.perf_counter()
+        failed = False
+        try:
+            yield replica
+        except Exception as e:
+            failed = self._is_endpoint_failure(e)
+            raise
+        finally:
+            self._release(replica, (time.perf_counter() - t_start) * 1000, failed)
+
+    @staticmethod
+    def _is_endpoint_failure(error):
+        """Les erreurs 4xx (hors 408/429) viennent de la requête, pas du serveur: elles n'affectent pas sa santé."""
+        status_code = getattr(error, "status_code", None)
+        return not (status_code is not None and 400 <= status_code < 500 and status_code not in (408, 429))
+
+    def _release(self, replica, duration_ms, failed):
+        with self._condition:
+            replica.outstanding -= 1
+            if failed:
+                replica.failures += 1
+                replica.consecutive_failures += 1
+                if replica.consecutive_failures >= self.eject_after_failures and not replica.is_ejected(time.monotonic()):
+                    replica.ejected_until = time.monotonic() + self.eject_seconds
+                    replica.ejections += 1
+                    logging.warning(f"{self.label}: endpoint {replica.name} éjecté pour {self.eject_seconds:.0f}s "
+                                    f"après {replica.consecutive_failures} échecs consécutifs.")
+                    self._ensure_health_checker()
+            else:
+                replica.consecutive_failures = 0
+                replica.ejected_until = 0.0
+                replica.ewma_latency_ms = duration_ms if replica.ewma_latency_ms is None else 0.8 * replica.ewma_latency_ms + 0.2 * duration_ms
+            self._condition.notify_all()
+
+    def _ensure_health_checker(self):
+        if self.health_check_interval_s <= 0 or (self._health_thread is not None and self._health_thread.is_alive()):
+            return
+        self._health_thread = threading.Thread(target=self._health_check_loop, name=f"health-{self.label}", daemon=True)
+        self._health_thread.start()
+
+    def _health_check_loop(self):
+        while not self._closed:
+            time.sleep(self.health_check_interval_s)
+            with self._condition:
+                ejected = [r for r in self.replicas if r.is_ejected(time.monotonic())]
+            if not ejected:
+                return # Le thread est relancé à la prochaine éjection
+            for replica in ejected:
+                try:
+                    replica.client.models.list() # Sonde légère
+                except Exception as e:
+                    logging.debug(f"{self.label}: sonde de santé de {replica.name} en échec: {e}")
+                    continue
+                with self._condition:
+                    replica.consecutive_failures = 0
+                    replica.ejected_until = 0.0
+                    self._condition.notify_all()
+                logging.info(f"{self.label}: endpoint {replica.name} réintégré (sonde de santé OK).")
+
+    def close(self):
+        self._closed = True
+        for replica in self.replicas:
+            try: replica.close()
+            except Exception: pass
+
+    def stats_summary(self):
+        parts = []
+        for r in self.replicas:
+            latency = f"{r.ewma_latency_ms:.0f} ms" if r.ewma_latency_ms is not None else "n/a"
+            parts.append(f"{r.name}: {r.requests} req., {r.failures} échecs, {r.ejections} éjections, latence EWMA {latency}")
+        return f"Endpoints {self.label}: " + "; ".join(parts)
+
+def _create_openai_client(base_url, api_key, max_concurrency):
+    """Client OpenAI dont le pool de connexions HTTP garde au moins 'max_concurrency' connexions keep-alive."""
+    try:
+        import httpx # Dépendance de la librairie openai
+        http_client = httpx.Client(limits=httpx.Limits(max_connections=max(10, max_concurrency * 2),
+                                                       max_keepalive_connections=max(2, max_concurrency),
+                                                       keepalive_expiry=ENDPOINT_KEEPALIVE_EXPIRY_S),
+                                   timeout=httpx.Timeout(600.0, connect=5.0))
+    except ImportError:
+        http_client = None
+    # Pas de reprises internes au client: délais, reprises et hedging sont gérés par RequestPolicy
+    return openai.OpenAI(base_url=base_url, api_key=api_key, http_client=http_client, max_retries=0)
+
+# --- Délais, Reprises et Requêtes Couvertes (hedging) ---
+class EndpointSaturatedError(RuntimeError):
+    """Aucun réplica n'a libéré de place avant l'expiration du délai d'attente du pool (non réessayé)."""
+
+class ModelRequestTimeout(TimeoutError):
+    """Garde-fou: aucune réponse dans le délai de la tentative, toutes requêtes couvertes comprises."""
+
+def is_retryable_request_error(error):
+    """Erreurs transitoires uniquement: coupure/délai réseau, 408/409/429 et 5xx. Les autres 4xx ne sont pas réessayées."""
+    if isinstance(error, ModelRequestTimeout):
+        return True
+    status_code = getattr(error, "status_code", None)
+    if status_code is not None:
+        return status_code in (408, 409, 429) or status_code >= 500
+    if openai._is_loaded() and isinstance(error, openai.APIConnectionError): # Inclut APITimeoutError
+        return True
+    return any(cls.__name__ == "TransportError" for cls in type(error).__mro__) # httpx, pendant la lecture d'un flux
+
+class RequestPolicy:
+    """Délai par tentative, reprises avec backoff exponentiel et jitter, et hedging optionnel pour un modèle.
+
+    Hedging: si la première réponse (premier token en streaming) n'est pas arrivée au bout du p95 observé, une
+    requête identique est envoyée à un autre réplica; la première réponse gagne et l'autre est fermée dès que possible.
+    """
+
+    def __init__(self, label, timeout_s, max_retries, hedging_enabled=REQUEST_HEDGING_ENABLED,
+                 hedge_quantile=REQUEST_HEDGE_QUANTILE, hedge_min_samples=REQUEST_HEDGE_MIN_SAMPLES,
+                 hedge_min_delay_s=REQUEST_HEDGE_MIN_DELAY_S, backoff_base_s=REQUEST_BACKOFF_BASE_S,
+                 backoff_max_s=REQUEST_BACKOFF_MAX_S):
+        self.label = label
+        self.timeout_s = timeout_s
+        self.max_retries = max(0, max_retries)
+        self.hedging_enabled = hedging_enabled
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_samples = hedge_min_samples
+        self.hedge_min_delay_s = hedge_min_delay_s
+        self.backoff_base_s = backoff_base_s
+        self.backoff_max_s = backoff_max_s
+        self._lock = threading.Lock()
+        self._latencies_ms = deque(maxlen=500)
+        self.requests = 0
+        self.retries = 0
+        self.timeouts = 0
+        self.failures = 0
+        self.hedges_fired = 0
+        self.hedge_wins = 0
+        self.cancelled = 0
+        self.hedge_saved_ms = 0.0
+
+    def backoff_delay_s(self, retry_index):
+        return min(self.backoff_max_s, self.backoff_base_s * (2 ** retry_index)) * random.uniform(0.5, 1.0)
+
+    def record_latency(self, duration_ms):
+        with self._lock:
+            self._latencies_ms.append(duration_ms)
+
+    def count(self, counter):
+        """Incrémente un compteur: les tentatives et couvertures tournent dans des threads différents."""
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def hedge_delay_s(self):
+        """Délai avant couverture (quantile observé), ou None tant qu'il n'y a pas assez de mesures."""
+        if not self.hedging_enabled:
+            return None
+        with self._lock:
+            if len(self._latencies_ms) < self.hedge_min_samples:
+                return None
+            quantile_ms = _percentile(sorted(self._latencies_ms), self.hedge_quantile)
+        return max(self.hedge_min_delay_s, quantile_ms / 1000)
+
+    def record_loser(self, completed, loser_total_ms=None, winner_total_ms=None):
+        with self._lock:
+            self.cancelled += 1
+            if completed and loser_total_ms is not None and winner_total_ms is not None and loser_total_ms > winner_total_ms:
+                self.hedge_saved_ms += loser_total_ms - winner_total_ms
+
+    def stats_summary(self):
+        with self._lock:
+            latencies = sorted(self._latencies_ms)
+            counters = (f"Requêtes {self.label}: {self.requests} requêtes, {self.retries} reprises, {self.timeouts} délais dépassés, "
+                        f"{self.failures} échecs définitifs, {self.hedges_fired} couvertures ({self.hedge_wins} gagnantes, "
+                        f"{self.cancelled} requêtes perdantes fermées, ~{self.hedge_saved_ms / 1000:.1f}s économisées)")
+        quantiles = (f"p50={_percentile(latencies, 0.5):.0f} p95={_percentile(latencies, 0.95):.0f} p99={_percentile(latencies, 0.99):.0f} ms"
+                     if latencies else "aucune mesure")
+        return f"{counters}. Première réponse: {quantiles}"
+
+_model_request_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="model-request")
+
+def _leased_request_attempt(endpoint_pool, open_fn, cancel_event, exclude=(), acquire_timeout_s=None, holder=None):
+    """Réserve un réplica puis appelle open_fn(replica, cancel_event). En cas de succès, la réservation (ExitStack)
+    est transmise à l'appelant, qui la ferme après avoir consommé la réponse."""
+    lease = contextlib.ExitStack()
+    try:
+        replica = lease.enter_context(endpoint_pool.acquire(exclude=exclude, timeout_s=acquire_timeout_s))
+        if holder is not None:
+            holder["replica"] = replica.name
+        return open_fn(replica, cancel_event), lease, replica.name
+    except BaseException:
+        if not lease.__exit__(*sys.exc_info()):
+            raise
+
+def _discard_losing_attempt(future, close_fn, policy, t_start, winner_total_ms):
+    """Callback: ferme la réponse d'une tentative perdante (hedging ou garde-fou) dès qu'elle se termine."""
+    if future.cancelled() or future.exception() is not None:
+        policy.record_loser(completed=False)
+        return
+    value, lease, _ = future.result()
+    policy.record_loser(completed=True, loser_total_ms=(time.perf_counter() - t_start) * 1000, winner_total_ms=winner_total_ms)
+    try:
+        if close_fn is not None:
+            close_fn(value)
+    finally:
+        lease.close()
+
+def _run_hedged_attempt(endpoint_pool, policy, open_fn, close_fn):
+    t_start = time.perf_counter()
+    hedge_delay_s = policy.hedge_delay_s() if len(endpoint_pool.replicas) > 1 else None
+    if hedge_delay_s is None: # Chemin direct: pas de thread, le délai est imposé par le client HTTP
+        value, lease, replica_name = _leased_request_attempt(endpoint_pool, open_fn, None)
+        policy.record_latency((time.perf_counter() - t_start) * 1000)
+        return value, lease, replica_name
+
+    attempts = {} # future -> (cancel_event, is_hedge)
+    primary_holder = {}
+    primary_cancel = threading.Event()
+    primary = _model_request_executor.submit(_leased_request_attempt, endpoint_pool, open_fn, primary_cancel, (), None, primary_holder)
+    attempts[primary] = (primary_cancel, False)
+    done, _ = wait_for_futures([primary], timeout=hedge_delay_s)
+    if not done and primary_holder.get("replica") and endpoint_pool.has_available_replica(exclude=(primary_holder["replica"],)):
+        hedge_cancel = threading.Event()
+        hedge = _model_request_executor.submit(_leased_request_attempt, endpoint_pool, open_fn, hedge_cancel,
+                                               (primary_holder["replica"],), 0.0)
+        attempts[hedge] = (hedge_cancel, True)
+        policy.count("hedges_fired")
+        logging.info(f"{policy.label}: pas de réponse après {hedge_delay_s:.2f}s, requête de couverture envoyée à un autre réplica.")
+
+    pending = set(attempts)
+    errors = {} # is_hedge -> première erreur: celle de la requête principale prime (la couverture peut être saturée)
+    deadline = t_start + policy.timeout_s + 1.0 # Le client HTTP doit expirer avant ce garde-fou
+    while pending:
+        done, pending = wait_for_futures(pending, timeout=max(0.0, deadline - time.perf_counter()), return_when=FIRST_COMPLETED)
+        if not done:
+            policy.count("timeouts")
+            for future in pending:
+                attempts[future][0].set()
+                future.add_done_callback(lambda f: _discard_losing_attempt(f, close_fn, policy, t_start, None))
+            raise ModelRequestTimeout(f"{policy.label}: aucune réponse après {policy.timeout_s:.0f}s.")
+        for future in done:
+            if future.exception() is not None:
+                errors.setdefault(attempts[future][1], future.exception())
+                continue
+            winner_total_ms = (time.perf_counter() - t_start) * 1000
+            if attempts[future][1]:
+                policy.count("hedge_wins")
+            policy.record_latency(winner_total_ms)
+            for other in pending:
+                attempts[other][0].set()
+                other.add_done_callback(lambda f, w=winner_total_ms: _discard_losing_attempt(f, close_fn, policy, t_start, w))
+            return future.result()
+    raise errors.get(False) or errors[True]
+
+def run_model_request(endpoint_pool, policy, open_fn, close_fn=None):
+    """Exécute open_fn(replica, cancel_event) avec délai, reprises et hedging selon 'policy'.
+
+    open_fn retourne la réponse complète, ou un flux ouvert jusqu'à son premier token (close_fn le ferme s'il perd).
+    Retourne (réponse, réservation, nom du réplica); l'appelant ferme la réservation ('with lease:') après
+    consommation, ce qui met à jour la santé du réplica.
+    """
+    policy.count("requests")
+    for attempt_index in range(policy.max_retries + 1):
+        try:
+            return _run_hedged_attempt(endpoint_pool, policy, open_fn, close_fn)
+        except Exception as e:
+            if type(e).__name__ == "APITimeoutError": # Délai expiré côté client HTTP (le garde-fou compte les siens)
+                policy.count("timeouts")
+            if not is_retryable_request_error(e) or attempt_index == policy.max_retries:
+                policy.count("failures")
+                raise
+            delay_s = policy.backoff_delay_s(attempt_index)
+            policy.count("retries")
+            logging.warning(f"{policy.label}: erreur transitoire ({type(e).__name__}: {str(e)[:150]}). "
+                            f"Nouvelle tentative {attempt_index + 1}/{policy.max_retries} dans {delay_s:.2f}s.")
+            time.sleep(delay_s)
+
+vlm_request_policy = RequestPolicy("VLM", VLM_REQUEST_TIMEOUT_S, VLM_REQUEST_MAX_RETRIES)
+qwen_request_policy = RequestPolicy("Qwen", QWEN_REQUEST_TIMEOUT_S, QWEN_REQUEST_MAX_RETRIES)
+grounding_request_policy = RequestPolicy("VLM raffinement", GROUNDING_REFINE_TIMEOUT_S, VLM_REQUEST_MAX_RETRIES, hedging_enabled=False)
+
 # Initialisation des contrôleurs et des librairies
-# Client OpenAI (ou compatible)
+# Clients OpenAI (ou compatibles): un pool d'endpoints par modèle, clients créés à la première requête
 try:
-    from openai import OpenAI
-    # S'assurer que le client est initialisé pour être utilisé globalement si nécessaire
-    client = OpenAI(base_url=OPENAI_API_BASE_URL, api_key=OPENAI_API_KEY)
+    if importlib.util.find_spec("openai") is None:
+        raise ImportError("openai")
+    vlm_endpoint_pool = EndpointPool("VLM", VLM_API_BASE_URLS, VLM_API_KEY, _create_openai_client, max_concurrency=VLM_ENDPOINT_MAX_CONCURRENCY)
+    qwen_endpoint_pool = EndpointPool("Qwen", QWEN_API_BASE_URLS, QWEN_API_KEY, _create_openai_client, max_concurrency=QWEN_ENDPOINT_MAX_CONCURRENCY)
 except ImportError:
     logging.critical("La librairie OpenAI Python n'est pas installée. Veuillez l'installer avec 'pip install openai'")
     rich_print("[bold red]Erreur Fatale: Librairie OpenAI non trouvée. Exécutez: pip install openai[/bold red]")
@@ -53,37 +749,157 @@ except Exception as e:
     rich_print(f"[bold red]Erreur Fatale: Impossible d'initialiser le client OpenAI: {e}[/bold red]")
     exit()
 
-# Modules Audio
+# Module Audio (importé par le thread du SoundBank, jamais sur le chemin critique)
+AUDIO_ENABLED = importlib.util.find_spec("sounddevice") is not None
+if not AUDIO_ENABLED:
+    logging.warning("sounddevice non trouvé. Le retour audio sera désactivé.")
+    rich_print("[yellow]Attention: sounddevice non trouvé. Le retour audio sera désactivé.[/yellow]")
+
 try:
-    import sounddevice as sd
-    import soundfile as sf
-    AUDIO_ENABLED = True
+    import pyperclip # Installé avec PyAutoGUI; sert au collage des longues saisies
 except ImportError:
-    logging.warning("sounddevice ou soundfile non trouvé. Le retour audio sera désactivé.")
-    rich_print("[yellow]Attention: sounddevice ou soundfile non trouvé. Le retour audio sera désactivé.[/yellow]")
-    AUDIO_ENABLED = False
+    pyperclip = None
+    logging.warning("pyperclip non trouvé. Les saisies seront tapées caractère par caractère.")
 
-# Résolution d'écran
-try:
-    SCREEN_WIDTH, SCREEN_HEIGHT = pyautogui.size()
-except Exception as e: # Peut échouer dans certains environnements (ex: headless, VM sans GUI)
-    logging.error(f"Erreur lors de la récupération de la taille de l'écran via pyautogui: {e}")
-    rich_print(f"[red]Erreur PyAutoGUI pour taille écran: {e}.[/red]")
-    logging.warning("Utilisation par défaut de 1920x1080. Ajustez si nécessaire.")
-    rich_print("[yellow]Utilisation par défaut de 1920x1080. Ajustez si nécessaire.[/yellow]")
-    SCREEN_WIDTH, SCREEN_HEIGHT = 1920, 1080
-
-# Contrôleur de souris Pynput
+# Résolution d'écran (AGENT_SCREEN_SIZE="LARGEURxHAUTEUR" force la valeur, ex: rejeu d'une session enregistrée).
+# Sinon elle est lue par initialize_gui_backend() au premier besoin, pour que l'import du module n'importe pas pyautogui.
+SCREEN_SIZE_FROM_ENV = bool(os.getenv("AGENT_SCREEN_SIZE"))
 try:
-    pynput_mouse_controller = MouseController()
-except Exception as e:
-    logging.warning(f"Impossible d'initialiser Pynput MouseController: {e}. Certaines animations de curseur pourraient être moins fluides.")
-    pynput_mouse_controller = None # Fallback
+    SCREEN_WIDTH, SCREEN_HEIGHT = (int(v) for v in os.getenv("AGENT_SCREEN_SIZE", "1920x1080").lower().split("x"))
+except ValueError as e:
+    logging.error(f"AGENT_SCREEN_SIZE invalide ({e}). Utilisation de la résolution de l'écran.")
+    rich_print(f"[red]AGENT_SCREEN_SIZE invalide ({e}). Utilisation de la résolution de l'écran.[/red]")
+    SCREEN_WIDTH, SCREEN_HEIGHT, SCREEN_SIZE_FROM_ENV = 1920, 1080, False
+
+class ScreenGeometry:
+    """Transformation explicite entre l'espace des captures (image) et l'espace écran des actions (points logiques).
+
+    Sur un écran HiDPI, pyautogui travaille en points logiques alors que ImageGrab renvoie des pixels physiques
+    (x2 sur Retina): la capture est ramenée une seule fois à CAPTURE_RESOLUTION, juste après le grab.
+    Les positions normalisées [0, 1] sont identiques dans les deux espaces; seules les conversions en pixels diffèrent.
+    """
+
+    def __init__(self, screen_size, resolution_spec=CAPTURE_RESOLUTION):
+        self.screen_size = tuple(screen_size)
+        self.resolution_spec = resolution_spec
+        self.native_size = None # Taille physique observée à la première capture
+        self.scale_factor = None
+        self.captures = 0
+        self.downsampled = 0
+        self.pixels_saved = 0
+
+    def _observe_native_size(self, native_size):
+        if self.native_size == native_size:
+            return
+        self.native_size = native_size
+        self.scale_factor = native_size[0] / self.screen_size[0] if self.screen_size[0] else 1.0
+        msg = (f"Capture native {native_size[0]}x{native_size[1]} pour un écran logique {self.screen_size[0]}x{self.screen_size[1]} "
+               f"(facteur d'échelle {self.scale_factor:g}); captures ramenées à {self.capture_size()[0]}x{self.capture_size()[1]}.")
+        logging.info(msg)
+        rich_print(f"[grey50]{msg}[/grey50]")
+
+    def capture_size(self, native_size=None):
+        native_size = native_size or self.native_size or self.screen_size
+        if self.resolution_spec == "native":
+            return native_size
+        if self.resolution_spec == "logical":
+            return self.screen_size if native_size[0] >= self.screen_size[0] else native_size # Jamais d'agrandissement
+        return compute_fitted_image_size(native_size, parse_image_size_spec(self.resolution_spec))
+
+    def grab_native(self, bbox=None):
+        """Capture en pixels physiques; 'bbox' est exprimée en points logiques de l'écran."""
+        initialize_gui_backend()
+        if bbox is None:
+            frame = ImageGrab.grab()
+            self._observe_native_size(frame.size)
+            return frame
+        scale = 1.0 if sys.platform == "darwin" else (self.scale_factor or 1.0) # Sous macOS, Pillow attend déjà des points
+        return ImageGrab.grab(bbox=tuple(round(v * scale) for v in bbox))
+
+    def to_capture_resolution(self, frame):
+        """Ramène une capture plein écran native à la résolution de travail (une seule fois par capture)."""
+        if frame is None:
+            return None
+        self.captures += 1
+        target_size = self.capture_size(frame.size)
+        if tuple(target_size) == frame.size:
+            return frame
+        factor = frame.width / target_size[0]
+        if factor == int(factor) and frame.height == target_size[1] * int(factor):
+            resized = frame.reduce(int(factor)) # Moyenne par blocs, bien plus rapide qu'un filtre LANCZOS plein écran
+        else:
+            resized = frame.resize(tuple(target_size), Image.BILINEAR, reducing_gap=2.0)
+        self.downsampled += 1
+        self.pixels_saved += frame.width * frame.height - resized.width * resized.height
+        return resized
+
+    def grab(self):
+        """Capture plein écran à la résolution de travail."""
+        return self.to_capture_resolution(self.grab_native())
+
+    def to_screen(self, position_norm):
+        """Position normalisée -> point écran logique (entiers) utilisé par pyautogui/pynput."""
+        initialize_gui_backend()
+        x = round(max(0.0, min(1.0, position_norm[0])) * self.screen_size[0])
+        y = round(max(0.0, min(1.0, position_norm[1])) * self.screen_size[1])
+        return min(x, self.screen_size[0] - 1), min(y, self.screen_size[1] - 1)
+
+    def pixels_to_norm(self, raw_x, raw_y):
+        """Coordonnées en pixels renvoyées par un modèle (exprimées dans la résolution écran annoncée) -> normalisées."""
+        norm_x = raw_x / self.screen_size[0] if (abs(raw_x) > 1.0001 and self.screen_size[0] > 0) else raw_x
+        norm_y = raw_y / self.screen_size[1] if (abs(raw_y) > 1.0001 and self.screen_size[1] > 0) else raw_y
+        return norm_x, norm_y
+
+    def stats_summary(self):
+        native = f"{self.native_size[0]}x{self.native_size[1]}" if self.native_size else "inconnue"
+        capture = self.capture_size()
+        return (f"Captures: {self.captures} (native {native}, travail {capture[0]}x{capture[1]}), {self.downsampled} réduites, "
+                f"{self.pixels_saved / 1e6:.1f} Mpx évités")
+
+screen_geometry = ScreenGeometry((SCREEN_WIDTH, SCREEN_HEIGHT))
+
+_gui_backend_lock = threading.Lock()
+_gui_backend_initialized = False
+
+def initialize_gui_backend():
+    """Lit la résolution de l'écran (import de pyautogui) au premier besoin: début de la boucle, première capture ou action."""
+    global SCREEN_WIDTH, SCREEN_HEIGHT, _gui_backend_initialized
+    if _gui_backend_initialized:
+        return
+    with _gui_backend_lock:
+        if _gui_backend_initialized:
+            return
+        if not SCREEN_SIZE_FROM_ENV:
+            try:
+                SCREEN_WIDTH, SCREEN_HEIGHT = pyautogui.size()
+            except Exception as e: # Peut échouer dans certains environnements (ex: headless, VM sans GUI)
+                logging.error(f"Erreur lors de la récupération de la taille de l'écran via pyautogui: {e}")
+                rich_print(f"[red]Erreur PyAutoGUI pour taille écran: {e}.[/red]")
+                logging.warning("Utilisation par défaut de 1920x1080. Ajustez si nécessaire.")
+                rich_print("[yellow]Utilisation par défaut de 1920x1080. Ajustez si nécessaire.[/yellow]")
+                SCREEN_WIDTH, SCREEN_HEIGHT = 1920, 1080
+        screen_geometry.screen_size = (SCREEN_WIDTH, SCREEN_HEIGHT)
+        render_system_prompts()
+        _gui_backend_initialized = True
+
+# Contrôleur de souris Pynput (créé à la première animation du curseur)
+_pynput_mouse_controller = None
+
+def get_pynput_mouse_controller():
+    global _pynput_mouse_controller
+    if _pynput_mouse_controller is None:
+        try:
+            _pynput_mouse_controller = pynput_mouse.Controller()
+        except Exception as e:
+            logging.warning(f"Impossible d'initialiser Pynput MouseController: {e}. Certaines animations de curseur pourraient être moins fluides.")
+            _pynput_mouse_controller = False # Fallback pyautogui, sans nouvelle tentative
+    return _pynput_mouse_controller or None
 
 # --- Prompt Système pour le VLM Frontend (Perception) ---
-VLM_SYSTEM_PROMPT = f"""
+# La résolution est insérée par render_system_prompts(), une fois l'écran connu
+VLM_SYSTEM_PROMPT_TEMPLATE = f"""
 You are a VLM assistant for a macOS GUI agent. You analyze screenshots and follow SPECIFIC INSTRUCTIONS from a supervisor LLM.
-Your screen resolution is {SCREEN_WIDTH}x{SCREEN_HEIGHT}.
+Your screen resolution is {{screen_resolution}}.
 YOUR ENTIRE RESPONSE MUST BE A SINGLE, VALID JSON OBJECT. NO OTHER TEXT BEFORE OR AFTER THE JSON OBJECT.
 
 The JSON object structure MUST be: {{ "global_thought": {{...}}, "action_sequence": [...] }}
@@ -106,30 +922,296 @@ Available "action_type" for micro-actions (ensure all parameters are included as
 "PRESS_ENTER" ({{ "action_type": "PRESS_ENTER", "description": "..." }}),
 "KEY_PRESS" ({{ "action_type": "KEY_PRESS", "keys": ["MODIFIER_IF_ANY", "KEY"], "description": "..." }}), # 'keys' MUST be a list of strings. Example: {{"action_type": "KEY_PRESS", "keys": ["COMMAND", "SPACE"], "description": "Open Spotlight"}}
 "PAUSE" ({{ "action_type": "PAUSE", "duration_seconds": float_value, "description": "..." }}), # 'duration_seconds' is required.
+"WAIT_UNTIL_STABLE" ({{ "action_type": "WAIT_UNTIL_STABLE", "timeout_seconds": opt_float_value, "description": "..." }}), # Waits until the screen stops changing (app launch, page load). Prefer it over guessing a PAUSE duration. 'timeout_seconds' is optional.
 "FINISHED" ({{ "action_type": "FINISHED", "reason": "State why the instruction is complete.", "description": "Instruction fully completed." }}) -> Use this if your CURRENT INSTRUCTION is fully completed by the proposed actions or current screen state.
 
 Focus ONLY on the immediate instruction. The supervisor LLM (Qwen) handles the overall user goal.
 If the instruction is to "confirm if X is visible", and X is visible, your "action_sequence" might be an empty list [], and "global_thought" should reflect this confirmation in "Current Screen Analysis (Brief)" or "Current State Summary". If X is not visible and the instruction was just to check, still use an empty list for actions if no action is to be taken to make it visible.
 """
 
+# --- Traçage des Étapes (latence par étape de la boucle principale) ---
+_NULL_SPAN = contextlib.nullcontext() # Réutilisable: coût quasi nul quand le traçage est désactivé
+
+def _percentile(sorted_values, fraction):
+    """Percentile par rang le plus proche sur une liste déjà triée."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(fraction * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+def summarize_stage_durations(durations_by_stage):
+    """{étape: [ms]} -> {étape: {n, p50, p95, p99, total}}, trié par temps total décroissant."""
+    stage_stats = {}
+    for stage, values in sorted(durations_by_stage.items(), key=lambda item: -sum(item[1])):
+        ordered = sorted(values)
+        stage_stats[stage] = {"n": len(ordered), "p50": _percentile(ordered, 0.50), "p95": _percentile(ordered, 0.95),
+                              "p99": _percentile(ordered, 0.99), "total": sum(ordered)}
+    return stage_stats
+
+class _StageSpan:
+    __slots__ = ("tracer", "stage", "attrs", "t_start")
+
+    def __init__(self, tracer, stage, attrs):
+        self.tracer = tracer
+        self.stage = stage
+        self.attrs = attrs
+
+    def __enter__(self):
+        self.t_start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.attrs["error"] = exc_type.__name__
+        self.tracer.record(self.stage, self.t_start, **self.attrs)
+        return False
+
+class StageTracer:
+    """Mesure la durée de chaque étape de la boucle (capture, encodage, VLM, Qwen, actions, attentes...).
+
+    Chaque pas de l'agent est écrit comme une ligne JSONL (écriture en arrière-plan); les percentiles p50/p95/p99
+    par étape sont agrégés par tâche et, sur une fenêtre glissante, exportés au format texte Prometheus.
+    Désactivé, span() retourne un contexte vide partagé et record() sort immédiatement.
+    """
+
+    def __init__(self, enabled=STAGE_TRACE_ENABLED, jsonl_path=STAGE_TRACE_JSONL_PATH,
+                 prometheus_file=STAGE_TRACE_PROMETHEUS_FILE, prometheus_port=STAGE_TRACE_PROMETHEUS_PORT,
+                 window_size=STAGE_TRACE_WINDOW_SIZE):
+        self.enabled = enabled
+        self.jsonl_path = jsonl_path
+        self.prometheus_file = prometheus_file
+        self.prometheus_port = prometheus_port
+        self._lock = threading.Lock()
+        self._step = None
+        self._task_durations = {}
+        self._window = {}
+        self._totals = {}
+        self._window_size = max(1, window_size)
+        self._http_server = None
+
+    def span(self, stage, **attrs):
+        if not self.enabled:
+            return _NULL_SPAN
+        return _StageSpan(self, stage, attrs)
+
+    def now(self):
+        return time.perf_counter() if self.enabled else 0.0
+
+    def traced(self, stage):
+        """Décorateur: mesure chaque appel de la fonction sous le nom d'étape 'stage'."""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                t_start = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.record(stage, t_start)
+            return wrapper
+        return decorator
+
+    def record(self, stage, t_start=None, duration_ms=None, **attrs):
+        """Enregistre une durée: depuis 't_start' (valeur de now()/perf_counter) ou donnée directement en ms."""
+        if not self.enabled:
+            return
+        t_end = time.perf_counter()
+        if duration_ms is None:
+            duration_ms = (t_end - t_start) * 1000
+        with self._lock:
+            if self._step is not None:
+                span_entry = {"stage": stage, "start_ms": round((t_end - self._step["t0"]) * 1000 - duration_ms, 2),
+                              "duration_ms": round(duration_ms, 2)}
+                if attrs:
+                    span_entry.update(attrs)
+                self._step["spans"].append(span_entry)
+            self._task_durations.setdefault(stage, []).append(duration_ms)
+            window = self._window.get(stage)
+            if window is None:
+                window = self._window[stage] = deque(maxlen=self._window_size)
+            window.append(duration_ms)
+            total = self._totals.setdefault(stage, [0.0, 0])
+            total[0] += duration_ms
+            total[1] += 1
+
+    def begin_step(self, task, step_count):
+        """Ouvre le pas suivant (le pas précédent, s'il est resté ouvert après un 'continue', est d'abord écrit)."""
+        if not self.enabled:
+            return
+        self.end_step()
+        with self._lock:
+            self._step = {"t0": time.perf_counter(), "started_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                          "task": task, "step": step_count, "spans": []}
+
+    def end_step(self):
+        """Ferme le pas courant, l'écrit en JSONL et le retourne (None si le traçage est désactivé)."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            step, self._step = self._step, None
+        if step is None:
+            return None
+        step_total_ms = (time.perf_counter() - step.pop("t0")) * 1000
+        self.record("step.total", duration_ms=step_total_ms)
+        step["total_ms"] = round(step_total_ms, 2)
+        if self.jsonl_path:
+            persistence_worker.submit_log_record(self.jsonl_path, json.dumps(step, ensure_ascii=False) + "\n")
+        if self.prometheus_file:
+            persistence_worker.submit_file_snapshot(self.prometheus_file, self.render_prometheus())
+        return step
+
+    def reset_task(self):
+        with self._lock:
+            self._task_durations = {}
+
+    def task_durations(self):
+        """Copie des durées (ms) mesurées par étape pour la tâche courante."""
+        with self._lock:
+            return {stage: list(values) for stage, values in self._task_durations.items()}
+
+    def stats_summary(self):
+        stage_stats = summarize_stage_durations(self.task_durations())
+        if not stage_stats:
+            return "Latence par étape: aucune mesure."
+        lines = ["Latence par étape (ms, tâche courante):"]
+        for stage, st in stage_stats.items():
+            lines.append(f"  {stage:<28} n={st['n']:<4} p50={st['p50']:8.1f} "
+                         f"p95={st['p95']:8.1f} p99={st['p99']:8.1f} total={st['total']:9.1f}")
+        return "\n".join(lines)
+
+    def render_prometheus(self):
+        """Texte d'exposition Prometheus: un 'summary' par étape (quantiles sur la fenêtre glissante, somme/compte cumulés)."""
+        with self._lock:
+            windows = {stage: sorted(values) for stage, values in self._window.items()}
+            totals = {stage: tuple(total) for stage, total in self._totals.items()}
+        lines = ["# HELP gui_agent_stage_duration_seconds Duration of each stage of the GUI agent loop.",
+                 "# TYPE gui_agent_stage_duration_seconds summary"]
+        for stage in sorted(windows):
+            for quantile in (0.5, 0.95, 0.99):
+                lines.append(f'gui_agent_stage_duration_seconds{{stage="{stage}",quantile="{quantile}"}} {_percentile(windows[stage], quantile) / 1000:.6f}')
+            total_ms, count = totals[stage]
+            lines.append(f'gui_agent_stage_duration_seconds_sum{{stage="{stage}"}} {total_ms / 1000:.6f}')
+            lines.append(f'gui_agent_stage_duration_seconds_count{{stage="{stage}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+    def start_exporter(self):
+        """Démarre l'endpoint HTTP Prometheus (GET /metrics) si un port est configuré."""
+        if not (self.enabled and self.prometheus_port) or self._http_server is not None:
+            return
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        tracer = self
+
+        class _MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = tracer.render_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args): # Pas de log par requête de scraping
+                pass
+
+        try:
+            self._http_server = ThreadingHTTPServer(("127.0.0.1", self.prometheus_port), _MetricsHandler)
+        except OSError as e:
+            logging.warning(f"Endpoint Prometheus indisponible sur le port {self.prometheus_port}: {e}")
+            return
+        threading.Thread(target=self._http_server.serve_forever, name="stage-trace-exporter", daemon=True).start()
+        logging.info(f"Métriques de latence exposées sur http://127.0.0.1:{self.prometheus_port}/metrics")
+
+    def close(self):
+        self.end_step()
+        if self._http_server is not None:
+            self._http_server.shutdown()
+            self._http_server.server_close()
+            self._http_server = None
+
+stage_tracer = StageTracer()
+
 # --- Fonctions Audio ---
+SOUND_CUE_FREQUENCIES = {"ask.wav": 660, "ok.wav": 880, "ask_2.wav": 550, "error.wav": 330, "task_completed.wav": 1046}
+
+class SoundBank:
+    """Sons de retour synthétisés une seule fois en mémoire, joués par un thread dédié (jamais bloquant).
+
+    L'import de sounddevice (initialisation de PortAudio) et la synthèse ont lieu dans ce thread, au démarrage de la
+    boucle ou au premier son: aucun fichier WAV n'est écrit ni relu.
+    """
+
+    def __init__(self, frequencies=SOUND_CUE_FREQUENCIES, sample_rate=16000, duration_s=0.15, fade_s=0.05):
+        self.frequencies = frequencies
+        self.sample_rate = sample_rate
+        self.duration_s = duration_s
+        self.fade_s = fade_s
+        self._queue = queue.SimpleQueue()
+        self._start_lock = threading.Lock()
+        self._thread = None
+        self._sounds = {}
+        self.disabled = False
+        self.played = 0
+
+    def _synthesize(self):
+        t = np.linspace(0, self.duration_s, int(self.sample_rate * self.duration_s), False)
+        fade_len = int(self.sample_rate * self.fade_s)
+        sounds = {}
+        for name, frequency in self.frequencies.items():
+            data = (0.3 * np.sin(2 * np.pi * frequency * t)).astype(np.float32)
+            if len(data) > fade_len:
+                data[-fade_len:] *= np.linspace(1, 0, fade_len, dtype=np.float32)
+            sounds[name] = data
+        return sounds
+
+    def start(self):
+        with self._start_lock:
+            if self._thread is None and not self.disabled:
+                self._thread = threading.Thread(target=self._run, name="sound-bank", daemon=True)
+                self._thread.start()
+
+    def play(self, name):
+        if self.disabled:
+            return
+        self.start()
+        self._queue.put(name)
+
+    def _run(self):
+        try:
+            self._sounds = self._synthesize()
+            sounddevice._load(background=True)
+        except Exception as e:
+            self.disabled = True
+            logging.warning(f"Retour audio désactivé: {e}")
+            rich_print(f"[yellow]Retour audio désactivé: {e}[/yellow]")
+            return
+        while True:
+            name = self._queue.get()
+            if name is None:
+                return
+            data = self._sounds.get(name)
+            if data is None:
+                logging.warning(f"Son inconnu: {name}")
+                continue
+            try:
+                sounddevice.play(data, self.sample_rate) # Interrompt le son précédent, comme avant
+                self.played += 1
+            except Exception as e:
+                logging.warning(f"Impossible de jouer le son {name}: {e}")
+                rich_print(f"[yellow]Impossible de jouer le son {name}: {e}[/yellow]")
+
+    def close(self):
+        if self._thread is not None:
+            self._queue.put(None)
+
+sound_bank = SoundBank()
+
 def play_sound_feedback(sound_file_name):
     if not AUDIO_ENABLED: return
-    try:
-        audio_dir = "audio_feedback"
-        os.makedirs(audio_dir, exist_ok=True)
-        file_path = os.path.join(audio_dir, sound_file_name)
-        if os.path.exists(file_path):
-            data, fs = sf.read(file_path, dtype='float32')
-            sd.play(data, fs)
-        else:
-            logging.warning(f"Fichier audio non trouvé: {file_path}")
-            rich_print(f"[yellow]Fichier audio non trouvé: {file_path}[/yellow]")
-    except Exception as e:
-        logging.warning(f"Impossible de jouer le son {sound_file_name}: {e}")
-        rich_print(f"[yellow]Impossible de jouer le son {sound_file_name}: {e}[/yellow]")
+    sound_bank.play(sound_file_name)
 
 # --- Fonctions Utilitaires pour l'Overlay et l'Animation du Curseur ---
+@stage_tracer.traced("action.cursor_animation")
 def animate_cursor_movement(start_x, start_y, end_x, end_y, duration=CURSOR_ANIMATION_DURATION):
     steps = max(1, int(duration * 100))
     for i in range(steps + 1):
@@ -137,8 +1219,9 @@ def animate_cursor_movement(start_x, start_y, end_x, end_y, duration=CURSOR_ANIM
         current_x = start_x + (end_x - start_x) * t
         current_y = start_y + (end_y - start_y) * t
         try:
-            if pynput_mouse_controller:
-                pynput_mouse_controller.position = (current_x, current_y)
+            mouse_controller = get_pynput_mouse_controller()
+            if mouse_controller:
+                mouse_controller.position = (current_x, current_y)
             else: # Fallback si pynput n'est pas dispo
                 pyautogui.moveTo(current_x, current_y, duration=0) # Mouvement instantané pour chaque pas
         except Exception: # Fallback plus large
@@ -147,73 +1230,366 @@ def animate_cursor_movement(start_x, start_y, end_x, end_y, duration=CURSOR_ANIM
             time.sleep(duration / steps)
 
 def highlight_click_position(x, y, duration=HIGHLIGHT_DURATION):
+    if CURSOR_ANIMATION_DURATION <= 0 and duration <= 0: # Curseur téléporté: pyautogui.click() le déplace lui-même
+        return
     current_pos_x, current_pos_y = pyautogui.position()
     animate_cursor_movement(current_pos_x, current_pos_y, x, y)
     try:
-        if pynput_mouse_controller:
-            pynput_mouse_controller.position = (x,y)
+        mouse_controller = get_pynput_mouse_controller()
+        if mouse_controller:
+            mouse_controller.position = (x,y)
         else:
             pyautogui.moveTo(x,y, duration=0)
     except Exception:
          pyautogui.moveTo(x,y, duration=0)
     time.sleep(duration)
 
+# --- Overlay d'Action (une seule fenêtre, créée une fois et réutilisée) ---
+class ActionOverlayService:
+    """Fenêtre d'overlay persistante alimentée par une file de messages, pour un retour visuel quasi gratuit.
+
+    'thread': la fenêtre vit dans son propre thread UI; les actions déposent leurs messages sans attendre.
+    'main': Tk reste sur le thread principal (obligatoire sur macOS); chaque message est appliqué sur place, et pump()
+    (appelé par le moteur pendant qu'il attend une étape) traite le masquage automatique et les événements Tk entre deux.
+    'off': aucun retour visuel (sans affichage, rejeu, benchmarks).
+    """
+
+    def __init__(self, mode=OVERLAY_MODE):
+        self.mode = mode if mode in ("thread", "main", "off") else "thread"
+        self._queue = queue.SimpleQueue()
+        self._start_lock = threading.Lock()
+        self._thread = None
+        self._root = None
+        self._label = None
+        self._screen_size = (SCREEN_WIDTH, SCREEN_HEIGHT)
+        self._hide_at = None # Instant (monotonic) de masquage automatique de l'overlay affiché
+
+    def show(self, action_text, x, y, color="lime", duration=OVERLAY_DURATION):
+        self._submit(("show", action_text, x, y, color, duration))
+
+    def expire_after(self, delay_s):
+        """Avance le masquage de l'overlay courant à 'delay_s' (sans jamais le retarder)."""
+        if self._started():
+            self._submit(("expire", delay_s))
+
+    def hide(self, wait_s=0.0):
+        """Masque l'overlay; avec 'wait_s', attend que ce soit fait (ex: avant une capture d'écran envoyée aux modèles)."""
+        if not self._started(): # Rien n'a jamais été affiché: ne crée ni la fenêtre ni son thread
+            return
+        done = threading.Event()
+        self._submit(("hide", done))
+        if wait_s > 0 and self.mode == "thread":
+            done.wait(wait_s)
+
+    def pump(self):
+        """Mode 'main': masque l'overlay arrivé à échéance et traite les événements Tk (fenêtre jamais figée)."""
+        if self.mode != "main" or self._root is None or threading.current_thread() is not threading.main_thread():
+            return
+        self._expire_if_due()
+        self._refresh()
+
+    def close(self):
+        if self._thread is not None:
+            self._queue.put(("stop",))
+            self._thread.join(timeout=1.0)
+            self._thread = None
+        elif self._root is not None:
+            self._destroy_window()
+
+    def _submit(self, message):
+        if not self._ensure_started():
+            return
+        if self.mode == "thread":
+            self._queue.put(message)
+            return
+        if threading.current_thread() is not threading.main_thread(): # Tk n'est utilisable que depuis son thread
+            return
+        self._handle(message)
+        self._expire_if_due()
+        self._refresh()
+
+    def _started(self):
+        return self.mode != "off" and (self._root is not None or self._thread is not None)
+
+    def _ensure_started(self):
+        """Création paresseuse: l'import du module ne touche pas à l'affichage."""
+        if self.mode == "off" or self._root is not None or self._thread is not None:
+            return self.mode != "off"
+        if self.mode == "main":
+            self._create_window()
+            return self.mode != "off"
+        with self._start_lock:
+            if self._thread is None:
+                ready = threading.Event()
+                self._thread = threading.Thread(target=self._run_ui_thread, args=(ready,), name="ActionOverlay", daemon=True)
+                self._thread.start()
+                ready.wait(2.0)
+        return self.mode != "off"
+
+    def _create_window(self):
+        try:
+            root = tk.Tk()
+            root.withdraw()
+            root.overrideredirect(True)
+            root.attributes("-topmost", True)
+            root.attributes("-alpha", 0.75) # Transparence
+            root.config(bg="black") # Couleur de fond pour contraste
+            self._label = tk.Label(root, text="", fg="lime", bg="black", font=("Arial", 12, "bold"), justify=tk.LEFT)
+            self._label.pack(padx=10, pady=5, expand=True, fill='both')
+            self._screen_size = (root.winfo_screenwidth(), root.winfo_screenheight())
+            self._root = root
+        except Exception as e: # Pas d'affichage (TclError) ou Tk absent
+            logging.warning(f"Overlay d'action indisponible ({e}). Retour visuel désactivé.")
+            rich_print(f"[yellow]Overlay d'action indisponible ({e}). Retour visuel désactivé.[/yellow]")
+            self.mode = "off"
+
+    def _destroy_window(self):
+        root, self._root = self._root, None
+        try:
+            if root is not None:
+                root.destroy()
+        except tk.TclError as e: # Souvent si l'application est déjà en cours de fermeture
+            logging.debug(f"Erreur TclError bénigne lors de la destruction de l'overlay: {e}")
+
+    def _run_ui_thread(self, ready):
+        self._create_window()
+        ready.set()
+        while self._root is not None:
+            timeout_s = 0.05 if self._hide_at is None else min(0.05, max(0.0, self._hide_at - time.monotonic()))
+            try:
+                message = self._queue.get(timeout=timeout_s)
+            except queue.Empty:
+                message = None
+            if message is not None and message[0] == "stop":
+                break
+            if message is not None:
+                self._handle(message)
+            self._expire_if_due()
+            self._refresh()
+        self._destroy_window()
+
+    def _handle(self, message):
+        kind = message[0]
+        if kind == "show":
+            _, action_text, x, y, color, duration = message
+            lines = action_text.split('\n')
+            # Estimations grossières pour la taille, ajustez si nécessaire
+            font_avg_width = 8  # Largeur moyenne d'un caractère
+            font_avg_height = 18 # Hauteur moyenne d'une ligne
+            overlay_width = (max(len(line) for line in lines) * font_avg_width) + 40 # Padding horizontal
+            overlay_height = (len(lines) * font_avg_height) + 20 # Padding vertical
+            # Positionner l'overlay près du clic, mais en s'assurant qu'il reste à l'écran
+            final_x = min(max(0, x + 25), self._screen_size[0] - overlay_width)
+            final_y = min(max(0, y + 25), self._screen_size[1] - overlay_height)
+            self._label.config(text=action_text, fg=color)
+            self._root.geometry(f"{int(overlay_width)}x{int(overlay_height)}+{int(final_x)}+{int(final_y)}")
+            self._root.deiconify()
+            self._root.lift()
+            self._hide_at = time.monotonic() + duration
+        elif kind == "expire":
+            if self._hide_at is not None:
+                self._hide_at = min(self._hide_at, time.monotonic() + message[1])
+        elif kind == "hide":
+            self._withdraw()
+            message[1].set()
+
+    def _expire_if_due(self):
+        if self._hide_at is not None and time.monotonic() >= self._hide_at:
+            self._withdraw()
+
+    def _withdraw(self):
+        self._hide_at = None
+        if self._root is not None:
+            self._root.withdraw()
+
+    def _refresh(self):
+        try:
+            if self._root is not None:
+                self._root.update()
+        except tk.TclError as e:
+            logging.warning(f"Overlay d'action: erreur Tk ({e}). Retour visuel désactivé.")
+            self._root, self.mode = None, "off"
+
+action_overlay = ActionOverlayService()
+
+@stage_tracer.traced("action.overlay")
 def create_action_overlay(action_text, x, y, color="lime", duration=OVERLAY_DURATION):
-    overlay_root = None
     try:
-        overlay_root = tk.Tk()
-        overlay_root.overrideredirect(True)
-        overlay_root.attributes("-topmost", True)
-        overlay_root.attributes("-alpha", 0.75) # Transparence
-        overlay_root.config(bg="black") # Couleur de fond pour contraste
-        
-        lines = action_text.split('\n')
-        # Estimations grossières pour la taille, ajustez si nécessaire
-        font_avg_width = 8  # Largeur moyenne d'un caractère
-        font_avg_height = 18 # Hauteur moyenne d'une ligne
-        max_line_len = max(len(line) for line in lines) if lines else 0
-        
-        overlay_width = (max_line_len * font_avg_width) + 40 # Padding horizontal
-        overlay_height = (len(lines) * font_avg_height) + 20 # Padding vertical
-        
-        screen_w_tk, screen_h_tk = overlay_root.winfo_screenwidth(), overlay_root.winfo_screenheight()
-        
-        # Positionner l'overlay près du clic, mais en s'assurant qu'il reste à l'écran
-        final_x = min(max(0, x + 25), screen_w_tk - overlay_width)
-        final_y = min(max(0, y + 25), screen_h_tk - overlay_height)
-        
-        overlay_root.geometry(f"{int(overlay_width)}x{int(overlay_height)}+{int(final_x)}+{int(final_y)}")
-        
-        label = tk.Label(overlay_root, text=action_text, fg=color, bg="black", font=("Arial", 12, "bold"), justify=tk.LEFT)
-        label.pack(padx=10, pady=5, expand=True, fill='both')
-        
-        overlay_root.after(int(duration * 1000), lambda r=overlay_root: safe_destroy_overlay(r))
-        overlay_root.update() # Forcer l'affichage
-        return overlay_root # Retourner la référence pour une destruction potentielle plus tôt
-    except tk.TclError as e: # Erreurs Tkinter spécifiques
-        logging.warning(f"Erreur TclError Overlay (peut arriver si Tk est mal initialisé): {e}")
-        if overlay_root: safe_destroy_overlay(overlay_root) # Tentative de nettoyage
-        return None
+        action_overlay.show(action_text, x, y, color, duration)
     except Exception as e:
-        logging.warning(f"Avertissement création Overlay: {e}")
-        if overlay_root: safe_destroy_overlay(overlay_root) # Tentative de nettoyage
-        return None
+        logging.warning(f"Avertissement affichage Overlay: {e}")
 
-def safe_destroy_overlay(overlay_ref):
-    try:
-        if overlay_ref and overlay_ref.winfo_exists(): # Vérifier si la fenêtre existe encore
-            overlay_ref.destroy()
-    except tk.TclError as e: # Souvent si déjà détruit ou application parente fermée
-        logging.debug(f"Erreur TclError bénigne lors de la destruction de l'overlay: {e}")
-    except Exception as e:
-        logging.warning(f"Erreur inattendue lors de la destruction de l'overlay: {e}")
+# --- Détection de Stabilité de l'Écran ---
+def _settle_sample(frame):
+    """Réduit une capture en une petite image en niveaux de gris (tableau NumPy) pour la comparaison."""
+    sample_w = max(8, min(SETTLE_SAMPLE_WIDTH, frame.width))
+    sample_h = max(8, round(frame.height * sample_w / frame.width))
+    return np.asarray(frame.convert("L").resize((sample_w, sample_h), Image.BILINEAR), dtype=np.int16)
+
+def wait_for_screen_stable(timeout_s=SETTLE_TIMEOUT_S, stable_ms=SETTLE_STABLE_MS, poll_interval_s=SETTLE_POLL_INTERVAL_S):
+    """Échantillonne l'écran jusqu'à ce qu'il soit inchangé depuis 'stable_ms' ou que 'timeout_s' soit écoulé.
+
+    Retourne (stable, durée_écoulée_s, dernière_capture_pleine_résolution). La dernière capture peut être
+    réutilisée comme capture d'étape pour éviter un second ImageGrab.grab(), après screen_geometry.to_capture_resolution().
+    """
+    t_start = time.monotonic()
+    previous_sample, previous_time, stable_since = None, None, None
+    frame = None
+    while True:
+        try:
+            frame = screen_geometry.grab_native()
+        except Exception as e:
+            logging.warning(f"Détecteur de stabilité: capture impossible ({e}). Pause fixe utilisée.")
+            time.sleep(min(timeout_s, PRE_CAPTURE_FIXED_DELAY_S))
+            return False, time.monotonic() - t_start, None
+        sample = _settle_sample(frame)
+        now = time.monotonic()
+        if previous_sample is not None and sample.shape == previous_sample.shape:
+            changed_ratio = np.count_nonzero(np.abs(sample - previous_sample) > SETTLE_PIXEL_DELTA) / sample.size
+            if changed_ratio <= SETTLE_CHANGED_RATIO:
+                if stable_since is None:
+                    stable_since = previous_time # L'écran n'a pas changé depuis l'échantillon précédent
+                if (now - stable_since) * 1000 >= stable_ms:
+                    return True, now - t_start, frame
+            else:
+                stable_since = None
+        previous_sample, previous_time = sample, now
+        if now - t_start >= timeout_s:
+            return False, now - t_start, frame
+        action_overlay.pump() # Un overlay échu disparaît avant que l'écran soit déclaré stable
+        time.sleep(poll_interval_s)
+
+# --- Auto-réglage des Pauses entre Actions ---
+class ActionTimingTuner:
+    """Apprend, par application et par type d'action, la pause minimale sûre après une micro-action.
+
+    Les temps de stabilisation mesurés par le détecteur alimentent une fenêtre glissante. Dès qu'elle contient assez de
+    mesures, la pause appliquée devient le p95 multiplié par une marge, plafonné par SETTLE_ACTION_TIMEOUT_S (par la pause
+    fixe du profil si le détecteur est désactivé), sans le coût du détecteur (au moins SETTLE_STABLE_MS d'écran immobile);
+    une action sur N est encore mesurée pour suivre l'application.
+    """
+
+    def __init__(self, enabled=EXECUTION_AUTOTUNE_ENABLED, persist_path=EXECUTION_AUTOTUNE_PATH, min_samples=EXECUTION_AUTOTUNE_MIN_SAMPLES,
+                 margin=EXECUTION_AUTOTUNE_MARGIN, min_delay_s=EXECUTION_AUTOTUNE_MIN_DELAY_S, recheck_every=EXECUTION_AUTOTUNE_RECHECK_EVERY,
+                 window=EXECUTION_AUTOTUNE_WINDOW):
+        self.enabled = enabled
+        self.persist_path = persist_path
+        self.min_samples = max(1, min_samples)
+        self.margin = margin
+        self.min_delay_s = min_delay_s
+        self.recheck_every = max(1, recheck_every)
+        self.window = max(self.min_samples, window)
+        self._samples = {} # "application|type d'action" -> temps de stabilisation observés (s)
+        self._since_measure = {}
+        self._dirty = False
+        self.learned_waits = 0
+        self.measured_waits = 0
+        self.learned_wait_s_total = 0.0
+        if self.enabled and self.persist_path:
+            self.load()
+
+    @staticmethod
+    def application_key():
+        """Application au premier plan, sinon '*'.
+
+        Sous macOS, propriétaire de la première fenêtre normale (couche 0) dans l'ordre d'empilement de Quartz:
+        PyAutoGUI n'y fournit pas getActiveWindowTitle, et NSWorkspace n'est pas mis à jour sans boucle d'événements
+        Cocoa. Ailleurs, d'après le titre de la fenêtre active si PyAutoGUI le fournit (Windows).
+        """
+        if sys.platform == "darwin":
+            try:
+                windows = quartz.CGWindowListCopyWindowInfo(
+                    quartz.kCGWindowListOptionOnScreenOnly | quartz.kCGWindowListExcludeDesktopElements, quartz.kCGNullWindowID)
+            except Exception:
+                return "*"
+            for window in windows or ():
+                if window.get("kCGWindowLayer") == 0 and window.get("kCGWindowOwnerName"): # Overlays Tk "topmost": couche > 0
+                    return str(window["kCGWindowOwnerName"])[:60]
+            return "*"
+        try:
+            title = pyautogui.getActiveWindowTitle() if hasattr(pyautogui, "getActiveWindowTitle") else None
+        except Exception:
+            title = None
+        if not title:
+            return "*"
+        return title.rsplit(" - ", 1)[-1].strip()[:60] or "*" # "Document - Application" -> "Application"
+
+    def learned_delay(self, key):
+        samples = self._samples.get(key)
+        if not samples or len(samples) < self.min_samples:
+            return None
+        return max(self.min_delay_s, _percentile(sorted(samples), 0.95) * self.margin)
+
+    def observe(self, key, settle_s):
+        self._samples.setdefault(key, deque(maxlen=self.window)).append(settle_s)
+        self._dirty = True
+
+    def wait_after_action(self, action_type):
+        key = f"{self.application_key()}|{action_type or '*'}"
+        ceiling_s = SETTLE_ACTION_TIMEOUT_S if SETTLE_DETECTOR_ENABLED else POST_ACTION_FIXED_DELAY_S
+        delay_s = self.learned_delay(key)
+        since_measure = self._since_measure.get(key, 0) + 1
+        if delay_s is not None and not (SETTLE_DETECTOR_ENABLED and since_measure >= self.recheck_every):
+            self._since_measure[key] = since_measure
+            delay_s = min(delay_s, ceiling_s)
+            time.sleep(delay_s)
+            self.learned_waits += 1
+            self.learned_wait_s_total += delay_s
+            return
+        self._since_measure[key] = 0
+        if not SETTLE_DETECTOR_ENABLED: # Sans détecteur, rien à mesurer: pause du profil
+            time.sleep(POST_ACTION_FIXED_DELAY_S)
+            return
+        stable, elapsed, _ = wait_for_screen_stable(timeout_s=SETTLE_ACTION_TIMEOUT_S)
+        # Le détecteur confirme la stabilité SETTLE_STABLE_MS après le dernier changement: ce délai n'est pas nécessaire
+        self.observe(key, max(0.0, elapsed - SETTLE_STABLE_MS / 1000) if stable else SETTLE_ACTION_TIMEOUT_S)
+        self.measured_waits += 1
+
+    def load(self):
+        if not os.path.exists(self.persist_path):
+            return
+        try:
+            with open(self.persist_path, "r", encoding="utf-8") as timing_file:
+                data = json.load(timing_file)
+            for key, samples in data.get("samples", {}).items():
+                self._samples[key] = deque((float(v) for v in samples), maxlen=self.window)
+            logging.info(f"Auto-réglage des pauses: {len(self._samples)} clé(s) chargée(s) depuis {self.persist_path}.")
+        except Exception as e:
+            logging.warning(f"Auto-réglage des pauses: impossible de charger {self.persist_path}: {e}")
+
+    def close(self):
+        if self.enabled and self.persist_path and self._dirty:
+            samples = {key: [round(v, 4) for v in values] for key, values in self._samples.items()}
+            persistence_worker.submit_file_snapshot(self.persist_path, json.dumps({"version": 1, "samples": samples}, ensure_ascii=False))
+            self._dirty = False
+
+    def stats_summary(self):
+        learned = {key: self.learned_delay(key) for key in self._samples}
+        ready = ", ".join(f"{key}: {delay * 1000:.0f} ms" for key, delay in sorted(learned.items()) if delay is not None)
+        mean_ms = (1000 * self.learned_wait_s_total / self.learned_waits) if self.learned_waits else 0.0
+        return (f"Auto-réglage des pauses: {self.learned_waits} pauses apprises (moy. {mean_ms:.0f} ms), {self.measured_waits} mesurées; "
+                f"pauses apprises: {ready or 'aucune (mesures insuffisantes)'}")
+
+action_timing_tuner = ActionTimingTuner()
+
+@stage_tracer.traced("settle.post_action")
+def wait_after_micro_action(action_type=None):
+    """Attente entre deux micro-actions: pause apprise (auto-réglage), détection de stabilité si activée, sinon pause fixe."""
+    if action_timing_tuner.enabled:
+        action_timing_tuner.wait_after_action(action_type)
+        return
+    if not SETTLE_DETECTOR_ENABLED:
+        time.sleep(POST_ACTION_FIXED_DELAY_S)
+        return
+    stable, elapsed, _ = wait_for_screen_stable(timeout_s=SETTLE_ACTION_TIMEOUT_S)
+    logging.debug(f"Écran {'stable' if stable else 'toujours en mouvement (timeout)'} après {elapsed:.2f}s.")
 
 # --- Fonctions d'Action GUI ---
 def action_click(position_norm, description=""):
-    x, y = round(position_norm[0] * SCREEN_WIDTH), round(position_norm[1] * SCREEN_HEIGHT)
+    x, y = screen_geometry.to_screen(position_norm)
     logging.info(f"Exécution: CLICK à ({x}, {y}) Description: {description}")
     rich_print(f"Exécution: CLICK à ({x}, {y}) Description: {description}")
-    overlay = create_action_overlay(f"CLICK\n({x},{y})\n{description[:30]}", x, y)
+    create_action_overlay(f"CLICK\n({x},{y})\n{description[:30]}", x, y)
     action_successful = False
     try:
         highlight_click_position(x, y)
@@ -222,43 +1598,98 @@ def action_click(position_norm, description=""):
     except Exception as e:
         logging.error(f"Erreur lors de action_click: {e}")
     finally: # S'assurer que l'overlay est détruit même si l'action échoue
-        if overlay:
-             # L'overlay a son propre timer, mais on peut le forcer ici après un court délai
-            overlay.after(200, lambda r=overlay: safe_destroy_overlay(r))
+        action_overlay.expire_after(0.2) # L'overlay a sa propre durée, mais on le masque peu après l'action
         return action_successful
 
 
 def action_double_click(position_norm, description=""):
-    x, y = round(position_norm[0] * SCREEN_WIDTH), round(position_norm[1] * SCREEN_HEIGHT)
+    x, y = screen_geometry.to_screen(position_norm)
     logging.info(f"Exécution: DOUBLE_CLICK à ({x}, {y}) Description: {description}")
     rich_print(f"Exécution: DOUBLE_CLICK à ({x}, {y}) Description: {description}")
-    overlay = create_action_overlay(f"DBL_CLICK\n({x},{y})\n{description[:30]}", x, y)
+    create_action_overlay(f"DBL_CLICK\n({x},{y})\n{description[:30]}", x, y)
     action_successful = False
     try:
         highlight_click_position(x, y)
-        pyautogui.doubleClick(x=x, y=y, interval=0.1)
+        pyautogui.doubleClick(x=x, y=y, interval=DOUBLE_CLICK_INTERVAL_S)
         action_successful = True
     except Exception as e:
         logging.error(f"Erreur lors de action_double_click: {e}")
     finally:
-        if overlay:
-            overlay.after(200, lambda r=overlay: safe_destroy_overlay(r))
+        action_overlay.expire_after(0.2)
         return action_successful
 
-def action_input_text(value_to_type, position_norm=None, description=""):
-    logging.info(f"Exécution: INPUT '{value_to_type}' Description: {description}")
-    rich_print(f"Exécution: INPUT '{value_to_type}' Description: {description}")
+# --- Stratégie de Saisie (frappe caractère par caractère ou collage via le presse-papiers) ---
+PASTE_HOTKEY = ("command", "v") if sys.platform == "darwin" else ("ctrl", "v")
+paste_blocked_applications = set() # Applications où un collage n'a eu aucun effet visible: frappe directe ensuite
+
+def choose_input_strategy(value_to_type):
+    """'paste' pour les textes longs ou non ASCII (que pyautogui.write ne sait pas taper), sinon 'type'."""
+    if INPUT_STRATEGY == "type" or pyperclip is None or not value_to_type:
+        return "type"
+    if ActionTimingTuner.application_key() in paste_blocked_applications:
+        return "type"
+    if INPUT_STRATEGY == "paste" or len(value_to_type) >= INPUT_PASTE_MIN_CHARS or not value_to_type.isascii():
+        return "paste"
+    return "type"
+
+def _input_region_sample(x, y):
+    """Bande autour du champ de saisie, en niveaux de gris à pleine résolution (quelques caractères suffisent à la modifier)."""
+    bbox = (max(0, x - 300), max(0, y - 30), min(SCREEN_WIDTH, x + 300), min(SCREEN_HEIGHT, y + 30))
+    return np.asarray(screen_geometry.grab_native(bbox=bbox).convert("L"), dtype=np.int16)
+
+def _input_region_changed(before, x, y, timeout_s=INPUT_PASTE_VERIFY_TIMEOUT_S):
+    """Échantillonne la zone du champ jusqu'à ce qu'elle change (True) ou que 'timeout_s' soit écoulé (False)."""
+    deadline = time.monotonic() + timeout_s
+    while True:
+        after = _input_region_sample(x, y)
+        if after.shape != before.shape or np.count_nonzero(np.abs(after - before) > SETTLE_PIXEL_DELTA) >= INPUT_PASTE_VERIFY_MIN_PIXELS:
+            return True
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(SETTLE_POLL_INTERVAL_S)
+
+def paste_text(value_to_type, x=None, y=None):
+    """Colle le texte via le presse-papiers, puis restaure son contenu texte précédent (s'il y en avait un).
+
+    Retourne False seulement si la zone du champ cliqué est restée identique pendant INPUT_PASTE_VERIFY_TIMEOUT_S
+    (collage probablement bloqué par le champ ou l'application). Sans position connue, le collage n'est pas vérifié
+    (une comparaison de tout l'écran n'est pas fiable).
+    """
+    try:
+        previous_clipboard = pyperclip.paste()
+    except Exception as e:
+        logging.debug(f"Presse-papiers illisible, il ne sera pas restauré: {e}")
+        previous_clipboard = None
+    before = _input_region_sample(x, y) if INPUT_PASTE_VERIFY and x is not None else None
+    try:
+        pyperclip.copy(value_to_type)
+        pyautogui.hotkey(*PASTE_HOTKEY)
+        time.sleep(INPUT_PASTE_SETTLE_S) # L'application doit lire le presse-papiers avant sa restauration
+    finally:
+        if previous_clipboard: # "" pour une image ou des fichiers: les recopier effacerait le presse-papiers
+            try:
+                pyperclip.copy(previous_clipboard)
+            except Exception as e:
+                logging.warning(f"Impossible de restaurer le presse-papiers: {e}")
+    if before is None:
+        return True
+    return _input_region_changed(before, x, y)
+
+def action_input_text(value_to_type, position_norm=None, description="", press_enter=False):
+    value_to_type = str(value_to_type)
+    logging.info(f"Exécution: INPUT '{value_to_type}'{' + ENTRÉE' if press_enter else ''} Description: {description}")
+    rich_print(f"Exécution: INPUT '{value_to_type}'{' + ENTRÉE' if press_enter else ''} Description: {description}")
     overlay_x, overlay_y = SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2
-    overlay = None
+    x_click, y_click = None, None
     action_successful = False
     try:
         if position_norm and isinstance(position_norm, list) and len(position_norm) == 2:
-            x_click, y_click = round(position_norm[0] * SCREEN_WIDTH), round(position_norm[1] * SCREEN_HEIGHT)
+            x_click, y_click = screen_geometry.to_screen(position_norm)
             logging.info(f"Clic optionnel à ({x_click}, {y_click}) avant de taper.")
             rich_print(f"Clic optionnel à ({x_click}, {y_click}) avant de taper.")
-            highlight_click_position(x_click, y_click, duration=0.1) # Plus court pour clic avant input
+            highlight_click_position(x_click, y_click, duration=min(0.1, HIGHLIGHT_DURATION)) # Plus court pour clic avant input
             pyautogui.click(x=x_click, y=y_click)
-            time.sleep(0.2) # Délai pour que le focus se fasse
+            time.sleep(INPUT_FOCUS_DELAY_S) # Délai pour que le focus se fasse
             overlay_x, overlay_y = x_click, y_click
         else:
             logging.info("Aucune position de clic spécifiée pour INPUT, frappe directe.")
@@ -266,16 +1697,28 @@ def action_input_text(value_to_type, position_norm=None, description=""):
 
         overlay_text = f"TYPE:\n{value_to_type[:25]}{'...' if len(value_to_type) > 25 else ''}\n{description[:30]}"
         overlay_duration = max(0.5, min(len(value_to_type) * 0.05, 3.0)) # Durée proportionnelle
-        overlay = create_action_overlay(overlay_text, overlay_x, overlay_y, duration=overlay_duration)
-        
-        pyautogui.write(value_to_type, interval=0.03)
+        strategy = choose_input_strategy(value_to_type)
+        if strategy == "paste":
+            # Jamais de frappe après l'envoi du raccourci: un faux négatif de la vérification (collage hors de la zone
+            # observée, application lente) dupliquerait le texte. Les saisies suivantes de l'application seront tapées.
+            if not paste_text(value_to_type, x_click, y_click):
+                application = ActionTimingTuner.application_key()
+                logging.warning(f"Collage sans effet visible ({application}): le champ bloque peut-être le collage. Les prochaines saisies seront tapées.")
+                rich_print(f"[yellow]Collage sans effet visible ({application}): les prochaines saisies seront tapées au clavier.[/yellow]")
+                if application != "*":
+                    paste_blocked_applications.add(application)
+            # Overlay affiché après la vérification, pour ne pas fausser la comparaison de la zone du champ
+            create_action_overlay(overlay_text, overlay_x, overlay_y, duration=overlay_duration)
+        else:
+            create_action_overlay(overlay_text, overlay_x, overlay_y, duration=overlay_duration)
+            pyautogui.write(value_to_type, interval=TYPING_INTERVAL_S)
+        if press_enter:
+            pyautogui.press("enter")
         action_successful = True
     except Exception as e:
         logging.error(f"Erreur lors de action_input_text: {e}")
     finally:
-        # L'overlay créé par create_action_overlay se détruira via son propre timer.
-        # Si on veut une destruction immédiate après pyautogui.write, il faudrait appeler safe_destroy_overlay(overlay) ici.
-        # Pour l'instant, on se fie à son timer interne.
+        # L'overlay se masquera à la fin de sa durée (proportionnelle à la longueur du texte).
         return action_successful
 
 def action_scroll(direction, description=""):
@@ -283,7 +1726,7 @@ def action_scroll(direction, description=""):
     amount = -scroll_clicks if direction.lower() == "up" else scroll_clicks
     logging.info(f"Exécution: SCROLL {direction.upper()} Description: {description}")
     rich_print(f"Exécution: SCROLL {direction.upper()} Description: {description}")
-    overlay = create_action_overlay(f"SCROLL {direction.upper()}\n{description[:30]}", SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2)
+    create_action_overlay(f"SCROLL {direction.upper()}\n{description[:30]}", SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2)
     action_successful = False
     try:
         pyautogui.scroll(amount)
@@ -291,14 +1734,13 @@ def action_scroll(direction, description=""):
     except Exception as e:
         logging.error(f"Erreur lors de action_scroll: {e}")
     finally:
-        if overlay:
-            overlay.after(200, lambda r=overlay: safe_destroy_overlay(r))
+        action_overlay.expire_after(0.2)
         return action_successful
 
 def action_press_enter(description=""):
     logging.info(f"Exécution: PRESS_ENTER Description: {description}")
     rich_print(f"Exécution: PRESS_ENTER Description: {description}")
-    overlay = create_action_overlay(f"ENTRÉE\n{description[:30]}", SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2)
+    create_action_overlay(f"ENTRÉE\n{description[:30]}", SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2)
     action_successful = False
     try:
         pyautogui.press("enter")
@@ -306,8 +1748,7 @@ def action_press_enter(description=""):
     except Exception as e:
         logging.error(f"Erreur lors de action_press_enter: {e}")
     finally:
-        if overlay:
-            overlay.after(200, lambda r=overlay: safe_destroy_overlay(r))
+        action_overlay.expire_after(0.2)
         return action_successful
 
 KEY_MAP = { # Étendu et normalisé
@@ -341,7 +1782,6 @@ KEY_MAP = { # Étendu et normalisé
 def action_key_press(keys_to_press_list, description=""):
     logging.info(f"Tentative KEY_PRESS: {keys_to_press_list}. Description: {description}")
     rich_print(f"Tentative KEY_PRESS: {keys_to_press_list}. Description: {description}")
-    ov = None
     action_successful = False
     try:
         if not isinstance(keys_to_press_list, list) or not keys_to_press_list:
@@ -372,7 +1812,7 @@ def action_key_press(keys_to_press_list, description=""):
 
         logging.info(f"Exécution: KEY_PRESS PyAutoGUI: {pyautogui_keys} (Original VLM: {keys_to_press_list})")
         rich_print(f"Exécution: KEY_PRESS PyAutoGUI: {pyautogui_keys} (Original VLM: {keys_to_press_list})")
-        ov = create_action_overlay(f"RACCOURCI:\n{'+'.join(map(str,pyautogui_keys))}\n{description[:30]}", SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2, color="orange")
+        create_action_overlay(f"RACCOURCI:\n{'+'.join(map(str,pyautogui_keys))}\n{description[:30]}", SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2, color="orange")
 
         # Gestion améliorée pour hotkey vs pressions séquentielles
         potential_modifiers = {"command", "ctrl", "alt", "shift", "option"} # 'option' est mappé sur 'alt'
@@ -394,9 +1834,9 @@ def action_key_press(keys_to_press_list, description=""):
             main_keys = [k for k in pyautogui_keys if k not in potential_modifiers]
 
             for mod in modifiers_down: pyautogui.keyDown(mod)
-            time.sleep(0.05) # Petit délai
+            time.sleep(KEY_CHORD_DELAY_S) # Petit délai
             for key in main_keys: pyautogui.press(key)
-            time.sleep(0.05) # Petit délai
+            time.sleep(KEY_CHORD_DELAY_S) # Petit délai
             for mod in reversed(modifiers_down): pyautogui.keyUp(mod) # Relâcher dans l'ordre inverse
         
         action_successful = True
@@ -406,14 +1846,14 @@ def action_key_press(keys_to_press_list, description=""):
         play_sound_feedback("error.wav")
         # action_successful reste False
     finally:
-        if ov: ov.after(200, lambda r=ov: safe_destroy_overlay(r)) # Assurer que ov est défini
+        action_overlay.expire_after(0.2)
         return action_successful
 
 
 def action_pause(duration_seconds, description=""):
     logging.info(f"Exécution: PAUSE pour {duration_seconds}s Description: {description}")
     rich_print(f"Exécution: PAUSE pour {duration_seconds}s Description: {description}")
-    overlay = create_action_overlay(f"PAUSE {duration_seconds}s\n{description[:30]}", SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2, color="blue")
+    create_action_overlay(f"PAUSE {duration_seconds}s\n{description[:30]}", SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2, color="blue")
     action_successful = False
     try:
         duration_val = float(duration_seconds)
@@ -427,7 +1867,35 @@ def action_pause(duration_seconds, description=""):
     except Exception as e:
         logging.error(f"Erreur inattendue durant PAUSE: {e}")
     finally:
-        if overlay: safe_destroy_overlay(overlay) # Laisser create_action_overlay gérer sa propre durée principale
+        action_overlay.hide()
+        return action_successful
+
+def action_wait_until_stable(timeout_seconds=None, description=""):
+    try:
+        timeout_val = float(timeout_seconds) if timeout_seconds is not None else SETTLE_TIMEOUT_S
+    except (TypeError, ValueError):
+        logging.warning(f"WAIT_UNTIL_STABLE: timeout invalide '{timeout_seconds}'. Utilisation de {SETTLE_TIMEOUT_S}s.")
+        timeout_val = SETTLE_TIMEOUT_S
+    timeout_val = max(0.0, min(timeout_val, SETTLE_MAX_WAIT_UNTIL_STABLE_S))
+    logging.info(f"Exécution: WAIT_UNTIL_STABLE (timeout {timeout_val}s) Description: {description}")
+    rich_print(f"Exécution: WAIT_UNTIL_STABLE (timeout {timeout_val}s) Description: {description}")
+    create_action_overlay(f"ATTENTE STABILITÉ\n{description[:30]}", SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2, color="blue")
+    action_successful = False
+    try:
+        if SETTLE_DETECTOR_ENABLED:
+            stable, elapsed, _ = wait_for_screen_stable(timeout_s=timeout_val)
+            if stable:
+                logging.info(f"Écran stable après {elapsed:.2f}s.")
+            else:
+                logging.warning(f"WAIT_UNTIL_STABLE: écran toujours en mouvement après {elapsed:.2f}s, poursuite.")
+                rich_print(f"[yellow]WAIT_UNTIL_STABLE: écran toujours en mouvement après {elapsed:.2f}s, poursuite.[/yellow]")
+        else:
+            time.sleep(min(timeout_val, POST_ACTION_FIXED_DELAY_S))
+        action_successful = True # Un timeout n'est pas un échec: l'étape suivante évaluera l'écran
+    except Exception as e:
+        logging.error(f"Erreur inattendue durant WAIT_UNTIL_STABLE: {e}")
+    finally:
+        action_overlay.hide()
         return action_successful
 
 def action_finished_vlm(reason="VLM: L'instruction semble terminée.", description=""):
@@ -436,8 +1904,77 @@ def action_finished_vlm(reason="VLM: L'instruction semble terminée.", descripti
     play_sound_feedback("ok.wav")
     return True # Cette action elle-même réussit toujours, son impact est logique.
 
+# --- Dispatch des Micro-Actions ---
+ACTION_FUNCTION_MAP = {
+    "CLICK": action_click, "DOUBLE_CLICK": action_double_click,
+    "INPUT": action_input_text, "SCROLL": action_scroll,
+    "PRESS_ENTER": action_press_enter, "KEY_PRESS": action_key_press,
+    "PAUSE": action_pause, "WAIT_UNTIL_STABLE": action_wait_until_stable,
+    "FINISHED": action_finished_vlm
+}
+
+def execute_micro_action(micro_action):
+    """Exécute une micro-action validée via la fonction action_* correspondante. Retourne True si elle a réussi."""
+    m_act_type = micro_action.get("action_type")
+    m_desc = micro_action.get("description", "N/A")
+    action_func = ACTION_FUNCTION_MAP.get(m_act_type)
+    if action_func is None:
+        logging.error(f"Type d'action '{m_act_type}' inconnu ou non géré. Action ignorée. Action: {micro_action}")
+        rich_print(f"[red]Type d'action '{m_act_type}' inconnu. Action ignorée.[/red]")
+        return False
+    with stage_tracer.span(f"action.{m_act_type}"):
+        try:
+            if m_act_type in ["CLICK", "DOUBLE_CLICK"]:
+                return action_func(micro_action["position"], m_desc)
+            elif m_act_type == "INPUT":
+                return action_func(micro_action["value"], micro_action.get("position"), m_desc, micro_action.get("press_enter", False))
+            elif m_act_type == "SCROLL":
+                return action_func(micro_action["direction"], m_desc)
+            elif m_act_type == "KEY_PRESS":
+                return action_func(micro_action["keys"], m_desc)
+            elif m_act_type == "PAUSE":
+                return action_func(micro_action["duration_seconds"], m_desc)
+            elif m_act_type == "WAIT_UNTIL_STABLE":
+                return action_func(micro_action.get("timeout_seconds"), m_desc)
+            elif m_act_type == "FINISHED":
+                return action_func(micro_action.get("reason", "Raison non spécifiée."), m_desc)
+            else: # PRESS_ENTER
+                return action_func(m_desc)
+        except KeyError as ke:
+            logging.error(f"Champ manquant pour micro-action {m_act_type}: {ke}. Action: {micro_action}")
+            rich_print(f"[red]Champ manquant pour micro-action {m_act_type}: {ke}. Action ignorée.[/red]")
+        except Exception as e_action_exec:
+            logging.error(f"Erreur inattendue durant exécution {m_act_type}: {e_action_exec}")
+            rich_print(f"[red]Erreur exécution {m_act_type}: {e_action_exec}[/red]")
+    return False
+
+def coalesce_input_micro_actions(micro_actions):
+    """Fusionne les saisies adjacentes en une seule micro-action INPUT: les INPUT suivants sans nouvelle position
+    (même champ) sont concaténés et un PRESS_ENTER qui suit devient 'press_enter'. Supprime les pauses entre
+    fragments et permet un seul collage. La séquence d'origine (historique, cache VLM) n'est pas modifiée.
+    """
+    if not INPUT_COALESCE_ENABLED:
+        return list(micro_actions)
+    plan = []
+    for micro_action in micro_actions:
+        previous = plan[-1] if plan else None
+        action_type = micro_action.get("action_type")
+        if previous is not None and previous.get("action_type") == "INPUT" and not previous.get("press_enter"):
+            merged_count = previous.get("coalesced_count", 1) + 1
+            description = f"{previous.get('description', '')} + {micro_action.get('description', '')}"
+            if action_type == "INPUT" and micro_action.get("position") is None:
+                plan[-1] = dict(previous, value=f"{previous['value']}{micro_action['value']}", description=description, coalesced_count=merged_count)
+                continue
+            if action_type == "PRESS_ENTER":
+                plan[-1] = dict(previous, press_enter=True, description=description, coalesced_count=merged_count)
+                continue
+        plan.append(micro_action)
+    if len(plan) < len(micro_actions):
+        logging.info(f"Saisies fusionnées: {len(micro_actions)} micro-actions exécutées en {len(plan)} dispatch(s).")
+    return plan
+
 # --- Fonctions de l'Agent ---
-def image_to_base64_url(image_path_or_obj, target_format="PNG"): # Renommé format -> target_format
+def image_to_base64_url(image_path_or_obj, target_format="PNG", quality=None, resize_to=None): # Renommé format -> target_format
     try:
         img = None
         if isinstance(image_path_or_obj, str):
@@ -448,12 +1985,18 @@ def image_to_base64_url(image_path_or_obj, target_format="PNG"): # Renommé form
         else:
             raise ValueError("image_path_or_obj doit être un chemin (str) ou un objet PIL.Image.")
 
+        if resize_to and tuple(resize_to) != img.size:
+            img = img.resize(tuple(resize_to), Image.LANCZOS)
+
         # Assurer la conversion en RGB pour les formats qui ne supportent pas l'alpha (comme JPEG)
         if target_format.upper() == "JPEG" and (img.mode == 'RGBA' or img.mode == 'LA' or img.mode == 'P'):
             img = img.convert('RGB')
-        
+
+        save_kwargs = {}
+        if quality is not None and target_format.upper() in ("JPEG", "WEBP"):
+            save_kwargs["quality"] = int(quality)
         buffered = io.BytesIO()
-        img.save(buffered, format=target_format) # Utiliser target_format
+        img.save(buffered, format=target_format, **save_kwargs) # Utiliser target_format
         base64_str = base64.b64encode(buffered.getvalue()).decode('utf-8')
         return f"data:image/{target_format.lower()};base64,{base64_str}"
     except Exception as e:
@@ -461,6 +2004,158 @@ def image_to_base64_url(image_path_or_obj, target_format="PNG"): # Renommé form
         rich_print(f"[red]Erreur d'encodage image: {e}[/red]")
         return None
 
+# --- Pipeline d'encodage des captures (redimensionnement, codec, encodage unique par frame) ---
+EncodedFrame = namedtuple("EncodedFrame", ["data_url", "size", "image_format", "quality", "payload_bytes", "encode_ms", "estimated_image_tokens", "from_cache"])
+
+def parse_image_size_spec(size_spec):
+    """Convertit "1280x800" / "1280" en tuple (largeur, hauteur). "native" ou vide -> None (pas de redimensionnement)."""
+    if not size_spec or str(size_spec).strip().lower() in ("native", "none", "0"):
+        return None
+    parts = str(size_spec).lower().replace(" ", "").split("x")
+    try:
+        if len(parts) == 1:
+            return (int(parts[0]), int(parts[0]))
+        return (int(parts[0]), int(parts[1]))
+    except ValueError:
+        logging.warning(f"Taille d'image invalide '{size_spec}'. Utilisation de la résolution native.")
+        return None
+
+def compute_fitted_image_size(source_size, max_size):
+    """Taille qui tient dans la boîte max_size en conservant le ratio (jamais d'agrandissement)."""
+    src_w, src_h = source_size
+    if not max_size or src_w <= 0 or src_h <= 0:
+        return (src_w, src_h)
+    scale = min(max_size[0] / src_w, max_size[1] / src_h, 1.0)
+    return (max(1, round(src_w * scale)), max(1, round(src_h * scale)))
+
+def estimate_image_prefill_tokens(width, height, detail="high", patch_size=28):
+    """Estimation du coût de prefill d'une image: un token par patch de 28px (type Qwen2-VL), indicative pour les VLM locaux."""
+    if detail == "low":
+        width, height = compute_fitted_image_size((width, height), (512, 512))
+    return math.ceil(width / patch_size) * math.ceil(height / patch_size)
+
+class FrameEncodingCache:
+    """Encode la frame courante une seule fois par (taille, codec, qualité) et réutilise le résultat pour le VLM et Qwen."""
+
+    def __init__(self):
+        self._frame = None
+        self._entries = {}
+        self._lock = threading.Lock() # Encodages VLM et Qwen en parallèle (moteur asynchrone)
+
+    def encode(self, frame, max_size_spec=VLM_IMAGE_MAX_SIZE, image_format=VLM_IMAGE_FORMAT, quality=VLM_IMAGE_QUALITY, detail=VLM_IMAGE_DETAIL):
+        target_size = compute_fitted_image_size(frame.size, parse_image_size_spec(max_size_spec))
+        effective_quality = None if image_format == "PNG" else quality
+        key = (target_size, image_format, effective_quality)
+        with self._lock:
+            if frame is not self._frame: # Nouvelle frame: on oublie les encodages précédents
+                self._frame = frame
+                self._entries = {}
+            cached = self._entries.get(key)
+        if cached:
+            return cached._replace(from_cache=True)
+
+        t_start = time.perf_counter()
+        data_url = image_to_base64_url(frame, target_format=image_format, quality=effective_quality, resize_to=target_size)
+        encode_ms = (time.perf_counter() - t_start) * 1000
+        if not data_url:
+            return None
+        encoded = EncodedFrame(data_url, target_size, image_format, effective_quality, len(data_url), encode_ms,
+                               estimate_image_prefill_tokens(target_size[0], target_size[1], detail), False)
+        with self._lock:
+            if frame is self._frame:
+                self._entries[key] = encoded
+        return encoded
+
+def log_frame_encoding(label, frame, encoded):
+    """Journalise le coût d'encodage d'une frame (temps, taille de la charge utile, tokens de prefill estimés)."""
+    native_tokens = estimate_image_prefill_tokens(frame.size[0], frame.size[1])
+    msg = (f"Encodage {label}: {encoded.size[0]}x{encoded.size[1]} {encoded.image_format}"
+           f"{f' q{encoded.quality}' if encoded.quality is not None else ''} (natif {frame.size[0]}x{frame.size[1]}), "
+           f"{encoded.payload_bytes / 1024:.0f} Ko base64, "
+           f"{'réutilisé depuis le cache' if encoded.from_cache else f'{encoded.encode_ms:.1f} ms'}, "
+           f"~{encoded.estimated_image_tokens} tokens image estimés (vs ~{native_tokens} en natif)")
+    logging.info(msg)
+    rich_print(f"[grey50]{msg}[/grey50]")
+
+frame_encoding_cache = FrameEncodingCache()
+
+# --- Hash Perceptuel des Captures ---
+_PHASH_DCT_MATRICES = {}
+
+def compute_perceptual_hash(frame, hash_size=8, highfreq_factor=4):
+    """pHash 64 bits (DCT sur une réduction 32x32 en niveaux de gris), robuste aux petites variations de rendu."""
+    img_size = hash_size * highfreq_factor
+    dct_matrix = _PHASH_DCT_MATRICES.get(img_size)
+    if dct_matrix is None:
+        n = np.arange(img_size)
+        dct_matrix = np.cos(np.pi * (2 * n[None, :] + 1) * n[:, None] / (2 * img_size))
+        _PHASH_DCT_MATRICES[img_size] = dct_matrix
+    small = frame.resize((img_size, img_size), Image.BILINEAR, reducing_gap=3.0).convert("L")
+    pixels = np.asarray(small, dtype=np.float64)
+    low_freq = (dct_matrix @ pixels @ dct_matrix.T)[:hash_size, :hash_size]
+    bits = (low_freq > np.median(low_freq)).flatten()
+    return int("".join("1" if b else "0" for b in bits), 2)
+
+def hamming_distance(hash_a, hash_b):
+    return bin(hash_a ^ hash_b).count("1")
+
+VLM_MISSING_THOUGHT_PLACEHOLDER = "N/A (non fourni par VLM ou null)"
+VLM_GLOBAL_THOUGHT_KEYS = [
+    "Current State Summary", "User's Current Instruction", "Previous Action Assessment",
+    "Current Screen Analysis (Brief)", "Next Immediate Sub-goal for THIS Instruction",
+    "Action Justification & Selection", "Anticipated Next Step AFTER THIS sequence"
+]
+
+def validate_vlm_micro_action(micro_action, i):
+    """Valide (et normalise en place) une micro-action VLM. Retourne False si elle est inutilisable."""
+    if not isinstance(micro_action, dict):
+        logging.error(f"Micro-action {i} n'est pas un objet JSON. Contenu: {micro_action}")
+        rich_print(f"[red]Erreur VLM: Micro-action {i} n'est pas un objet JSON.[/red]")
+        return False
+
+    action_type = micro_action.get("action_type")
+    if not action_type: # action_type est obligatoire
+        logging.error(f"Micro-action {i} (Description: {micro_action.get('description','N/A')}) manque 'action_type'.")
+        rich_print(f"[red]Erreur VLM: Micro-action {i} manque 'action_type'.[/red]")
+        return False
+
+    micro_action.setdefault("description", f"Action VLM {i+1} ({action_type}) sans description explicite")
+
+    if action_type in ["CLICK", "DOUBLE_CLICK"]:
+        if micro_action.get("position") is None:
+            logging.error(f"'position' requise et manquante/null pour '{action_type}' (micro_action {i}).")
+            rich_print(f"[red]Erreur VLM: 'position' est requise pour {action_type}.[/red]")
+            return False
+    # ... (validation plus poussée des champs par action_type, comme dans la version précédente)
+    if "position" in micro_action and micro_action["position"] is not None: # Validation et normalisation de la position
+        pos = micro_action["position"]
+        if not (isinstance(pos, list) and len(pos) == 2 and all(isinstance(p, (float, int, str)) for p in pos)):
+            logging.error(f"Format 'position' invalide pour micro_action {i} ('{action_type}'): {pos}")
+            return False
+        try:
+            raw_x, raw_y = float(pos[0]), float(pos[1])
+            norm_x, norm_y = screen_geometry.pixels_to_norm(raw_x, raw_y)
+            micro_action["position"] = [max(0.0, min(1.0, norm_x)), max(0.0, min(1.0, norm_y))]
+        except ValueError:
+            logging.error(f"Impossible de convertir position en nombres pour micro_action {i} ('{action_type}'): {pos}")
+            return False
+
+    if action_type == "INPUT" and "value" not in micro_action: # 'value' peut être vide, mais la clé doit exister
+         logging.error(f"'value' requise pour 'INPUT' (micro_action {i})."); return False
+    if action_type == "SCROLL" and micro_action.get("direction") not in ["up", "down"]:
+         logging.error(f"'direction' (up/down) requise et valide pour 'SCROLL' (micro_action {i}). Reçu: {micro_action.get('direction')}"); return False
+    if action_type == "KEY_PRESS" and (not isinstance(micro_action.get("keys"), list) or not micro_action.get("keys")):
+         logging.error(f"'keys' (liste non vide) requise pour 'KEY_PRESS' (micro_action {i})."); return False
+    if action_type == "PAUSE":
+        if "duration_seconds" not in micro_action:
+             logging.error(f"'duration_seconds' requise pour 'PAUSE' (micro_action {i})."); return False
+        try: float(micro_action["duration_seconds"])
+        except ValueError: logging.error(f"'duration_seconds' doit être un nombre pour 'PAUSE' (micro_action {i}). Reçu: {micro_action['duration_seconds']}"); return False
+    if action_type == "WAIT_UNTIL_STABLE" and micro_action.get("timeout_seconds") is not None:
+        try: float(micro_action["timeout_seconds"])
+        except (TypeError, ValueError): logging.error(f"'timeout_seconds' doit être un nombre pour 'WAIT_UNTIL_STABLE' (micro_action {i}). Reçu: {micro_action['timeout_seconds']}"); return False
+    return True
+
 def parse_vlm_output_to_sequence(vlm_response_str: str):
     json_str_to_parse = None
     cleaned_str = vlm_response_str.strip()
@@ -497,18 +2192,13 @@ def parse_vlm_output_to_sequence(vlm_response_str: str):
             return None
 
         parsed_global_thought = {}
-        expected_thought_keys = [
-            "Current State Summary", "User's Current Instruction", "Previous Action Assessment",
-            "Current Screen Analysis (Brief)", "Next Immediate Sub-goal for THIS Instruction",
-            "Action Justification & Selection", "Anticipated Next Step AFTER THIS sequence"
-        ]
         incomplete_thought = False
-        for key in expected_thought_keys:
+        for key in VLM_GLOBAL_THOUGHT_KEYS:
             value = global_thought_raw.get(key)
             if value is None: # Clé manquante
                 logging.warning(f"'global_thought' manque la clé '{key}'. Utilisation de 'N/A'.")
                 rich_print(f"[yellow]Avertissement VLM: 'global_thought' manque la clé '{key}'. Utilisation de 'N/A'.[/yellow]")
-                parsed_global_thought[key] = "N/A (non fourni par VLM ou null)"
+                parsed_global_thought[key] = VLM_MISSING_THOUGHT_PLACEHOLDER
                 incomplete_thought = True
             else:
                  parsed_global_thought[key] = value
@@ -520,52 +2210,8 @@ def parse_vlm_output_to_sequence(vlm_response_str: str):
 
         validated_sequence = []
         for i, micro_action in enumerate(action_sequence_raw):
-            if not isinstance(micro_action, dict):
-                logging.error(f"Micro-action {i} n'est pas un objet JSON. Contenu: {micro_action}")
-                rich_print(f"[red]Erreur VLM: Micro-action {i} n'est pas un objet JSON.[/red]")
-                return None
-            
-            action_type = micro_action.get("action_type")
-            if not action_type: # action_type est obligatoire
-                logging.error(f"Micro-action {i} (Description: {micro_action.get('description','N/A')}) manque 'action_type'.")
-                rich_print(f"[red]Erreur VLM: Micro-action {i} manque 'action_type'.[/red]")
+            if not validate_vlm_micro_action(micro_action, i):
                 return None
-            
-            micro_action.setdefault("description", f"Action VLM {i+1} ({action_type}) sans description explicite")
-
-
-            if action_type in ["CLICK", "DOUBLE_CLICK"]:
-                if micro_action.get("position") is None:
-                    logging.error(f"'position' requise et manquante/null pour '{action_type}' (micro_action {i}).")
-                    rich_print(f"[red]Erreur VLM: 'position' est requise pour {action_type}.[/red]")
-                    return None
-            # ... (validation plus poussée des champs par action_type, comme dans la version précédente)
-            if "position" in micro_action and micro_action["position"] is not None: # Validation et normalisation de la position
-                pos = micro_action["position"]
-                if not (isinstance(pos, list) and len(pos) == 2 and all(isinstance(p, (float, int, str)) for p in pos)):
-                    logging.error(f"Format 'position' invalide pour micro_action {i} ('{action_type}'): {pos}")
-                    return None
-                try:
-                    raw_x, raw_y = float(pos[0]), float(pos[1])
-                    norm_x = raw_x / SCREEN_WIDTH if (abs(raw_x) > 1.0001 and SCREEN_WIDTH > 0) else raw_x
-                    norm_y = raw_y / SCREEN_HEIGHT if (abs(raw_y) > 1.0001 and SCREEN_HEIGHT > 0) else raw_y
-                    micro_action["position"] = [max(0.0, min(1.0, norm_x)), max(0.0, min(1.0, norm_y))]
-                except ValueError:
-                    logging.error(f"Impossible de convertir position en nombres pour micro_action {i} ('{action_type}'): {pos}")
-                    return None
-            
-            if action_type == "INPUT" and "value" not in micro_action: # 'value' peut être vide, mais la clé doit exister
-                 logging.error(f"'value' requise pour 'INPUT' (micro_action {i})."); return None
-            if action_type == "SCROLL" and micro_action.get("direction") not in ["up", "down"]:
-                 logging.error(f"'direction' (up/down) requise et valide pour 'SCROLL' (micro_action {i}). Reçu: {micro_action.get('direction')}"); return None
-            if action_type == "KEY_PRESS" and (not isinstance(micro_action.get("keys"), list) or not micro_action.get("keys")):
-                 logging.error(f"'keys' (liste non vide) requise pour 'KEY_PRESS' (micro_action {i})."); return None
-            if action_type == "PAUSE":
-                if "duration_seconds" not in micro_action:
-                     logging.error(f"'duration_seconds' requise pour 'PAUSE' (micro_action {i})."); return None
-                try: float(micro_action["duration_seconds"])
-                except ValueError: logging.error(f"'duration_seconds' doit être un nombre pour 'PAUSE' (micro_action {i}). Reçu: {micro_action['duration_seconds']}"); return None
-            
             validated_sequence.append(micro_action)
 
         if incomplete_thought:
@@ -584,30 +2230,622 @@ def parse_vlm_output_to_sequence(vlm_response_str: str):
         rich_print(f"[red]Erreur VLM inattendue durant parsing: {e}. Entrée: '{cleaned_str[:200]}...'[/red]")
         return None
 
-def build_messages_for_vlm_api(system_prompt_content, current_instruction_for_vlm, image_base64_url, vlm_execution_history_summary_list):
-    user_text_content = f"Current Specific Instruction from Supervisor: {current_instruction_for_vlm}"
-    if vlm_execution_history_summary_list: # Limiter la taille de l'historique
-        user_text_content += "\n\n--- Summary of Your Previous VLM Steps & Outcomes (for this overall task, max 3 recent shown) ---"
-        for i, summary_line in enumerate(vlm_execution_history_summary_list[-3:]):
-            user_text_content += f"\n{len(vlm_execution_history_summary_list) - min(3, len(vlm_execution_history_summary_list)) + i + 1}. {summary_line}"
-    else:
-        user_text_content += "\n\n--- No previous VLM steps for this current VLM instruction phase. ---"
+# --- Historique d'Interaction Structuré ---
+VlmHistoryWindow = namedtuple("VlmHistoryWindow", ["total_count", "recent_lines"])
+
+class InteractionRecord:
+    """Entrée compacte d'historique pour une étape. Les lignes de résumé des prompts VLM et Qwen sont calculées une fois."""
+    __slots__ = ("step_count", "vlm_instruction", "decision_type", "reasoning", "executed_action_sequence",
+                 "vlm_summary_line", "qwen_summary_body", "verbose_log")
+
+    def __init__(self, step_count, vlm_instruction, qwen_decision_obj, executed_action_sequence, verbose_log=None):
+        reasoning = qwen_decision_obj.get("reasoning", "N/A")
+        self.step_count = step_count
+        self.vlm_instruction = vlm_instruction
+        self.decision_type = qwen_decision_obj.get("decision_type")
+        self.reasoning = reasoning[:150] + "..." if len(qwen_decision_obj.get("reasoning", "")) > 150 else reasoning
+        self.executed_action_sequence = executed_action_sequence or None
+        self.verbose_log = verbose_log
+        self.vlm_summary_line = self._build_vlm_summary_line()
+        self.qwen_summary_body = self._build_qwen_summary_body()
+
+    def executed_action_types(self, unknown_label):
+        return [a.get('action_type', unknown_label) for a in self.executed_action_sequence or [] if isinstance(a, dict)]
+
+    def _build_vlm_summary_line(self):
+        """Ligne de résumé (concise) pour le prompt VLM."""
+        summary_line = (f"Prev. VLM instruction: '{(self.vlm_instruction or 'N/A')[:100]}...'. "
+                        f"Qwen decided: '{self.decision_type or 'N/A'}' (Reason: '{(self.reasoning or 'N/A')[:100]}...') ")
+        if self.executed_action_sequence:
+            summary_line += f" Executed: {self.executed_action_types('?')}."
+        else:
+            summary_line += " No direct GUI actions taken or other path chosen."
+        return summary_line
+
+    def _build_qwen_summary_body(self):
+        """Résumé pour le prompt Qwen, sans le préfixe 'Step N.'."""
+        summary_line = f"Your (Qwen) Prev Decision: '{self.decision_type or 'N/A'}' for VLM instruction: '{self.vlm_instruction or 'N/A'}'. "
+        summary_line += f"Your Reason: '{self.reasoning or 'N/A'}'. "
+        if self.executed_action_sequence:
+            summary_line += f" Actions then executed: {self.executed_action_types('UNKNOWN')}. "
+        elif self.decision_type not in ["EXECUTE_VLM_SEQUENCE", "EXECUTE_MODIFIED_SEQUENCE"]:
+            summary_line += f" No direct GUI actions were executed based on Qwen's decision type '{self.decision_type or 'N/A'}'. "
+        return summary_line.strip()
+
+class InteractionHistory:
+    """Historique d'une tâche: ajout et accès à la fenêtre récente en O(1), sans re-parsing JSON à chaque étape.
+
+    Avec 'keep_verbose_in_memory' à False, la partie verbeuse de chaque étape n'est conservée que dans le journal
+    détaillé écrit sur disque par le PersistenceWorker.
+    """
+
+    def __init__(self, keep_verbose_in_memory=INTERACTION_HISTORY_KEEP_VERBOSE_IN_MEMORY):
+        self.keep_verbose_in_memory = keep_verbose_in_memory
+        self._records = []
+
+    def __len__(self):
+        return len(self._records)
+
+    def __bool__(self):
+        return bool(self._records)
+
+    def append(self, record):
+        if not self.keep_verbose_in_memory:
+            record.verbose_log = None
+        self._records.append(record)
+
+    def recent(self, count):
+        return self._records[-count:] if count > 0 else []
+
+    def vlm_prompt_window(self, pending_record=None, window_size=3):
+        """Fenêtre des résumés VLM récents (avec éventuellement l'entrée de l'étape en cours, pour la spéculation)."""
+        lines = [r.vlm_summary_line for r in self.recent(window_size)]
+        total_count = len(self._records)
+        if pending_record is not None:
+            lines, total_count = (lines + [pending_record.vlm_summary_line])[-window_size:], total_count + 1
+        return VlmHistoryWindow(total_count, tuple(lines))
+
+    def qwen_summary_lines(self, window_size=3):
+        """Résumés Qwen des étapes récentes, de la plus ancienne à la plus récente (les lignes déjà envoyées restent en préfixe)."""
+        return [f"Step {record.step_count}. {record.qwen_summary_body}" for record in self.recent(window_size)]
+
+# --- Assemblage des Prompts (préfixe stable pour la réutilisation du cache KV du serveur) ---
+# Ordre imposé, du plus stable au plus volatil: prompt système, consignes statiques, contexte de la tâche,
+# historique glissant, état courant, puis la capture d'écran en dernier. L'instruction VLM, réécrite par Qwen à
+# presque chaque étape, fait partie de l'état courant (l'objectif global reste le contexte de la tâche de Qwen). Deux requêtes successives partagent
+# ainsi le plus long préfixe possible octet pour octet, que le serveur n'a pas à recalculer (prefill).
+VLM_PROMPT_STATIC_PREAMBLE = ("Analyze the attached screenshot and follow the 'Current Specific Instruction from Supervisor' below. "
+                              "Your ENTIRE response MUST be a single valid JSON object as specified in the system prompt.")
+QWEN_PROMPT_STATIC_PREAMBLE = ("Provide your decision in the JSON format specified in the system prompt, based on the overall goal, "
+                               "the interaction history and the VLM status below. Ensure 'decision_type' is one of the allowed values and "
+                               "'action_sequence_to_execute' (if provided for EXECUTE_MODIFIED_SEQUENCE) uses the correct action format.")
+
+def stable_json_dumps(obj):
+    """Sérialisation compacte et déterministe pour les prompts (pas d'indentation: moins de tokens, même texte à contenu égal)."""
+    return json.dumps(obj, ensure_ascii=False, separators=(", ", ": "))
+
+def assemble_prompt_messages(system_prompt_content, static_text, task_text, rolling_text, volatile_text,
+                             image_base64_url=None, image_detail=VLM_IMAGE_DETAIL):
+    """Construit les messages dans l'ordre stable -> volatil (les sections vides sont omises)."""
+    user_text_content = "\n\n".join(part for part in (static_text, task_text, rolling_text, volatile_text) if part)
+    content_list = [{"type": "text", "text": user_text_content}]
+    if image_base64_url:
+        content_list.append({"type": "image_url", "image_url": {"url": image_base64_url, "detail": image_detail}})
+    return [{"role": "system", "content": system_prompt_content}, {"role": "user", "content": content_list}]
+
+def prompt_cache_request_kwargs(cache_slot, session_key, streaming=False):
+    """Arguments supplémentaires de chat.completions.create() pour la réutilisation du cache de prompt côté serveur."""
+    kwargs = {}
+    if PROMPT_CACHE_HINTS == "llama_cpp":
+        kwargs["extra_body"] = {"cache_prompt": True, "id_slot": cache_slot}
+    elif PROMPT_CACHE_HINTS == "openai":
+        kwargs["extra_body"] = {"prompt_cache_key": session_key}
+    if streaming: # Sans cela, l'usage (et donc les tokens en cache) n'est pas renvoyé en streaming
+        kwargs["stream_options"] = {"include_usage": True}
+    return kwargs
+
+def merge_request_kwargs(*kwargs_dicts):
+    """Fusionne des arguments de chat.completions.create(); les 'extra_body' sont fusionnés plutôt que remplacés."""
+    merged = {}
+    for kwargs in kwargs_dicts:
+        for key, value in kwargs.items():
+            merged[key] = {**merged[key], **value} if key == "extra_body" and key in merged else value
+    return merged
+
+def extract_prompt_cache_usage(usage, timings=None):
+    """Retourne (tokens de prompt, tokens servis depuis le cache) ou None pour une valeur inconnue.
+
+    Lit usage.prompt_tokens_details.cached_tokens (OpenAI, vLLM, llama.cpp récent) et, à défaut, les 'timings'
+    renvoyés par llama.cpp (cache_n = tokens réutilisés, prompt_n = tokens recalculés).
+    """
+    prompt_tokens = getattr(usage, "prompt_tokens", None) if usage is not None else None
+    cached_tokens = None
+    details = getattr(usage, "prompt_tokens_details", None) if usage is not None else None
+    if details is not None:
+        cached_tokens = details.get("cached_tokens") if isinstance(details, dict) else getattr(details, "cached_tokens", None)
+    if cached_tokens is None and isinstance(timings, dict) and "cache_n" in timings:
+        cached_tokens = timings["cache_n"]
+        if prompt_tokens is None and "prompt_n" in timings:
+            prompt_tokens = timings["prompt_n"] + timings["cache_n"]
+    return prompt_tokens, cached_tokens
+
+class PromptCacheStats:
+    """Cumule, par tâche et par modèle, les tokens de prompt et ceux réutilisés depuis le cache KV du serveur."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.per_label = {}
+
+    def record(self, label, usage, timings=None):
+        prompt_tokens, cached_tokens = extract_prompt_cache_usage(usage, timings)
+        if prompt_tokens is None:
+            return
+        totals = self.per_label.setdefault(label, {"calls": 0, "prompt_tokens": 0, "cached_tokens": 0, "reported": 0})
+        totals["calls"] += 1
+        totals["prompt_tokens"] += prompt_tokens
+        completion_tokens = getattr(usage, "completion_tokens", None) if usage is not None else None
+        if cached_tokens is None:
+            logging.info(f"Tokens {label}: prompt={prompt_tokens}, complétion={completion_tokens} (tokens en cache non rapportés par le serveur)")
+            return
+        totals["cached_tokens"] += cached_tokens
+        totals["reported"] += 1
+        logging.info(f"Tokens {label}: prompt={prompt_tokens} dont {cached_tokens} en cache (prefill calculé: {prompt_tokens - cached_tokens}), "
+                     f"complétion={completion_tokens}")
+
+    def stats_summary(self):
+        if not self.per_label:
+            return "Cache de prompt: aucun usage rapporté par le serveur."
+        parts = []
+        for label, totals in self.per_label.items():
+            ratio = (100.0 * totals["cached_tokens"] / totals["prompt_tokens"]) if totals["prompt_tokens"] else 0.0
+            parts.append(f"{label}: {totals['cached_tokens']}/{totals['prompt_tokens']} tokens de prompt en cache ({ratio:.0f}%, "
+                         f"{totals['reported']}/{totals['calls']} appels rapportés)")
+        return "Cache de prompt: " + "; ".join(parts)
+
+prompt_cache_stats = PromptCacheStats()
+
+def build_messages_for_vlm_api(system_prompt_content, current_instruction_for_vlm, image_base64_url, vlm_execution_history_summary_list, image_detail=VLM_IMAGE_DETAIL, history_total_count=None):
+    instruction_text = f"Current Specific Instruction from Supervisor: {current_instruction_for_vlm}"
+    if vlm_execution_history_summary_list: # Limiter la taille de l'historique
+        recent_summary_lines = list(vlm_execution_history_summary_list)[-3:]
+        total_count = history_total_count if history_total_count is not None else len(vlm_execution_history_summary_list)
+        rolling_text = "--- Summary of Your Previous VLM Steps & Outcomes (for this overall task, max 3 recent shown) ---"
+        for i, summary_line in enumerate(recent_summary_lines):
+            rolling_text += f"\n{total_count - len(recent_summary_lines) + i + 1}. {summary_line}"
+    else:
+        rolling_text = "--- No previous VLM steps for this current VLM instruction phase. ---"
+    # L'instruction change plus souvent que l'historique: elle suit l'historique, juste avant la capture d'écran
+    return assemble_prompt_messages(system_prompt_content, VLM_PROMPT_STATIC_PREAMBLE, "", rolling_text, instruction_text,
+                                    image_base64_url, image_detail)
+
+# --- Streaming VLM: parsing JSON incrémental et dispatch anticipé ---
+class IncrementalVlmJsonParser:
+    """Suit l'objet { "global_thought": ..., "action_sequence": [...] } au fil des tokens reçus.
+
+    feed() retourne chaque micro-action dès que son accolade fermante arrive; 'done' passe à True quand
+    l'objet de premier niveau est fermé (le texte éventuel avant la première accolade, ex: ```json, est ignoré).
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.done = False
+        self.completed_actions = []
+        self._pos = 0
+        self._depth = 0
+        self._started = False
+        self._in_string = False
+        self._escape = False
+        self._string_start = None
+        self._last_top_level_string = None # Dernière chaîne au niveau 1: la clé qui précède une valeur tableau/objet
+        self._in_action_array = False
+        self._action_start = None
+        self.end_index = None
+
+    def feed(self, chunk):
+        if self.done or not chunk:
+            return []
+        self.text += chunk
+        new_actions = []
+        text = self.text
+        while self._pos < len(text):
+            idx, ch = self._pos, text[self._pos]
+            self._pos += 1
+            if not self._started:
+                if ch == "{":
+                    self._started, self._depth = True, 1
+                continue
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._depth == 1:
+                        self._last_top_level_string = text[self._string_start + 1:idx]
+                continue
+            if ch == '"':
+                self._in_string, self._string_start = True, idx
+            elif ch in "{[":
+                self._depth += 1
+                if ch == "[" and self._depth == 2 and self._last_top_level_string == "action_sequence":
+                    self._in_action_array = True
+                elif ch == "{" and self._in_action_array and self._depth == 3:
+                    self._action_start = idx
+            elif ch in "}]":
+                if ch == "}" and self._in_action_array and self._depth == 3 and self._action_start is not None:
+                    try:
+                        micro_action = json.loads(text[self._action_start:idx + 1])
+                        self.completed_actions.append(micro_action)
+                        new_actions.append(micro_action)
+                    except json.JSONDecodeError as e:
+                        logging.debug(f"Streaming VLM: micro-action non décodable ignorée ({e}).")
+                    self._action_start = None
+                elif ch == "]" and self._in_action_array and self._depth == 2:
+                    self._in_action_array = False
+                self._depth -= 1
+                if self._depth == 0:
+                    self.done, self.end_index = True, idx
+                    break
+        return new_actions
+
+def should_dispatch_micro_action_early(micro_action, index, already_dispatched, consecutive_vlm_failures):
+    """Politique de dispatch anticipé d'une micro-action reçue en streaming, avant l'approbation de Qwen.
+
+    Remplaçable par l'utilisateur. Politique "allowlist": seules les actions en tête de séquence, de type autorisé,
+    sont exécutées tôt, et uniquement si l'instruction courante n'a pas d'échec VLM en cours.
+    """
+    if VLM_EARLY_DISPATCH_POLICY != "allowlist" or consecutive_vlm_failures > 0:
+        return False
+    if len(already_dispatched) != index: # Uniquement un préfixe contigu de la séquence
+        return False
+    return micro_action.get("action_type") in VLM_EARLY_DISPATCH_ACTION_TYPES
+
+def _open_vlm_stream(api_messages):
+    """open_fn pour run_model_request: ouvre le flux VLM et le lit jusqu'au premier token de contenu."""
+    def open_fn(replica, cancel_event):
+        stream, constraint = structured_output.create("VLM", lambda constraint_kwargs: replica.client.chat.completions.create(
+            model=VLM_MODEL_NAME_FOR_API,
+            messages=api_messages,
+            max_tokens=1500,
+            temperature=0.01,
+            stream=True,
+            timeout=VLM_REQUEST_TIMEOUT_S,
+            **merge_request_kwargs(prompt_cache_request_kwargs(VLM_PROMPT_CACHE_SLOT, "vlm", streaming=True), constraint_kwargs)
+        ))
+        iterator = iter(stream)
+        buffered_chunks = []
+        try:
+            for chunk in iterator:
+                buffered_chunks.append(chunk)
+                if chunk.choices and chunk.choices[0].delta.content:
+                    break
+                if cancel_event is not None and cancel_event.is_set():
+                    break
+        except BaseException:
+            stream.close()
+            raise
+        return {"stream": stream, "iterator": iterator, "buffered_chunks": buffered_chunks, "constraint": constraint}
+    return open_fn
+
+def _close_vlm_stream(opened_stream):
+    opened_stream["stream"].close()
+
+def request_vlm_completion(endpoint_pool, api_messages, on_micro_action=None, cancel_event=None):
+    """Envoie la requête VLM (en streaming si activé) et retourne un dict décrivant la réponse.
+
+    En streaming, 'on_micro_action' est appelé pour chaque micro-action complète dès sa réception et la génération
+    est interrompue dès que l'objet JSON de premier niveau est fermé. Les reprises et le hedging (vlm_request_policy)
+    ne s'appliquent qu'avant le premier token: une fois des actions reçues, la requête n'est jamais rejouée.
+    """
+    result = {"raw": "", "ttft_ms": None, "total_ms": None, "usage": None, "timings": None, "streamed": VLM_STREAMING_ENABLED,
+              "stopped_early": False, "cancelled": False, "endpoint": None, "constraint": None}
+    t_start = time.perf_counter()
+    if not VLM_STREAMING_ENABLED:
+        (vlm_completion, result["constraint"]), lease, result["endpoint"] = run_model_request(
+            endpoint_pool, vlm_request_policy,
+            lambda replica, _cancel_event: structured_output.create("VLM", lambda constraint_kwargs: replica.client.chat.completions.create(
+                model=VLM_MODEL_NAME_FOR_API,
+                messages=api_messages,
+                max_tokens=1500, # Augmenté légèrement, mais attention au contexte
+                temperature=0.01, # Très bas pour la structure JSON
+                timeout=VLM_REQUEST_TIMEOUT_S,
+                **merge_request_kwargs(prompt_cache_request_kwargs(VLM_PROMPT_CACHE_SLOT, "vlm"), constraint_kwargs)
+            )))
+        lease.close()
+        result["raw"] = vlm_completion.choices[0].message.content or ""
+        result["usage"] = getattr(vlm_completion, "usage", None)
+        result["timings"] = getattr(vlm_completion, "timings", None)
+        result["total_ms"] = result["ttft_ms"] = (time.perf_counter() - t_start) * 1000
+        return result
+
+    opened_stream, lease, result["endpoint"] = run_model_request(endpoint_pool, vlm_request_policy,
+                                                                 _open_vlm_stream(api_messages), _close_vlm_stream)
+    result["constraint"] = opened_stream["constraint"]
+    parser = IncrementalVlmJsonParser()
+    with lease: # Réplica réservé jusqu'à la fin du streaming
+        try:
+            for chunk in itertools.chain(opened_stream["buffered_chunks"], opened_stream["iterator"]):
+                if cancel_event is not None and cancel_event.is_set():
+                    result["cancelled"] = True
+                    break
+                if getattr(chunk, "usage", None):
+                    result["usage"] = chunk.usage
+                if getattr(chunk, "timings", None):
+                    result["timings"] = chunk.timings
+                if not chunk.choices:
+                    continue
+                delta_text = chunk.choices[0].delta.content or ""
+                if not delta_text:
+                    continue
+                if result["ttft_ms"] is None:
+                    result["ttft_ms"] = (time.perf_counter() - t_start) * 1000
+                for micro_action in parser.feed(delta_text):
+                    if on_micro_action is not None:
+                        on_micro_action(micro_action)
+                if parser.done: # Objet JSON complet: inutile de payer les tokens suivants
+                    result["stopped_early"] = True
+                    break
+                if time.perf_counter() - t_start > VLM_REQUEST_TIMEOUT_S:
+                    raise ModelRequestTimeout(f"VLM: réponse toujours incomplète après {VLM_REQUEST_TIMEOUT_S:.0f}s.")
+        finally:
+            opened_stream["stream"].close() # Ferme la connexion HTTP: le serveur interrompt la génération
+    result["raw"] = parser.text[:parser.end_index + 1] if parser.done else parser.text
+    result["total_ms"] = (time.perf_counter() - t_start) * 1000
+    return result
+
+# --- Raffinement des Positions de Clic (grossier -> fin) ---
+GROUNDING_REFINE_SYSTEM_PROMPT = """You refine the position of a click target on a zoomed crop of a computer screen.
+The red circle marks a first estimate of the target position; it may be slightly off.
+Reply with ONLY a JSON object: {"found": true, "position": [x, y]} where x and y are the center of the target
+inside the crop, normalized between 0 and 1 ([0, 0] = top-left corner of the crop).
+If the target is not visible in the crop, reply {"found": false}."""
+
+class GroundingRefiner:
+    """Second passage VLM sur un recadrage agrandi autour d'une position de CLICK/DOUBLE_CLICK/INPUT.
+
+    Le recadrage est pris dans la capture déjà faite pour l'étape (aucune nouvelle capture): quelques centaines de pixels
+    au lieu de l'écran entier, donc une requête bien moins chère qu'une étape supplémentaire VLM + Qwen après un clic raté.
+    """
+
+    def __init__(self, policy=GROUNDING_REFINE_POLICY, crop_size=GROUNDING_REFINE_CROP_SIZE, zoom=GROUNDING_REFINE_ZOOM,
+                 small_target_keywords=GROUNDING_REFINE_SMALL_TARGET_KEYWORDS, max_per_step=GROUNDING_REFINE_MAX_PER_STEP):
+        self.policy = set() if "off" in policy else set(policy)
+        self.crop_size = max(32, crop_size)
+        self.zoom = max(1.0, zoom)
+        self.small_target_keywords = small_target_keywords
+        self.max_per_step = max_per_step
+        self.attempted = 0
+        self.applied = 0
+        self.not_found = 0
+        self.errors = 0
+        self.shift_px_total = 0.0
+        self.duration_ms_total = 0.0
+
+    @property
+    def enabled(self):
+        return bool(self.policy)
+
+    def trigger_for(self, micro_action, after_failure):
+        """Raison du raffinement de cette micro-action selon la politique, ou None."""
+        if micro_action.get("action_type") not in ("CLICK", "DOUBLE_CLICK", "INPUT"):
+            return None
+        position = micro_action.get("position")
+        if not (isinstance(position, list) and len(position) == 2 and all(isinstance(v, (int, float)) and 0 <= v <= 1 for v in position)):
+            return None # Positions non normalisées (ex: séquence directe de Qwen) laissées telles quelles
+        if "always" in self.policy:
+            return "always"
+        if "after_failure" in self.policy and after_failure:
+            return "after_failure"
+        description = str(micro_action.get("description", "")).lower()
+        if "small_targets" in self.policy and any(keyword in description for keyword in self.small_target_keywords):
+            return "small_targets"
+        return None
+
+    def refine_sequence(self, micro_actions, frame, after_failure=False):
+        """Copie de la séquence avec les positions raffinées; les autres micro-actions sont renvoyées telles quelles."""
+        if not self.enabled or frame is None:
+            return micro_actions
+        refined_sequence, budget = [], self.max_per_step
+        for micro_action in micro_actions:
+            trigger = self.trigger_for(micro_action, after_failure) if budget > 0 else None
+            if trigger is None:
+                refined_sequence.append(micro_action)
+                continue
+            budget -= 1
+            refined_position = self.refine_position(frame, micro_action["position"], micro_action.get("description", ""), trigger)
+            refined_sequence.append(dict(micro_action, position=refined_position) if refined_position else micro_action)
+        return refined_sequence
+
+    def crop_around(self, frame, position_norm):
+        """Recadrage carré autour du point (décalé pour rester dans la capture), agrandi, avec le point marqué."""
+        side = min(self.crop_size, frame.width, frame.height)
+        center_x, center_y = position_norm[0] * frame.width, position_norm[1] * frame.height
+        left = int(min(max(0, center_x - side / 2), frame.width - side))
+        top = int(min(max(0, center_y - side / 2), frame.height - side))
+        box = (left, top, left + side, top + side)
+        crop = frame.crop(box).convert("RGB")
+        zoomed_side = round(side * self.zoom)
+        if zoomed_side != side:
+            crop = crop.resize((zoomed_side, zoomed_side), Image.LANCZOS)
+        marker_x, marker_y = (center_x - left) * self.zoom, (center_y - top) * self.zoom
+        radius = max(6, zoomed_side / 40)
+        ImageDraw.Draw(crop).ellipse([marker_x - radius, marker_y - radius, marker_x + radius, marker_y + radius], outline=(255, 0, 0), width=2)
+        return crop, box
+
+    @staticmethod
+    def parse_answer(answer_text, crop_side):
+        """Position normalisée dans le recadrage, ou None (cible non trouvée, réponse invalide)."""
+        first_brace, last_brace = answer_text.find("{"), answer_text.rfind("}")
+        if first_brace == -1 or last_brace <= first_brace:
+            return None
+        try:
+            answer = json.loads(answer_text[first_brace:last_brace + 1])
+        except json.JSONDecodeError:
+            return None
+        position = answer.get("position") if isinstance(answer, dict) else None
+        if not answer.get("found", True) or not isinstance(position, list) or len(position) != 2:
+            return None
+        try:
+            x, y = float(position[0]), float(position[1])
+        except (TypeError, ValueError):
+            return None
+        if x > 1.0001 or y > 1.0001: # Pixels de l'image envoyée plutôt que des coordonnées normalisées
+            x, y = x / crop_side, y / crop_side
+        return (x, y) if 0 <= x <= 1 and 0 <= y <= 1 else None
+
+    def refine_position(self, frame, position_norm, description, trigger):
+        self.attempted += 1
+        t_start = time.perf_counter()
+        crop, box = self.crop_around(frame, position_norm)
+        image_url = image_to_base64_url(crop, "PNG")
+        messages = [{"role": "system", "content": GROUNDING_REFINE_SYSTEM_PROMPT},
+                    {"role": "user", "content": [{"type": "text", "text": f"Target to click: {description or 'the element marked by the circle'}"},
+                                                 {"type": "image_url", "image_url": {"url": image_url, "detail": "high"}}]}]
+        try:
+            completion, lease, _ = run_model_request(
+                vlm_endpoint_pool, grounding_request_policy,
+                lambda replica, _cancel_event: replica.client.chat.completions.create(
+                    model=VLM_MODEL_NAME_FOR_API,
+                    messages=messages,
+                    max_tokens=60,
+                    temperature=0.0,
+                    timeout=GROUNDING_REFINE_TIMEOUT_S
+                ))
+            lease.close()
+            answer = self.parse_answer(completion.choices[0].message.content or "", crop.width)
+        except Exception as e:
+            self.errors += 1
+            logging.warning(f"Raffinement de position impossible ({type(e).__name__}: {e}). Position initiale conservée.")
+            return None
+        finally:
+            duration_ms = (time.perf_counter() - t_start) * 1000
+            self.duration_ms_total += duration_ms
+            stage_tracer.record("grounding.refine", duration_ms=duration_ms, trigger=trigger)
+        if answer is None:
+            self.not_found += 1
+            logging.info(f"Raffinement de position ({trigger}): cible non trouvée dans le recadrage, position initiale conservée.")
+            return None
+        target_x = box[0] + answer[0] * (box[2] - box[0])
+        target_y = box[1] + answer[1] * (box[3] - box[1])
+        shift_px = math.hypot(target_x - position_norm[0] * frame.width, target_y - position_norm[1] * frame.height)
+        self.applied += 1
+        self.shift_px_total += shift_px
+        logging.info(f"Raffinement de position ({trigger}): décalage de {shift_px:.0f} px en {duration_ms:.0f} ms pour '{description}'.")
+        return [max(0.0, min(1.0, target_x / frame.width)), max(0.0, min(1.0, target_y / frame.height))]
+
+    def stats_summary(self):
+        mean_shift = (self.shift_px_total / self.applied) if self.applied else 0.0
+        mean_ms = (self.duration_ms_total / self.attempted) if self.attempted else 0.0
+        return (f"Raffinement des positions: {self.applied}/{self.attempted} appliqués (décalage moyen {mean_shift:.0f} px, "
+                f"{mean_ms:.0f} ms par requête), {self.not_found} cibles non trouvées, {self.errors} erreurs")
+
+grounding_refiner = GroundingRefiner()
+
+# --- Préchargement Spéculatif de la Requête VLM ---
+class SpeculativeVlmPrefetcher:
+    """Lance la requête VLM de l'étape suivante dès la fin de l'exécution des actions, en arrière-plan.
+
+    La requête spéculative utilise l'instruction de continuation prédite et l'historique tel qu'il sera à l'étape
+    suivante. Elle n'est utilisée que si l'étape suivante demande exactement la même chose; sinon elle est annulée.
+    """
+
+    def __init__(self, enabled=VLM_SPECULATIVE_PREFETCH_ENABLED):
+        self.enabled = enabled
+        self._executor = None
+        self._pending = None
+        self.launched = 0
+        self.hits = 0
+        self.discarded = 0
+        self.saved_ms_total = 0.0
+
+    def launch(self, endpoint_pool, instruction, history_window):
+        self.discard("remplacée")
+        t_prep_start = time.perf_counter()
+        action_overlay.hide(wait_s=0.1) # L'overlay ne doit pas apparaître dans la capture envoyée au VLM
+        frame = None
+        if SETTLE_DETECTOR_ENABLED:
+            _, _, frame = wait_for_screen_stable(timeout_s=SETTLE_TIMEOUT_S)
+            frame = screen_geometry.to_capture_resolution(frame)
+        else:
+            time.sleep(PRE_CAPTURE_FIXED_DELAY_S)
+        try:
+            if frame is None:
+                frame = screen_geometry.grab()
+        except Exception as e:
+            logging.warning(f"Spéculation VLM abandonnée: capture impossible ({e}).")
+            return
+        encoded = frame_encoding_cache.encode(frame, VLM_IMAGE_MAX_SIZE, VLM_IMAGE_FORMAT, VLM_IMAGE_QUALITY, VLM_IMAGE_DETAIL)
+        if not encoded:
+            return
+        messages = build_messages_for_vlm_api(VLM_SYSTEM_PROMPT, instruction, encoded.data_url, history_window.recent_lines,
+                                              history_total_count=history_window.total_count)
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="vlm-speculation")
+        cancel_event = threading.Event()
+        launched_at = time.perf_counter()
+        future = self._executor.submit(request_vlm_completion, endpoint_pool, messages, None, cancel_event)
+        self._pending = {"instruction": instruction, "history_window": history_window, "frame": frame,
+                         "future": future, "cancel_event": cancel_event, "launched_at": launched_at,
+                         "prep_ms": (launched_at - t_prep_start) * 1000}
+        self.launched += 1
+        logging.info("Requête VLM spéculative lancée pour l'instruction de continuation.")
+
+    def claim(self, instruction, history_window):
+        """Retourne la spéculation en attente si elle correspond à la requête de cette étape, sinon l'annule."""
+        pending = self._pending
+        if pending is None:
+            return None
+        if pending["instruction"] != instruction or pending["history_window"] != history_window:
+            self.discard("instruction ou historique différents")
+            return None
+        self._pending = None
+        pending["claimed_at"] = time.perf_counter()
+        self.hits += 1
+        return pending
 
-    user_text_content += "\n\n--- Current Situation ---\nAnalyze the screen and follow the 'Current Specific Instruction from Supervisor'. Your ENTIRE response MUST be a single valid JSON object as specified in the system prompt."
+    def collect(self, pending):
+        """Attend le résultat de la requête spéculative et comptabilise la latence économisée."""
+        vlm_result = pending["future"].result()
+        used_at = time.perf_counter()
+        # Sans spéculation: stabilisation/capture/encodage puis requête complète à partir de la réclamation
+        non_speculative_ready_at = pending["claimed_at"] + (pending["prep_ms"] + vlm_result["total_ms"]) / 1000
+        saved_ms = max(0.0, (non_speculative_ready_at - used_at) * 1000)
+        self.saved_ms_total += saved_ms
+        logging.info(f"Spéculation VLM réussie: ~{saved_ms:.0f} ms économisées.")
+        return vlm_result
 
-    messages = [{"role": "system", "content": system_prompt_content}]
-    content_list = [{"type": "text", "text": user_text_content}]
-    if image_base64_url:
-        content_list.append({"type": "image_url", "image_url": {"url": image_base64_url, "detail": "high"}}) # 'high' pour meilleure analyse
-    messages.append({"role": "user", "content": content_list})
-    return messages
+    def discard(self, reason=""):
+        pending, self._pending = self._pending, None
+        if pending is None:
+            return
+        pending["cancel_event"].set() # Interrompt le streaming en cours
+        pending["future"].cancel()
+        self.discarded += 1
+        logging.info(f"Requête VLM spéculative abandonnée ({reason}).")
+
+    def close(self):
+        self.discard("arrêt")
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def stats_summary(self):
+        resolved = self.hits + self.discarded
+        hit_rate = (100.0 * self.hits / resolved) if resolved else 0.0
+        return (f"Spéculation VLM: {self.launched} lancées, {self.hits} utilisées, {self.discarded} abandonnées "
+                f"(taux de succès {hit_rate:.0f}%), ~{self.saved_ms_total / 1000:.1f}s économisées au total")
+
+speculative_vlm_prefetcher = SpeculativeVlmPrefetcher()
 
 # --- Prompt Système pour Qwen (Backend Stratégique) ---
-QWEN_SYSTEM_PROMPT = f"""
+QWEN_SYSTEM_PROMPT_TEMPLATE = f"""
 You are an expert strategic supervisor for a macOS GUI automation agent.
 The agent has a VLM frontend that analyzes screenshots based on specific instructions you provide, and proposes a GUI 'action_sequence' in JSON.
 You (Qwen) are the brain: receive an 'overall_user_goal', give specific instructions to the VLM, analyze the VLM's JSON output (or its failure), and decide the final course of action.
-Screen resolution: {SCREEN_WIDTH}x{SCREEN_HEIGHT}.
+Screen resolution: {{screen_resolution}}.
 
 You will receive:
 - 'overall_user_goal'.
@@ -645,7 +2883,7 @@ YOUR ENTIRE RESPONSE MUST BE A SINGLE VALID JSON OBJECT with the following struc
 }}
 
 Available "action_type" for 'action_sequence_to_execute' (WHEN YOU PROVIDE IT under EXECUTE_MODIFIED_SEQUENCE):
-"CLICK", "DOUBLE_CLICK", "INPUT", "SCROLL", "PRESS_ENTER", "KEY_PRESS", "PAUSE", "FINISHED".
+"CLICK", "DOUBLE_CLICK", "INPUT", "SCROLL", "PRESS_ENTER", "KEY_PRESS", "PAUSE", "WAIT_UNTIL_STABLE", "FINISHED".
 Use the same parameters as specified for the VLM (e.g., "keys" as a list for KEY_PRESS, "value" for INPUT, "position" for CLICK).
 Always aim for progress. Break down complex goals for the VLM.
 If VLM's 'global_thought' is missing many fields (filled with "N/A (non fourni par VLM ou null)"), it's struggling; simplify its instruction.
@@ -654,6 +2892,15 @@ If the task cannot be completed after reasonable attempts, set 'decision_type' t
 DO NOT use any other 'decision_type' than those listed above. DO NOT use 'EXECUTE_BLIND_ACTION'.
 """
 
+def render_system_prompts():
+    """(Re)construit les prompts système avec la résolution d'écran courante."""
+    global VLM_SYSTEM_PROMPT, QWEN_SYSTEM_PROMPT
+    resolution = f"{SCREEN_WIDTH}x{SCREEN_HEIGHT}"
+    VLM_SYSTEM_PROMPT = VLM_SYSTEM_PROMPT_TEMPLATE.replace("{screen_resolution}", resolution)
+    QWEN_SYSTEM_PROMPT = QWEN_SYSTEM_PROMPT_TEMPLATE.replace("{screen_resolution}", resolution)
+
+render_system_prompts()
+
 VALID_QWEN_DECISION_TYPES = [
     "EXECUTE_VLM_SEQUENCE",
     "EXECUTE_MODIFIED_SEQUENCE",
@@ -662,85 +2909,453 @@ VALID_QWEN_DECISION_TYPES = [
     "TASK_FAILED"
 ]
 
-def get_qwen_strategic_decision(api_client_ref, overall_user_goal, image_base64_url_for_qwen_vl,
-                                current_vlm_status_report,
-                                full_interaction_history,
-                                consecutive_vlm_failures_count):
-    qwen_user_prompt_parts = [f"Current Overall User Goal: {overall_user_goal}"]
-    vlm_report = current_vlm_status_report
-    qwen_user_prompt_parts.append("\n--- VLM Frontend Status for its Last Instruction ---")
+# --- Sorties Structurées: Schémas JSON et Grammaires GBNF des Réponses VLM et Qwen ---
+MICRO_ACTION_JSON_SCHEMA = { # Ordre des propriétés = ordre imposé par la grammaire GBNF
+    "type": "object",
+    "properties": {
+        "action_type": {"type": "string", "enum": list(ACTION_FUNCTION_MAP)},
+        "position": {"type": "array", "items": {"type": "number"}, "minItems": 2, "maxItems": 2},
+        "value": {"type": "string"},
+        "direction": {"type": "string", "enum": ["up", "down"]},
+        "keys": {"type": "array", "items": {"type": "string"}},
+        "duration_seconds": {"type": "number"},
+        "timeout_seconds": {"type": "number"},
+        "reason": {"type": "string"},
+        "description": {"type": "string"},
+    },
+    "required": ["action_type", "description"],
+}
 
-    if vlm_report.get("parsed_vlm_data"):
-        qwen_user_prompt_parts.append(f"VLM Parsed Output:\n```json\n{json.dumps(vlm_report['parsed_vlm_data'], indent=2, ensure_ascii=False)}\n```")
-    else:
-        qwen_user_prompt_parts.append(f"VLM FAILED to provide usable/parsable JSON output for its last instruction.")
-
-    if vlm_report.get("vlm_error_message"):
-        qwen_user_prompt_parts.append(f"VLM Error/Warning Details: {vlm_report['vlm_error_message']}")
-    if not vlm_report.get("parsed_vlm_data") and vlm_report.get("vlm_output_json_str"):
-        qwen_user_prompt_parts.append(f"VLM Raw (unparsable/problematic) Output Snippet: ```\n{vlm_report['vlm_output_json_str'][:350]}...\n```")
-    
-    qwen_user_prompt_parts.append(f"Consecutive VLM Failures for Current VLM Instruction: {consecutive_vlm_failures_count}")
-
-    history_summary_for_qwen_str = "\n\n--- Recent Interaction History (Your Past Qwen Decisions & VLM Outcomes, max 3 recent shown) ---"
-    if full_interaction_history:
-        for i, (enriched_hist_entry_json_str, _) in enumerate(reversed(full_interaction_history[-3:])):
-            try:
-                entry_data = json.loads(enriched_hist_entry_json_str)
-                qwen_prev_decision = entry_data.get("qwen_decision_obj", {})
-                vlm_instr_given_to_vlm = entry_data.get("vlm_instruction_given_to_vlm", "N/A")
-                
-                summary_line = f"Hist-{i+1}. Your (Qwen) Prev Decision: '{qwen_prev_decision.get('decision_type','N/A')}' for VLM instruction: '{vlm_instr_given_to_vlm}'. "
-                summary_line += f"Your Reason: '{qwen_prev_decision.get('reasoning','N/A')}'. "
-                
-                vlm_status_in_hist = entry_data.get("vlm_status_report_from_that_step", {})
-                vlm_parsed_data_in_hist = vlm_status_in_hist.get("parsed_vlm_data", {}) # Nested
-                vlm_action_sequence_in_hist = vlm_parsed_data_in_hist.get("action_sequence") if vlm_parsed_data_in_hist else None
-
-                if vlm_action_sequence_in_hist and isinstance(vlm_action_sequence_in_hist, list):
-                    action_types_proposed = [a.get('action_type','UNKNOWN') for a in vlm_action_sequence_in_hist if isinstance(a,dict)]
-                    summary_line += f" VLM had proposed actions: {action_types_proposed}. "
-                elif vlm_status_in_hist.get("vlm_error_message"):
-                     summary_line += f" VLM then had error: {vlm_status_in_hist['vlm_error_message']}. "
-                
-                executed_actions_in_hist = entry_data.get("executed_action_sequence") # From top level of history entry
-                if executed_actions_in_hist and isinstance(executed_actions_in_hist, list):
-                    action_types_executed = [a.get('action_type','UNKNOWN') for a in executed_actions_in_hist if isinstance(a,dict)]
-                    summary_line += f" Actions then executed: {action_types_executed}. "
-                elif qwen_prev_decision.get('decision_type') not in ["EXECUTE_VLM_SEQUENCE", "EXECUTE_MODIFIED_SEQUENCE"]:
-                     summary_line += f" No direct GUI actions were executed based on Qwen's decision type '{qwen_prev_decision.get('decision_type','N/A')}'. "
-                history_summary_for_qwen_str += "\n" + summary_line.strip()
-            except Exception as e_hist:
-                history_summary_for_qwen_str += f"\nHist-{i+1}. (Erreur de parsing de l'historique pour Qwen: {str(e_hist)[:100]})"
-        qwen_user_prompt_parts.append(history_summary_for_qwen_str)
-    else:
-        qwen_user_prompt_parts.append("\n--- No interaction history yet for this overall task. ---")
+VLM_OUTPUT_JSON_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "global_thought": {"type": "object", "properties": {key: {"type": "string"} for key in VLM_GLOBAL_THOUGHT_KEYS},
+                           "required": VLM_GLOBAL_THOUGHT_KEYS},
+        "action_sequence": {"type": "array", "items": MICRO_ACTION_JSON_SCHEMA},
+    },
+    "required": ["global_thought", "action_sequence"],
+}
+
+QWEN_DECISION_JSON_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "decision_type": {"type": "string", "enum": VALID_QWEN_DECISION_TYPES},
+        "reasoning": {"type": "string"},
+        "action_sequence_to_execute": {"type": ["array", "null"], "items": MICRO_ACTION_JSON_SCHEMA},
+        "next_vlm_instruction": {"type": ["string", "null"]},
+        "user_summary_message": {"type": ["string", "null"]},
+    },
+    "required": ["decision_type", "reasoning", "action_sequence_to_execute", "next_vlm_instruction"],
+}
+
+GBNF_PRIMITIVE_RULES = {
+    "ws": r'| " " | "\n" [ \t]{0,20}', # Borné comme dans llama.cpp: pas de génération d'espaces sans fin
+    "string": r'"\"" ( [^"\\\x7F\x00-\x1F] | "\\" ( ["\\/bfnrt] | "u" [0-9a-fA-F] [0-9a-fA-F] [0-9a-fA-F] [0-9a-fA-F] ) )* "\"" ws',
+    "number": '"-"? ( "0" | [1-9] [0-9]* ) ( "." [0-9]+ )? ( [eE] [-+]? [0-9]+ )? ws',
+    "integer": '"-"? ( "0" | [1-9] [0-9]* ) ws',
+    "boolean": '( "true" | "false" ) ws',
+    "null": '"null" ws',
+}
+
+def json_schema_to_gbnf(schema):
+    """Grammaire GBNF (llama.cpp) pour le sous-ensemble de JSON Schema utilisé ci-dessus.
+
+    Les propriétés d'un objet sont émises dans l'ordre du schéma (la première doit être requise), les autres
+    propriétés optionnelles peuvent être omises.
+    """
+    rules = {}
+
+    def gbnf_literal(json_text):
+        return json.dumps(json_text) # Littéral GBNF: mêmes échappements qu'une chaîne JSON
+
+    def visit(node, rule_name):
+        node_type = node.get("type")
+        if "enum" in node:
+            rules[rule_name] = "( " + " | ".join(gbnf_literal(json.dumps(v)) for v in node["enum"]) + " ) ws"
+        elif isinstance(node_type, list):
+            rules[rule_name] = " | ".join(visit(dict(node, type=t), f"{rule_name}-{t}") for t in node_type)
+        elif node_type == "object":
+            required = set(node.get("required", []))
+            members = []
+            for index, (key, sub_schema) in enumerate(node.get("properties", {}).items()):
+                key_rule_name = f"{rule_name}-" + re.sub(r"[^a-z0-9]+", "-", key.lower()).strip("-")
+                member = f'{gbnf_literal(json.dumps(key))} ws ":" ws {visit(sub_schema, key_rule_name)}'
+                if index == 0:
+                    if key not in required:
+                        raise ValueError(f"GBNF: la première propriété '{key}' doit être requise.")
+                    members.append(member)
+                else:
+                    members.append(f'"," ws {member}' if key in required else f'( "," ws {member} )?')
+            rules[rule_name] = '"{" ws ' + " ".join(members) + ' "}" ws'
+        elif node_type == "array":
+            item = visit(node.get("items", {"type": "string"}), f"{rule_name}-item")
+            if node.get("minItems") is not None and node.get("minItems") == node.get("maxItems"):
+                rules[rule_name] = '"[" ws ' + ' "," ws '.join([item] * node["minItems"]) + ' "]" ws'
+            else:
+                rules[rule_name] = f'"[" ws ( {item} ( "," ws {item} )* )? "]" ws'
+        elif node_type in GBNF_PRIMITIVE_RULES:
+            rules[node_type] = GBNF_PRIMITIVE_RULES[node_type]
+            return node_type
+        else:
+            raise ValueError(f"GBNF: type de schéma non pris en charge: {node_type}")
+        return rule_name
+
+    rules["root"] = f"ws {visit(schema, 'value')}"
+    rules["ws"] = GBNF_PRIMITIVE_RULES["ws"]
+    return "\n".join(f"{name} ::= {body}" for name, body in rules.items())
+
+class StructuredOutputController:
+    """Contraintes de décodage par modèle et taux d'échec de parsing avec et sans contrainte.
+
+    Un refus du serveur (4xx) est vérifié par un second envoi sans contrainte: s'il réussit, la contrainte est
+    désactivée pour ce modèle pour le reste de la session. Un 400 n'est attribué à la contrainte que si le message
+    d'erreur la mentionne (sinon: prompt trop long, image invalide... et l'erreur est propagée telle quelle).
+    """
+
+    UNSUPPORTED_STATUS_CODES = (400, 404, 422, 501)
+    CONSTRAINT_ERROR_MARKERS = ("response_format", "json_schema", "grammar")
+
+    def __init__(self, modes, schemas):
+        self._modes = {role: mode for role, mode in modes.items() if mode in ("json_schema", "gbnf")}
+        self._schemas = schemas # role -> (nom, schéma JSON)
+        self._grammars = {}
+        self._lock = threading.Lock()
+        self._parse_counts = {} # (role, contrainte) -> [réponses, échecs]
+
+    def constraint_for(self, role):
+        return self._modes.get(role)
+
+    def request_kwargs(self, role, constraint):
+        schema_name, schema = self._schemas[role]
+        if constraint == "json_schema":
+            return {"response_format": {"type": "json_schema", "json_schema": {"name": schema_name, "schema": schema, "strict": False}}}
+        if role not in self._grammars:
+            self._grammars[role] = json_schema_to_gbnf(schema)
+        return {"extra_body": {"grammar": self._grammars[role]}}
+
+    def create(self, role, create_fn):
+        """Appelle create_fn(arguments_de_contrainte); retourne (réponse, contrainte effectivement appliquée ou None)."""
+        constraint = self.constraint_for(role)
+        if constraint is None:
+            return create_fn({}), None
+        try:
+            return create_fn(self.request_kwargs(role, constraint)), constraint
+        except Exception as e:
+            if not self.is_constraint_rejection(e):
+                raise
+            response = create_fn({}) # Si cet envoi échoue aussi, la contrainte n'était pas en cause
+            self.disable(role, e)
+            return response, None
+
+    def is_constraint_rejection(self, error):
+        status_code = getattr(error, "status_code", None)
+        if status_code not in self.UNSUPPORTED_STATUS_CODES:
+            return False
+        if status_code != 400:
+            return True
+        error_text = f"{getattr(error, 'body', None) or ''} {error}".lower()
+        return any(marker in error_text for marker in self.CONSTRAINT_ERROR_MARKERS)
+
+    def disable(self, role, error):
+        with self._lock:
+            if self._modes.pop(role, None) is None:
+                return
+        logging.warning(f"{role}: le serveur refuse les sorties structurées ({type(error).__name__}: {str(error)[:150]}). "
+                        "Extraction JSON par regex seulement pour la suite de la session.")
+        rich_print(f"[yellow]{role}: sorties structurées non prises en charge par le serveur, retour à l'extraction par regex.[/yellow]")
+
+    def record_parse(self, role, constraint, parse_ok):
+        with self._lock:
+            counts = self._parse_counts.setdefault((role, constraint), [0, 0])
+            counts[0] += 1
+            counts[1] += 0 if parse_ok else 1
+
+    def parse_failure_rate(self, role, constraint):
+        responses, failures = self._parse_counts.get((role, constraint), (0, 0))
+        return failures / responses if responses else None
+
+    def stats_summary(self):
+        parts = []
+        for (role, constraint), (responses, failures) in sorted(self._parse_counts.items(), key=lambda item: (item[0][0], str(item[0][1]))):
+            parts.append(f"{role} {constraint or 'sans contrainte'}: {failures}/{responses} échecs de parsing")
+        return "Sorties structurées: " + ("; ".join(parts) if parts else "aucune réponse")
+
+structured_output = StructuredOutputController(
+    {"VLM": VLM_STRUCTURED_OUTPUT, "Qwen": QWEN_STRUCTURED_OUTPUT},
+    {"VLM": ("vlm_action_sequence", VLM_OUTPUT_JSON_SCHEMA), "Qwen": ("qwen_decision", QWEN_DECISION_JSON_SCHEMA)})
+
+# --- Fast-Path: Approbation Locale des Séquences VLM à Faible Risque ---
+def micro_action_signature(micro_action):
+    """Signature comparable d'une micro-action (type, position arrondie, paramètres) pour détecter les répétitions."""
+    position = micro_action.get("position")
+    try:
+        rounded_position = tuple(round(float(p), 2) for p in position) if isinstance(position, list) else None
+    except (TypeError, ValueError):
+        rounded_position = str(position)
+    keys = tuple(str(k).lower() for k in micro_action.get("keys", [])) if isinstance(micro_action.get("keys"), list) else None
+    return (micro_action.get("action_type"), rounded_position, keys, micro_action.get("value"), micro_action.get("direction"))
+
+def evaluate_qwen_fast_path(parsed_vlm_data, vlm_error_message, early_dispatch_failed, interaction_history,
+                            consecutive_vlm_failures_count, step_count):
+    """Décide si la séquence VLM peut être exécutée sans consulter Qwen. Retourne (approuvée, raison)."""
+    if not QWEN_FAST_PATH_ENABLED:
+        return False, "fast-path désactivé"
+    if vlm_error_message or not parsed_vlm_data or early_dispatch_failed:
+        return False, "échec VLM ou d'exécution anticipée"
+    if consecutive_vlm_failures_count > 0:
+        return False, "échecs VLM consécutifs en cours"
+    if QWEN_FAST_PATH_ESCALATE_EVERY_N_STEPS > 0 and (step_count - 1) % QWEN_FAST_PATH_ESCALATE_EVERY_N_STEPS == 0:
+        return False, "escalade périodique"
+    if any(value == VLM_MISSING_THOUGHT_PLACEHOLDER for value in parsed_vlm_data["global_thought"].values()):
+        return False, "global_thought incomplet"
+    action_sequence = parsed_vlm_data["action_sequence"]
+    if not action_sequence:
+        return False, "séquence vide"
+    if any(a.get("action_type") == "FINISHED" for a in action_sequence):
+        return False, "FINISHED proposé (validation par Qwen requise)"
+    if len(action_sequence) > QWEN_FAST_PATH_MAX_ACTIONS:
+        return False, "séquence trop longue"
+    disallowed_types = [a.get("action_type") for a in action_sequence if a.get("action_type") not in QWEN_FAST_PATH_ACTION_TYPES]
+    if disallowed_types:
+        return False, f"types d'action hors liste autorisée ({disallowed_types})"
+    sequence_signature = [micro_action_signature(a) for a in action_sequence]
+    for record in interaction_history.recent(QWEN_FAST_PATH_LOOP_WINDOW):
+        executed = record.executed_action_sequence or []
+        if [micro_action_signature(a) for a in executed if isinstance(a, dict)] == sequence_signature:
+            return False, "répétition d'une séquence récente (boucle possible)"
+    return True, f"séquence de {len(action_sequence)} action(s) autorisée(s), sans échec ni boucle"
+
+def build_fast_path_qwen_decision(reason):
+    """Décision EXECUTE_VLM_SEQUENCE synthétisée localement, au même format que get_qwen_strategic_decision."""
+    return {
+        "decision_type": "EXECUTE_VLM_SEQUENCE",
+        "reasoning": f"Fast-path local (Qwen non consulté): {reason}",
+        "action_sequence_to_execute": None,
+        "next_vlm_instruction": None,
+        "user_summary_message": None,
+        "raw_qwen_response_str_for_debug": "Fast-path local: Qwen non consulté.",
+        "fast_path": True
+    }
+
+class QwenFastPathReport:
+    """Compte, par tâche, les appels Qwen évités par le fast-path et estime le temps économisé."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.avoided_calls = 0
+        self.qwen_calls = 0
+        self.qwen_total_ms = 0.0
+        self.escalation_reasons = {}
+
+    def record_avoided_call(self):
+        self.avoided_calls += 1
+
+    def record_qwen_call(self, duration_ms, escalation_reason):
+        self.qwen_calls += 1
+        self.qwen_total_ms += duration_ms
+        self.escalation_reasons[escalation_reason] = self.escalation_reasons.get(escalation_reason, 0) + 1
+
+    def summary(self):
+        avg_qwen_ms = self.qwen_total_ms / self.qwen_calls if self.qwen_calls else 0.0
+        return (f"Fast-path Qwen: {self.avoided_calls} appel(s) évité(s) sur {self.avoided_calls + self.qwen_calls}, "
+                f"~{self.avoided_calls * avg_qwen_ms / 1000:.1f}s économisées (moyenne Qwen {avg_qwen_ms:.0f} ms). "
+                f"Escalades: {self.escalation_reasons}")
+
+qwen_fast_path_report = QwenFastPathReport()
+
+# --- Budget de Tokens du Prompt Qwen ---
+# Niveaux de compacité, du plus complet au plus réduit; le premier qui tient dans le budget est retenu.
+QwenPromptLevel = namedtuple("QwenPromptLevel", ["thought_keys", "thought_chars", "history_lines", "action_format", "raw_snippet_chars"])
+QWEN_PROMPT_LEVELS = [
+    QwenPromptLevel(VLM_GLOBAL_THOUGHT_KEYS, 300, 3, "json", 350),
+    QwenPromptLevel(["Current State Summary", "Previous Action Assessment", "Next Immediate Sub-goal for THIS Instruction",
+                     "Action Justification & Selection"], 160, 3, "json", 350),
+    QwenPromptLevel(["Previous Action Assessment", "Next Immediate Sub-goal for THIS Instruction"], 100, 2, "compact", 250),
+    QwenPromptLevel([], 0, 1, "compact_no_description", 150),
+    QwenPromptLevel([], 0, 0, "types", 80),
+]
+
+def truncate_text(text, max_chars):
+    text = str(text)
+    return text if len(text) <= max_chars else text[:max(0, max_chars - 3)] + "..."
 
-    qwen_user_prompt_parts.append("\nBased on all the above, provide your decision in the specified JSON format. Ensure 'decision_type' is one of the allowed values and 'action_sequence_to_execute' (if provided for EXECUTE_MODIFIED_SEQUENCE) uses the correct action format.")
-    qwen_messages = [{"role": "system", "content": QWEN_SYSTEM_PROMPT}]
-    
-    current_user_message_content_list = [{"type": "text", "text": "\n".join(qwen_user_prompt_parts)}]
+def abbreviate_micro_action(micro_action, with_description=True):
+    """Forme courte d'une micro-action pour le prompt Qwen, ex: CLICK (0.41, 0.22) "Bouton OK"."""
+    parts = [str(micro_action.get("action_type", "UNKNOWN"))]
+    position = micro_action.get("position")
+    if isinstance(position, list) and len(position) == 2:
+        try:
+            parts.append(f"({float(position[0]):.2f}, {float(position[1]):.2f})")
+        except (TypeError, ValueError):
+            parts.append(str(position))
+    if isinstance(micro_action.get("keys"), list):
+        parts.append("+".join(map(str, micro_action["keys"])))
+    if micro_action.get("value") is not None:
+        parts.append(f"value={json.dumps(truncate_text(micro_action['value'], 60), ensure_ascii=False)}")
+    for field in ("direction", "duration_seconds", "timeout_seconds"):
+        if micro_action.get(field) is not None:
+            parts.append(f"{field}={micro_action[field]}")
+    if with_description and micro_action.get("description"):
+        parts.append(json.dumps(truncate_text(micro_action["description"], 60), ensure_ascii=False))
+    return " ".join(parts)
+
+class QwenPromptBudgeter:
+    """Construit les sections du prompt Qwen dans un budget de tokens (contexte du serveur et latence de prefill).
+
+    Les tokens sont estimés à partir du nombre de caractères; le ratio caractères/token est recalibré sur l'usage
+    rapporté par le serveur quand aucune image n'est envoyée.
+    """
+
+    def __init__(self, context_tokens=QWEN_CONTEXT_TOKENS, prompt_token_budget=QWEN_PROMPT_TOKEN_BUDGET,
+                 max_completion_tokens=QWEN_MAX_COMPLETION_TOKENS, chars_per_token=QWEN_CHARS_PER_TOKEN, levels=QWEN_PROMPT_LEVELS):
+        self.context_tokens = context_tokens
+        self.prompt_token_budget = prompt_token_budget
+        self.max_completion_tokens = max_completion_tokens
+        self.chars_per_token = chars_per_token
+        self.levels = levels
+        self.calls = 0
+        self.over_budget_calls = 0
+        self.estimated_tokens_total = 0
+        self.level_counts = [0] * len(levels)
+
+    def estimate_tokens(self, text):
+        return math.ceil(len(text) / self.chars_per_token) if text else 0
+
+    def budget_for(self, system_prompt, image_tokens=0):
+        """Tokens disponibles pour le message utilisateur: le plus petit du budget de latence et du reste du contexte."""
+        context_left = self.context_tokens - self.max_completion_tokens - self.estimate_tokens(system_prompt) - image_tokens
+        return max(0, min(self.prompt_token_budget, context_left))
+
+    def render_sections(self, level, overall_user_goal, interaction_history, vlm_report, consecutive_vlm_failures_count):
+        """Sections du prompt pour un niveau donné: {"goal", "history", "vlm", "notes"}."""
+        sections = {"goal": f"Current Overall User Goal: {overall_user_goal}"}
+
+        history_lines = interaction_history.qwen_summary_lines(level.history_lines) if interaction_history and level.history_lines else []
+        if history_lines:
+            sections["history"] = "\n".join([f"--- Recent Interaction History (Your Past Qwen Decisions & VLM Outcomes, oldest first, max {level.history_lines} recent shown) ---"] + history_lines)
+        elif interaction_history:
+            sections["history"] = f"--- Interaction history omitted for brevity ({len(interaction_history)} past steps). ---"
+        else:
+            sections["history"] = "--- No interaction history yet for this overall task. ---"
+
+        vlm_parts = ["--- VLM Frontend Status for its Last Instruction ---"]
+        parsed_vlm_data = vlm_report.get("parsed_vlm_data")
+        if parsed_vlm_data:
+            thought = parsed_vlm_data.get("global_thought") or {}
+            actions = parsed_vlm_data.get("action_sequence") or []
+            if level.action_format == "json":
+                compact_output = {"global_thought": {key: truncate_text(thought.get(key, VLM_MISSING_THOUGHT_PLACEHOLDER), level.thought_chars) for key in level.thought_keys},
+                                  "action_sequence": actions}
+                vlm_parts.append(f"VLM Parsed Output:\n```json\n{stable_json_dumps(compact_output)}\n```")
+            else:
+                for key in level.thought_keys:
+                    vlm_parts.append(f"VLM {key}: {truncate_text(thought.get(key, VLM_MISSING_THOUGHT_PLACEHOLDER), level.thought_chars)}")
+                if level.action_format == "types":
+                    vlm_parts.append(f"VLM Proposed Actions ({len(actions)}): {', '.join(str(a.get('action_type')) for a in actions)}")
+                else:
+                    with_description = level.action_format == "compact"
+                    vlm_parts.append(f"VLM Proposed Actions ({len(actions)}):")
+                    vlm_parts.extend(f"{i + 1}. {abbreviate_micro_action(a, with_description)}" for i, a in enumerate(actions))
+        else:
+            vlm_parts.append("VLM FAILED to provide usable/parsable JSON output for its last instruction.")
+        if vlm_report.get("vlm_error_message"):
+            vlm_parts.append(f"VLM Error/Warning Details: {vlm_report['vlm_error_message']}")
+        if not parsed_vlm_data and vlm_report.get("vlm_output_json_str"):
+            vlm_parts.append(f"VLM Raw (unparsable/problematic) Output Snippet: ```\n{vlm_report['vlm_output_json_str'][:level.raw_snippet_chars]}...\n```")
+        sections["vlm"] = "\n".join(vlm_parts)
+
+        note_parts = []
+        if vlm_report.get("early_dispatched_actions"):
+            early_types = [a.get('action_type', 'UNKNOWN') for a in vlm_report["early_dispatched_actions"]]
+            note_parts.append(f"NOTE: The first {len(early_types)} VLM action(s) {early_types} were ALREADY EXECUTED while the VLM response was streaming (low-risk early dispatch). EXECUTE_VLM_SEQUENCE will only run the remaining actions.")
+        if vlm_report.get("early_dispatch_failed"):
+            note_parts.append("NOTE: An early-dispatched VLM action FAILED during streaming; the rest of the VLM sequence will not run if you choose EXECUTE_VLM_SEQUENCE.")
+        note_parts.append(f"Consecutive VLM Failures for Current VLM Instruction: {consecutive_vlm_failures_count}")
+        sections["notes"] = "\n".join(note_parts)
+        return sections
+
+    def build(self, overall_user_goal, interaction_history, vlm_report, consecutive_vlm_failures_count,
+              system_prompt=None, static_text=QWEN_PROMPT_STATIC_PREAMBLE, image_tokens=0):
+        """Retourne (sections, comptes de tokens par section, index du niveau retenu, budget)."""
+        system_prompt = QWEN_SYSTEM_PROMPT if system_prompt is None else system_prompt
+        budget = self.budget_for(system_prompt, image_tokens)
+        for level_index, level in enumerate(self.levels):
+            sections = self.render_sections(level, overall_user_goal, interaction_history, vlm_report, consecutive_vlm_failures_count)
+            token_counts = {"instructions": self.estimate_tokens(static_text)}
+            token_counts.update((name, self.estimate_tokens(text)) for name, text in sections.items())
+            if sum(token_counts.values()) <= budget:
+                break
+        else: # Même le niveau le plus compact dépasse: il est envoyé tel quel
+            self.over_budget_calls += 1
+        total_tokens = sum(token_counts.values())
+        self.calls += 1
+        self.level_counts[level_index] += 1
+        self.estimated_tokens_total += total_tokens
+        logging.info(f"Prompt Qwen (niveau {level_index}/{len(self.levels) - 1}): "
+                     + ", ".join(f"{name} {count}" for name, count in token_counts.items())
+                     + f" = ~{total_tokens} tokens estimés (budget {budget}, image ~{image_tokens}, complétion max {self.max_completion_tokens})")
+        return sections, token_counts, level_index, budget
+
+    def calibrate(self, prompt_chars, reported_prompt_tokens):
+        """Ajuste le ratio caractères/token sur l'usage rapporté (moyenne mobile, bornée)."""
+        if not reported_prompt_tokens or prompt_chars <= 0:
+            return
+        observed_ratio = prompt_chars / reported_prompt_tokens
+        self.chars_per_token = min(8.0, max(1.5, 0.8 * self.chars_per_token + 0.2 * observed_ratio))
 
+    def stats_summary(self):
+        mean_tokens = (self.estimated_tokens_total / self.calls) if self.calls else 0.0
+        return (f"Budget prompt Qwen: {self.calls} prompts, ~{mean_tokens:.0f} tokens estimés en moyenne, niveaux {self.level_counts}, "
+                f"{self.over_budget_calls} hors budget, {self.chars_per_token:.2f} caractères/token")
+
+qwen_prompt_budgeter = QwenPromptBudgeter()
+
+def get_qwen_strategic_decision(endpoint_pool, overall_user_goal, image_base64_url_for_qwen_vl,
+                                current_vlm_status_report,
+                                full_interaction_history,
+                                consecutive_vlm_failures_count,
+                                image_tokens_estimate=0):
+    t_prompt_build = stage_tracer.now()
     is_qwen_multimodal = "VL" in QWEN_MODEL_NAME_FOR_API.upper()
-    if is_qwen_multimodal and image_base64_url_for_qwen_vl:
-        current_user_message_content_list.append({"type": "image_url", "image_url": {"url": image_base64_url_for_qwen_vl, "detail": "high"}})
+    image_for_qwen = image_base64_url_for_qwen_vl if is_qwen_multimodal else None
+    if image_for_qwen:
         logging.info("Image envoyée au Backend Qwen (car semble multimodal).")
-    qwen_messages.append({"role": "user", "content": current_user_message_content_list})
+    sections, _, _, _ = qwen_prompt_budgeter.build(overall_user_goal, full_interaction_history, current_vlm_status_report,
+                                                   consecutive_vlm_failures_count, image_tokens=image_tokens_estimate if image_for_qwen else 0)
+    qwen_messages = assemble_prompt_messages(QWEN_SYSTEM_PROMPT, QWEN_PROMPT_STATIC_PREAMBLE, sections["goal"], sections["history"],
+                                             sections["vlm"] + "\n" + sections["notes"], image_for_qwen, QWEN_IMAGE_DETAIL)
+    stage_tracer.record("history.build_qwen", t_prompt_build)
+    session_recorder.record("qwen_prompt_text", qwen_messages[-1]["content"][0]["text"])
 
     qwen_response_str_raw = ""
+    qwen_constraint = None
     try:
         logging.info(f"Envoi de la requête au Backend Qwen (Modèle: {QWEN_MODEL_NAME_FOR_API})...")
         rich_print(f"\nEnvoi de la requête au Backend Qwen (Modèle: {QWEN_MODEL_NAME_FOR_API})...")
-        completion = api_client_ref.chat.completions.create(
-            model=QWEN_MODEL_NAME_FOR_API,
-            messages=qwen_messages,
-            max_tokens=1800, # Qwen peut être verbeux
-            temperature=0.1 # Température basse pour des décisions plus déterministes
-        )
+        t_qwen_request = stage_tracer.now()
+        (completion, qwen_constraint), lease, _ = run_model_request(
+            endpoint_pool, qwen_request_policy,
+            lambda replica, _cancel_event: structured_output.create("Qwen", lambda constraint_kwargs: replica.client.chat.completions.create(
+                model=QWEN_MODEL_NAME_FOR_API,
+                messages=qwen_messages,
+                max_tokens=QWEN_MAX_COMPLETION_TOKENS,
+                temperature=0.1, # Température basse pour des décisions plus déterministes
+                timeout=QWEN_REQUEST_TIMEOUT_S,
+                **merge_request_kwargs(prompt_cache_request_kwargs(QWEN_PROMPT_CACHE_SLOT, "qwen"), constraint_kwargs)
+            )))
+        lease.close()
         qwen_response_str_raw = completion.choices[0].message.content
+        stage_tracer.record("qwen.request", t_qwen_request)
+        prompt_cache_stats.record("Qwen", getattr(completion, "usage", None), getattr(completion, "timings", None))
+        if not image_for_qwen:
+            qwen_prompt_chars = len(QWEN_SYSTEM_PROMPT) + len(qwen_messages[-1]["content"][0]["text"])
+            qwen_prompt_budgeter.calibrate(qwen_prompt_chars, getattr(getattr(completion, "usage", None), "prompt_tokens", None))
         logging.debug(f"Réponse Brute du Backend Qwen:\n{qwen_response_str_raw}")
         rich_print(f"[cyan]Réponse Brute du Backend Qwen:[/]\n{qwen_response_str_raw}")
 
+        t_qwen_parse = stage_tracer.now()
         json_str_to_parse_qwen = None
         match_qwen = re.search(r"```json\s*(\{[\s\S]+?\})\s*```", qwen_response_str_raw, re.DOTALL)
         if match_qwen:
@@ -785,41 +3400,1058 @@ def get_qwen_strategic_decision(api_client_ref, overall_user_goal, image_base64_
         if dt != "RETRY_VLM_WITH_NEW_INSTRUCTION":
             qwen_decision["next_vlm_instruction"] = None
 
+        stage_tracer.record("qwen.parse", t_qwen_parse)
+        structured_output.record_parse("Qwen", qwen_constraint, True)
         return qwen_decision
         
     except Exception as e:
+        if qwen_response_str_raw: # Réponse reçue mais inexploitable (et non erreur de requête)
+            structured_output.record_parse("Qwen", qwen_constraint, False)
         logging.critical(f"Erreur Critique durant l'appel Qwen ou parsing: {e}\nRéponse brute Qwen (si disponible): {qwen_response_str_raw}")
         rich_print(f"[bold red]Erreur Critique Qwen: {e}[/bold red]")
+        session_recorder.record("qwen_error", f"{type(e).__name__}: {e}")
         play_sound_feedback("error.wav")
-        return { # Fallback robuste
-            "decision_type": "TASK_FAILED",
-            "reasoning": f"Erreur critique du module stratégique Qwen: {str(e)}",
-            "action_sequence_to_execute": None,
+        return build_qwen_failure_decision(f"Erreur critique du module stratégique Qwen: {str(e)}")
+
+def build_qwen_failure_decision(reasoning, user_summary_message="Le module de stratégie interne (Qwen) a rencontré une erreur critique."):
+    return { # Fallback robuste
+        "decision_type": "TASK_FAILED",
+        "reasoning": reasoning,
+        "action_sequence_to_execute": None,
+        "next_vlm_instruction": None,
+        "user_summary_message": user_summary_message
+    }
+
+# --- Archive des Captures (adressage par contenu, deltas par tuiles, rétention) ---
+class ScreenshotArchive:
+    """Archive des captures d'étape adressée par le hash SHA-256 des pixels.
+
+    Chaque trame est soit un doublon exact d'un contenu déjà archivé, soit un quasi-doublon de la trame précédente
+    (hash perceptuel, fusionnée avec elle), soit un delta (tuiles modifiées par rapport à la trame précédente), soit
+    une trame complète. index.jsonl est en ajout seul et réécrit lors du compactage, qui applique la rétention (taille,
+    âge, tâches réussies) puis supprime les objets qui ne sont plus référencés.
+    Les écritures passent toutes par le thread du PersistenceWorker.
+    """
+
+    def __init__(self, folder=SCREENSHOT_ARCHIVE_FOLDER, tile_size=SCREENSHOT_ARCHIVE_TILE_SIZE,
+                 near_dup_hamming=SCREENSHOT_ARCHIVE_NEAR_DUP_HAMMING, max_delta_ratio=SCREENSHOT_ARCHIVE_MAX_DELTA_RATIO,
+                 keyframe_interval=SCREENSHOT_ARCHIVE_KEYFRAME_INTERVAL, max_bytes=SCREENSHOT_RETENTION_MAX_BYTES,
+                 max_age_days=SCREENSHOT_RETENTION_MAX_AGE_DAYS, keep_only_failed=SCREENSHOT_RETENTION_KEEP_ONLY_FAILED,
+                 compact_every=SCREENSHOT_ARCHIVE_COMPACT_EVERY, png_compress_level=SCREENSHOT_PNG_COMPRESS_LEVEL):
+        self.folder = folder
+        self.tile_size = max(8, tile_size)
+        self.near_dup_hamming = near_dup_hamming
+        self.max_delta_ratio = max_delta_ratio
+        self.keyframe_interval = max(1, keyframe_interval)
+        self.max_bytes = max_bytes
+        self.max_age_days = max_age_days
+        self.keep_only_failed = keep_only_failed
+        self.compact_every = max(1, compact_every)
+        self.png_compress_level = png_compress_level
+        self._lock = threading.RLock()
+        self._contents = None # hash de contenu -> {"kind": "key"|"delta", "base", "tiles", "size", "mode", "depth", "bytes"}
+        self._frames = {}     # identifiant de trame -> {"content", "task", "ts"}
+        self._task_outcomes = {}
+        self._index_file = None
+        self._previous = None # (hash de contenu, pixels, hash perceptuel, profondeur de la chaîne de deltas)
+        self._task_id = None
+        self._frames_since_compaction = 0
+        self.frames = 0
+        self.keyframes = 0
+        self.deltas = 0
+        self.exact_duplicates = 0
+        self.near_duplicates = 0
+        self.bytes_written = 0
+        self.compactions = 0
+        self.removed_frames = 0
+        self.removed_bytes = 0
+
+    @staticmethod
+    def frame_id_for(path):
+        return os.path.basename(path)
+
+    def _object_path(self, content_hash):
+        return os.path.join(self.folder, "objects", content_hash[:2], f"{content_hash}.png")
+
+    def _ensure_loaded(self):
+        if self._contents is not None:
+            return
+        self._contents = {}
+        index_path = os.path.join(self.folder, "index.jsonl")
+        if not os.path.exists(index_path):
+            return
+        try:
+            with open(index_path, "r", encoding="utf-8") as index_file:
+                for line in index_file:
+                    if line.strip():
+                        self._apply_index_entry(json.loads(line))
+            logging.info(f"Archive des captures: {len(self._frames)} trame(s), {len(self._contents)} contenu(s) chargés depuis {index_path}.")
+        except Exception as e:
+            logging.warning(f"Archive des captures: index {index_path} illisible ({e}). Les entrées lisibles sont conservées.")
+
+    def _apply_index_entry(self, entry):
+        entry_type = entry.pop("type")
+        if entry_type == "content":
+            self._contents[entry.pop("hash")] = entry
+        elif entry_type == "frame":
+            self._frames[entry.pop("frame")] = entry
+        elif entry_type == "task":
+            self._task_outcomes[entry["task"]] = entry["outcome"]
+
+    def _append_index(self, entry):
+        if self._index_file is None:
+            os.makedirs(self.folder, exist_ok=True)
+            self._index_file = open(os.path.join(self.folder, "index.jsonl"), "a", encoding="utf-8")
+        self._index_file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self._index_file.flush()
+
+    def _write_object(self, content_hash, image):
+        object_path = self._object_path(content_hash)
+        os.makedirs(os.path.dirname(object_path), exist_ok=True)
+        image.save(object_path, format="PNG", compress_level=self.png_compress_level)
+        size_bytes = os.path.getsize(object_path)
+        self.bytes_written += size_bytes
+        return size_bytes
+
+    def _changed_tiles(self, previous_pixels, pixels):
+        """Coordonnées (colonne, ligne) des tuiles différentes entre deux trames de même taille."""
+        tile = self.tile_size
+        height, width = pixels.shape[:2]
+        rows, cols = -(-height // tile), -(-width // tile)
+        changed = np.zeros((rows * tile, cols * tile), dtype=bool)
+        changed[:height, :width] = (pixels != previous_pixels).reshape(height, width, -1).any(axis=2)
+        tile_mask = changed.reshape(rows, tile, cols, tile).any(axis=(1, 3))
+        return [(int(c), int(r)) for r, c in zip(*np.nonzero(tile_mask))], rows * cols
+
+    # --- Appelé dans le thread du PersistenceWorker ---
+    def store_frame(self, frame_id, image):
+        with self._lock:
+            self._ensure_loaded()
+            content_hash = hashlib.sha256(f"{image.mode}{image.size}".encode() + image.tobytes()).hexdigest()
+            pixels = np.asarray(image)
+            phash = compute_perceptual_hash(image)
+            previous = self._previous
+            if content_hash in self._contents:
+                self.exact_duplicates += 1
+                depth = self._contents[content_hash].get("depth", 0)
+            elif (previous is not None and self.near_dup_hamming >= 0 and previous[1].shape == pixels.shape
+                  and hamming_distance(phash, previous[2]) <= self.near_dup_hamming):
+                self.near_duplicates += 1 # Pixels non conservés: la trame pointe vers le contenu précédent
+                content_hash, pixels, phash, depth = previous
+            else:
+                tiles, tile_count = (self._changed_tiles(previous[1], pixels) if previous is not None and previous[1].shape == pixels.shape
+                                     else (None, 0))
+                if tiles is not None and len(tiles) <= self.max_delta_ratio * tile_count and previous[3] + 1 < self.keyframe_interval:
+                    tile = self.tile_size
+                    strip = Image.new(image.mode, (tile, tile * max(1, len(tiles))))
+                    for i, (col, row) in enumerate(tiles):
+                        strip.paste(image.crop((col * tile, row * tile, min(image.width, (col + 1) * tile), min(image.height, (row + 1) * tile))), (0, i * tile))
+                    depth = previous[3] + 1
+                    record = {"kind": "delta", "base": previous[0], "tiles": tiles, "size": list(image.size), "mode": image.mode,
+                              "depth": depth, "bytes": self._write_object(content_hash, strip)}
+                    self.deltas += 1
+                else:
+                    depth = 0
+                    record = {"kind": "key", "size": list(image.size), "mode": image.mode, "depth": 0,
+                              "bytes": self._write_object(content_hash, image)}
+                    self.keyframes += 1
+                self._contents[content_hash] = record
+                self._append_index({"type": "content", "hash": content_hash, **record})
+            frame_entry = {"content": content_hash, "task": self._task_id, "ts": round(time.time(), 3)}
+            self._frames[frame_id] = frame_entry
+            self._append_index({"type": "frame", "frame": frame_id, **frame_entry})
+            self._previous = (content_hash, pixels, phash, depth)
+            self.frames += 1
+            self._frames_since_compaction += 1
+            if self._frames_since_compaction >= self.compact_every:
+                self.compact()
+
+    def _begin_task(self, task_id):
+        with self._lock:
+            self._task_id = task_id
+
+    def _end_task(self, task_id, outcome):
+        with self._lock:
+            self._ensure_loaded()
+            self._task_outcomes[task_id] = outcome
+            self._append_index({"type": "task", "task": task_id, "outcome": outcome})
+            if self.keep_only_failed and outcome == "TASK_COMPLETED":
+                self.compact()
+
+    def _live_contents(self, frames):
+        live = set()
+        pending = [entry["content"] for entry in frames.values()]
+        if self._previous is not None:
+            pending.append(self._previous[0]) # Base du prochain delta
+        while pending:
+            content_hash = pending.pop()
+            if content_hash in live or content_hash not in self._contents:
+                continue
+            live.add(content_hash)
+            if self._contents[content_hash].get("base"):
+                pending.append(self._contents[content_hash]["base"])
+        return live
+
+    def compact(self):
+        """Applique la rétention puis supprime les objets non référencés et réécrit l'index."""
+        with self._lock:
+            self._ensure_loaded()
+            self._frames_since_compaction = 0
+            now = time.time()
+            kept = {}
+            for frame_id, entry in self._frames.items():
+                too_old = self.max_age_days > 0 and now - entry["ts"] > self.max_age_days * 86400
+                succeeded = self.keep_only_failed and self._task_outcomes.get(entry["task"]) == "TASK_COMPLETED"
+                if not (too_old or succeeded):
+                    kept[frame_id] = entry
+            live = self._live_contents(kept)
+            oldest_first = sorted(kept, key=lambda frame_id: kept[frame_id]["ts"])
+            while self.max_bytes > 0 and oldest_first and sum(self._contents[h]["bytes"] for h in live) > self.max_bytes:
+                for frame_id in oldest_first[:max(1, len(oldest_first) // 10)]: # Par lots: le calcul des contenus vivants est global
+                    del kept[frame_id]
+                oldest_first = oldest_first[max(1, len(oldest_first) // 10):]
+                live = self._live_contents(kept)
+            removed_bytes = 0
+            for content_hash in [h for h in self._contents if h not in live]:
+                removed_bytes += self._contents.pop(content_hash)["bytes"]
+                try:
+                    os.remove(self._object_path(content_hash))
+                except FileNotFoundError:
+                    pass
+            self.removed_frames += len(self._frames) - len(kept)
+            self.removed_bytes += removed_bytes
+            self._frames = kept
+            live_tasks = {entry["task"] for entry in kept.values()} | {self._task_id}
+            self._task_outcomes = {task: outcome for task, outcome in self._task_outcomes.items() if task in live_tasks}
+            self._rewrite_index()
+            self.compactions += 1
+
+    def _rewrite_index(self):
+        if self._index_file is not None:
+            self._index_file.close()
+            self._index_file = None
+        os.makedirs(self.folder, exist_ok=True)
+        index_path = os.path.join(self.folder, "index.jsonl")
+        with open(f"{index_path}.tmp", "w", encoding="utf-8") as index_file:
+            for content_hash, record in self._contents.items(): # Une base est toujours écrite avant ses deltas
+                index_file.write(json.dumps({"type": "content", "hash": content_hash, **record}) + "\n")
+            for frame_id, entry in self._frames.items():
+                index_file.write(json.dumps({"type": "frame", "frame": frame_id, **entry}, ensure_ascii=False) + "\n")
+            for task_id, outcome in self._task_outcomes.items():
+                index_file.write(json.dumps({"type": "task", "task": task_id, "outcome": outcome}) + "\n")
+        os.replace(f"{index_path}.tmp", index_path)
+
+    # --- Appelé depuis la boucle principale (sans effet si l'archive n'est pas utilisée) ---
+    def begin_task(self, goal):
+        if persistence_worker.archive is not self:
+            return
+        task_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{hashlib.sha1(goal.encode('utf-8')).hexdigest()[:8]}"
+        persistence_worker.submit_call(functools.partial(self._begin_task, task_id))
+        self._submitted_task_id = task_id
+
+    def end_task(self, outcome):
+        task_id = getattr(self, "_submitted_task_id", None)
+        if task_id is not None:
+            persistence_worker.submit_call(functools.partial(self._end_task, task_id, outcome))
+            self._submitted_task_id = None
+
+    def load_frame(self, frame_id):
+        """Reconstruit une trame archivée (trame complète + deltas successifs), ou None si elle est inconnue."""
+        with self._lock: # Objets lus sous le verrou: un compactage concurrent ne peut pas les supprimer entre-temps
+            self._ensure_loaded()
+            entry = self._frames.get(self.frame_id_for(frame_id))
+            if entry is None:
+                return None
+            chain, content_hash = [], entry["content"]
+            while content_hash is not None:
+                chain.append(content_hash)
+                content_hash = self._contents[content_hash].get("base")
+            records = []
+            for content_hash in reversed(chain):
+                with open(self._object_path(content_hash), "rb") as object_file:
+                    records.append((object_file.read(), self._contents[content_hash]))
+        with Image.open(io.BytesIO(records[0][0])) as keyframe:
+            image = keyframe.convert(records[0][1]["mode"])
+        tile = self.tile_size
+        for object_bytes, record in records[1:]:
+            with Image.open(io.BytesIO(object_bytes)) as strip:
+                for i, (col, row) in enumerate(record["tiles"]):
+                    width = min(tile, image.width - col * tile)
+                    height = min(tile, image.height - row * tile)
+                    image.paste(strip.crop((0, i * tile, width, i * tile + height)), (col * tile, row * tile))
+        return image
+
+    def close(self):
+        with self._lock:
+            if self._index_file is not None:
+                self._index_file.close()
+                self._index_file = None
+
+    def stats_summary(self):
+        with self._lock: # _contents est modifié par le thread du PersistenceWorker
+            stored_bytes = sum(record["bytes"] for record in (self._contents or {}).values())
+        return (f"Archive des captures: {self.frames} trame(s) ({self.keyframes} complètes, {self.deltas} deltas, "
+                f"{self.exact_duplicates} doublons exacts, {self.near_duplicates} quasi-doublons), "
+                f"{self.bytes_written / 1024 ** 2:.1f} Mo écrits, {stored_bytes / 1024 ** 2:.1f} Mo conservés, "
+                f"{self.compactions} compactage(s) ({self.removed_frames} trames et {self.removed_bytes / 1024 ** 2:.1f} Mo supprimés)")
+
+screenshot_archive = ScreenshotArchive()
+
+# --- Persistance Asynchrone (captures d'écran et journal détaillé hors du chemin critique) ---
+class PersistenceWorker:
+    """Thread d'écriture disque alimenté par une file bornée.
+
+    Quand le disque prend du retard, les captures sont sous-échantillonnées (politique "downsample", file remplie
+    aux trois quarts) puis abandonnées (file pleine). Les enregistrements du journal ne sont abandonnés
+    qu'après une courte attente. Avec une archive, les captures y sont dédupliquées au lieu d'être écrites une à une.
+    """
+
+    def __init__(self, max_queue_size=PERSISTENCE_QUEUE_SIZE, backpressure_policy=PERSISTENCE_BACKPRESSURE_POLICY,
+                 image_format=SCREENSHOT_SAVE_FORMAT, image_quality=SCREENSHOT_SAVE_QUALITY, png_compress_level=SCREENSHOT_PNG_COMPRESS_LEVEL,
+                 archive=None):
+        self._queue = queue.Queue(maxsize=max(1, max_queue_size))
+        self._thread = None
+        self._lock = threading.Lock()
+        self._open_log_files = {}
+        self._created_dirs = set()
+        self.backpressure_policy = backpressure_policy
+        self.image_format = image_format
+        self.image_quality = image_quality
+        self.png_compress_level = png_compress_level
+        self.archive = archive
+        self.written_screenshots = 0
+        self.downsampled_screenshots = 0
+        self.dropped_screenshots = 0
+        self.dropped_log_records = 0
+
+    @property
+    def screenshot_extension(self):
+        return {"JPEG": "jpg", "WEBP": "webp"}.get(self.image_format, "png")
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="persistence-worker", daemon=True)
+                self._thread.start()
+
+    def submit_screenshot(self, image, path):
+        """Met une capture en file d'écriture sans bloquer. Retourne False si elle a été abandonnée."""
+        self.start()
+        downsample = (self.backpressure_policy == "downsample"
+                      and self._queue.qsize() >= max(1, self._queue.maxsize * 3 // 4))
+        try:
+            self._queue.put_nowait(("screenshot", path, image, downsample))
+        except queue.Full:
+            self.dropped_screenshots += 1
+            logging.warning(f"Persistance en retard: capture abandonnée ({path}). Total abandonnées: {self.dropped_screenshots}")
+            return False
+        if downsample:
+            self.downsampled_screenshots += 1
+        return True
+
+    def submit_log_record(self, path, text, timeout=0.5):
+        self.start()
+        try:
+            self._queue.put(("log", path, text, False), timeout=timeout)
+            return True
+        except queue.Full:
+            self.dropped_log_records += 1
+            logging.warning(f"Persistance en retard: enregistrement du journal abandonné ({path}).")
+            return False
+
+    def _ensure_parent_dir(self, path):
+        parent = os.path.dirname(path)
+        if parent and parent not in self._created_dirs:
+            os.makedirs(parent, exist_ok=True)
+            self._created_dirs.add(parent)
+
+    def _write_screenshot(self, path, image, downsample):
+        if downsample:
+            image = image.resize((max(1, image.width // 2), max(1, image.height // 2)), Image.BILINEAR)
+        if self.archive is not None:
+            self.archive.store_frame(self.archive.frame_id_for(path), image)
+            self.written_screenshots += 1
+            return
+        save_kwargs = {"format": self.image_format}
+        if self.image_format == "PNG":
+            save_kwargs["compress_level"] = self.png_compress_level
+        else:
+            save_kwargs["quality"] = self.image_quality
+            if image.mode not in ("RGB", "L"):
+                image = image.convert("RGB")
+        image.save(path, **save_kwargs)
+        self.written_screenshots += 1
+
+    def _write_log_record(self, path, text):
+        log_file = self._open_log_files.get(path)
+        if log_file is None:
+            log_file = open(path, "a", encoding="utf-8")
+            self._open_log_files[path] = log_file
+        log_file.write(text)
+        log_file.flush()
+
+    def _write_file_snapshot(self, path, text):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as snapshot_file:
+            snapshot_file.write(text)
+        os.replace(tmp_path, path) # Remplacement atomique: jamais de fichier à moitié écrit
+
+    def submit_call(self, fn, timeout=0.5):
+        """Exécute fn() dans le thread d'écriture, dans l'ordre des autres écritures."""
+        self.start()
+        try:
+            self._queue.put(("call", "", fn, False), timeout=timeout)
+            return True
+        except queue.Full:
+            logging.warning("Persistance en retard: tâche d'arrière-plan abandonnée.")
+            return False
+
+    def submit_file_snapshot(self, path, text, timeout=0.5):
+        """Réécrit entièrement 'path' avec 'text' en arrière-plan (écriture atomique)."""
+        self.start()
+        try:
+            self._queue.put(("snapshot", path, text, False), timeout=timeout)
+            return True
+        except queue.Full:
+            logging.warning(f"Persistance en retard: instantané de {path} abandonné.")
+            return False
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                kind, path, payload, downsample = item
+                t_write = stage_tracer.now()
+                self._ensure_parent_dir(path)
+                if kind == "screenshot":
+                    self._write_screenshot(path, payload, downsample)
+                elif kind == "snapshot":
+                    self._write_file_snapshot(path, payload)
+                elif kind == "call":
+                    payload()
+                else:
+                    self._write_log_record(path, payload)
+                stage_tracer.record(f"persist.write_{kind}", t_write)
+            except Exception as e:
+                logging.error(f"Erreur d'écriture en arrière-plan ({item[0] if item else '?'}): {e}")
+            finally:
+                self._queue.task_done()
+
+    def flush(self, timeout=PERSISTENCE_FLUSH_TIMEOUT_S):
+        """Attend que la file soit vidée (au plus 'timeout' secondes). Retourne True si tout a été écrit."""
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            if self._thread is None or not self._thread.is_alive():
+                break
+            time.sleep(0.02)
+        return not self._queue.unfinished_tasks
+
+    def close(self, timeout=PERSISTENCE_FLUSH_TIMEOUT_S):
+        if self._thread is not None and self._thread.is_alive():
+            flushed = self.flush(timeout)
+            if not flushed:
+                logging.warning(f"Persistance: {self._queue.unfinished_tasks} écriture(s) en attente non terminée(s) à l'arrêt.")
+            try:
+                self._queue.put_nowait(None)
+                self._thread.join(timeout=1.0)
+            except queue.Full:
+                pass
+        for log_file in self._open_log_files.values():
+            try: log_file.close()
+            except Exception: pass
+        self._open_log_files = {}
+        if self.archive is not None:
+            self.archive.close()
+        if self.dropped_screenshots or self.downsampled_screenshots or self.dropped_log_records:
+            logging.info(f"Persistance: {self.written_screenshots} captures écrites, {self.downsampled_screenshots} sous-échantillonnées, "
+                         f"{self.dropped_screenshots} abandonnées, {self.dropped_log_records} enregistrements de journal abandonnés.")
+
+persistence_worker = PersistenceWorker(archive=screenshot_archive if SCREENSHOT_STORAGE_MODE == "archive" else None)
+
+# --- Enregistrement des Sessions (corpus rejouable par replay_benchmark.py) ---
+SESSION_RECORDING_FORMAT_VERSION = 1
+
+class SessionRecorder:
+    """Enregistre chaque tâche dans un fichier JSONL rejouable hors ligne (replay_benchmark.py).
+
+    Une ligne d'en-tête, puis une ligne par pas (instruction, capture, prompt VLM, réponses brutes VLM et Qwen,
+    décision, actions exécutées, durées par étape), puis le résultat de la tâche. Les captures ne sont pas
+    dupliquées: chaque pas référence (chemin relatif) celle déjà écrite dans SCREENSHOTS_FOLDER. En mode "archive",
+    l'en-tête donne le dossier de l'archive (relatif au dossier des sessions) et chaque pas l'identifiant de sa trame,
+    pour rejouer la session ailleurs en copiant sessions et archive ensemble.
+    """
+
+    def __init__(self, enabled=SESSION_RECORDING_ENABLED, folder=SESSION_RECORDING_FOLDER):
+        self.enabled = enabled
+        self.folder = folder
+        self._path = None
+        self._step = None
+
+    def begin_session(self, goal):
+        if not self.enabled:
+            return
+        if self._path:
+            self.end_session("ABANDONED")
+        self._path = os.path.join(self.folder, f"session_{time.strftime('%Y%m%d-%H%M%S')}.jsonl")
+        self._write({"type": "session", "format_version": SESSION_RECORDING_FORMAT_VERSION, "goal": goal,
+                     "started_at": time.strftime("%Y-%m-%dT%H:%M:%S"), "screen_size": [SCREEN_WIDTH, SCREEN_HEIGHT],
+                     "vlm_model": VLM_MODEL_NAME_FOR_API, "qwen_model": QWEN_MODEL_NAME_FOR_API, "max_agent_steps": MAX_AGENT_STEPS,
+                     "screenshot_storage": SCREENSHOT_STORAGE_MODE,
+                     "screenshot_archive": os.path.relpath(SCREENSHOT_ARCHIVE_FOLDER, self.folder) if SCREENSHOT_STORAGE_MODE == "archive" else None})
+
+    def begin_step(self, step_count):
+        if not self._path:
+            return
+        self.end_step()
+        self._step = {"type": "step", "step": step_count}
+
+    def record(self, key, value):
+        if self._step is not None:
+            self._step[key] = value
+
+    def record_screenshot(self, screenshot_path, written):
+        if self._step is not None:
+            self._step["screenshot"] = os.path.relpath(screenshot_path, self.folder) if written else None
+            if written and SCREENSHOT_STORAGE_MODE == "archive": # Le fichier n'existe pas: la trame est dans l'archive
+                self._step["frame_id"] = ScreenshotArchive.frame_id_for(screenshot_path)
+
+    def end_step(self, step_trace=None):
+        if self._step is None:
+            return
+        if step_trace:
+            self._step["spans"] = step_trace.get("spans")
+            self._step["total_ms"] = step_trace.get("total_ms")
+        self._write(self._step)
+        self._step = None
+
+    def end_session(self, outcome):
+        if not self._path:
+            return
+        self.end_step()
+        self._write({"type": "outcome", "outcome": outcome, "ended_at": time.strftime("%Y-%m-%dT%H:%M:%S")})
+        self._path = None
+
+    def _write(self, entry):
+        persistence_worker.submit_log_record(self._path, json.dumps(entry, ensure_ascii=False, default=str) + "\n", timeout=2.0)
+
+session_recorder = SessionRecorder()
+
+# --- Cache des Réponses VLM ---
+class VlmResponseCache:
+    """Cache LRU des réponses VLM brutes, indexé par (modèle, instruction) puis par hash perceptuel de la capture.
+
+    Une entrée est servie si la distance de Hamming entre les hash est <= 'hamming_tolerance'. Seules les réponses
+    validées par parse_vlm_output_to_sequence puis exécutées sur décision de Qwen doivent y être insérées.
+    """
+
+    def __init__(self, enabled=VLM_RESPONSE_CACHE_ENABLED, max_entries=VLM_RESPONSE_CACHE_MAX_ENTRIES,
+                 max_bytes=VLM_RESPONSE_CACHE_MAX_BYTES, hamming_tolerance=VLM_RESPONSE_CACHE_HAMMING_TOLERANCE,
+                 persist_path=VLM_RESPONSE_CACHE_PATH, save_every=VLM_RESPONSE_CACHE_SAVE_EVERY):
+        self.enabled = enabled
+        self.max_entries = max(1, max_entries)
+        self.max_bytes = max(1, max_bytes)
+        self.hamming_tolerance = hamming_tolerance
+        self.persist_path = persist_path
+        self.save_every = max(1, save_every)
+        self._entries = OrderedDict() # (modèle, instruction, phash) -> réponse brute, ordre LRU
+        self._phashes_by_context = {} # (modèle, instruction) -> set(phash)
+        self._total_bytes = 0
+        self._unsaved_stores = 0
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.stores = 0
+        self.evictions = 0
+        self.invalidations = 0
+        if self.enabled and self.persist_path:
+            self.load()
+
+    def lookup(self, phash, instruction, model):
+        """Retourne (réponse, clé) si une capture proche a déjà été traitée pour cette instruction, sinon (None, None)."""
+        if not self.enabled or phash is None:
+            self.bypassed += 1
+            return None, None
+        best_key, best_distance = None, None
+        for cached_phash in self._phashes_by_context.get((model, instruction), ()):
+            distance = hamming_distance(phash, cached_phash)
+            if distance <= self.hamming_tolerance and (best_distance is None or distance < best_distance):
+                best_key, best_distance = (model, instruction, cached_phash), distance
+        if best_key is None:
+            self.misses += 1
+            return None, None
+        self.hits += 1
+        self._entries.move_to_end(best_key)
+        logging.info(f"Cache VLM: succès (distance de Hamming {best_distance}).")
+        return self._entries[best_key], best_key
+
+    def store(self, phash, instruction, model, response):
+        """Insère une réponse validée; retourne sa clé (à invalider si ses actions restent sans effet)."""
+        if not self.enabled or phash is None or not response:
+            return None
+        key = (model, instruction, phash)
+        if key in self._entries:
+            self._total_bytes -= len(self._entries[key].encode("utf-8"))
+        self._entries[key] = response
+        self._entries.move_to_end(key)
+        self._phashes_by_context.setdefault((model, instruction), set()).add(phash)
+        self._total_bytes += len(response.encode("utf-8"))
+        self.stores += 1
+        self._evict()
+        self._unsaved_stores += 1
+        if self.persist_path and self._unsaved_stores >= self.save_every:
+            self.save()
+        return key
+
+    def invalidate(self, key):
+        """Retire une entrée servie depuis le cache qui n'a finalement pas mené à une exécution réussie."""
+        if key in self._entries:
+            self._remove(key)
+            self.invalidations += 1
+
+    def _remove(self, key):
+        response = self._entries.pop(key)
+        self._total_bytes -= len(response.encode("utf-8"))
+        context_phashes = self._phashes_by_context.get(key[:2])
+        if context_phashes is not None:
+            context_phashes.discard(key[2])
+            if not context_phashes:
+                del self._phashes_by_context[key[:2]]
+
+    def _evict(self):
+        while self._entries and (len(self._entries) > self.max_entries or self._total_bytes > self.max_bytes):
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def load(self):
+        if not os.path.exists(self.persist_path):
+            return
+        try:
+            with open(self.persist_path, "r", encoding="utf-8") as cache_file:
+                data = json.load(cache_file)
+            for entry in data.get("entries", []): # Ordre LRU: du plus ancien au plus récent
+                key = (entry["model"], entry["instruction"], int(entry["phash"], 16))
+                self._entries[key] = entry["response"]
+                self._phashes_by_context.setdefault(key[:2], set()).add(key[2])
+                self._total_bytes += len(entry["response"].encode("utf-8"))
+            self._evict()
+            logging.info(f"Cache VLM: {len(self._entries)} entrée(s) chargée(s) depuis {self.persist_path}.")
+        except Exception as e:
+            logging.warning(f"Cache VLM: impossible de charger {self.persist_path}: {e}")
+
+    def save(self):
+        if not self.persist_path:
+            return
+        entries = [{"model": m, "instruction": instr, "phash": f"{ph:016x}", "response": resp}
+                   for (m, instr, ph), resp in self._entries.items()]
+        persistence_worker.submit_file_snapshot(self.persist_path, json.dumps({"version": 1, "entries": entries}, ensure_ascii=False))
+        self._unsaved_stores = 0
+
+    def close(self):
+        if self.enabled and self.persist_path and self._unsaved_stores:
+            self.save()
+
+    def stats_summary(self):
+        lookups = self.hits + self.misses
+        hit_rate = (100.0 * self.hits / lookups) if lookups else 0.0
+        return (f"Cache VLM: {self.hits} succès / {self.misses} échecs ({hit_rate:.0f}%), {self.bypassed} contournements, "
+                f"{self.stores} insertions, {self.evictions} évictions, {self.invalidations} invalidations, "
+                f"{len(self._entries)} entrées ({self._total_bytes / 1024:.0f} Ko)")
+
+vlm_response_cache = VlmResponseCache()
+
+# --- Rejeu de Trajectoires Connues ---
+class TrajectoryReplayCache:
+    """Séquences d'actions exécutées lors des tâches terminées (TASK_COMPLETED), par objectif normalisé et résolution.
+
+    Chaque étape garde l'empreinte perceptuelle de l'écran sur lequel ses actions ont été exécutées. Pour un objectif
+    connu, les étapes sont rejouées sans VLM ni Qwen tant que l'écran correspond; à la première divergence, la boucle
+    normale reprend. La fin de la tâche reste toujours confirmée par les modèles.
+    """
+
+    def __init__(self, enabled=TRAJECTORY_REPLAY_ENABLED, persist_path=TRAJECTORY_STORE_PATH,
+                 max_entries=TRAJECTORY_MAX_ENTRIES, hamming_tolerance=TRAJECTORY_HAMMING_TOLERANCE):
+        self.enabled = enabled
+        self.persist_path = persist_path
+        self.max_entries = max(1, max_entries)
+        self.hamming_tolerance = hamming_tolerance
+        self._trajectories = OrderedDict() # (objectif normalisé, "LxH") -> {"goal", "steps": [{"phash", "actions", "model_ms"}]}
+        self._dirty = False
+        self._task_key = None
+        self._recorded_steps = []
+        self._replay_steps = []
+        self._replay_index = 0
+        self.task_replayed_steps = 0
+        self.task_saved_ms = 0.0
+        self.replayed_steps_total = 0
+        self.saved_ms_total = 0.0
+        self.divergences = 0
+        self.stores = 0
+        if self.enabled and self.persist_path:
+            self.load()
+
+    @staticmethod
+    def normalize_goal(goal):
+        """Minuscules, sans accents ni ponctuation, espaces réduits: "Ouvre  Safari !" -> "ouvre safari"."""
+        decomposed = unicodedata.normalize("NFKD", str(goal))
+        without_accents = "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+        return " ".join(re.sub(r"[^\w]+", " ", without_accents.lower()).split())
+
+    def _key_for(self, goal):
+        return (self.normalize_goal(goal), f"{SCREEN_WIDTH}x{SCREEN_HEIGHT}")
+
+    @property
+    def replay_pending(self):
+        return self._replay_index < len(self._replay_steps)
+
+    def begin_task(self, goal):
+        self._task_key = self._key_for(goal) if self.enabled else None
+        self._recorded_steps = []
+        self._replay_index = 0
+        self.task_replayed_steps = 0
+        self.task_saved_ms = 0.0
+        trajectory = self._trajectories.get(self._task_key) if self._task_key else None
+        self._replay_steps = list(trajectory["steps"]) if trajectory else []
+        if self._replay_steps:
+            self._trajectories.move_to_end(self._task_key)
+            msg = f"Trajectoire connue pour cet objectif: {len(self._replay_steps)} étape(s) rejouables tant que l'écran correspond."
+            logging.info(msg)
+            rich_print(f"[grey50]{msg}[/grey50]")
+
+    def next_replay_step(self, phash):
+        """Étape suivante de la trajectoire si l'écran courant correspond à son empreinte, sinon None (fin du rejeu)."""
+        if not self.replay_pending:
+            return None
+        step = self._replay_steps[self._replay_index]
+        distance = hamming_distance(phash, step["phash"]) if phash is not None else None
+        if distance is None or distance > self.hamming_tolerance:
+            self.abort_replay(f"écran différent de l'étape {self._replay_index + 1} enregistrée (distance {distance})")
+            return None
+        self._replay_index += 1
+        logging.info(f"Rejeu de trajectoire: étape {self._replay_index}/{len(self._replay_steps)} (distance de Hamming {distance}), "
+                     f"{len(step['actions'])} action(s) sans appel de modèle.")
+        return step
+
+    def abort_replay(self, reason):
+        if not self.replay_pending:
+            return
+        self.divergences += 1
+        logging.info(f"Rejeu de trajectoire interrompu ({reason}). Reprise de la boucle VLM + Qwen.")
+        rich_print(f"[grey50]Rejeu de trajectoire interrompu ({reason}). Reprise de la boucle VLM + Qwen.[/grey50]")
+        self._replay_index = len(self._replay_steps)
+
+    def build_decision(self, step):
+        """Décision équivalente à une séquence dirigée par Qwen, pour que l'exécution et l'historique restent inchangés."""
+        return {
+            "decision_type": "EXECUTE_MODIFIED_SEQUENCE",
+            "reasoning": f"Rejeu de trajectoire (étape {self._replay_index}/{len(self._replay_steps)} d'une exécution réussie, écran identique).",
+            "action_sequence_to_execute": json.loads(json.dumps(step["actions"])), # Copie: les actions sont normalisées en place
             "next_vlm_instruction": None,
-            "user_summary_message": "Le module de stratégie interne (Qwen) a rencontré une erreur critique."
+            "user_summary_message": None,
         }
 
+    def record_step(self, phash, executed_actions, model_ms, replayed_step=None):
+        """Mémorise les actions effectivement exécutées à cette étape (étapes sans action ignorées)."""
+        if self._task_key is None:
+            return
+        actions = [dict(a) for a in executed_actions if a.get("action_type") != "FINISHED"]
+        if replayed_step is not None:
+            self.task_replayed_steps += 1
+            self.task_saved_ms += replayed_step.get("model_ms", 0.0)
+            model_ms = replayed_step.get("model_ms", 0.0) # Coût de référence conservé pour les rejeux suivants
+        if actions and phash is not None:
+            self._recorded_steps.append({"phash": phash, "actions": actions, "model_ms": round(model_ms, 1)})
+
+    def end_task(self, outcome):
+        """Enregistre la trajectoire si la tâche est terminée avec succès et journalise la couverture du rejeu."""
+        if self._task_key is None:
+            return
+        if self._replay_steps:
+            coverage = 100.0 * self.task_replayed_steps / len(self._replay_steps)
+            msg = (f"Rejeu de trajectoire: {self.task_replayed_steps}/{len(self._replay_steps)} étape(s) rejouée(s) ({coverage:.0f}%), "
+                   f"~{self.task_saved_ms / 1000:.1f}s d'appels de modèles évités.")
+            logging.info(msg)
+            rich_print(f"[grey50]{msg}[/grey50]")
+        self.replayed_steps_total += self.task_replayed_steps
+        self.saved_ms_total += self.task_saved_ms
+        if outcome == "TASK_COMPLETED" and self._recorded_steps:
+            self._trajectories[self._task_key] = {"goal": self._task_key[0], "steps": self._recorded_steps}
+            self._trajectories.move_to_end(self._task_key)
+            while len(self._trajectories) > self.max_entries:
+                self._trajectories.popitem(last=False)
+            self.stores += 1
+            self._dirty = True
+            self.save()
+        self._task_key, self._replay_steps, self._replay_index = None, [], 0
+
+    def load(self):
+        if not os.path.exists(self.persist_path):
+            return
+        try:
+            with open(self.persist_path, "r", encoding="utf-8") as store_file:
+                data = json.load(store_file)
+            for entry in data.get("trajectories", []): # Ordre LRU: du plus ancien au plus récent
+                steps = [{"phash": int(step["phash"], 16), "actions": step["actions"], "model_ms": step.get("model_ms", 0.0)}
+                         for step in entry["steps"]]
+                self._trajectories[(entry["goal"], entry["screen_size"])] = {"goal": entry["goal"], "steps": steps}
+            logging.info(f"Trajectoires: {len(self._trajectories)} objectif(s) chargé(s) depuis {self.persist_path}.")
+        except Exception as e:
+            logging.warning(f"Trajectoires: impossible de charger {self.persist_path}: {e}")
+
+    def save(self):
+        if not self.persist_path or not self._dirty:
+            return
+        entries = [{"goal": goal, "screen_size": screen_size,
+                    "steps": [{"phash": f"{step['phash']:016x}", "actions": step["actions"], "model_ms": step["model_ms"]} for step in trajectory["steps"]]}
+                   for (goal, screen_size), trajectory in self._trajectories.items()]
+        persistence_worker.submit_file_snapshot(self.persist_path, json.dumps({"version": 1, "trajectories": entries}, ensure_ascii=False))
+        self._dirty = False
+
+    def close(self):
+        if self.enabled:
+            self.save()
+
+    def stats_summary(self):
+        return (f"Trajectoires: {len(self._trajectories)} objectif(s) connus, {self.stores} enregistrée(s), "
+                f"{self.replayed_steps_total} étape(s) rejouée(s), {self.divergences} divergence(s), "
+                f"~{self.saved_ms_total / 1000:.1f}s d'appels de modèles évités")
+
+trajectory_replay_cache = TrajectoryReplayCache()
+
+# --- Moteur d'Exécution des Étapes (asyncio, délais, annulation, recouvrement) ---
+class StageCancelled(RuntimeError):
+    """Étape annulée par l'utilisateur (Ctrl+C pendant une requête de modèle, moteur asynchrone)."""
+
+class StageDeadlineExceeded(TimeoutError):
+    """Étape abandonnée: son délai (AGENT_STAGE_DEADLINES) est dépassé."""
+
+class AgentEngine:
+    """Exécute les étapes d'un pas de l'agent (capture, encodage, requêtes VLM/Qwen).
+
+    "sync" (compatibilité): chaque étape est appelée directement, dans l'ordre, comme avant.
+    "async": une boucle asyncio, dans un thread dédié, exécute les étapes sur un pool de threads avec un délai par
+    étape, lance ensemble les étapes indépendantes (gather) ou en arrière-plan, et annule la requête en cours sur
+    Ctrl+C (la tâche est alors abandonnée au lieu de quitter l'agent). Le thread principal garde les actions GUI
+    (Tk et pyautogui sur macOS): les callbacks enveloppés par call_in_main_thread() y sont exécutés pendant qu'il
+    attend la fin d'une étape. Chaque étape a son propre jeton d'annulation (new_cancel_token()), levé au délai
+    dépassé ou à Ctrl+C: une requête en streaming s'y arrête et les actions qu'elle a déjà envoyées au thread
+    principal sont ignorées au lieu d'être exécutées pendant une étape suivante. Une étape abandonnée sans point
+    d'annulation coopératif finit en arrière-plan et son résultat est ignoré.
+    """
+
+    def __init__(self, mode=AGENT_ENGINE, deadlines_s=AGENT_STAGE_DEADLINES_S, max_workers=AGENT_ENGINE_WORKERS):
+        self.mode = mode if mode in ("async", "sync") else "async"
+        self.deadlines_s = deadlines_s
+        self.max_workers = max(2, max_workers)
+        self._active_tokens = set() # Jetons d'annulation des étapes en cours, levés à la fermeture
+        self._start_lock = threading.Lock()
+        self._loop = None
+        self._thread = None
+        self._executor = None
+        self._main_thread_calls = queue.SimpleQueue()
+        self._cancel_requested = False
+        self.stages = 0
+        self.overlapped = 0
+        self.background = 0
+        self.deadlines_exceeded = 0
+        self.cancelled = 0
+
+    def deadline_for(self, stage):
+        deadline_s = self.deadlines_s.get(stage, self.deadlines_s.get(stage.split(".")[0]))
+        return deadline_s if deadline_s and deadline_s > 0 else None
+
+    def start(self):
+        if self.mode != "async" or self._loop is not None:
+            return
+        with self._start_lock:
+            if self._loop is not None:
+                return
+            loop = asyncio.new_event_loop()
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="engine-stage")
+            loop.set_default_executor(self._executor)
+            ready = threading.Event()
+            def run_loop():
+                asyncio.set_event_loop(loop)
+                loop.call_soon(ready.set)
+                loop.run_forever()
+            self._thread = threading.Thread(target=run_loop, name="agent-engine", daemon=True)
+            self._thread.start()
+            ready.wait(2.0)
+            self._loop = loop
+
+    def new_cancel_token(self):
+        """Jeton d'annulation d'une étape (à passer à run() et à call_in_main_thread()); None en mode "sync"."""
+        return threading.Event() if self.mode == "async" else None
+
+    async def _run_stage(self, stage, call, cancel_token=None):
+        deadline_s = self.deadline_for(stage)
+        try:
+            return await asyncio.wait_for(asyncio.get_running_loop().run_in_executor(None, call), deadline_s)
+        except asyncio.TimeoutError:
+            self.deadlines_exceeded += 1
+            if cancel_token is not None: # Arrête aussi une requête VLM en streaming à son prochain fragment
+                cancel_token.set()
+            raise StageDeadlineExceeded(f"Étape '{stage}': délai de {deadline_s:g}s dépassé.") from None
+
+    def _wait(self, coroutine, cancellable, cancel_token=None):
+        future = asyncio.run_coroutine_threadsafe(coroutine, self._loop)
+        try:
+            while True:
+                done, _ = wait_for_futures([future], timeout=0.05)
+                if done:
+                    return future.result()
+                self._run_main_thread_calls()
+                action_overlay.pump() # Mode "main": Tk n'a pas d'autre occasion de tourner pendant une requête
+        except KeyboardInterrupt:
+            if cancel_token is not None:
+                cancel_token.set()
+            future.cancel()
+            if not cancellable:
+                raise
+            self.cancelled += 1
+            self._cancel_requested = True
+            logging.warning("Interruption: requête en cours annulée, la tâche est abandonnée.")
+            rich_print("\n[bold yellow]Interruption: requête en cours annulée, la tâche est abandonnée (Ctrl+C à la saisie de l'objectif pour quitter).[/bold yellow]")
+            raise StageCancelled("Étape annulée par l'utilisateur.") from None
+
+    def run(self, stage, fn, *args, cancellable=False, cancel_token=None, **kwargs):
+        """Exécute fn(*args, **kwargs) comme l'étape 'stage'. 'cancellable': Ctrl+C annule l'étape (StageCancelled).
+        'cancel_token': jeton propre à l'étape (new_cancel_token()), levé si elle est abandonnée."""
+        if self.mode != "async":
+            return fn(*args, **kwargs)
+        self.start()
+        cancel_token = cancel_token if cancel_token is not None else threading.Event()
+        self.stages += 1
+        self._active_tokens.add(cancel_token)
+        try:
+            return self._wait(self._run_stage(stage, functools.partial(fn, *args, **kwargs), cancel_token),
+                              cancellable, cancel_token)
+        finally:
+            self._active_tokens.discard(cancel_token)
+
+    def gather(self, *stages):
+        """Exécute ensemble des étapes indépendantes [(nom, callable ou None), ...]; retourne leurs résultats dans l'ordre."""
+        if self.mode != "async":
+            return [call() if call is not None else None for _, call in stages]
+        self.start()
+        active = [(stage, call) for stage, call in stages if call is not None]
+        self.stages += len(active)
+        self.overlapped += max(0, len(active) - 1)
+        async def run_all():
+            return await asyncio.gather(*(self._run_stage(stage, call) for stage, call in active))
+        results = iter(self._wait(run_all(), cancellable=False))
+        return [next(results) if call is not None else None for _, call in stages]
+
+    def run_in_background(self, stage, call):
+        """Lance une étape sans l'attendre (ex: encodage pour Qwen pendant la requête VLM); rien en mode "sync"."""
+        if self.mode != "async":
+            return None
+        self.start()
+        self.background += 1
+        future = asyncio.run_coroutine_threadsafe(self._run_stage(stage, call), self._loop)
+        future.add_done_callback(lambda f: f.cancelled() or f.exception() is None or
+                                 logging.warning(f"Étape '{stage}' en arrière-plan échouée: {f.exception()}"))
+        return future
+
+    def call_in_main_thread(self, fn, cancel_token=None):
+        """Enveloppe fn pour qu'un appel depuis une étape en arrière-plan s'exécute dans le thread principal.
+        Les appels d'une étape dont 'cancel_token' est levé ne sont plus exécutés."""
+        if self.mode != "async":
+            return fn
+        def marshalled(*args, **kwargs):
+            if threading.current_thread() is threading.main_thread():
+                return fn(*args, **kwargs)
+            if cancel_token is not None and cancel_token.is_set():
+                raise StageCancelled("Étape annulée: action ignorée.")
+            done = Future()
+            self._main_thread_calls.put((functools.partial(fn, *args, **kwargs), done, cancel_token))
+            while True:
+                try:
+                    return done.result(timeout=0.1)
+                except FuturesTimeoutError:
+                    if cancel_token is not None and cancel_token.is_set(): # Étape abandonnée: appel retiré
+                        done.cancel()
+                        raise StageCancelled("Étape annulée pendant l'attente d'une action.") from None
+                except CancelledError:
+                    raise StageCancelled("Étape annulée: action ignorée.") from None
+        return marshalled
+
+    def _run_main_thread_calls(self):
+        while True:
+            try:
+                call, done, cancel_token = self._main_thread_calls.get_nowait()
+            except queue.Empty:
+                return
+            if cancel_token is not None and cancel_token.is_set(): # Action d'une étape abandonnée: jamais exécutée
+                done.cancel()
+            if not done.set_running_or_notify_cancel():
+                continue
+            try:
+                done.set_result(call())
+            except BaseException as e:
+                done.set_exception(e)
+                if not isinstance(e, Exception): # Ctrl+C pendant l'action: annulation de l'étape
+                    raise
+
+    def consume_cancel_request(self):
+        """True (une seule fois) si l'utilisateur a annulé une étape de la tâche en cours."""
+        cancel_requested, self._cancel_requested = self._cancel_requested, False
+        return cancel_requested
+
+    def close(self):
+        if self._loop is not None:
+            for cancel_token in list(self._active_tokens):
+                cancel_token.set()
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(timeout=1.0)
+            self._executor.shutdown(wait=False)
+            self._loop = None
+
+    def stats_summary(self):
+        return (f"Moteur {self.mode}: {self.stages} étape(s) exécutée(s), {self.overlapped} recouverte(s), "
+                f"{self.background} en arrière-plan, {self.deadlines_exceeded} délai(s) dépassé(s), {self.cancelled} annulation(s)")
+
+agent_engine = AgentEngine()
+
 # --- Boucle Principale de l'Agent ---
 def main_agent_loop():
     rich_print("[bold blue]Assistant de Navigation GUI (Architecture à Deux Niveaux)[/bold blue]")
-    logging.info(f"Utilisation VLM Frontend: API Base: {OPENAI_API_BASE_URL}, Modèle: {VLM_MODEL_NAME_FOR_API}")
-    logging.info(f"Utilisation LLM Backend (Qwen): API Base: {OPENAI_API_BASE_URL}, Modèle: {QWEN_MODEL_NAME_FOR_API}")
+    initialize_gui_backend()
+    preload_modules_in_background(openai, np) # Pendant la saisie de l'objectif
+    agent_engine.start()
+    if AUDIO_ENABLED:
+        sound_bank.start()
+    logging.info(f"Utilisation VLM Frontend: API Base: {vlm_endpoint_pool.describe()}, Modèle: {VLM_MODEL_NAME_FOR_API}")
+    logging.info(f"Utilisation LLM Backend (Qwen): API Base: {qwen_endpoint_pool.describe()}, Modèle: {QWEN_MODEL_NAME_FOR_API}")
     logging.info(f"Résolution d'écran: {SCREEN_WIDTH}x{SCREEN_HEIGHT}")
-    rich_print(f"Utilisation VLM Frontend: API Base: {OPENAI_API_BASE_URL}, Modèle: {VLM_MODEL_NAME_FOR_API}")
-    rich_print(f"Utilisation LLM Backend (Qwen): API Base: {OPENAI_API_BASE_URL}, Modèle: {QWEN_MODEL_NAME_FOR_API}")
+    rich_print(f"Utilisation VLM Frontend: API Base: {vlm_endpoint_pool.describe()}, Modèle: {VLM_MODEL_NAME_FOR_API}")
+    rich_print(f"Utilisation LLM Backend (Qwen): API Base: {qwen_endpoint_pool.describe()}, Modèle: {QWEN_MODEL_NAME_FOR_API}")
     rich_print(f"Résolution d'écran: {SCREEN_WIDTH}x{SCREEN_HEIGHT}")
+    engine_deadlines = ", ".join(f"{stage}={seconds:g}s" for stage, seconds in agent_engine.deadlines_s.items() if seconds > 0) or "aucun"
+    logging.info(f"Moteur d'exécution: {agent_engine.mode} (délais par étape: {engine_deadlines if agent_engine.mode == 'async' else 'non appliqués'})")
+    if EXECUTION_PROFILE_NAME not in EXECUTION_PROFILES:
+        logging.warning(f"Profil d'exécution inconnu '{EXECUTION_PROFILE_NAME}', profil 'normal' utilisé.")
+    logging.info(f"Profil d'exécution: {EXECUTION_PROFILE_NAME if EXECUTION_PROFILE_NAME in EXECUTION_PROFILES else 'normal'} {dict(EXECUTION_PROFILE._asdict())}"
+                 f"{' (auto-réglage des pauses actif)' if action_timing_tuner.enabled else ''}")
     rich_print("Tapez 'exit' ou 'quit' pour quitter.")
     if "internvl3-1b" in VLM_MODEL_NAME_FOR_API or "internvl3-2b" in VLM_MODEL_NAME_FOR_API: # Exemple
         rich_print("[yellow]Note: Les petits modèles VLM peuvent avoir des difficultés avec des prompts JSON complexes.[/yellow]")
     if "4096" in "some_server_config_variable_for_vlm_context_length": # Hypothetical check
         rich_print("[yellow]Attention: Le VLM pourrait être chargé avec une fenêtre de contexte limitée (ex: 4096 tokens). Des prompts longs avec historique peuvent échouer.[/yellow]")
-
+    stage_tracer.start_exporter()
+    startup_profiler.mark("prêt")
+    logging.info(startup_profiler.summary())
+    rich_print(f"[grey50]{startup_profiler.summary()}[/grey50]")
 
     overall_user_task = ""
-    interaction_history = []
+    interaction_history = InteractionHistory()
     current_task_step_count = 0
     current_vlm_instruction = ""
     consecutive_vlm_failures_for_current_instruction = 0
+    last_step_action_failed = False
+    last_click_frame_phash = None # Capture sur laquelle les derniers clics ont été décidés (détection des clics sans effet)
+    last_vlm_cache_key = None # Entrée du cache VLM servie ou insérée à l'étape précédente
 
     while True:
         if not overall_user_task:
@@ -829,14 +4461,23 @@ def main_agent_loop():
             if not new_task_input: continue
 
             overall_user_task = new_task_input
-            interaction_history = []
+            speculative_vlm_prefetcher.discard("nouvel objectif")
+            qwen_fast_path_report.reset()
+            prompt_cache_stats.reset()
+            stage_tracer.reset_task()
+            session_recorder.begin_session(new_task_input)
+            trajectory_replay_cache.begin_task(new_task_input)
+            screenshot_archive.begin_task(new_task_input)
+            interaction_history = InteractionHistory()
             current_task_step_count = 0
             # L'instruction VLM initiale est l'objectif global de l'utilisateur
             current_vlm_instruction = overall_user_task
             consecutive_vlm_failures_for_current_instruction = 0
+            last_step_action_failed, last_click_frame_phash, last_vlm_cache_key = False, None, None
             rich_print(f"\n[bold magenta]Nouvel Objectif Global Utilisateur:[/] {overall_user_task}"); play_sound_feedback("ask.wav")
 
         current_task_step_count += 1
+        stage_tracer.begin_step(overall_user_task, current_task_step_count)
         rich_print(f"\n[bold_white on_blue]>>> Traitement Étape {current_task_step_count}/{MAX_AGENT_STEPS} pour Objectif: '{overall_user_task}' <<[/bold_white on_blue]")
         logging.info(f"Étape {current_task_step_count}/{MAX_AGENT_STEPS} pour '{overall_user_task}'. Instr. VLM: '{current_vlm_instruction}' (Échecs VLM consécutifs sur cette instr.: {consecutive_vlm_failures_for_current_instruction})")
         rich_print(f"Instruction VLM Actuelle: '{current_vlm_instruction}' (Échecs VLM sur cette instr.: {consecutive_vlm_failures_for_current_instruction})")
@@ -845,94 +4486,217 @@ def main_agent_loop():
         if current_task_step_count > MAX_AGENT_STEPS:
             logging.error(f"Nombre maximum d'étapes ({MAX_AGENT_STEPS}) atteint. La tâche '{overall_user_task}' a échoué.")
             rich_print(f"[bold red]Nombre maximum d'étapes ({MAX_AGENT_STEPS}) atteint. La tâche '{overall_user_task}' a échoué.[/bold red]"); play_sound_feedback("error.wav")
+            session_recorder.end_session("MAX_AGENT_STEPS")
+            screenshot_archive.end_task("MAX_AGENT_STEPS")
             overall_user_task = ""
             continue
 
-        time.sleep(0.3)
+        session_recorder.begin_step(current_task_step_count)
+        session_recorder.record("instruction", current_vlm_instruction)
+        session_recorder.record("consecutive_vlm_failures", consecutive_vlm_failures_for_current_instruction)
+
+        t_stage = stage_tracer.now()
+        vlm_history_window = interaction_history.vlm_prompt_window()
+        stage_tracer.record("history.window", t_stage)
+        # Requête VLM spéculative lancée à la fin de l'étape précédente: utilisable si l'instruction et l'historique correspondent
+        speculative_prefetch = speculative_vlm_prefetcher.claim(current_vlm_instruction, vlm_history_window)
+
+        settled_frame = None
+        t_stage = stage_tracer.now()
+        if speculative_prefetch is not None:
+            settled_frame = speculative_prefetch["frame"] # Écran déjà stabilisé et capturé lors de la spéculation
+        else:
+            action_overlay.hide(wait_s=0.1) # L'overlay ne doit pas apparaître dans la capture envoyée aux modèles
+            if SETTLE_DETECTOR_ENABLED: # Attendre la fin du rendu plutôt qu'une pause fixe
+                settled, settle_elapsed, settled_frame = wait_for_screen_stable(timeout_s=SETTLE_TIMEOUT_S)
+                settled_frame = screen_geometry.to_capture_resolution(settled_frame)
+                logging.info(f"Écran {'stable' if settled else 'encore en mouvement (timeout)'} après {settle_elapsed:.2f}s avant capture.")
+            else:
+                time.sleep(PRE_CAPTURE_FIXED_DELAY_S)
+        if speculative_prefetch is None:
+            stage_tracer.record("settle.pre_capture", t_stage)
         timestamp = time.strftime("%Y%m%d-%H%M%S")
-        screenshots_folder = "agent_gui_screenshots_api"
-        os.makedirs(screenshots_folder, exist_ok=True)
-        screenshot_filename = f"etape_{current_task_step_count}_{timestamp}.png"
+        screenshots_folder = SCREENSHOTS_FOLDER
+        screenshot_filename = f"etape_{current_task_step_count}_{timestamp}.{persistence_worker.screenshot_extension}"
         screenshot_path = os.path.join(screenshots_folder, screenshot_filename)
         
         screenshot_image_pil = None
         try:
-            screenshot_image_pil = ImageGrab.grab()
-            screenshot_image_pil.save(screenshot_path)
-            logging.info(f"Capture d'écran: {screenshot_path}")
-            rich_print(f"Capture d'écran: {screenshot_path}")
+            t_stage = stage_tracer.now()
+            screenshot_image_pil = settled_frame if settled_frame is not None else agent_engine.run("capture", screen_geometry.grab)
+            stage_tracer.record("capture", t_stage, reused_settle_frame=settled_frame is not None)
+            t_stage = stage_tracer.now()
+            screenshot_submitted = persistence_worker.submit_screenshot(screenshot_image_pil, screenshot_path)
+            stage_tracer.record("persist.submit_screenshot", t_stage)
+            session_recorder.record_screenshot(screenshot_path, screenshot_submitted)
+            if screenshot_submitted: # Écriture en arrière-plan
+                archived_note = " (archive dédupliquée)" if persistence_worker.archive is not None else ""
+                logging.info(f"Capture d'écran: {screenshot_path}{archived_note}")
+                rich_print(f"Capture d'écran: {screenshot_path}{archived_note}")
         except Exception as e:
             logging.error(f"Erreur lors de la capture d'écran: {e}"); rich_print(f"[red]Erreur capture écran: {e}[/red]"); play_sound_feedback("error.wav")
             time.sleep(1); continue
 
-        image_b64_url_for_vlm = image_to_base64_url(screenshot_image_pil, target_format="PNG") if screenshot_image_pil else None
+        # Encodage VLM et hash perceptuel en parallèle (moteur asynchrone); l'encodage pour un Qwen-VL est lancé en
+        # arrière-plan pendant la requête VLM (résultat repris par frame_encoding_cache si Qwen est appelé)
+        needs_phash = vlm_response_cache.enabled or grounding_refiner.enabled or trajectory_replay_cache.enabled
+        if screenshot_image_pil and "VL" in QWEN_MODEL_NAME_FOR_API.upper():
+            agent_engine.run_in_background("encode.qwen_prefetch", functools.partial(
+                frame_encoding_cache.encode, screenshot_image_pil, QWEN_IMAGE_MAX_SIZE, QWEN_IMAGE_FORMAT, QWEN_IMAGE_QUALITY, QWEN_IMAGE_DETAIL))
+        try:
+            encoded_frame_for_vlm, screenshot_phash = agent_engine.gather(
+                ("encode.vlm", stage_tracer.traced("encode.vlm")(functools.partial(
+                    frame_encoding_cache.encode, screenshot_image_pil, VLM_IMAGE_MAX_SIZE, VLM_IMAGE_FORMAT, VLM_IMAGE_QUALITY, VLM_IMAGE_DETAIL))
+                 if screenshot_image_pil else None),
+                ("phash", stage_tracer.traced("phash")(functools.partial(compute_perceptual_hash, screenshot_image_pil))
+                 if screenshot_image_pil and needs_phash else None))
+        except StageDeadlineExceeded as e_stage:
+            logging.error(str(e_stage))
+            encoded_frame_for_vlm, screenshot_phash = None, None
+        image_b64_url_for_vlm = encoded_frame_for_vlm.data_url if encoded_frame_for_vlm else None
         if not image_b64_url_for_vlm:
             logging.error("Échec de l'encodage de la capture d'écran pour VLM."); rich_print("[red]Échec encodage capture pour VLM.[/red]"); play_sound_feedback("error.wav")
             time.sleep(1); continue
+        log_frame_encoding("VLM", screenshot_image_pil, encoded_frame_for_vlm)
 
-        vlm_history_summary_for_prompt = []
-        for hist_json_str, _ in interaction_history:
-            try:
-                entry = json.loads(hist_json_str)
-                # Rendre le résumé plus concis pour le VLM
-                vlm_instr_hist = entry.get("vlm_instruction_given_to_vlm", "N/A")[:100] # Tronquer
-                q_dec_obj_hist = entry.get("qwen_decision_obj", {})
-                q_dec_type_hist = q_dec_obj_hist.get("decision_type", "N/A")
-                q_reason_hist = q_dec_obj_hist.get("reasoning", "N/A")[:100] # Tronquer
-                
-                summary_line = f"Prev. VLM instruction: '{vlm_instr_hist}...'. Qwen decided: '{q_dec_type_hist}' (Reason: '{q_reason_hist}...') "
-                exec_actions_hist = entry.get("executed_action_sequence")
-                if exec_actions_hist and isinstance(exec_actions_hist, list):
-                    action_types_exec = [a.get('action_type', '?') for a in exec_actions_hist if isinstance(a, dict)]
-                    summary_line += f" Executed: {action_types_exec}."
-                else:
-                    summary_line += " No direct GUI actions taken or other path chosen."
-                vlm_history_summary_for_prompt.append(summary_line)
-            except Exception as e_hist_parse:
-                logging.warning(f"Erreur parsing historique pour prompt VLM: {e_hist_parse}")
-                vlm_history_summary_for_prompt.append("(Erreur parsing entrée historique)")
-        
         # Stocker l'instruction VLM qui *va être donnée* pour le log, pas celle de la prochaine étape
         vlm_instruction_for_this_turn_log = current_vlm_instruction
 
-        api_messages_for_vlm = build_messages_for_vlm_api(VLM_SYSTEM_PROMPT, current_vlm_instruction, image_b64_url_for_vlm, vlm_history_summary_for_prompt)
+        t_stage = stage_tracer.now()
+        api_messages_for_vlm = build_messages_for_vlm_api(VLM_SYSTEM_PROMPT, current_vlm_instruction, image_b64_url_for_vlm, vlm_history_window.recent_lines,
+                                                          history_total_count=vlm_history_window.total_count)
+        stage_tracer.record("history.build_vlm", t_stage)
+        session_recorder.record("vlm_prompt_text", api_messages_for_vlm[-1]["content"][0]["text"])
         
         vlm_raw_response_str = ""; parsed_vlm_data = None; vlm_api_or_parse_error_msg = None
-        try:
-            logging.info(f"Envoi de la requête au VLM Frontend (Modèle: {VLM_MODEL_NAME_FOR_API})...")
-            rich_print(f"Envoi de la requête au VLM Frontend (Modèle: {VLM_MODEL_NAME_FOR_API})...")
-            vlm_completion = client.chat.completions.create(
-                model=VLM_MODEL_NAME_FOR_API,
-                messages=api_messages_for_vlm,
-                max_tokens=1500, # Augmenté légèrement, mais attention au contexte
-                temperature=0.01 # Très bas pour la structure JSON
-            )
-            vlm_raw_response_str = vlm_completion.choices[0].message.content
-            logging.debug(f"Réponse Brute VLM (premiers 300): {vlm_raw_response_str[:300]}...")
-            rich_print(f"[grey50]Réponse Brute VLM (premiers 300): {vlm_raw_response_str[:300]}...[/grey50]")
+        early_dispatched_actions = []; early_dispatch_failed = False; streamed_action_count = 0
+
+        def dispatch_streamed_micro_action(micro_action):
+            """Exécute une micro-action reçue en streaming si la politique de dispatch anticipé l'autorise."""
+            nonlocal early_dispatch_failed, streamed_action_count
+            index = streamed_action_count
+            streamed_action_count += 1
+            if early_dispatch_failed or not validate_vlm_micro_action(micro_action, index):
+                return
+            if not should_dispatch_micro_action_early(micro_action, index, early_dispatched_actions, consecutive_vlm_failures_for_current_instruction):
+                return
+            rich_print(f"\n--- Exécution anticipée micro-action {index+1} (streaming VLM, avant approbation Qwen) ---")
+            if execute_micro_action(micro_action):
+                early_dispatched_actions.append(micro_action)
+            else:
+                early_dispatch_failed = True
+        # Cache des réponses VLM: pas de consultation quand l'instruction courante a déjà échoué (il faut une réponse neuve)
+        click_had_no_effect = (last_click_frame_phash is not None and screenshot_phash is not None
+                               and hamming_distance(screenshot_phash, last_click_frame_phash) <= GROUNDING_NO_EFFECT_HAMMING)
+        if click_had_no_effect:
+            logging.info("Les clics de l'étape précédente n'ont eu aucun effet visible (capture quasi identique).")
+            if last_vlm_cache_key is not None: # Sinon la même réponse serait resservie sur le même écran, en boucle
+                vlm_response_cache.invalidate(last_vlm_cache_key)
+        grounding_after_failure = last_step_action_failed or click_had_no_effect
+        # Trajectoire connue pour cet objectif: si l'écran correspond à l'étape enregistrée, ni VLM ni Qwen ne sont appelés
+        trajectory_step = trajectory_replay_cache.next_replay_step(screenshot_phash)
+        t_step_models = time.perf_counter()
+        cached_vlm_response, vlm_cache_key_used = None, None
+        vlm_result = None
+        if (trajectory_step is None and consecutive_vlm_failures_for_current_instruction == 0 and speculative_prefetch is None
+                and not grounding_after_failure):
+            cached_vlm_response, vlm_cache_key_used = vlm_response_cache.lookup(screenshot_phash, current_vlm_instruction, VLM_MODEL_NAME_FOR_API)
+        if trajectory_step is None:
+            try:
+                if cached_vlm_response is not None:
+                    vlm_raw_response_str = cached_vlm_response
+                    rich_print("[grey50]Réponse VLM servie depuis le cache (capture quasi identique, même instruction).[/grey50]")
+                else:
+                    t_stage = stage_tracer.now()
+                    if speculative_prefetch is not None:
+                        rich_print("[grey50]Utilisation de la requête VLM spéculative lancée à la fin de l'étape précédente.[/grey50]")
+                        vlm_result = agent_engine.run("vlm", speculative_vlm_prefetcher.collect, speculative_prefetch, cancellable=True)
+                    else:
+                        logging.info(f"Envoi de la requête au VLM Frontend (Modèle: {VLM_MODEL_NAME_FOR_API})...")
+                        rich_print(f"Envoi de la requête au VLM Frontend (Modèle: {VLM_MODEL_NAME_FOR_API})...")
+                        vlm_cancel_token = agent_engine.new_cancel_token() # Propre à cette requête: ses actions tardives sont ignorées
+                        vlm_result = agent_engine.run("vlm", request_vlm_completion, vlm_endpoint_pool, api_messages_for_vlm, cancellable=True,
+                                                      cancel_token=vlm_cancel_token,
+                                                      on_micro_action=agent_engine.call_in_main_thread(dispatch_streamed_micro_action, vlm_cancel_token),
+                                                      cancel_event=vlm_cancel_token)
+                    vlm_raw_response_str = vlm_result["raw"]
+                    stage_tracer.record("vlm.request", t_stage, speculative=speculative_prefetch is not None)
+                    if vlm_result["ttft_ms"] is not None and speculative_prefetch is None:
+                        stage_tracer.record("vlm.ttft", duration_ms=vlm_result["ttft_ms"])
+                    prompt_cache_stats.record("VLM", vlm_result["usage"], vlm_result["timings"])
+                    logging.info(f"VLM ({vlm_result['endpoint']}): premier token après {vlm_result['ttft_ms'] or 0:.0f} ms, réponse complète en {vlm_result['total_ms']:.0f} ms"
+                                 f"{' (génération arrêtée à la fermeture du JSON)' if vlm_result['stopped_early'] else ''}.")
+                logging.debug(f"Réponse Brute VLM (premiers 300): {vlm_raw_response_str[:300]}...")
+                rich_print(f"[grey50]Réponse Brute VLM (premiers 300): {vlm_raw_response_str[:300]}...[/grey50]")
             
-            parsed_vlm_data = parse_vlm_output_to_sequence(vlm_raw_response_str)
-            if parsed_vlm_data is None:
-                vlm_api_or_parse_error_msg = "Le parsing du JSON VLM a échoué ou la structure était invalide."
-        except Exception as e_vlm_api: # Attraper les erreurs d'API OpenAI/HTTPX aussi
-            vlm_api_or_parse_error_msg = f"Erreur API VLM: {str(e_vlm_api)}"
-            logging.error(vlm_api_or_parse_error_msg); rich_print(f"[red]{vlm_api_or_parse_error_msg}[/red]");
-            # Pas de play_sound_feedback ici, Qwen gère
+                t_stage = stage_tracer.now()
+                parsed_vlm_data = parse_vlm_output_to_sequence(vlm_raw_response_str)
+                stage_tracer.record("vlm.parse", t_stage)
+                if vlm_result is not None:
+                    structured_output.record_parse("VLM", vlm_result["constraint"], parsed_vlm_data is not None)
+                if parsed_vlm_data is None:
+                    vlm_api_or_parse_error_msg = "Le parsing du JSON VLM a échoué ou la structure était invalide."
+            except Exception as e_vlm_api: # Attraper les erreurs d'API OpenAI/HTTPX aussi
+                vlm_api_or_parse_error_msg = f"Erreur API VLM: {str(e_vlm_api)}"
+                logging.error(vlm_api_or_parse_error_msg); rich_print(f"[red]{vlm_api_or_parse_error_msg}[/red]");
+                # Pas de play_sound_feedback ici, Qwen gère
+
+            session_recorder.record("vlm", {
+                "source": "cache" if cached_vlm_response is not None else ("speculative" if speculative_prefetch is not None else "live"),
+                "raw": vlm_raw_response_str, "parse_ok": parsed_vlm_data is not None, "error": vlm_api_or_parse_error_msg,
+                "ttft_ms": vlm_result["ttft_ms"] if vlm_result else None, "total_ms": vlm_result["total_ms"] if vlm_result else None,
+                "early_dispatched_count": len(early_dispatched_actions)})
 
         current_vlm_status_report_for_qwen = {
             "vlm_output_json_str": vlm_raw_response_str,
             "parsed_vlm_data": parsed_vlm_data,
             "vlm_error_message": vlm_api_or_parse_error_msg,
-            "vlm_instruction_given_at_start_of_step": vlm_instruction_for_this_turn_log # Pour le log Qwen
+            "vlm_instruction_given_at_start_of_step": vlm_instruction_for_this_turn_log, # Pour le log Qwen
+            "early_dispatched_actions": early_dispatched_actions,
+            "early_dispatch_failed": early_dispatch_failed
         }
 
-        if vlm_api_or_parse_error_msg or parsed_vlm_data is None:
+        if trajectory_step is None and (vlm_api_or_parse_error_msg or parsed_vlm_data is None):
             consecutive_vlm_failures_for_current_instruction += 1
             logging.warning(f"Échec VLM pour l'instruction actuelle. Total échecs consécutifs pour '{current_vlm_instruction}': {consecutive_vlm_failures_for_current_instruction}")
             rich_print(f"[orange_red1]Échec VLM pour l'instruction actuelle. Total échecs consécutifs pour '{current_vlm_instruction}': {consecutive_vlm_failures_for_current_instruction}[/orange_red1]")
         
-        image_b64_url_for_qwen = image_b64_url_for_vlm if "VL" in QWEN_MODEL_NAME_FOR_API.upper() else None
-        qwen_decision_obj = get_qwen_strategic_decision(client, overall_user_task, image_b64_url_for_qwen, current_vlm_status_report_for_qwen, interaction_history, consecutive_vlm_failures_for_current_instruction)
+        # Politique locale de fast-path: les séquences VLM bien formées et à faible risque sont approuvées sans Qwen
+        fast_path_approved, fast_path_reason = (False, "trajectory_replay") if trajectory_step is not None else evaluate_qwen_fast_path(
+            parsed_vlm_data, vlm_api_or_parse_error_msg, early_dispatch_failed, interaction_history,
+            consecutive_vlm_failures_for_current_instruction, current_task_step_count)
+        if agent_engine.consume_cancel_request(): # Ctrl+C pendant la requête VLM: tâche abandonnée sans appeler Qwen
+            fast_path_approved, fast_path_reason = False, "cancelled"
+            qwen_decision_obj = build_qwen_failure_decision("Tâche annulée par l'utilisateur pendant la requête VLM.", "Tâche annulée par l'utilisateur.")
+        elif trajectory_step is not None:
+            qwen_decision_obj = trajectory_replay_cache.build_decision(trajectory_step)
+        elif fast_path_approved:
+            qwen_decision_obj = build_fast_path_qwen_decision(fast_path_reason)
+            qwen_fast_path_report.record_avoided_call()
+        else:
+            image_b64_url_for_qwen = None
+            if "VL" in QWEN_MODEL_NAME_FOR_API.upper():
+                t_stage = stage_tracer.now()
+                encoded_frame_for_qwen = frame_encoding_cache.encode(screenshot_image_pil, QWEN_IMAGE_MAX_SIZE, QWEN_IMAGE_FORMAT, QWEN_IMAGE_QUALITY, QWEN_IMAGE_DETAIL)
+                stage_tracer.record("encode.qwen", t_stage)
+                if encoded_frame_for_qwen:
+                    image_b64_url_for_qwen = encoded_frame_for_qwen.data_url
+                    log_frame_encoding("Qwen", screenshot_image_pil, encoded_frame_for_qwen)
+            t_qwen_start = time.perf_counter()
+            try:
+                qwen_decision_obj = agent_engine.run("qwen", get_qwen_strategic_decision, qwen_endpoint_pool, overall_user_task, image_b64_url_for_qwen, current_vlm_status_report_for_qwen, interaction_history, consecutive_vlm_failures_for_current_instruction,
+                                                     image_tokens_estimate=encoded_frame_for_qwen.estimated_image_tokens if image_b64_url_for_qwen else 0, cancellable=True)
+            except (StageCancelled, StageDeadlineExceeded) as e_stage: # Requête Qwen abandonnée (elle se termine en arrière-plan)
+                agent_engine.consume_cancel_request()
+                session_recorder.record("qwen_error", f"{type(e_stage).__name__}: {e_stage}")
+                qwen_decision_obj = build_qwen_failure_decision(str(e_stage), "Tâche annulée par l'utilisateur." if isinstance(e_stage, StageCancelled) else
+                                                                "Le module de stratégie interne (Qwen) n'a pas répondu à temps.")
+            qwen_fast_path_report.record_qwen_call((time.perf_counter() - t_qwen_start) * 1000, fast_path_reason)
+            session_recorder.record("qwen_duration_ms", (time.perf_counter() - t_qwen_start) * 1000)
+        step_model_ms = (time.perf_counter() - t_step_models) * 1000
+        session_recorder.record("fast_path", {"approved": fast_path_approved, "reason": fast_path_reason})
+        session_recorder.record("qwen_raw", qwen_decision_obj.get("raw_qwen_response_str_for_debug") if not fast_path_approved else None)
+        session_recorder.record("qwen_decision", {k: v for k, v in qwen_decision_obj.items() if k != "raw_qwen_response_str_for_debug"})
 
         rich_print(f"\n[bold_white on_purple]Décision du Backend Qwen ({qwen_decision_obj.get('decision_type', 'INCONNUE')}):[/]")
         rich_print(f"  [purple]Raisonnement de Qwen:[/purple] {qwen_decision_obj.get('reasoning', 'N/A')}")
@@ -946,6 +4710,7 @@ def main_agent_loop():
         
         executed_any_actions_successfully_this_turn = False
         action_execution_failed_mid_sequence = False # Drapeau spécifique pour échec D'UNE action
+        executed_plan_actions = [] # Actions du plan réellement exécutées (fusionnées/raffinées), pour les trajectoires
 
         if qwen_decision_type == "EXECUTE_VLM_SEQUENCE":
             if parsed_vlm_data and isinstance(parsed_vlm_data.get("action_sequence"), list):
@@ -997,49 +4762,32 @@ def main_agent_loop():
             # La validation dans get_qwen_strategic_decision devrait empêcher cela.
 
 
+        # Actions déjà exécutées pendant le streaming VLM (dispatch anticipé): elles ne sont pas rejouées
+        early_skip_count = len(early_dispatched_actions) if qwen_decision_type == "EXECUTE_VLM_SEQUENCE" else 0
+        if early_dispatched_actions:
+            executed_any_actions_successfully_this_turn = True
+
         if actions_to_execute_this_turn:
             vlm_instruction_marked_finished_in_sequence = False
+            # Actions restantes à exécuter, saisies adjacentes fusionnées (INPUT + INPUT + PRESS_ENTER -> une saisie)
+            # Positions de clic raffinées sur un recadrage zoomé si la politique le demande (petite cible, échec précédent)
+            remaining_actions = actions_to_execute_this_turn[early_skip_count:]
+            if trajectory_step is None: # Positions d'une trajectoire rejouée déjà raffinées lors de son enregistrement
+                remaining_actions = grounding_refiner.refine_sequence(remaining_actions, screenshot_image_pil, grounding_after_failure)
+            dispatch_plan = coalesce_input_micro_actions(remaining_actions)
 
-            for i, micro_action in enumerate(actions_to_execute_this_turn):
-                rich_print(f"\n--- Exécution micro-action {i+1}/{len(actions_to_execute_this_turn)} ({'VLM' if qwen_decision_type == 'EXECUTE_VLM_SEQUENCE' else 'Qwen'}) ---")
+            for i, micro_action in enumerate(dispatch_plan):
+                if early_dispatch_failed and qwen_decision_type == "EXECUTE_VLM_SEQUENCE":
+                    # Cette action a déjà échoué lors du dispatch anticipé: le reste de la séquence n'est pas exécuté
+                    m_act_type = micro_action.get("action_type")
+                    action_execution_failed_mid_sequence = True
+                    break
+                rich_print(f"\n--- Exécution micro-action {early_skip_count+i+1}/{early_skip_count+len(dispatch_plan)} ({'VLM' if qwen_decision_type == 'EXECUTE_VLM_SEQUENCE' else 'Qwen'}) ---")
                 m_act_type = micro_action.get("action_type")
-                m_desc = micro_action.get("description", "N/A")
-                
-                action_func_map = {
-                    "CLICK": action_click, "DOUBLE_CLICK": action_double_click,
-                    "INPUT": action_input_text, "SCROLL": action_scroll,
-                    "PRESS_ENTER": action_press_enter, "KEY_PRESS": action_key_press,
-                    "PAUSE": action_pause, "FINISHED": action_finished_vlm
-                }
-                
-                success_this_step = False
-                if m_act_type in action_func_map:
-                    try:
-                        if m_act_type in ["CLICK", "DOUBLE_CLICK"]:
-                            success_this_step = action_func_map[m_act_type](micro_action["position"], m_desc)
-                        elif m_act_type == "INPUT":
-                            success_this_step = action_func_map[m_act_type](micro_action["value"], micro_action.get("position"), m_desc)
-                        elif m_act_type == "SCROLL":
-                            success_this_step = action_func_map[m_act_type](micro_action["direction"], m_desc)
-                        elif m_act_type == "KEY_PRESS":
-                            success_this_step = action_func_map[m_act_type](micro_action["keys"], m_desc)
-                        elif m_act_type == "PAUSE":
-                            success_this_step = action_func_map[m_act_type](micro_action["duration_seconds"], m_desc)
-                        elif m_act_type == "FINISHED":
-                            success_this_step = action_func_map[m_act_type](micro_action.get("reason", "Raison non spécifiée."), m_desc)
-                            vlm_instruction_marked_finished_in_sequence = True
-                        else: # PRESS_ENTER
-                             success_this_step = action_func_map[m_act_type](m_desc)
-                    except KeyError as ke:
-                        logging.error(f"Champ manquant pour micro-action {m_act_type}: {ke}. Action: {micro_action}")
-                        rich_print(f"[red]Champ manquant pour micro-action {m_act_type}: {ke}. Action ignorée.[/red]")
-                    except Exception as e_action_exec:
-                        logging.error(f"Erreur inattendue durant exécution {m_act_type}: {e_action_exec}")
-                        rich_print(f"[red]Erreur exécution {m_act_type}: {e_action_exec}[/red]")
-                else:
-                    logging.error(f"Type d'action '{m_act_type}' inconnu ou non géré. Action ignorée. Action: {micro_action}")
-                    rich_print(f"[red]Type d'action '{m_act_type}' inconnu. Action ignorée.[/red]")
-                
+                success_this_step = execute_micro_action(micro_action)
+                if m_act_type == "FINISHED":
+                    vlm_instruction_marked_finished_in_sequence = True
+
                 if not success_this_step:
                     logging.error(f"La micro-action {m_act_type} a échoué ou n'a pas pu être exécutée.")
                     rich_print(f"[red]La micro-action {m_act_type} a échoué.[/red]")
@@ -1047,8 +4795,12 @@ def main_agent_loop():
                     break
                 
                 executed_any_actions_successfully_this_turn = True
-                if m_act_type not in ["PAUSE", "FINISHED"]:
-                    time.sleep(0.6)
+                executed_plan_actions.append(micro_action)
+                is_last_action = i == len(dispatch_plan) - 1
+                if m_act_type not in ["PAUSE", "WAIT_UNTIL_STABLE", "FINISHED"]:
+                    # Après la dernière action, l'attente de stabilité avant capture de l'étape suivante suffit
+                    if not (is_last_action and SETTLE_DETECTOR_ENABLED):
+                        wait_after_micro_action(m_act_type)
             
             # Mise à jour de l'instruction VLM pour la prochaine itération
             if qwen_decision_type != "RETRY_VLM_WITH_NEW_INSTRUCTION": # Si Qwen n'a pas déjà donné une nouvelle instruction
@@ -1071,16 +4823,32 @@ def main_agent_loop():
              logging.info("Aucune action exécutée ce tour. L'instruction VLM reste la même ou a été modifiée par Qwen (RETRY).")
 
 
+        last_step_action_failed = action_execution_failed_mid_sequence
+        clicked_this_turn = any(a.get("action_type") in ("CLICK", "DOUBLE_CLICK") for a in actions_to_execute_this_turn[early_skip_count:])
+        last_click_frame_phash = screenshot_phash if clicked_this_turn and not action_execution_failed_mid_sequence else None
+        trajectory_replay_cache.record_step(screenshot_phash, early_dispatched_actions + executed_plan_actions, step_model_ms, trajectory_step)
+        if action_execution_failed_mid_sequence:
+            trajectory_replay_cache.abort_replay("échec d'une action")
+
+        # Entrée d'historique de cette étape (ajoutée plus bas, mais nécessaire dès maintenant pour la spéculation)
+        executed_actions_for_history = actions_to_execute_this_turn if qwen_decision_type == "EXECUTE_VLM_SEQUENCE" else early_dispatched_actions + actions_to_execute_this_turn
+        current_history_record = InteractionRecord(current_task_step_count, vlm_instruction_for_this_turn_log, qwen_decision_obj, executed_actions_for_history)
+
+        # Prochaine requête VLM lancée dès maintenant, pendant la fin de l'étape (journal, cache, historique)
+        if (speculative_vlm_prefetcher.enabled and executed_any_actions_successfully_this_turn and not action_execution_failed_mid_sequence
+                and not trajectory_replay_cache.replay_pending and qwen_decision_type in ["EXECUTE_VLM_SEQUENCE", "EXECUTE_MODIFIED_SEQUENCE"] and current_task_step_count < MAX_AGENT_STEPS):
+            predicted_history_window = interaction_history.vlm_prompt_window(pending_record=current_history_record)
+            speculative_vlm_prefetcher.launch(vlm_endpoint_pool, current_vlm_instruction, predicted_history_window)
+
+        # Alimentation du cache VLM: uniquement une réponse parsée, approuvée par Qwen (pas par le fast-path local) puis exécutée sans échec
+        last_vlm_cache_key = None
+        if (qwen_decision_type == "EXECUTE_VLM_SEQUENCE" and not fast_path_approved and parsed_vlm_data and actions_to_execute_this_turn
+                and not action_execution_failed_mid_sequence):
+            last_vlm_cache_key = vlm_response_cache.store(screenshot_phash, vlm_instruction_for_this_turn_log, VLM_MODEL_NAME_FOR_API, vlm_raw_response_str)
+        elif vlm_cache_key_used is not None:
+            vlm_response_cache.invalidate(vlm_cache_key_used)
+
         # Enregistrement de l'historique
-        current_history_entry_data_for_prompt = {
-            "step_count": current_task_step_count,
-            "vlm_instruction_given_to_vlm": vlm_instruction_for_this_turn_log, # Instruction donnée au VLM à cette étape
-            "qwen_decision_obj": { # Résumé simplifié pour le prompt
-                "decision_type": qwen_decision_obj.get("decision_type"),
-                "reasoning": qwen_decision_obj.get("reasoning", "N/A")[:150] + "..." if len(qwen_decision_obj.get("reasoning", "")) > 150 else qwen_decision_obj.get("reasoning", "N/A"),
-            },
-            "executed_action_sequence": actions_to_execute_this_turn if actions_to_execute_this_turn else None
-        }
         history_log_details_for_file = ( # Log plus détaillé pour débogage
             f"--- Étape {current_task_step_count} pour Objectif: '{overall_user_task}' ---\n"
             f"Instruction VLM donnée à cette étape: {vlm_instruction_for_this_turn_log}\n"
@@ -1089,14 +4857,17 @@ def main_agent_loop():
             f"Erreur VLM (si applicable): {vlm_api_or_parse_error_msg if vlm_api_or_parse_error_msg else 'Aucune'}\n\n"
             f"Réponse Brute Qwen:\n{qwen_decision_obj.get('raw_qwen_response_str_for_debug', 'Non disponible')}\n"
             f"Décision Qwen (JSON Complet):\n{json.dumps(qwen_decision_obj, indent=2, ensure_ascii=False)}\n"
-            f"Actions Exécutées (si applicable):\n{json.dumps(actions_to_execute_this_turn, indent=2, ensure_ascii=False) if actions_to_execute_this_turn else 'Aucune'}\n"
+            f"Actions Exécutées (si applicable):\n{json.dumps(executed_actions_for_history, indent=2, ensure_ascii=False) if executed_actions_for_history else 'Aucune'}\n"
             f"Prochaine Instruction VLM (si définie par Qwen ou logique interne): {current_vlm_instruction}\n"
             f"-----------------------------------\n"
         )
-        interaction_history.append((json.dumps(current_history_entry_data_for_prompt, ensure_ascii=False), history_log_details_for_file))
-        # Optionnel: écrire history_log_details_for_file dans un fichier log séparé
-        with open(os.path.join(screenshots_folder, "detailed_interaction_log.txt"), "a", encoding="utf-8") as log_file:
-            log_file.write(history_log_details_for_file)
+        current_history_record.verbose_log = history_log_details_for_file
+        interaction_history.append(current_history_record)
+        # Journal détaillé écrit en arrière-plan par le PersistenceWorker
+        persistence_worker.submit_log_record(os.path.join(screenshots_folder, "detailed_interaction_log.txt"), history_log_details_for_file)
+        session_recorder.record("executed_actions", executed_actions_for_history)
+        session_recorder.record("action_failed", action_execution_failed_mid_sequence)
+        session_recorder.end_step(stage_tracer.end_step())
 
 
         if qwen_decision_type == "TASK_COMPLETED":
@@ -1109,47 +4880,42 @@ def main_agent_loop():
             overall_user_task = ""
 
         if not overall_user_task:
+            session_recorder.end_session(qwen_decision_type)
+            trajectory_replay_cache.end_task(qwen_decision_type)
+            screenshot_archive.end_task(qwen_decision_type)
             logging.info("--- Réinitialisation pour un nouvel objectif utilisateur global ---")
             rich_print("--- Réinitialisation pour un nouvel objectif utilisateur global ---")
+            logging.info(vlm_response_cache.stats_summary())
+            logging.info(trajectory_replay_cache.stats_summary())
+            logging.info(agent_engine.stats_summary())
+            if persistence_worker.archive is not None:
+                logging.info(screenshot_archive.stats_summary())
+            logging.info(speculative_vlm_prefetcher.stats_summary())
+            logging.info(qwen_fast_path_report.summary())
+            rich_print(f"[grey50]{qwen_fast_path_report.summary()}[/grey50]")
+            logging.info(prompt_cache_stats.stats_summary())
+            logging.info(vlm_endpoint_pool.stats_summary())
+            logging.info(qwen_endpoint_pool.stats_summary())
+            logging.info(vlm_request_policy.stats_summary())
+            logging.info(qwen_request_policy.stats_summary())
+            logging.info(structured_output.stats_summary())
+            logging.info(qwen_prompt_budgeter.stats_summary())
+            logging.info(screen_geometry.stats_summary())
+            if grounding_refiner.enabled:
+                logging.info(grounding_refiner.stats_summary())
+            rich_print(f"[grey50]{prompt_cache_stats.stats_summary()}[/grey50]")
+            if action_timing_tuner.enabled:
+                logging.info(action_timing_tuner.stats_summary())
+                action_timing_tuner.close() # Instantané des pauses apprises, réutilisées à la prochaine session
+            if stage_tracer.enabled:
+                stage_summary = stage_tracer.stats_summary()
+                logging.info(stage_summary)
+                rich_print(f"[grey50]{stage_summary}[/grey50]")
 
 
-if __name__ == "__main__":
-    if AUDIO_ENABLED:
-        audio_dir = "audio_feedback"
-        os.makedirs(audio_dir, exist_ok=True)
-        sr = 16000
-        dur = 0.15
+startup_profiler.mark("module importé")
 
-        try:
-            t_np = np.linspace(0, dur, int(sr * dur), False)
-            sound_configs = [
-                ("ask.wav", 660), ("ok.wav", 880), ("ask_2.wav", 550),
-                ("error.wav", 330), ("task_completed.wav", 1046)
-            ]
-            dummy_sound_data_fallback = 0.5 * np.sin(2 * np.pi * 440 * np.linspace(0, 0.1, int(sr * 0.1), False))
-
-            for fname, freq in sound_configs:
-                f_path = os.path.join(audio_dir, fname)
-                if not os.path.exists(f_path):
-                    try:
-                        sound_data = 0.3 * np.sin(2 * np.pi * freq * t_np)
-                        fade_len = int(sr * 0.05)
-                        if len(sound_data) > fade_len:
-                             sound_data[-fade_len:] *= np.linspace(1, 0, fade_len)
-                        sf.write(f_path, sound_data, sr, format='WAV', subtype='PCM_16')
-                    except Exception as e_sf_write:
-                        logging.warning(f"Impossible d'écrire {fname} ({e_sf_write}), fallback.")
-                        try: sf.write(f_path, dummy_sound_data_fallback, sr, format='WAV', subtype='PCM_16')
-                        except Exception as e_sf_fallback:
-                            logging.error(f"Échec écriture fallback {fname}: {e_sf_fallback}")
-                            AUDIO_ENABLED = False; break
-        except NameError:
-            logging.warning("Numpy non trouvé. Pas de génération de sons. (pip install numpy)")
-            AUDIO_ENABLED = False
-        except Exception as e_audio_create:
-            logging.warning(f"Erreur création sons: {e_audio_create}")
-            AUDIO_ENABLED = False
-            
+if __name__ == "__main__":
     try:
         main_agent_loop()
     except KeyboardInterrupt:
@@ -1159,5 +4925,17 @@ if __name__ == "__main__":
         logging.critical(f"Erreur non gérée dans la boucle principale: {e_main}", exc_info=True)
         rich_print(f"[bold red]Erreur critique non gérée dans la boucle principale: {e_main}[/bold red]")
     finally:
+        speculative_vlm_prefetcher.close()
+        sound_bank.close()
+        action_overlay.close()
+        vlm_endpoint_pool.close()
+        qwen_endpoint_pool.close()
+        agent_engine.close()
+        session_recorder.end_session("INTERRUPTED")
+        stage_tracer.close() # Dernier pas du traçage écrit avant la vidange de la file de persistance
+        action_timing_tuner.close()
+        vlm_response_cache.close() # Dernier instantané du cache persistant (écrit par le PersistenceWorker)
+        trajectory_replay_cache.close()
+        persistence_worker.close() # Vider la file d'écriture (captures + journal) avant de quitter
         logging.info("Arrêt de l'agent.")
         rich_print("Agent arrêté.")
@@ -0,0 +1,590 @@
+"""Serveur de modèles factice compatible OpenAI (/v1/chat/completions) et générateur de charge pour l'agent GUI.
+
+Remplace LM Studio / llama.cpp / vLLM sans GPU pour tester le comportement en débit de l'agent (délais, reprises,
+pools d'endpoints, streaming, cache de prompt): réponses VLM et Qwen scriptées, enregistrées (sessions de
+SESSION_RECORDING_FOLDER) ou synthétiques, avec injection de latence (TTFT, débit de tokens, prefill), d'erreurs
+HTTP, de blocages, de coupures de flux et de JSON malformé.
+
+Exemples:
+    # 3 réplicas sur 8001..8003, TTFT log-normal (médiane 400 ms), 40 tokens/s, 5% d'erreurs 503
+    python mock_model_server.py serve --port 8001 --replicas 3 --vlm-ttft-ms lognormal:400,0.4 --vlm-tokens-per-s 40 \\
+        --error-rate 0.05 --error-statuses 503
+    # 20 sessions d'agent simulées (8 en parallèle) contre des serveurs lancés dans le même processus
+    python mock_model_server.py load --sessions 20 --concurrency 8 --vlm-ttft-ms lognormal:400,0.4 --output charge.json
+"""
+import argparse
+import json
+import math
+import os
+import random
+import re
+import socket
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CHARS_PER_TOKEN = 4 # Estimation grossière, suffisante pour simuler usage et débit
+
+# --- Distributions de latence ---
+def parse_latency_distribution(spec):
+    """'300', 'fixed:300', 'uniform:100,400', 'normal:300,50', 'lognormal:300,0.5' (médiane, sigma), 'exp:300' -> tirage en ms."""
+    spec = str(spec).strip().lower()
+    kind, _, params = spec.partition(":")
+    if not params:
+        kind, params = "fixed", kind
+    values = [float(v) for v in params.split(",") if v.strip()]
+    if kind == "fixed" and len(values) == 1:
+        return lambda rng: values[0]
+    if kind == "uniform" and len(values) == 2:
+        return lambda rng: rng.uniform(values[0], values[1])
+    if kind == "normal" and len(values) == 2:
+        return lambda rng: max(0.0, rng.gauss(values[0], values[1]))
+    if kind == "lognormal" and len(values) == 2:
+        return lambda rng: rng.lognormvariate(math.log(max(values[0], 1e-6)), values[1])
+    if kind == "exp" and len(values) == 1:
+        return lambda rng: rng.expovariate(1.0 / values[0]) if values[0] > 0 else 0.0
+    raise argparse.ArgumentTypeError(f"Distribution de latence invalide: '{spec}'")
+
+# --- Sources de réponses ---
+VLM_THOUGHT_KEYS = ["Current State Summary", "User's Current Instruction", "Previous Action Assessment",
+                    "Current Screen Analysis (Brief)", "Next Immediate Sub-goal for THIS Instruction",
+                    "Action Justification & Selection", "Anticipated Next Step AFTER THIS sequence"]
+
+def request_role(messages):
+    """'qwen' si le prompt système est celui du superviseur (décisions), sinon 'vlm'."""
+    system_text = next((m.get("content") for m in messages if m.get("role") == "system"), "") or ""
+    return "qwen" if "decision_type" in str(system_text) else "vlm"
+
+def request_text(messages):
+    """Texte complet du prompt (sans les images), dans l'ordre des messages."""
+    parts = []
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, str):
+            parts.append(content)
+        elif isinstance(content, list):
+            parts.extend(part.get("text", "") for part in content if part.get("type") == "text")
+    return "\n".join(parts)
+
+def request_image_count(messages):
+    return sum(1 for m in messages if isinstance(m.get("content"), list) for p in m["content"] if p.get("type") == "image_url")
+
+class SyntheticResponses:
+    """Réponses valides générées: le VLM propose un clic, Qwen l'approuve puis déclare la tâche terminée après N pas."""
+
+    def __init__(self, task_steps=5):
+        self.task_steps = max(1, task_steps)
+
+    def next(self, role, prompt_text, rng):
+        if role == "vlm":
+            thought = {key: "Synthetic response from the stand-in server." for key in VLM_THOUGHT_KEYS}
+            actions = [{"action_type": "CLICK", "position": [round(rng.random(), 3), round(rng.random(), 3)],
+                        "description": "Click the next synthetic target"}]
+            return json.dumps({"global_thought": thought, "action_sequence": actions}, ensure_ascii=False)
+        done_steps = max((int(n) for n in re.findall(r"\bStep (\d+)\.", prompt_text)), default=0)
+        if done_steps + 1 >= self.task_steps:
+            decision = {"decision_type": "TASK_COMPLETED", "reasoning": "Synthetic task length reached.",
+                        "action_sequence_to_execute": None, "next_vlm_instruction": None,
+                        "user_summary_message": "Synthetic task completed."}
+        else:
+            decision = {"decision_type": "EXECUTE_VLM_SEQUENCE", "reasoning": "The VLM sequence matches the goal.",
+                        "action_sequence_to_execute": None, "next_vlm_instruction": None, "user_summary_message": None}
+        return json.dumps(decision, ensure_ascii=False)
+
+class ScriptedResponses:
+    """Réponses servies dans l'ordre, par rôle et en boucle, depuis un script JSONL ({"role": "vlm"|"qwen", "content": ...})
+    ou depuis des sessions enregistrées par l'agent (réponses brutes VLM et Qwen de chaque pas)."""
+
+    def __init__(self, fallback):
+        self.fallback = fallback
+        self.responses = {"vlm": [], "qwen": []}
+        self._positions = {"vlm": 0, "qwen": 0}
+        self._lock = threading.Lock()
+
+    def load_script(self, path):
+        with open(path, encoding="utf-8") as script_file:
+            for line in script_file:
+                if line.strip():
+                    entry = json.loads(line)
+                    content = entry["content"]
+                    self.responses[entry.get("role", "vlm")].append(content if isinstance(content, str) else json.dumps(content, ensure_ascii=False))
+
+    def load_session(self, path):
+        with open(path, encoding="utf-8") as session_file:
+            for line in session_file:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                if entry.get("type") != "step":
+                    continue
+                if (entry.get("vlm") or {}).get("raw"):
+                    self.responses["vlm"].append(entry["vlm"]["raw"])
+                if entry.get("qwen_raw"):
+                    self.responses["qwen"].append(entry["qwen_raw"])
+
+    def next(self, role, prompt_text, rng):
+        with self._lock:
+            responses = self.responses[role]
+            if not responses:
+                return self.fallback.next(role, prompt_text, rng)
+            response = responses[self._positions[role] % len(responses)]
+            self._positions[role] += 1
+            return response
+
+def make_malformed(text, rng):
+    """Dégrade une réponse comme le ferait un modèle: JSON tronqué, prose sans JSON ou champ obligatoire renommé."""
+    mode = rng.choice(("truncated", "prose", "renamed_field"))
+    if mode == "truncated":
+        return text[:max(1, len(text) // 2)]
+    if mode == "prose":
+        return "Sure! I will click on the button to continue with the task."
+    return text.replace('"action_sequence"', '"actions"', 1).replace('"decision_type"', '"decision"', 1)
+
+# --- Serveur ---
+class ModelProfile:
+    """Latences simulées d'un modèle: TTFT, prefill (tokens non servis par le cache de préfixe) et débit de décodage."""
+
+    def __init__(self, model_name, ttft_ms, tokens_per_s, prefill_tokens_per_s, image_tokens):
+        self.model_name = model_name
+        self.ttft_ms = parse_latency_distribution(ttft_ms)
+        self.tokens_per_s = tokens_per_s
+        self.prefill_tokens_per_s = prefill_tokens_per_s
+        self.image_tokens = image_tokens
+
+class FaultProfile:
+    def __init__(self, error_rate=0.0, error_statuses=(500, 503), hang_rate=0.0, hang_s=600.0,
+                 disconnect_rate=0.0, malformed_rate=0.0, roles=("vlm", "qwen")):
+        self.error_rate = error_rate
+        self.error_statuses = tuple(error_statuses) or (500,)
+        self.hang_rate = hang_rate
+        self.hang_s = hang_s
+        self.disconnect_rate = disconnect_rate
+        self.malformed_rate = malformed_rate
+        self.roles = tuple(roles)
+
+class _ClientGone(Exception):
+    """Le client a fermé la connexion (arrêt anticipé du streaming, requête perdante d'un hedge, délai dépassé)."""
+
+class _QuietThreadingHTTPServer(ThreadingHTTPServer):
+    """Un client qui ferme sa connexion keep-alive (hedge perdant, flux coupé, fin de session) n'est pas une erreur serveur."""
+
+    def handle_error(self, request, client_address):
+        if isinstance(sys.exc_info()[1], (ConnectionResetError, BrokenPipeError)):
+            return
+        super().handle_error(request, client_address)
+
+class MockModelServer:
+    """Un réplica: serveur HTTP multi-thread, compteurs et cache de préfixe simulé (un préfixe par rôle et par slot)."""
+
+    def __init__(self, host, port, profiles, faults, responses, slots=0, seed=0):
+        self.profiles = profiles
+        self.faults = faults
+        self.responses = responses
+        self._slots = threading.BoundedSemaphore(slots) if slots > 0 else None
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._prefix_cache = {} # (rôle, slot) -> texte du dernier prompt
+        self.stats = {"requests": 0, "streamed": 0, "in_flight": 0, "max_in_flight": 0, "injected_errors": {},
+                      "hangs": 0, "disconnects": 0, "malformed": 0, "client_cancelled": 0,
+                      "prompt_tokens": 0, "cached_tokens": 0, "completion_tokens": 0, "per_role": {"vlm": 0, "qwen": 0}}
+        server = self
+        class Handler(_MockRequestHandler):
+            mock = server
+        self.httpd = _QuietThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self.base_url = f"http://{host}:{self.httpd.server_address[1]}/v1"
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name=f"MockModelServer-{self.base_url}", daemon=True)
+        self._thread.start()
+        return self
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def draw(self, fn):
+        with self._rng_lock:
+            return fn(self._rng)
+
+    def count(self, key, increment=1):
+        with self._lock:
+            self.stats[key] += increment
+
+    def cached_prefix_tokens(self, role, cache_slot, prompt_text):
+        """Tokens du préfixe commun avec le prompt précédent du même slot (comme le cache KV de llama.cpp / vLLM)."""
+        with self._lock:
+            previous = self._prefix_cache.get((role, cache_slot), "")
+            self._prefix_cache[(role, cache_slot)] = prompt_text
+        return len(os.path.commonprefix([previous, prompt_text])) // CHARS_PER_TOKEN
+
+    def snapshot(self):
+        with self._lock:
+            return json.loads(json.dumps(self.stats))
+
+class _MockRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1" # Keep-alive: le client de l'agent réutilise ses connexions
+    mock = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/models"):
+            data = [{"id": p.model_name, "object": "model", "owned_by": "mock"} for p in self.mock.profiles.values()]
+            self._send_json(200, {"object": "list", "data": data})
+        elif self.path.rstrip("/").endswith("/stats"):
+            self._send_json(200, self.mock.snapshot())
+        else:
+            self._send_json(404, {"error": {"message": f"Route inconnue: {self.path}", "type": "not_found"}})
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": f"Route inconnue: {self.path}", "type": "not_found"}})
+            return
+        try:
+            request = json.loads(body or b"{}")
+            messages = request["messages"]
+        except (ValueError, KeyError) as e:
+            self._send_json(400, {"error": {"message": f"Requête invalide: {e}", "type": "invalid_request_error"}})
+            return
+        mock = self.mock
+        with mock._lock:
+            mock.stats["requests"] += 1
+            mock.stats["in_flight"] += 1
+            mock.stats["max_in_flight"] = max(mock.stats["max_in_flight"], mock.stats["in_flight"])
+        try:
+            if mock._slots is not None: # Slots de génération saturés: la requête attend, comme sur un vrai serveur
+                with mock._slots:
+                    self._serve_completion(request, messages)
+            else:
+                self._serve_completion(request, messages)
+        except (_ClientGone, BrokenPipeError, ConnectionResetError):
+            mock.count("client_cancelled")
+            self.close_connection = True
+        finally:
+            mock.count("in_flight", -1)
+
+    def _serve_completion(self, request, messages):
+        mock, faults = self.mock, self.mock.faults
+        role = request_role(messages)
+        profile = mock.profiles[role]
+        with mock._lock:
+            mock.stats["per_role"][role] += 1
+        prompt_text = request_text(messages)
+        faulty = role in faults.roles
+
+        if faulty and mock.draw(lambda rng: rng.random()) < faults.hang_rate: # Serveur bloqué: seul le délai du client libère la requête
+            mock.count("hangs")
+            self._sleep_unless_gone(faults.hang_s)
+            raise _ClientGone()
+        if faulty and mock.draw(lambda rng: rng.random()) < faults.error_rate:
+            status = mock.draw(lambda rng: rng.choice(faults.error_statuses))
+            with mock._lock:
+                mock.stats["injected_errors"][str(status)] = mock.stats["injected_errors"].get(str(status), 0) + 1
+            headers = {"Retry-After": "1"} if status == 429 else {}
+            self._send_json(status, {"error": {"message": f"Erreur injectée ({status})", "type": "mock_injected_error"}}, headers)
+            return
+
+        text = mock.draw(lambda rng: mock.responses.next(role, prompt_text, rng))
+        if faulty and mock.draw(lambda rng: rng.random()) < faults.malformed_rate:
+            mock.count("malformed")
+            text = mock.draw(lambda rng: make_malformed(text, rng))
+
+        extra_body_slot = request.get("id_slot", -1)
+        prompt_tokens = len(prompt_text) // CHARS_PER_TOKEN + request_image_count(messages) * profile.image_tokens
+        cached_tokens = min(prompt_tokens, mock.cached_prefix_tokens(role, extra_body_slot, prompt_text))
+        completion_tokens = max(1, len(text) // CHARS_PER_TOKEN)
+        with mock._lock:
+            mock.stats["prompt_tokens"] += prompt_tokens
+            mock.stats["cached_tokens"] += cached_tokens
+        ttft_s = mock.draw(profile.ttft_ms) / 1000
+        if profile.prefill_tokens_per_s > 0:
+            ttft_s += (prompt_tokens - cached_tokens) / profile.prefill_tokens_per_s
+        token_interval_s = 1.0 / profile.tokens_per_s if profile.tokens_per_s > 0 else 0.0
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                 "total_tokens": prompt_tokens + completion_tokens, "prompt_tokens_details": {"cached_tokens": cached_tokens}}
+        timings = {"prompt_n": prompt_tokens - cached_tokens, "cache_n": cached_tokens}
+        completion_id = f"chatcmpl-mock-{uuid.uuid4().hex[:12]}"
+        model_name = request.get("model") or profile.model_name
+
+        if not request.get("stream"):
+            self._sleep_unless_gone(ttft_s + completion_tokens * token_interval_s)
+            mock.count("completion_tokens", completion_tokens)
+            self._send_json(200, {"id": completion_id, "object": "chat.completion", "created": int(time.time()), "model": model_name,
+                                  "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                                  "usage": usage, "timings": timings})
+            return
+
+        mock.count("streamed")
+        disconnect_at = None
+        if faulty and mock.draw(lambda rng: rng.random()) < faults.disconnect_rate:
+            disconnect_at = mock.draw(lambda rng: rng.randint(1, max(1, completion_tokens - 1)))
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        self._sleep_unless_gone(ttft_s)
+        def chunk(delta, finish_reason=None):
+            return {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()), "model": model_name,
+                    "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]}
+        self._send_event(chunk({"role": "assistant", "content": ""}))
+        pieces = [text[i:i + CHARS_PER_TOKEN] for i in range(0, len(text), CHARS_PER_TOKEN)]
+        for i, piece in enumerate(pieces):
+            if i and token_interval_s:
+                self._sleep_unless_gone(token_interval_s)
+            if disconnect_at is not None and i == disconnect_at: # Coupure brutale: pas de [DONE], pas de fin de chunk
+                mock.count("disconnects")
+                self.close_connection = True
+                self.wfile.flush()
+                self.connection.shutdown(socket.SHUT_RDWR)
+                return
+            self._send_event(chunk({"content": piece}))
+            mock.count("completion_tokens")
+        self._send_event(chunk({}, "stop"))
+        if (request.get("stream_options") or {}).get("include_usage"):
+            self._send_event({"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()), "model": model_name,
+                              "choices": [], "usage": usage, "timings": timings})
+        self._write_chunk(b"data: [DONE]\n\n")
+        self._write_chunk(b"")
+
+    def _sleep_unless_gone(self, duration_s):
+        """Attend sans ignorer une déconnexion du client (sinon un hedge perdant ou un délai client occuperait un slot)."""
+        deadline = time.perf_counter() + max(0.0, duration_s)
+        while True:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                return
+            time.sleep(min(remaining, 0.05))
+            if duration_s > 0.2 and self._client_disconnected():
+                raise _ClientGone()
+
+    def _client_disconnected(self):
+        try:
+            self.connection.setblocking(False)
+            try:
+                return self.connection.recv(1, socket.MSG_PEEK) == b"" # b"" = fermeture côté client
+            finally:
+                self.connection.setblocking(True)
+        except (BlockingIOError, InterruptedError):
+            return False
+        except OSError:
+            return True
+
+    def _send_event(self, payload):
+        self._write_chunk(b"data: " + json.dumps(payload, ensure_ascii=False).encode("utf-8") + b"\n\n")
+
+    def _write_chunk(self, data):
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def _send_json(self, status, payload, headers=None):
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+def start_servers(args):
+    fallback = SyntheticResponses(task_steps=args.task_steps)
+    responses = ScriptedResponses(fallback)
+    for path in args.script or []:
+        responses.load_script(path)
+    for path in args.recorded_session or []:
+        responses.load_session(path)
+    profiles = {
+        "vlm": ModelProfile(args.vlm_model, args.vlm_ttft_ms, args.vlm_tokens_per_s, args.prefill_tokens_per_s, args.image_tokens),
+        "qwen": ModelProfile(args.qwen_model, args.qwen_ttft_ms, args.qwen_tokens_per_s, args.prefill_tokens_per_s, args.image_tokens),
+    }
+    faults = FaultProfile(args.error_rate, [int(s) for s in args.error_statuses.split(",") if s.strip()], args.hang_rate, args.hang_s,
+                          args.disconnect_rate, args.malformed_rate, ("vlm", "qwen") if args.fault_role == "all" else (args.fault_role,))
+    return [MockModelServer(args.host, args.port + i if args.port else 0, profiles, faults, responses, args.slots, args.seed + i).start()
+            for i in range(max(1, args.replicas))]
+
+def add_server_arguments(parser):
+    group = parser.add_argument_group("serveur factice")
+    group.add_argument("--host", default="127.0.0.1")
+    group.add_argument("--port", type=int, default=0, help="Premier port (réplicas sur les ports suivants); 0 = port libre")
+    group.add_argument("--replicas", type=int, default=1)
+    group.add_argument("--slots", type=int, default=0, help="Requêtes générées en parallèle par réplica (0 = illimité)")
+    group.add_argument("--vlm-model", default=os.getenv("VLM_MODEL_NAME_FOR_API", "internvl3-8b-instruct"))
+    group.add_argument("--qwen-model", default=os.getenv("QWEN_MODEL_NAME_FOR_API", "qwen/qwen3-8b"))
+    group.add_argument("--vlm-ttft-ms", default="0", help="Distribution du TTFT VLM (ex: lognormal:400,0.4)")
+    group.add_argument("--qwen-ttft-ms", default="0")
+    group.add_argument("--vlm-tokens-per-s", type=float, default=0.0, help="Débit de décodage (0 = instantané)")
+    group.add_argument("--qwen-tokens-per-s", type=float, default=0.0)
+    group.add_argument("--prefill-tokens-per-s", type=float, default=0.0, help="Coût du prefill hors cache de préfixe (0 = ignoré)")
+    group.add_argument("--image-tokens", type=int, default=256, help="Tokens de prompt comptés par image")
+    group.add_argument("--error-rate", type=float, default=0.0)
+    group.add_argument("--error-statuses", default="500,503")
+    group.add_argument("--hang-rate", type=float, default=0.0, help="Requêtes qui ne répondent jamais (jusqu'à --hang-s)")
+    group.add_argument("--hang-s", type=float, default=600.0)
+    group.add_argument("--disconnect-rate", type=float, default=0.0, help="Flux coupés au milieu de la réponse")
+    group.add_argument("--malformed-rate", type=float, default=0.0, help="Réponses au JSON tronqué ou invalide")
+    group.add_argument("--fault-role", choices=("all", "vlm", "qwen"), default="all")
+    group.add_argument("--script", action="append", help="Réponses scriptées JSONL ({\"role\": ..., \"content\": ...}), répétable")
+    group.add_argument("--recorded-session", action="append", help="Session enregistrée par l'agent dont rejouer les réponses, répétable")
+    group.add_argument("--task-steps", type=int, default=5, help="Réponses synthétiques: pas avant TASK_COMPLETED")
+    group.add_argument("--seed", type=int, default=0)
+
+def serve(args):
+    servers = start_servers(args)
+    base_urls = ",".join(s.base_url for s in servers)
+    print(f"Serveur factice prêt ({len(servers)} réplica(s)). Pour l'agent:")
+    print(f"  VLM_API_BASE_URLS={base_urls} QWEN_API_BASE_URLS={base_urls}")
+    print("Statistiques: GET <base_url>/stats. Ctrl+C pour arrêter.")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for server in servers:
+            print(f"{server.base_url}: {json.dumps(server.snapshot(), ensure_ascii=False)}")
+            server.close()
+    return 0
+
+# --- Générateur de charge: sessions d'agent simulées (sans GUI) contre les pools d'endpoints de l'agent ---
+def _percentiles(values):
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    pick = lambda q: ordered[min(len(ordered) - 1, max(0, math.ceil(q * len(ordered)) - 1))]
+    return {"n": len(ordered), "p50": round(pick(0.50), 1), "p95": round(pick(0.95), 1), "p99": round(pick(0.99), 1)}
+
+def _interrupted_mid_stream(agent, error):
+    """Erreur de transport levée pendant la lecture du flux VLM, donc après run_model_request: la politique de requête
+    (reprises, hedging) ne la voit pas et ne la compte pas dans ses échecs."""
+    if not agent.is_retryable_request_error(error):
+        return False
+    traceback = error.__traceback__
+    while traceback is not None:
+        if traceback.tb_frame.f_code.co_name == "run_model_request":
+            return False
+        traceback = traceback.tb_next
+    return True
+
+def run_simulated_session(agent, session_index, goal, max_steps, image_url):
+    """Boucle VLM -> Qwen de main_agent_loop, sans capture ni action: mesure le coût client (pools, reprises, streaming)."""
+    history = agent.InteractionHistory()
+    instruction = goal
+    failures = 0
+    metrics = {"session": session_index, "steps": 0, "outcome": "MAX_AGENT_STEPS", "step_ms": [], "vlm_ttft_ms": [], "vlm_total_ms": [],
+               "qwen_ms": [], "vlm_errors": 0, "vlm_stream_disconnects": 0, "vlm_parse_failures": 0, "qwen_errors": 0}
+    for step in range(1, max_steps + 1):
+        t_step = time.perf_counter()
+        window = history.vlm_prompt_window()
+        messages = agent.build_messages_for_vlm_api(agent.VLM_SYSTEM_PROMPT, instruction, image_url, window.recent_lines,
+                                                    history_total_count=window.total_count)
+        parsed, error_message, raw = None, None, ""
+        try:
+            result = agent.request_vlm_completion(agent.vlm_endpoint_pool, messages)
+            raw = result["raw"]
+            metrics["vlm_total_ms"].append(result["total_ms"])
+            if result["ttft_ms"] is not None:
+                metrics["vlm_ttft_ms"].append(result["ttft_ms"])
+            parsed = agent.parse_vlm_output_to_sequence(raw)
+            if parsed is None:
+                metrics["vlm_parse_failures"] += 1
+                error_message = "Échec du parsing de la réponse VLM."
+        except Exception as e:
+            metrics["vlm_errors"] += 1
+            if _interrupted_mid_stream(agent, e):
+                metrics["vlm_stream_disconnects"] += 1
+            error_message = f"Erreur API VLM: {type(e).__name__}: {e}"
+        failures = failures + 1 if parsed is None else 0
+        status_report = {"vlm_output_json_str": raw, "parsed_vlm_data": parsed, "vlm_error_message": error_message,
+                         "vlm_instruction_given_at_start_of_step": instruction, "early_dispatched_actions": [], "early_dispatch_failed": False}
+        t_qwen = time.perf_counter()
+        decision = agent.get_qwen_strategic_decision(agent.qwen_endpoint_pool, goal, None, status_report, history, failures)
+        metrics["qwen_ms"].append((time.perf_counter() - t_qwen) * 1000)
+        if "raw_qwen_response_str_for_debug" not in decision:
+            metrics["qwen_errors"] += 1
+        decision_type = decision.get("decision_type")
+        executed = parsed["action_sequence"] if parsed and decision_type == "EXECUTE_VLM_SEQUENCE" else None
+        history.append(agent.InteractionRecord(step, instruction, decision, executed))
+        metrics["steps"] = step
+        metrics["step_ms"].append((time.perf_counter() - t_step) * 1000)
+        if decision_type in ("TASK_COMPLETED", "TASK_FAILED"):
+            metrics["outcome"] = decision_type
+            break
+        if decision_type == "RETRY_VLM_WITH_NEW_INSTRUCTION" and decision.get("next_vlm_instruction"):
+            instruction, failures = decision["next_vlm_instruction"], 0
+    return metrics
+
+def load(args):
+    servers = [] if args.base_urls else start_servers(args)
+    base_urls = args.base_urls or ",".join(s.base_url for s in servers)
+    os.environ.update({ # Avant l'import: l'agent lit sa configuration au chargement
+        "VLM_API_BASE_URLS": base_urls, "QWEN_API_BASE_URLS": base_urls,
+        "VLM_MODEL_NAME_FOR_API": args.vlm_model, "QWEN_MODEL_NAME_FOR_API": args.qwen_model,
+        "SESSION_RECORDING_ENABLED": "0", "STAGE_TRACE_ENABLED": "0", "VLM_SPECULATIVE_PREFETCH_ENABLED": "0",
+        "VLM_RESPONSE_CACHE_ENABLED": "0", "VLM_RESPONSE_CACHE_PATH": "",
+    })
+    import logging
+    from PIL import Image
+    import autonomous_gui_agent as agent
+    logging.getLogger().setLevel(logging.WARNING)
+    agent.rich_print = lambda *a, **k: None # Les sessions parallèles rendraient la console illisible
+    agent.AUDIO_ENABLED = False
+    image_url = agent.image_to_base64_url(Image.new("RGB", (1280, 800), (40, 90, 160)), "JPEG", 80)
+
+    t_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, args.concurrency), thread_name_prefix="SimulatedSession") as executor:
+        sessions = list(executor.map(lambda i: run_simulated_session(agent, i, args.goal, args.max_steps, image_url), range(args.sessions)))
+    wall_s = time.perf_counter() - t_start
+
+    total_steps = sum(s["steps"] for s in sessions)
+    collect = lambda key: [v for s in sessions for v in s[key]]
+    report = {
+        "sessions": len(sessions), "concurrency": args.concurrency, "base_urls": base_urls.split(","),
+        "wall_s": round(wall_s, 2), "steps": total_steps, "steps_per_s": round(total_steps / wall_s, 2) if wall_s else None,
+        "outcomes": {o: sum(1 for s in sessions if s["outcome"] == o) for o in sorted({s["outcome"] for s in sessions})},
+        "step_ms": _percentiles(collect("step_ms")), "vlm_ttft_ms": _percentiles(collect("vlm_ttft_ms")),
+        "vlm_total_ms": _percentiles(collect("vlm_total_ms")), "qwen_ms": _percentiles(collect("qwen_ms")),
+        "vlm_errors": sum(s["vlm_errors"] for s in sessions), "vlm_parse_failures": sum(s["vlm_parse_failures"] for s in sessions),
+        "vlm_stream_disconnects": sum(s["vlm_stream_disconnects"] for s in sessions), # Inclus dans vlm_errors
+        "qwen_errors": sum(s["qwen_errors"] for s in sessions),
+        "client": {"vlm_pool": agent.vlm_endpoint_pool.stats_summary(), "qwen_pool": agent.qwen_endpoint_pool.stats_summary(),
+                   "vlm_policy": agent.vlm_request_policy.stats_summary(), "qwen_policy": agent.qwen_request_policy.stats_summary()},
+        "servers": {s.base_url: s.snapshot() for s in servers},
+    }
+    agent.vlm_endpoint_pool.close()
+    agent.qwen_endpoint_pool.close()
+    agent.persistence_worker.close()
+    for server in servers:
+        server.close()
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output_file:
+            json.dump(report, output_file, ensure_ascii=False, indent=2)
+    return 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serveur de modèles factice compatible OpenAI et générateur de charge pour l'agent GUI.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    serve_parser = commands.add_parser("serve", help="Lance le(s) serveur(s) factice(s)")
+    add_server_arguments(serve_parser)
+    load_parser = commands.add_parser("load", help="Simule des sessions d'agent en parallèle et mesure le débit")
+    add_server_arguments(load_parser)
+    load_parser.add_argument("--base-urls", help="Endpoints existants (virgules); sinon des serveurs factices sont lancés ici")
+    load_parser.add_argument("--sessions", type=int, default=10)
+    load_parser.add_argument("--concurrency", type=int, default=4)
+    load_parser.add_argument("--max-steps", type=int, default=20)
+    load_parser.add_argument("--goal", default="Open the settings and enable dark mode")
+    load_parser.add_argument("--output", help="Écrit le rapport JSON dans ce fichier")
+    args = parser.parse_args(argv)
+    return serve(args) if args.command == "serve" else load(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,378 @@
+"""Banc de rejeu déterministe des sessions enregistrées par autonomous_gui_agent.py.
+
+Rejoue la logique de main_agent_loop sur des sessions JSONL (SESSION_RECORDING_FOLDER): captures d'écran
+enregistrées à la place de l'écran, réponses VLM/Qwen enregistrées à la place des serveurs de modèles, actions GUI
+sans effet. Fonctionne sans affichage (CI Linux) et produit un rapport JSON comparable d'un commit à l'autre.
+
+Exemples:
+    python replay_benchmark.py agent_gui_screenshots_api/sessions/*.jsonl --output rapport.json
+    python replay_benchmark.py sessions/*.jsonl --repeat 5 --compare rapport_main.json
+"""
+import argparse
+import glob
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+# Réglages imposés avant l'import de l'agent: ils rendent le rejeu déterministe et sans effet de bord
+_FORCED_ENV = {
+    "SESSION_RECORDING_ENABLED": "0",          # Ne pas enregistrer le rejeu lui-même
+    "VLM_SPECULATIVE_PREFETCH_ENABLED": "0",   # La spéculation demanderait la réponse du pas suivant trop tôt
+    "SETTLE_DETECTOR_ENABLED": "0",            # Les captures viennent de l'enregistrement
+    "REQUEST_HEDGING_ENABLED": "0",
+    "VLM_REQUEST_MAX_RETRIES": "0",
+    "QWEN_REQUEST_MAX_RETRIES": "0",
+    "VLM_RESPONSE_CACHE_PATH": "",             # Jamais le cache persistant de l'utilisateur
+    "TRAJECTORY_REPLAY_ENABLED": "0",          # Un rejeu de trajectoire sauterait les réponses enregistrées
+    "SCREENSHOT_STORAGE_MODE": "files",        # Les captures du rejeu restent dans le dossier de travail
+    "STAGE_TRACE_ENABLED": "1",
+    "STAGE_TRACE_JSONL_PATH": "",
+    "STAGE_TRACE_PROMETHEUS_FILE": "",
+    "STAGE_TRACE_PROMETHEUS_PORT": "0",
+}
+
+
+def load_session(path):
+    """Lit une session JSONL: (en-tête, {numéro de pas: pas}, résultat enregistré)."""
+    header, steps, outcome = None, {}, None
+    with open(path, encoding="utf-8") as session_file:
+        for line in session_file:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            if entry.get("type") == "session":
+                header = entry
+            elif entry.get("type") == "step":
+                steps[entry["step"]] = entry
+            elif entry.get("type") == "outcome":
+                outcome = entry.get("outcome")
+    if header is None:
+        raise ValueError(f"{path}: en-tête de session manquant.")
+    return header, steps, outcome
+
+
+class ReplayCursor:
+    """Remplace session_recorder dans l'agent: suit le pas courant et collecte ce que la boucle enregistre."""
+
+    def __init__(self, session_dir, steps):
+        self.session_dir = session_dir
+        self.steps = steps
+        self.current_step = 0
+        self.replayed = {}
+        self.outcome = None
+
+    def recorded(self, step=None):
+        return self.steps.get(self.current_step if step is None else step)
+
+    def begin_session(self, goal):
+        pass
+
+    def begin_step(self, step_count):
+        self.current_step = step_count
+        self.replayed[step_count] = {}
+
+    def record(self, key, value):
+        self.replayed.setdefault(self.current_step, {})[key] = value
+
+    def record_screenshot(self, screenshot_path, written):
+        pass
+
+    def end_step(self, step_trace=None):
+        pass
+
+    def end_session(self, outcome):
+        if outcome and self.outcome is None:
+            self.outcome = outcome
+
+    def screenshot_for_current_step(self, image_module, archive=None):
+        """Capture enregistrée du pas courant (ou du dernier pas disponible si la capture manque).
+
+        Sans fichier image (SCREENSHOT_STORAGE_MODE=archive), la trame est reconstruite depuis l'archive des captures
+        référencée par l'en-tête de la session.
+        """
+        for step in range(self.current_step, 0, -1):
+            recorded = self.steps.get(step)
+            if recorded and recorded.get("screenshot"):
+                path = os.path.join(self.session_dir, recorded["screenshot"])
+                if os.path.exists(path):
+                    with image_module.open(path) as image:
+                        return image.convert("RGB")
+                archived = archive.load_frame(recorded.get("frame_id") or path) if archive is not None else None
+                if archived is not None:
+                    return archived.convert("RGB")
+        raise FileNotFoundError(f"Aucune capture enregistrée disponible pour le pas {self.current_step}.")
+
+
+class _ReplayStream:
+    def __init__(self, chunks, first_delay_s, chunk_delay_s):
+        self._chunks = chunks
+        self._first_delay_s = first_delay_s
+        self._chunk_delay_s = chunk_delay_s
+        self.closed = False
+
+    def __iter__(self):
+        for i, chunk in enumerate(self._chunks):
+            if self.closed:
+                return
+            delay_s = self._first_delay_s if i == 0 else self._chunk_delay_s
+            if delay_s > 0:
+                time.sleep(delay_s)
+            yield chunk
+
+    def close(self):
+        self.closed = True
+
+
+class ReplayModelClient:
+    """Client compatible avec l'usage que l'agent fait d'openai.OpenAI, servi depuis l'enregistrement."""
+
+    def __init__(self, role, cursor, latency_mode, chunk_chars=24):
+        self.role = role # "vlm" ou "qwen": un client par pool, les deux modèles peuvent porter le même nom
+        self.cursor = cursor
+        self.latency_mode = latency_mode
+        self.chunk_chars = chunk_chars
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+        self.models = SimpleNamespace(list=lambda: [])
+
+    def close(self):
+        pass
+
+    def _response_text(self):
+        recorded = self.cursor.recorded() or {}
+        if self.role == "qwen":
+            return self._qwen_text(recorded), (recorded.get("qwen_duration_ms") or 0) / 1000, 0.0
+        vlm = recorded.get("vlm") or {}
+        total_s = (vlm.get("total_ms") or 0) / 1000
+        return vlm.get("raw") or "", (vlm.get("ttft_ms") or 0) / 1000, total_s
+
+    def _qwen_text(self, recorded):
+        if recorded.get("qwen_raw"):
+            return recorded["qwen_raw"]
+        decision = recorded.get("qwen_decision")
+        if decision: # Pas approuvé par le fast-path à l'enregistrement: décision reconstruite
+            return json.dumps(decision, ensure_ascii=False)
+        return json.dumps({"decision_type": "TASK_FAILED", "reasoning": "Rejeu: enregistrement épuisé.",
+                           "action_sequence_to_execute": None, "next_vlm_instruction": None,
+                           "user_summary_message": "Rejeu: plus de pas enregistrés."})
+
+    def _create(self, model, messages, stream=False, **_kwargs):
+        text, first_delay_s, total_s = self._response_text()
+        if self.latency_mode != "recorded":
+            first_delay_s, total_s = 0.0, 0.0
+        if not stream:
+            if max(first_delay_s, total_s) > 0:
+                time.sleep(max(first_delay_s, total_s))
+            return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=text))], usage=None, timings=None)
+        pieces = [text[i:i + self.chunk_chars] for i in range(0, len(text), self.chunk_chars)] or [""]
+        chunks = [SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=piece))], usage=None, timings=None)
+                  for piece in pieces]
+        chunk_delay_s = max(0.0, total_s - first_delay_s) / max(1, len(chunks) - 1)
+        return _ReplayStream(chunks, first_delay_s, chunk_delay_s)
+
+
+def _noop_action(action_type, cursor):
+    def action(*_args, **_kwargs):
+        cursor.record(f"noop_{action_type}", True)
+        return True
+    return action
+
+
+def replay_session(agent, path, latency_mode, work_dir):
+    header, steps, recorded_outcome = load_session(path)
+    cursor = ReplayCursor(os.path.dirname(os.path.abspath(path)), steps)
+
+    agent.session_recorder = cursor
+    archive = agent.screenshot_archive # Sessions antérieures sans dossier d'archive dans l'en-tête
+    if header.get("screenshot_archive"):
+        archive = agent.ScreenshotArchive(folder=os.path.join(cursor.session_dir, header["screenshot_archive"]))
+    agent.ImageGrab = SimpleNamespace(grab=lambda *a, **k: cursor.screenshot_for_current_step(agent.Image, archive))
+    agent.SCREENSHOTS_FOLDER = work_dir
+    agent.PRE_CAPTURE_FIXED_DELAY_S = 0.0
+    agent.POST_ACTION_FIXED_DELAY_S = 0.0
+    agent.AUDIO_ENABLED = False
+    agent.MAX_AGENT_STEPS = header.get("max_agent_steps", agent.MAX_AGENT_STEPS)
+    for action_type in list(agent.ACTION_FUNCTION_MAP):
+        agent.ACTION_FUNCTION_MAP[action_type] = _noop_action(action_type, cursor)
+    agent.vlm_endpoint_pool = agent.EndpointPool("VLM", ["replay://vlm"], "", lambda *_: ReplayModelClient("vlm", cursor, latency_mode))
+    agent.qwen_endpoint_pool = agent.EndpointPool("Qwen", ["replay://qwen"], "", lambda *_: ReplayModelClient("qwen", cursor, latency_mode))
+    agent.vlm_response_cache = agent.VlmResponseCache(persist_path="") # Cache vierge à chaque rejeu
+    answers = iter([header["goal"]])
+    agent.Prompt = SimpleNamespace(ask=lambda *a, **k: next(answers, "exit"))
+
+    captured_durations = {}
+    original_reset_task = agent.stage_tracer.reset_task
+    def capture_then_reset(): # Une seule fois par tâche: au début de la suivante, puis après la boucle pour la dernière
+        for stage, values in agent.stage_tracer.task_durations().items():
+            captured_durations.setdefault(stage, []).extend(values)
+        original_reset_task()
+    agent.stage_tracer.reset_task = capture_then_reset
+
+    t_start = time.perf_counter()
+    agent.main_agent_loop()
+    wall_ms = (time.perf_counter() - t_start) * 1000
+    capture_then_reset()
+    agent.stage_tracer.reset_task = original_reset_task
+    agent.vlm_endpoint_pool.close(); agent.qwen_endpoint_pool.close()
+
+    replayed = cursor.replayed
+    vlm_steps = [r["vlm"] for r in replayed.values() if r.get("vlm")]
+    qwen_called = [r for r in replayed.values() if r.get("fast_path") and not r["fast_path"].get("approved")]
+    divergences = 0
+    for step, replayed_step in replayed.items():
+        recorded_step = steps.get(step)
+        if recorded_step is None or "executed_actions" not in replayed_step:
+            continue
+        recorded_types = [a.get("action_type") for a in recorded_step.get("executed_actions") or []]
+        replayed_types = [a.get("action_type") for a in replayed_step.get("executed_actions") or []]
+        divergences += recorded_types != replayed_types
+    return {
+        "session": os.path.relpath(path),
+        "goal": header["goal"],
+        "recorded_steps": len(steps),
+        "recorded_outcome": recorded_outcome,
+        "replayed_steps": len([r for r in replayed.values() if r.get("vlm")]),
+        "replayed_outcome": cursor.outcome,
+        "vlm_calls": len(vlm_steps),
+        "vlm_parse_failures": sum(1 for v in vlm_steps if not v.get("parse_ok")),
+        "qwen_calls": len(qwen_called),
+        "qwen_failures": sum(1 for r in replayed.values() if r.get("qwen_error")),
+        "fast_path_steps": sum(1 for r in replayed.values() if r.get("fast_path", {}).get("approved")),
+        "action_divergences": divergences,
+        "wall_ms": round(wall_ms, 1),
+    }, captured_durations
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def build_report(agent, session_results, durations, args, import_ms=None):
+    vlm_calls = sum(r["vlm_calls"] for r in session_results)
+    qwen_calls = sum(r["qwen_calls"] for r in session_results)
+    completed = [r for r in session_results if r["replayed_outcome"] == "TASK_COMPLETED"]
+    return {
+        "generated_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "git_commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "latency_mode": args.latency,
+        "engine": agent.agent_engine.mode,
+        "repeat": args.repeat,
+        "sessions": session_results,
+        "totals": {
+            "sessions": len(session_results),
+            "completed": len(completed),
+            "mean_steps_to_completion": (sum(r["replayed_steps"] for r in completed) / len(completed)) if completed else None,
+            "vlm_calls": vlm_calls,
+            "vlm_parse_failure_rate": (sum(r["vlm_parse_failures"] for r in session_results) / vlm_calls) if vlm_calls else 0.0,
+            "qwen_calls": qwen_calls,
+            "qwen_failure_rate": (sum(r["qwen_failures"] for r in session_results) / qwen_calls) if qwen_calls else 0.0,
+            "fast_path_steps": sum(r["fast_path_steps"] for r in session_results),
+            "action_divergences": sum(r["action_divergences"] for r in session_results),
+            "wall_ms": round(sum(r["wall_ms"] for r in session_results), 1),
+        },
+        "stages": {stage: {k: round(v, 3) if isinstance(v, float) else v for k, v in stats.items()}
+                   for stage, stats in agent.summarize_stage_durations(durations).items()},
+        "startup": {"import_ms": round(import_ms, 1) if import_ms is not None else None, **agent.startup_profiler.as_dict()},
+    }
+
+
+def print_report(report, baseline=None):
+    totals = report["totals"]
+    print(f"\nRejeu de {totals['sessions']} session(s) (commit {report['git_commit'] or '?'}, latence modèle: {report['latency_mode']}, "
+          f"moteur: {report.get('engine', 'sync')})")
+    print(f"  Terminées: {totals['completed']}, pas moyens jusqu'à complétion: {totals['mean_steps_to_completion']}")
+    print(f"  Échecs de parsing VLM: {totals['vlm_parse_failure_rate']:.1%} de {totals['vlm_calls']} appels; "
+          f"échecs Qwen: {totals['qwen_failure_rate']:.1%} de {totals['qwen_calls']} appels; fast-path: {totals['fast_path_steps']} pas")
+    print(f"  Divergences d'actions par rapport à l'enregistrement: {totals['action_divergences']}")
+    startup = report.get("startup") or {}
+    if startup.get("import_ms") is not None:
+        lazy_imports = ", ".join(f"{name} {ms:.0f} ms" for name, ms in startup.get("lazy_imports_ms", {}).items()) or "aucun"
+        print(f"  Import du module de l'agent: {startup['import_ms']:.0f} ms (imports différés pendant le rejeu: {lazy_imports})")
+    base_stages = (baseline or {}).get("stages", {})
+    print(f"\n  {'étape':<28} {'n':>5} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'total ms':>10}" + ("   Δp50     Δp95" if baseline else ""))
+    for stage, st in report["stages"].items():
+        line = f"  {stage:<28} {st['n']:>5} {st['p50']:>9.2f} {st['p95']:>9.2f} {st['p99']:>9.2f} {st['total']:>10.1f}"
+        base = base_stages.get(stage)
+        if base:
+            deltas = [(st[q] - base[q]) / base[q] * 100 if base[q] else 0.0 for q in ("p50", "p95")]
+            line += f"  {deltas[0]:+6.1f}%  {deltas[1]:+6.1f}%"
+        elif baseline:
+            line += "   (nouvelle)"
+        print(line)
+    if baseline:
+        base_totals = baseline.get("totals", {})
+        print(f"\n  Référence: commit {baseline.get('git_commit') or '?'}, moteur {baseline.get('engine', 'sync')}, "
+              f"parsing VLM {base_totals.get('vlm_parse_failure_rate', 0):.1%}, "
+              f"pas moyens {base_totals.get('mean_steps_to_completion')}, divergences {base_totals.get('action_divergences')}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rejeu déterministe de sessions enregistrées de l'agent GUI.")
+    parser.add_argument("sessions", nargs="+", help="Fichiers session_*.jsonl ou dossiers qui en contiennent")
+    parser.add_argument("--output", help="Écrit le rapport JSON dans ce fichier")
+    parser.add_argument("--compare", help="Rapport JSON de référence (ex: produit sur un autre commit)")
+    parser.add_argument("--repeat", type=int, default=1, help="Nombre de rejeux par session (timings plus stables)")
+    parser.add_argument("--latency", choices=("none", "recorded"), default="none",
+                        help="'none': réponses instantanées (coût propre de la boucle); 'recorded': TTFT et durées enregistrés")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--engine", choices=("async", "sync"),
+                        help="Moteur d'exécution des étapes (AGENT_ENGINE); comparer deux rapports avec --compare")
+    args = parser.parse_args(argv)
+
+    session_paths = []
+    for pattern in args.sessions:
+        if os.path.isdir(pattern):
+            session_paths.extend(sorted(glob.glob(os.path.join(pattern, "session_*.jsonl"))))
+        else:
+            session_paths.extend(sorted(glob.glob(pattern)) or [pattern])
+    if not session_paths:
+        parser.error("Aucune session trouvée.")
+
+    os.environ.update(_FORCED_ENV)
+    if args.engine:
+        os.environ["AGENT_ENGINE"] = args.engine
+    screen_size = load_session(session_paths[0])[0].get("screen_size")
+    if screen_size and not os.getenv("AGENT_SCREEN_SIZE"): # Les coordonnées normalisées dépendent de la résolution enregistrée
+        os.environ["AGENT_SCREEN_SIZE"] = f"{screen_size[0]}x{screen_size[1]}"
+    random.seed(args.seed)
+    t_import = time.perf_counter()
+    import autonomous_gui_agent as agent # Import après la configuration de l'environnement
+    import_ms = (time.perf_counter() - t_import) * 1000
+
+    session_results, durations = [], {}
+    with tempfile.TemporaryDirectory(prefix="agent_replay_") as work_dir:
+        for path in session_paths:
+            for _ in range(max(1, args.repeat)):
+                result, session_durations = replay_session(agent, path, args.latency, work_dir)
+                session_results.append(result)
+                for stage, values in session_durations.items():
+                    durations.setdefault(stage, []).extend(values)
+        agent.agent_engine.close()
+        agent.persistence_worker.close()
+
+    report = build_report(agent, session_results, durations, args, import_ms)
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as baseline_file:
+            baseline = json.load(baseline_file)
+    print_report(report, baseline)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output_file:
+            json.dump(report, output_file, ensure_ascii=False, indent=2)
+        print(f"\nRapport écrit dans {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,74 @@
+"""Configuration commune des tests: l'agent est importé sans affichage, sans fichiers persistants ni serveur de modèles."""
+import os
+import sys
+
+# Réglages imposés avant l'import de l'agent (même principe que replay_benchmark._FORCED_ENV)
+_TEST_ENV = {
+    "OVERLAY_MODE": "off",
+    "AGENT_SCREEN_SIZE": "1920x1080",
+    "SESSION_RECORDING_ENABLED": "0",
+    "VLM_SPECULATIVE_PREFETCH_ENABLED": "0",
+    "VLM_RESPONSE_CACHE_PATH": "",
+    "TRAJECTORY_STORE_PATH": "",
+    "EXECUTION_AUTOTUNE_PATH": "",
+    "STAGE_TRACE_JSONL_PATH": "",
+    "STAGE_TRACE_PROMETHEUS_FILE": "",
+    "STAGE_TRACE_PROMETHEUS_PORT": "0",
+}
+for _name, _value in _TEST_ENV.items():
+    os.environ[_name] = _value
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+
+@pytest.fixture(scope="session")
+def agent():
+    import autonomous_gui_agent
+    return autonomous_gui_agent
+
+
+def write_synthetic_session(folder, steps=3, vlm_total_ms=0, qwen_duration_ms=0):
+    """Session enregistrée minimale: une capture par pas, une saisie proposée par le VLM (jamais en fast-path, Qwen est
+    donc consulté à chaque pas), approuvée par Qwen, puis TASK_COMPLETED au dernier pas. Retourne le chemin du JSONL."""
+    import json
+    from PIL import Image
+
+    os.makedirs(folder, exist_ok=True)
+    lines = [{"type": "session", "format_version": 1, "goal": "Écrire une note", "screen_size": [1920, 1080],
+              "vlm_model": "vlm", "qwen_model": "qwen", "max_agent_steps": steps + 2}]
+    for step in range(1, steps + 1):
+        screenshot = f"step_{step}.png"
+        Image.new("RGB", (320, 180), (20 * step, 40, 60)).save(os.path.join(folder, screenshot))
+        actions = [{"action_type": "INPUT", "value": f"ligne {step}", "description": "note"}]
+        vlm_raw = json.dumps({"global_thought": {"Current State Summary": "N/A"}, "action_sequence": actions})
+        decision_type = "TASK_COMPLETED" if step == steps else "EXECUTE_VLM_SEQUENCE"
+        qwen_raw = json.dumps({"decision_type": decision_type, "reasoning": "ok", "action_sequence_to_execute": None,
+                               "next_vlm_instruction": None if step == steps else "Continuer la note",
+                               "user_summary_message": "Terminé." if step == steps else None})
+        lines.append({"type": "step", "step": step, "screenshot": screenshot,
+                      "vlm": {"raw": vlm_raw, "ttft_ms": vlm_total_ms / 4, "total_ms": vlm_total_ms},
+                      "qwen_raw": qwen_raw, "qwen_duration_ms": qwen_duration_ms,
+                      "executed_actions": [] if step == steps else actions})
+    lines.append({"type": "outcome", "outcome": "TASK_COMPLETED"})
+    path = os.path.join(folder, "session_synthetique.jsonl")
+    with open(path, "w", encoding="utf-8") as session_file:
+        session_file.writelines(json.dumps(line, ensure_ascii=False) + "\n" for line in lines)
+    return path
+
+
+def run_replay_benchmark(tmp_path, session_path, *extra_args):
+    """Lance replay_benchmark.py dans un processus séparé (il modifie les globales du module de l'agent)."""
+    import json
+    import subprocess
+
+    report_path = os.path.join(tmp_path, "rapport.json")
+    repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = {name: value for name, value in os.environ.items() if name != "AGENT_SCREEN_SIZE"}
+    completed = subprocess.run([sys.executable, os.path.join(repo_root, "replay_benchmark.py"), session_path,
+                                "--output", report_path, *extra_args],
+                               cwd=tmp_path, env=env, capture_output=True, text=True, timeout=120)
+    assert completed.returncode == 0, completed.stderr[-2000:]
+    with open(report_path, encoding="utf-8") as report_file:
+        return json.load(report_file)
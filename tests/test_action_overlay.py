@@ -0,0 +1,22 @@
+import pytest
+
+
+@pytest.mark.parametrize("mode", ["thread", "main"])
+def test_hide_before_any_show_creates_nothing(agent, monkeypatch, mode):
+    created = []
+    monkeypatch.setattr(agent.ActionOverlayService, "_create_window", lambda self: created.append(self))
+    overlay = agent.ActionOverlayService(mode=mode)
+    overlay.hide(wait_s=0.5) # Masquage systématique avant chaque capture
+    overlay.expire_after(0.1)
+    assert created == []
+    assert overlay._thread is None and overlay._root is None
+
+
+def test_off_mode_ignores_every_message(agent, monkeypatch):
+    monkeypatch.setattr(agent.ActionOverlayService, "_create_window", lambda self: pytest.fail("fenêtre créée"))
+    overlay = agent.ActionOverlayService(mode="off")
+    overlay.show("CLICK (10,10)", 10, 10)
+    overlay.hide(wait_s=0.5)
+    overlay.pump()
+    overlay.close()
+    assert overlay._thread is None and overlay._root is None
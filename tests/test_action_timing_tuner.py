@@ -0,0 +1,46 @@
+import pytest
+
+
+@pytest.fixture
+def tuner(agent, monkeypatch):
+    sleeps, settle_calls = [], []
+    monkeypatch.setattr(agent.time, "sleep", sleeps.append)
+    monkeypatch.setattr(agent, "SETTLE_DETECTOR_ENABLED", True)
+    monkeypatch.setattr(agent, "SETTLE_ACTION_TIMEOUT_S", 2.0)
+    monkeypatch.setattr(agent, "SETTLE_STABLE_MS", 100)
+    monkeypatch.setattr(agent.ActionTimingTuner, "application_key", staticmethod(lambda: "Notes"))
+    settle_s = {"value": 0.3}
+    def fake_wait_for_screen_stable(timeout_s):
+        settle_calls.append(timeout_s)
+        return True, settle_s["value"], None
+    monkeypatch.setattr(agent, "wait_for_screen_stable", fake_wait_for_screen_stable)
+    instance = agent.ActionTimingTuner(enabled=True, persist_path="", min_samples=3, margin=1.5, min_delay_s=0.05,
+                                       recheck_every=4, window=10)
+    return instance, sleeps, settle_calls, settle_s
+
+
+def test_learned_pause_replaces_detector_after_enough_samples(tuner):
+    instance, sleeps, settle_calls, _ = tuner
+    for _ in range(3):
+        instance.wait_after_action("CLICK")
+    assert len(settle_calls) == 3 and sleeps == []
+    # Mesure 0.3 s - SETTLE_STABLE_MS = 0.2 s, p95 x 1.5 = 0.3 s
+    assert instance.learned_delay("Notes|CLICK") == pytest.approx(0.3)
+    instance.wait_after_action("CLICK")
+    assert sleeps == [pytest.approx(0.3)] and len(settle_calls) == 3
+    assert instance.learned_delay("Notes|KEY_PRESS") is None # Clé par type d'action
+
+
+def test_one_action_in_n_is_measured_again(tuner):
+    instance, sleeps, settle_calls, _ = tuner
+    for _ in range(3 + 4):
+        instance.wait_after_action("CLICK")
+    assert len(settle_calls) == 4 and len(sleeps) == 3
+
+
+def test_learned_pause_is_capped_by_settle_timeout(tuner):
+    instance, sleeps, _, settle_s = tuner
+    settle_s["value"] = 1.9 # p95 x marge = 2.7 s > SETTLE_ACTION_TIMEOUT_S
+    for _ in range(4):
+        instance.wait_after_action("CLICK")
+    assert sleeps == [2.0]
@@ -0,0 +1,79 @@
+import threading
+import time
+
+import pytest
+
+
+@pytest.fixture
+def engine(agent):
+    instance = agent.AgentEngine(mode="async", deadlines_s={"lent": 0.2, "encode": 5.0}, max_workers=4)
+    yield instance
+    instance.close()
+
+
+def _wait_for_cancel(cancel_token, limit_s=5.0):
+    """Étape coopérative (comme une requête VLM en streaming): s'arrête dès que son jeton est levé."""
+    return cancel_token.wait(limit_s)
+
+
+def test_stage_deadline_raises_and_cancels_the_stage(agent, engine):
+    cancel_token = engine.new_cancel_token()
+    t_start = time.perf_counter()
+    with pytest.raises(agent.StageDeadlineExceeded):
+        engine.run("lent", _wait_for_cancel, cancel_token, cancel_token=cancel_token)
+    assert time.perf_counter() - t_start < 2.0
+    assert cancel_token.is_set() and engine.deadlines_exceeded == 1
+
+
+def test_deadline_falls_back_to_stage_family(engine):
+    assert engine.deadline_for("encode.vlm") == 5.0
+    assert engine.deadline_for("qwen") is None
+
+
+def test_ctrl_c_cancels_the_running_stage(agent, engine, monkeypatch):
+    interrupts = iter([KeyboardInterrupt()])
+    def pump():
+        error = next(interrupts, None) # Ctrl+C reçu une fois pendant que le thread principal attend l'étape
+        if error is not None:
+            raise error
+    monkeypatch.setattr(agent.action_overlay, "pump", pump)
+    cancel_token = engine.new_cancel_token()
+    with pytest.raises(agent.StageCancelled):
+        engine.run("vlm", _wait_for_cancel, cancel_token, cancellable=True, cancel_token=cancel_token)
+    assert cancel_token.is_set() and engine.cancelled == 1
+    assert engine.consume_cancel_request() and not engine.consume_cancel_request()
+
+
+def test_ctrl_c_outside_cancellable_stage_propagates(agent, engine, monkeypatch):
+    monkeypatch.setattr(agent.action_overlay, "pump", lambda: (_ for _ in ()).throw(KeyboardInterrupt()))
+    with pytest.raises(KeyboardInterrupt):
+        engine.run("capture", time.sleep, 0.5)
+    assert engine.cancelled == 0
+
+
+def test_actions_of_a_cancelled_stage_are_never_run(agent, engine):
+    executed = []
+    cancel_token = engine.new_cancel_token()
+    act = engine.call_in_main_thread(lambda: executed.append("clic"), cancel_token)
+    def stage():
+        act() # Exécutée dans le thread principal pendant l'attente
+        cancel_token.set()
+        with pytest.raises(agent.StageCancelled):
+            act()
+        return True
+    assert engine.run("vlm", stage, cancel_token=cancel_token)
+    assert executed == ["clic"]
+
+
+def test_gather_overlaps_independent_stages(engine):
+    barrier = threading.Barrier(2, timeout=2.0) # Ne passe que si les deux étapes tournent en même temps
+    assert engine.gather(("encode.vlm", lambda: barrier.wait() >= 0), ("phash", None),
+                         ("encode.hash", lambda: barrier.wait() >= 0)) == [True, None, True]
+    assert engine.overlapped == 1
+
+
+def test_sync_mode_calls_stages_directly(agent):
+    engine = agent.AgentEngine(mode="sync")
+    assert engine.new_cancel_token() is None
+    assert engine.run("capture", lambda: threading.current_thread()) is threading.current_thread()
+    assert engine.run_in_background("encode", lambda: None) is None
@@ -0,0 +1,84 @@
+from types import SimpleNamespace
+
+import pytest
+
+
+class FakeClient:
+    def __init__(self, base_url, api_key, max_concurrency):
+        self.base_url = base_url
+        self.healthy = True
+        self.models = SimpleNamespace(list=self._list)
+
+    def _list(self):
+        if not self.healthy:
+            raise ConnectionError("toujours hors ligne")
+        return []
+
+    def close(self):
+        pass
+
+
+class FakeStatusError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+def _pool(agent, urls=("http://a/v1", "http://b/v1"), **kwargs):
+    options = dict(max_concurrency=1, balancing="least_outstanding", eject_after_failures=2, eject_seconds=60,
+                   health_check_interval_s=0, acquire_timeout_s=0.2)
+    options.update(kwargs)
+    return agent.EndpointPool("VLM", list(urls), "clé", FakeClient, **options)
+
+
+def _fail(pool, error):
+    with pytest.raises(type(error)):
+        with pool.acquire():
+            raise error
+
+
+def test_requests_spread_over_free_replicas(agent):
+    pool = _pool(agent)
+    with pool.acquire() as first, pool.acquire() as second:
+        assert {first.name, second.name} == {"http://a/v1", "http://b/v1"}
+        with pytest.raises(agent.EndpointSaturatedError): # max_concurrency=1 par réplica
+            with pool.acquire():
+                pass
+    assert [r.requests for r in pool.replicas] == [1, 1] and all(r.outstanding == 0 for r in pool.replicas)
+
+
+def test_latency_balancing_prefers_the_faster_replica(agent):
+    pool = _pool(agent, balancing="latency")
+    pool.replicas[0].ewma_latency_ms, pool.replicas[1].ewma_latency_ms = 900.0, 300.0
+    with pool.acquire() as replica:
+        assert replica.name == "http://b/v1"
+
+
+def test_consecutive_failures_eject_a_replica(agent):
+    pool = _pool(agent)
+    for _ in range(2): # À égalité, le premier réplica est choisi
+        _fail(pool, ConnectionError("reset"))
+    assert pool.replicas[0].ejections == 1
+    for _ in range(3):
+        with pool.acquire() as replica:
+            assert replica.name == "http://b/v1"
+
+
+def test_client_errors_do_not_affect_health(agent):
+    pool = _pool(agent, urls=("http://a/v1",))
+    for _ in range(3):
+        _fail(pool, FakeStatusError(400))
+    assert pool.replicas[0].failures == 0 and pool.replicas[0].ejections == 0
+    _fail(pool, FakeStatusError(503))
+    assert pool.replicas[0].consecutive_failures == 1
+
+
+def test_health_probe_reinstates_an_ejected_replica(agent):
+    pool = _pool(agent, urls=("http://a/v1",), eject_after_failures=1, health_check_interval_s=0.02)
+    _fail(pool, ConnectionError("reset"))
+    replica = pool.replicas[0]
+    assert replica.is_ejected(agent.time.monotonic())
+    replica.client # Client créé: la sonde appelle models.list()
+    pool._health_thread.join(2.0)
+    assert not replica.is_ejected(agent.time.monotonic()) and replica.consecutive_failures == 0
+    pool.close()
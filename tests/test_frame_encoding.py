@@ -0,0 +1,35 @@
+import base64
+import io
+
+import pytest
+from PIL import Image
+
+
+@pytest.mark.parametrize("spec, expected", [("1280x800", (1280, 800)), ("1024", (1024, 1024)), ("native", None), ("", None),
+                                            ("abc", None)])
+def test_parse_image_size_spec(agent, spec, expected):
+    assert agent.parse_image_size_spec(spec) == expected
+
+
+def test_fitted_size_keeps_ratio_and_never_upscales(agent):
+    assert agent.compute_fitted_image_size((2880, 1800), (1280, 1280)) == (1280, 800)
+    assert agent.compute_fitted_image_size((800, 600), (1280, 1280)) == (800, 600)
+    assert agent.compute_fitted_image_size((800, 600), None) == (800, 600)
+
+
+def test_low_detail_caps_estimated_tokens(agent):
+    assert agent.estimate_image_prefill_tokens(1280, 800) == 46 * 29
+    assert agent.estimate_image_prefill_tokens(1280, 800, detail="low") < agent.estimate_image_prefill_tokens(1280, 800)
+
+
+def test_frame_is_encoded_once_per_settings(agent):
+    cache = agent.FrameEncodingCache()
+    frame = Image.new("RGB", (1600, 1000), (10, 120, 200))
+    first = cache.encode(frame, "800x800", "JPEG", 80)
+    again = cache.encode(frame, "800x800", "JPEG", 80)
+    other = cache.encode(frame, "800x800", "PNG", 80)
+    assert not first.from_cache and again.from_cache and not other.from_cache
+    assert again.data_url == first.data_url and first.size == (800, 500) and other.quality is None
+    decoded = Image.open(io.BytesIO(base64.b64decode(first.data_url.split(",", 1)[1])))
+    assert decoded.format == "JPEG" and decoded.size == (800, 500)
+    assert not cache.encode(frame.copy(), "800x800", "JPEG", 80).from_cache # Nouvelle frame: cache vidé
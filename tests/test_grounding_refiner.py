@@ -0,0 +1,28 @@
+from PIL import Image
+
+
+def test_off_by_default(agent):
+    assert agent.GroundingRefiner().enabled is False
+    frame = Image.new("RGB", (400, 300))
+    actions = [{"action_type": "CLICK", "position": [0.5, 0.5], "description": "icône"}]
+    assert agent.GroundingRefiner().refine_sequence(actions, frame, after_failure=True) is actions
+
+
+def test_triggers(agent):
+    refiner = agent.GroundingRefiner(policy={"after_failure", "small_targets"}, small_target_keywords=["icon"])
+    click = {"action_type": "CLICK", "position": [0.2, 0.3], "description": "Bouton OK"}
+    assert refiner.trigger_for(click, after_failure=False) is None
+    assert refiner.trigger_for(click, after_failure=True) == "after_failure"
+    assert refiner.trigger_for(dict(click, description="close icon"), after_failure=False) == "small_targets"
+    assert refiner.trigger_for({"action_type": "SCROLL", "direction": "down"}, after_failure=True) is None
+    assert refiner.trigger_for(dict(click, position=[640, 480]), after_failure=True) is None # Pixels: non raffinée
+
+
+def test_crop_stays_inside_frame_and_answer_maps_back(agent):
+    refiner = agent.GroundingRefiner(policy={"always"}, crop_size=100, zoom=2.0)
+    crop, box = refiner.crop_around(Image.new("RGB", (400, 300)), [0.99, 0.01])
+    assert box == (300, 0, 400, 100) and crop.size == (200, 200)
+    assert refiner.parse_answer('{"found": true, "position": [0.5, 0.25]}', 200) == (0.5, 0.25)
+    assert refiner.parse_answer('{"found": true, "position": [100, 50]}', 200) == (0.5, 0.25) # Pixels du recadrage
+    assert refiner.parse_answer('{"found": false}', 200) is None
+    assert refiner.parse_answer("pas de JSON", 200) is None
@@ -0,0 +1,61 @@
+from types import SimpleNamespace
+
+import pytest
+
+
+class FakeClipboard:
+    def __init__(self, content):
+        self.content = content
+        self.copies = []
+
+    def paste(self):
+        return self.content
+
+    def copy(self, text):
+        self.copies.append(text)
+        self.content = text
+
+
+@pytest.fixture
+def gui(agent, monkeypatch):
+    """pyautogui et le presse-papiers remplacés par des enregistreurs; saisie forcée en collage."""
+    calls = []
+    fake_pyautogui = SimpleNamespace(
+        click=lambda **kwargs: calls.append(("click", kwargs)),
+        hotkey=lambda *keys: calls.append(("hotkey", keys)),
+        write=lambda text, interval=0: calls.append(("write", text)),
+        press=lambda key: calls.append(("press", key)),
+    )
+    monkeypatch.setattr(agent, "pyautogui", fake_pyautogui)
+    monkeypatch.setattr(agent, "INPUT_STRATEGY", "paste")
+    monkeypatch.setattr(agent, "INPUT_PASTE_SETTLE_S", 0.0)
+    monkeypatch.setattr(agent, "INPUT_FOCUS_DELAY_S", 0.0)
+    monkeypatch.setattr(agent, "highlight_click_position", lambda *args, **kwargs: None)
+    monkeypatch.setattr(agent.screen_geometry, "to_screen", lambda position: (400, 300))
+    monkeypatch.setattr(agent.ActionTimingTuner, "application_key", staticmethod(lambda: "Notes"))
+    monkeypatch.setattr(agent, "paste_blocked_applications", set())
+    return calls
+
+
+def test_unverified_paste_is_never_retyped(agent, gui, monkeypatch):
+    monkeypatch.setattr(agent, "pyperclip", FakeClipboard("ancien"))
+    monkeypatch.setattr(agent, "_input_region_sample", lambda x, y: object())
+    monkeypatch.setattr(agent, "_input_region_changed", lambda before, x, y: False) # Faux négatif
+    assert agent.action_input_text("Bonjour à tous", position_norm=[0.5, 0.5])
+    assert [call for call in gui if call[0] == "write"] == []
+    assert "Notes" in agent.paste_blocked_applications
+    assert agent.choose_input_strategy("Bonjour à tous") == "type" # Les saisies suivantes sont tapées
+
+
+def test_text_clipboard_is_restored(agent, gui, monkeypatch):
+    clipboard = FakeClipboard("ancien")
+    monkeypatch.setattr(agent, "pyperclip", clipboard)
+    assert agent.paste_text("nouveau texte")
+    assert clipboard.copies == ["nouveau texte", "ancien"]
+
+
+def test_non_text_clipboard_is_not_overwritten(agent, gui, monkeypatch):
+    clipboard = FakeClipboard("") # pyperclip.paste() pour une image ou des fichiers
+    monkeypatch.setattr(agent, "pyperclip", clipboard)
+    assert agent.paste_text("nouveau texte")
+    assert clipboard.copies == ["nouveau texte"]
@@ -0,0 +1,41 @@
+def _record(agent, step, decision_type="EXECUTE_VLM_SEQUENCE", actions=None, reasoning="ok", verbose_log=None):
+    return agent.InteractionRecord(step, f"instruction {step}", {"decision_type": decision_type, "reasoning": reasoning},
+                                   actions, verbose_log=verbose_log)
+
+
+def test_summaries_are_computed_once_from_structured_fields(agent):
+    record = _record(agent, 1, actions=[{"action_type": "CLICK"}, {"action_type": "INPUT"}], reasoning="r" * 200)
+    assert record.reasoning == "r" * 150 + "..."
+    assert "Executed: ['CLICK', 'INPUT']" in record.vlm_summary_line
+    assert "Actions then executed: ['CLICK', 'INPUT']" in record.qwen_summary_body
+    retry = _record(agent, 2, decision_type="RETRY_VLM_WITH_NEW_INSTRUCTION")
+    assert "No direct GUI actions were executed" in retry.qwen_summary_body
+
+
+def test_prompt_windows_keep_the_last_three_steps(agent):
+    history = agent.InteractionHistory()
+    for step in range(1, 6):
+        history.append(_record(agent, step))
+    window = history.vlm_prompt_window()
+    assert window.total_count == 5 and len(window.recent_lines) == 3
+    assert "instruction 3" in window.recent_lines[0] and "instruction 5" in window.recent_lines[-1]
+    assert [line.split(".")[0] for line in history.qwen_summary_lines()] == ["Step 3", "Step 4", "Step 5"]
+
+
+def test_pending_record_predicts_the_next_window(agent):
+    history = agent.InteractionHistory()
+    for step in range(1, 4):
+        history.append(_record(agent, step))
+    pending = _record(agent, 4)
+    predicted = history.vlm_prompt_window(pending_record=pending)
+    history.append(pending)
+    assert predicted == history.vlm_prompt_window() # Condition de réutilisation d'une requête spéculative
+
+
+def test_verbose_log_is_not_kept_in_memory_by_default(agent):
+    history = agent.InteractionHistory()
+    history.append(_record(agent, 1, verbose_log="réponse brute très longue"))
+    assert history.recent(1)[0].verbose_log is None
+    verbose_history = agent.InteractionHistory(keep_verbose_in_memory=True)
+    verbose_history.append(_record(agent, 1, verbose_log="réponse brute"))
+    assert verbose_history.recent(1)[0].verbose_log == "réponse brute"
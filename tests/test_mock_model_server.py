@@ -0,0 +1,64 @@
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+
+import pytest
+
+import mock_model_server
+
+
+def test_load_counts_stream_disconnects_without_tracebacks(tmp_path):
+    """Coupures de flux et erreurs injectées: aucune trace d'exception côté serveur, et chaque coupure après le premier
+    token est comptée (la politique de requête ne les voit pas)."""
+    repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    report_path = os.path.join(tmp_path, "charge.json")
+    completed = subprocess.run([sys.executable, os.path.join(repo_root, "mock_model_server.py"), "load", "--sessions", "6",
+                                "--concurrency", "3", "--max-steps", "3", "--error-rate", "0.3", "--disconnect-rate", "0.5",
+                                "--vlm-tokens-per-s", "400", "--seed", "3", "--output", report_path],
+                               cwd=tmp_path, capture_output=True, text=True, timeout=300)
+    assert completed.returncode == 0, completed.stderr[-2000:]
+    assert "Traceback" not in completed.stderr
+    with open(report_path, encoding="utf-8") as report_file:
+        report = json.load(report_file)
+    server_disconnects = sum(server["disconnects"] for server in report["servers"].values())
+    assert server_disconnects > 0
+    assert report["vlm_stream_disconnects"] == server_disconnects
+    assert report["vlm_stream_disconnects"] <= report["vlm_errors"]
+
+
+@pytest.mark.parametrize("spec, low, high", [("300", 300, 300), ("fixed:300", 300, 300), ("uniform:100,400", 100, 400),
+                                             ("normal:300,50", 0, 1000), ("lognormal:300,0.5", 0, 10000), ("exp:300", 0, 10000)])
+def test_latency_distributions(spec, low, high):
+    draw = mock_model_server.parse_latency_distribution(spec)
+    rng = random.Random(1)
+    assert all(low <= draw(rng) <= high for _ in range(200))
+
+
+def test_invalid_latency_distribution_is_rejected():
+    with pytest.raises(argparse.ArgumentTypeError):
+        mock_model_server.parse_latency_distribution("gamma:1,2")
+
+
+def test_roles_and_synthetic_task_length():
+    qwen_messages = [{"role": "system", "content": "Reply with a decision_type"},
+                     {"role": "user", "content": [{"type": "text", "text": "Step 1. ...\nStep 2. ..."}]}]
+    assert mock_model_server.request_role(qwen_messages) == "qwen"
+    assert mock_model_server.request_role([{"role": "system", "content": "Analyze the screenshot"}]) == "vlm"
+    responses = mock_model_server.SyntheticResponses(task_steps=3)
+    prompt_text = mock_model_server.request_text(qwen_messages)
+    assert json.loads(responses.next("qwen", prompt_text, random.Random(0)))["decision_type"] == "TASK_COMPLETED"
+    assert json.loads(responses.next("qwen", "", random.Random(0)))["decision_type"] == "EXECUTE_VLM_SEQUENCE"
+    assert json.loads(responses.next("vlm", "", random.Random(0)))["action_sequence"][0]["action_type"] == "CLICK"
+
+
+def test_scripted_responses_cycle_per_role(tmp_path):
+    script = tmp_path / "script.jsonl"
+    script.write_text('{"role": "vlm", "content": "a"}\n{"role": "vlm", "content": {"b": 1}}\n', encoding="utf-8")
+    responses = mock_model_server.ScriptedResponses(mock_model_server.SyntheticResponses())
+    responses.load_script(str(script))
+    rng = random.Random(0)
+    assert [responses.next("vlm", "", rng) for _ in range(3)] == ["a", '{"b": 1}', "a"]
+    assert "decision_type" in responses.next("qwen", "", rng) # Rôle sans script: réponses synthétiques
@@ -0,0 +1,53 @@
+import threading
+
+from PIL import Image
+
+
+def _blocked_worker(agent, **kwargs):
+    """Worker occupé par une écriture lente: les éléments suivants restent en file."""
+    worker = agent.PersistenceWorker(**kwargs)
+    release, started = threading.Event(), threading.Event()
+    worker.submit_call(lambda: (started.set(), release.wait(5.0)))
+    started.wait(2.0)
+    return worker, release
+
+
+def test_writes_happen_in_order_in_the_background(agent, tmp_path):
+    worker = agent.PersistenceWorker(image_format="PNG")
+    log_path = str(tmp_path / "journal" / "detailed_interaction_log.txt")
+    worker.submit_log_record(log_path, "étape 1\n")
+    assert worker.submit_screenshot(Image.new("RGB", (64, 48), (1, 2, 3)), str(tmp_path / "step_1.png"))
+    worker.submit_log_record(log_path, "étape 2\n")
+    worker.submit_file_snapshot(str(tmp_path / "etat.json"), '{"ok": true}')
+    assert worker.flush(5.0)
+    worker.close()
+    with open(log_path, encoding="utf-8") as log_file:
+        assert log_file.read() == "étape 1\nétape 2\n"
+    with Image.open(tmp_path / "step_1.png") as saved:
+        assert saved.size == (64, 48) and saved.getpixel((0, 0)) == (1, 2, 3)
+    assert (tmp_path / "etat.json").read_text(encoding="utf-8") == '{"ok": true}'
+    assert not (tmp_path / "etat.json.tmp").exists()
+
+
+def test_drop_policy_never_blocks_the_step(agent, tmp_path):
+    worker, release = _blocked_worker(agent, max_queue_size=2, backpressure_policy="drop", image_format="PNG")
+    image = Image.new("RGB", (32, 32))
+    accepted = [worker.submit_screenshot(image, str(tmp_path / f"step_{i}.png")) for i in range(4)]
+    assert accepted == [True, True, False, False] and worker.dropped_screenshots == 2
+    release.set()
+    worker.close()
+    assert worker.written_screenshots == 2
+
+
+def test_downsample_policy_halves_frames_when_queue_fills(agent, tmp_path):
+    worker, release = _blocked_worker(agent, max_queue_size=4, backpressure_policy="downsample", image_format="PNG")
+    image = Image.new("RGB", (64, 48))
+    for i in range(4):
+        worker.submit_screenshot(image, str(tmp_path / f"step_{i}.png"))
+    release.set()
+    worker.close()
+    assert worker.downsampled_screenshots == 1
+    with Image.open(tmp_path / "step_3.png") as saved:
+        assert saved.size == (32, 24)
+    with Image.open(tmp_path / "step_0.png") as saved:
+        assert saved.size == (64, 48)
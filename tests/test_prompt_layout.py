@@ -0,0 +1,50 @@
+import os
+from types import SimpleNamespace
+
+import pytest
+
+
+def _user_text(messages):
+    return messages[1]["content"][0]["text"]
+
+
+def test_consecutive_vlm_prompts_share_a_long_prefix(agent):
+    first = agent.build_messages_for_vlm_api("système", "Ouvre le menu", "data:image/jpeg;base64,AAA", ["pas 1", "pas 2"],
+                                             history_total_count=2)
+    second = agent.build_messages_for_vlm_api("système", "Clique sur Enregistrer", "data:image/jpeg;base64,BBB",
+                                              ["pas 1", "pas 2"], history_total_count=2)
+    first_text, second_text = _user_text(first), _user_text(second)
+    assert first_text.startswith(agent.VLM_PROMPT_STATIC_PREAMBLE)
+    # Seule l'instruction, en fin de texte, diffère; la capture est le dernier élément du message
+    assert os.path.commonprefix([first_text, second_text]) == first_text[:first_text.rindex("Current Specific Instruction")] + "Current Specific Instruction from Supervisor: "
+    assert first[1]["content"][-1]["type"] == "image_url"
+
+
+def test_empty_sections_are_omitted(agent):
+    messages = agent.assemble_prompt_messages("système", "statique", "", "", "état")
+    assert _user_text(messages) == "statique\n\nétat" and len(messages[1]["content"]) == 1
+
+
+@pytest.mark.parametrize("hints, expected_extra_body", [
+    ("none", None), ("llama_cpp", {"cache_prompt": True, "id_slot": 2}), ("openai", {"prompt_cache_key": "vlm"})])
+def test_prompt_cache_hints(agent, monkeypatch, hints, expected_extra_body):
+    monkeypatch.setattr(agent, "PROMPT_CACHE_HINTS", hints)
+    kwargs = agent.prompt_cache_request_kwargs(2, "vlm", streaming=True)
+    assert kwargs.get("extra_body") == expected_extra_body
+    assert kwargs["stream_options"] == {"include_usage": True}
+
+
+def test_extra_body_is_merged_not_replaced(agent):
+    merged = agent.merge_request_kwargs({"extra_body": {"cache_prompt": True}, "timeout": 5}, {"extra_body": {"grammar": "g"}})
+    assert merged == {"extra_body": {"cache_prompt": True, "grammar": "g"}, "timeout": 5}
+
+
+def test_cached_tokens_from_usage_or_llama_cpp_timings(agent):
+    usage = SimpleNamespace(prompt_tokens=1000, prompt_tokens_details={"cached_tokens": 900})
+    assert agent.extract_prompt_cache_usage(usage) == (1000, 900)
+    assert agent.extract_prompt_cache_usage(None, {"prompt_n": 100, "cache_n": 900}) == (1000, 900)
+    assert agent.extract_prompt_cache_usage(SimpleNamespace(prompt_tokens=50, prompt_tokens_details=None)) == (50, None)
+    stats = agent.PromptCacheStats()
+    stats.record("VLM", usage)
+    stats.record("VLM", SimpleNamespace(prompt_tokens=1000, prompt_tokens_details=None, completion_tokens=3))
+    assert stats.per_label["VLM"] == {"calls": 2, "prompt_tokens": 2000, "cached_tokens": 900, "reported": 1}
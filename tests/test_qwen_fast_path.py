@@ -0,0 +1,52 @@
+import pytest
+
+
+def _parsed(*actions, thought="Écran des réglages"):
+    return {"global_thought": {"Current State Summary": thought}, "action_sequence": list(actions)}
+
+
+CLICK_OK = {"action_type": "CLICK", "position": [0.5, 0.5], "description": "OK"}
+
+
+@pytest.fixture
+def fast_path(agent, monkeypatch):
+    monkeypatch.setattr(agent, "QWEN_FAST_PATH_ENABLED", True)
+    monkeypatch.setattr(agent, "QWEN_FAST_PATH_ESCALATE_EVERY_N_STEPS", 3)
+    monkeypatch.setattr(agent, "QWEN_FAST_PATH_MAX_ACTIONS", 3)
+    monkeypatch.setattr(agent, "QWEN_FAST_PATH_LOOP_WINDOW", 2)
+    return lambda parsed, history=None, step=2, failures=0, error=None: agent.evaluate_qwen_fast_path(
+        parsed, error, False, history or agent.InteractionHistory(), failures, step)
+
+
+def test_low_risk_sequence_is_approved(fast_path):
+    approved, _ = fast_path(_parsed(CLICK_OK))
+    assert approved
+
+
+@pytest.mark.parametrize("kwargs", [
+    {"step": 1}, {"step": 4},                       # Escalade périodique
+    {"failures": 1},
+    {"error": "Échec du parsing"},
+])
+def test_escalates_to_qwen(fast_path, kwargs):
+    assert not fast_path(_parsed(CLICK_OK), **kwargs)[0]
+
+
+def test_risky_sequences_go_to_qwen(agent, fast_path):
+    assert not fast_path(_parsed({"action_type": "INPUT", "value": "mot de passe"}))[0]
+    assert not fast_path(_parsed({"action_type": "FINISHED"}))[0]
+    assert not fast_path(_parsed(*[CLICK_OK] * 4))[0]
+    assert not fast_path(_parsed(CLICK_OK, thought=agent.VLM_MISSING_THOUGHT_PLACEHOLDER))[0]
+
+
+def test_repeated_sequence_is_escalated(agent, fast_path):
+    history = agent.InteractionHistory()
+    history.append(agent.InteractionRecord(1, "Valider", {"decision_type": "EXECUTE_VLM_SEQUENCE", "reasoning": "ok"},
+                                           [{"action_type": "CLICK", "position": [0.501, 0.499]}]))
+    approved, reason = fast_path(_parsed(CLICK_OK), history=history)
+    assert not approved and "boucle" in reason
+
+
+def test_fast_path_decision_is_marked(agent):
+    decision = agent.build_fast_path_qwen_decision("test")
+    assert decision["decision_type"] == "EXECUTE_VLM_SEQUENCE" and decision["fast_path"] is True
@@ -0,0 +1,73 @@
+import pytest
+
+
+def _report(agent, actions=3, thought_chars=600):
+    thought = {key: "x" * thought_chars for key in agent.VLM_GLOBAL_THOUGHT_KEYS}
+    sequence = [{"action_type": "CLICK", "position": [0.41, 0.22], "description": f"Bouton {i}"} for i in range(actions)]
+    return {"parsed_vlm_data": {"global_thought": thought, "action_sequence": sequence}, "vlm_error_message": None,
+            "vlm_output_json_str": "", "early_dispatched_actions": [], "early_dispatch_failed": False}
+
+
+def _history(agent, steps):
+    history = agent.InteractionHistory()
+    for step in range(1, steps + 1):
+        history.append(agent.InteractionRecord(step, f"instruction {step} " + "y" * 200,
+                                               {"decision_type": "EXECUTE_VLM_SEQUENCE", "reasoning": "z" * 150},
+                                               [{"action_type": "CLICK"}]))
+    return history
+
+
+def _budgeter(agent, **kwargs):
+    options = dict(context_tokens=8192, prompt_token_budget=1200, max_completion_tokens=1024, chars_per_token=3.5)
+    options.update(kwargs)
+    return agent.QwenPromptBudgeter(**options)
+
+
+def test_full_detail_when_it_fits(agent):
+    budgeter = _budgeter(agent, prompt_token_budget=100000)
+    sections, token_counts, level_index, _ = budgeter.build("Objectif", _history(agent, 2), _report(agent), 0, system_prompt="s")
+    assert level_index == 0 and budgeter.over_budget_calls == 0
+    assert '"action_sequence"' in sections["vlm"] and set(token_counts) == {"instructions", "goal", "history", "vlm", "notes"}
+
+
+def test_detail_is_reduced_until_the_prompt_fits(agent):
+    budgeter = _budgeter(agent)
+    _, token_counts, level_index, budget = budgeter.build("Objectif", _history(agent, 6), _report(agent), 0, system_prompt="s")
+    assert level_index > 0 and sum(token_counts.values()) <= budget == 1200
+    assert budgeter.level_counts[level_index] == 1
+
+
+def test_most_compact_level_is_sent_when_nothing_fits(agent):
+    budgeter = _budgeter(agent, prompt_token_budget=10)
+    _, _, level_index, _ = budgeter.build("Objectif", _history(agent, 6), _report(agent), 0, system_prompt="s")
+    assert level_index == len(agent.QWEN_PROMPT_LEVELS) - 1 and budgeter.over_budget_calls == 1
+
+
+def test_budget_accounts_for_context_completion_and_image(agent):
+    budgeter = _budgeter(agent, context_tokens=4096, prompt_token_budget=5000)
+    assert budgeter.budget_for("s" * 350, image_tokens=1000) == 4096 - 1024 - 100 - 1000
+    assert budgeter.budget_for("s", image_tokens=10000) == 0
+
+
+def test_failed_vlm_output_keeps_a_raw_snippet(agent):
+    report = dict(_report(agent), parsed_vlm_data=None, vlm_output_json_str="{pas du json" * 100, vlm_error_message="Échec")
+    sections = _budgeter(agent).render_sections(agent.QWEN_PROMPT_LEVELS[-1], "Objectif", None, report, 2)
+    assert "FAILED" in sections["vlm"] and "Échec" in sections["vlm"]
+    assert len(sections["vlm"]) < 600 and "Consecutive VLM Failures for Current VLM Instruction: 2" in sections["notes"]
+
+
+def test_chars_per_token_calibration(agent):
+    budgeter = _budgeter(agent)
+    budgeter.calibrate(4000, 1000)
+    assert budgeter.chars_per_token == pytest.approx(0.8 * 3.5 + 0.2 * 4.0) # Moyenne mobile
+    budgeter.calibrate(4000, None) # Usage non rapporté: inchangé
+    assert budgeter.chars_per_token == pytest.approx(3.6)
+    for _ in range(50):
+        budgeter.calibrate(4000, 1)
+    assert budgeter.chars_per_token == 8.0 # Borné
+
+
+def test_abbreviated_actions(agent):
+    action = {"action_type": "INPUT", "position": [0.4123, 0.2], "value": "v" * 100, "description": "Champ"}
+    assert agent.abbreviate_micro_action(action, with_description=False) == f'INPUT (0.41, 0.20) value="{"v" * 57}..."'
+    assert agent.abbreviate_micro_action({"action_type": "KEY_PRESS", "keys": ["cmd", "s"]}).startswith("KEY_PRESS cmd+s")
@@ -0,0 +1,17 @@
+from conftest import run_replay_benchmark, write_synthetic_session
+
+
+def test_synthetic_session_replays_to_completion(tmp_path):
+    report = run_replay_benchmark(tmp_path, write_synthetic_session(tmp_path / "sessions", steps=3))
+    session = report["sessions"][0]
+    assert session["replayed_outcome"] == "TASK_COMPLETED"
+    assert session["replayed_steps"] == 3
+    assert session["vlm_parse_failures"] == 0 and session["action_divergences"] == 0
+
+
+def test_stage_counts_match_replayed_steps(tmp_path):
+    """Régression: les durées étaient recueillies à chaque appel de stats_summary (deux par fin de tâche), n doublé."""
+    report = run_replay_benchmark(tmp_path, write_synthetic_session(tmp_path / "sessions", steps=3))
+    replayed_steps = report["sessions"][0]["replayed_steps"]
+    for stage in ("capture", "vlm.request", "qwen.request"):
+        assert report["stages"][stage]["n"] == replayed_steps, stage
@@ -0,0 +1,85 @@
+import pytest
+
+from test_endpoint_pool import FakeClient, FakeStatusError
+
+
+def _policy(agent, **kwargs):
+    options = dict(timeout_s=5.0, max_retries=2, hedging_enabled=False, hedge_quantile=0.95, hedge_min_samples=1,
+                   hedge_min_delay_s=0.01, backoff_base_s=0.001, backoff_max_s=0.002)
+    options.update(kwargs)
+    return agent.RequestPolicy("VLM", **options)
+
+
+def _pool(agent, urls=("http://a/v1", "http://b/v1")):
+    return agent.EndpointPool("VLM", list(urls), "clé", FakeClient, max_concurrency=2, health_check_interval_s=0)
+
+
+def _scripted(*outcomes):
+    """open_fn qui lève ou retourne successivement les résultats donnés."""
+    remaining = list(outcomes)
+    def open_fn(replica, cancel_event):
+        outcome = remaining.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+    return open_fn
+
+
+def test_transient_errors_are_retried_with_backoff(agent):
+    policy = _policy(agent)
+    value, lease, _ = agent.run_model_request(_pool(agent), policy, _scripted(FakeStatusError(503), FakeStatusError(429), "ok"))
+    lease.close()
+    assert value == "ok" and (policy.requests, policy.retries, policy.failures) == (1, 2, 0)
+
+
+def test_client_errors_are_not_retried(agent):
+    policy = _policy(agent)
+    with pytest.raises(FakeStatusError):
+        agent.run_model_request(_pool(agent), policy, _scripted(FakeStatusError(400), "jamais"))
+    assert (policy.retries, policy.failures) == (0, 1)
+
+
+def test_retries_are_bounded(agent):
+    policy = _policy(agent, max_retries=1)
+    with pytest.raises(FakeStatusError):
+        agent.run_model_request(_pool(agent), policy, _scripted(FakeStatusError(500), FakeStatusError(502), "trop tard"))
+    assert (policy.retries, policy.failures) == (1, 1)
+
+
+def test_backoff_grows_and_is_capped(agent):
+    policy = _policy(agent, backoff_base_s=0.5, backoff_max_s=2.0)
+    assert 0.25 <= policy.backoff_delay_s(0) <= 0.5
+    assert 1.0 <= policy.backoff_delay_s(5) <= 2.0
+
+
+def _slow_on(slow_replica):
+    closed = []
+    def open_fn(replica, cancel_event):
+        if replica.name == slow_replica:
+            cancel_event.wait(3.0) # Réplica en retard: sa réponse arrive après la couverture
+            return "lente"
+        return "rapide"
+    return open_fn, closed.append, closed
+
+
+def test_hedge_wins_when_the_primary_replica_stalls(agent):
+    policy = _policy(agent, hedging_enabled=True)
+    assert policy.hedge_delay_s() is None # Pas encore de mesure
+    policy.record_latency(10.0)
+    open_fn, close_fn, closed = _slow_on("http://a/v1")
+    value, lease, replica_name = agent.run_model_request(_pool(agent), policy, open_fn, close_fn)
+    lease.close()
+    assert (value, replica_name) == ("rapide", "http://b/v1")
+    assert (policy.hedges_fired, policy.hedge_wins) == (1, 1)
+    deadline = agent.time.monotonic() + 3.0
+    while not closed and agent.time.monotonic() < deadline: # La réponse perdante est fermée dès qu'elle arrive
+        agent.time.sleep(0.01)
+    assert closed == ["lente"] and policy.cancelled == 1
+
+
+def test_guard_timeout_when_every_replica_hangs(agent):
+    policy = _policy(agent, hedging_enabled=True, timeout_s=0.1, max_retries=0)
+    policy.record_latency(10.0)
+    with pytest.raises(agent.ModelRequestTimeout): # Le garde-fou lève le jeton d'annulation des tentatives en cours
+        agent.run_model_request(_pool(agent), policy, lambda replica, cancel_event: cancel_event.wait(3.0))
+    assert policy.timeouts == 1 and policy.failures == 1
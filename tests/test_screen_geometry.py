@@ -0,0 +1,52 @@
+from types import SimpleNamespace
+
+import pytest
+from PIL import Image
+
+
+@pytest.fixture
+def retina(agent, monkeypatch):
+    """Écran logique 1440x900 capturé en 2880x1800 (facteur 2)."""
+    grabs = []
+    def grab(bbox=None):
+        grabs.append(bbox)
+        if bbox is None:
+            return Image.new("RGB", (2880, 1800), (200, 10, 10))
+        return Image.new("RGB", (bbox[2] - bbox[0], bbox[3] - bbox[1]))
+    monkeypatch.setattr(agent, "ImageGrab", SimpleNamespace(grab=grab))
+    monkeypatch.setattr(agent.sys, "platform", "linux")
+    return agent.ScreenGeometry((1440, 900), "logical"), grabs
+
+
+def test_capture_is_reduced_to_logical_resolution(retina):
+    geometry, _ = retina
+    frame = geometry.grab()
+    assert frame.size == (1440, 900) and frame.getpixel((0, 0)) == (200, 10, 10)
+    assert geometry.scale_factor == 2.0
+    assert (geometry.captures, geometry.downsampled, geometry.pixels_saved) == (1, 1, 2880 * 1800 - 1440 * 900)
+
+
+def test_bbox_is_given_in_logical_points(retina):
+    geometry, grabs = retina
+    geometry.grab()
+    crop = geometry.grab_native(bbox=(100, 50, 300, 150))
+    assert grabs[-1] == (200, 100, 600, 300) and crop.size == (400, 200)
+
+
+@pytest.mark.parametrize("spec, expected", [("native", (2880, 1800)), ("logical", (1440, 900)), ("1280x1280", (1280, 800))])
+def test_capture_size_modes(agent, spec, expected):
+    assert agent.ScreenGeometry((1440, 900), spec).capture_size((2880, 1800)) == expected
+
+
+def test_logical_mode_never_upscales(agent):
+    geometry = agent.ScreenGeometry((1920, 1080), "logical")
+    frame = Image.new("RGB", (1280, 720))
+    assert geometry.to_capture_resolution(frame) is frame
+
+
+def test_normalized_positions_map_to_logical_points(agent):
+    geometry = agent.ScreenGeometry((1440, 900), "logical")
+    assert geometry.to_screen([0.5, 0.5]) == (720, 450)
+    assert geometry.to_screen([1.2, -0.1]) == (1439, 0) # Borné à l'écran
+    assert geometry.pixels_to_norm(720, 450) == (0.5, 0.5)
+    assert geometry.pixels_to_norm(0.25, 0.75) == (0.25, 0.75) # Déjà normalisées
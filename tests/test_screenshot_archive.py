@@ -0,0 +1,88 @@
+import random
+import threading
+
+from PIL import Image
+
+
+def _frames(count, size=(200, 130)):
+    """Trames successives: quelques tuiles modifiées à chaque pas, et un doublon exact de temps en temps."""
+    rng = random.Random(7)
+    image = Image.new("RGB", size, (30, 30, 30))
+    frames = []
+    for i in range(count):
+        if i % 7 != 3: # Sinon: doublon exact de la trame précédente
+            image = image.copy()
+            for _ in range(rng.randint(1, 4)):
+                x, y = rng.randrange(size[0] - 20), rng.randrange(size[1] - 20)
+                image.paste((rng.randrange(256), rng.randrange(256), rng.randrange(256)), (x, y, x + 20, y + 20))
+        frames.append(image)
+    return frames
+
+
+def _archive(agent, folder, **kwargs):
+    options = dict(tile_size=32, near_dup_hamming=-1, keyframe_interval=5, max_bytes=0, max_age_days=0,
+                   keep_only_failed=False, compact_every=1000)
+    options.update(kwargs)
+    return agent.ScreenshotArchive(folder=str(folder), **options)
+
+
+def test_round_trip_is_lossless_after_reload_and_compaction(agent, tmp_path):
+    frames = _frames(30)
+    archive = _archive(agent, tmp_path)
+    for i, image in enumerate(frames):
+        archive.store_frame(f"step_{i}.png", image)
+    assert archive.deltas > 0 and archive.keyframes > 0 and archive.exact_duplicates > 0
+    archive.close()
+
+    reloaded = _archive(agent, tmp_path)
+    for i, image in enumerate(frames):
+        assert reloaded.load_frame(f"step_{i}.png").tobytes() == image.tobytes()
+    reloaded.compact()
+    for i, image in enumerate(frames):
+        assert reloaded.load_frame(f"step_{i}.png").tobytes() == image.tobytes()
+    assert reloaded.load_frame("inconnue.png") is None
+
+
+def test_defaults_keep_every_frame(agent, tmp_path):
+    assert agent.SCREENSHOT_STORAGE_MODE == "files"
+    archive = agent.ScreenshotArchive(folder=str(tmp_path))
+    assert archive.max_bytes == 0 and archive.max_age_days == 0
+    frames = _frames(10)
+    for i, image in enumerate(frames):
+        archive.store_frame(f"step_{i}.png", image)
+    archive.compact()
+    assert archive.removed_frames == 0
+    assert all(archive.load_frame(f"step_{i}.png") is not None for i in range(len(frames)))
+
+
+def test_size_retention_drops_oldest_frames(agent, tmp_path):
+    archive = _archive(agent, tmp_path, max_bytes=1)
+    for i, image in enumerate(_frames(10)):
+        archive.store_frame(f"step_{i}.png", image)
+    archive.compact()
+    assert archive.removed_frames > 0
+    assert archive.load_frame("step_0.png") is None
+
+
+def test_load_frame_is_safe_during_compaction(agent, tmp_path):
+    archive = _archive(agent, tmp_path, max_bytes=1)
+    frames = _frames(20)
+    for i, image in enumerate(frames):
+        archive.store_frame(f"step_{i}.png", image)
+    errors = []
+
+    def read_all():
+        for i in range(len(frames)):
+            try:
+                loaded = archive.load_frame(f"step_{i}.png")
+            except Exception as e: # Un objet supprimé pendant la lecture lèverait FileNotFoundError
+                errors.append(e)
+                continue
+            if loaded is not None and loaded.tobytes() != frames[i].tobytes():
+                errors.append(f"trame {i} corrompue")
+
+    reader = threading.Thread(target=read_all)
+    reader.start()
+    archive.compact()
+    reader.join()
+    assert errors == []
@@ -0,0 +1,49 @@
+import itertools
+
+import pytest
+from PIL import Image
+
+
+def _frames(*colors):
+    return [Image.new("RGB", (320, 200), color) for color in colors]
+
+
+@pytest.fixture
+def screen(agent, monkeypatch):
+    """Remplace la capture native par une suite de trames scriptée (la dernière se répète)."""
+    def script(frames):
+        sequence = itertools.chain(frames, itertools.repeat(frames[-1]))
+        monkeypatch.setattr(agent.screen_geometry, "grab_native", lambda: next(sequence))
+    return script
+
+
+def test_returns_the_first_frame_of_a_stable_screen(agent, screen):
+    frames = _frames((0, 0, 0), (90, 90, 90), (180, 180, 180), (250, 250, 250))
+    screen(frames)
+    stable, elapsed, frame = agent.wait_for_screen_stable(timeout_s=2.0, stable_ms=40, poll_interval_s=0.01)
+    assert stable and elapsed < 1.0
+    assert frame is frames[-1] # Réutilisable comme capture d'étape
+
+
+def test_tiny_changes_count_as_stable(agent, screen):
+    base = Image.new("RGB", (320, 200), (100, 100, 100))
+    blinking = base.copy()
+    blinking.paste((255, 255, 255), (10, 10, 12, 30)) # Curseur de texte: une fraction infime des pixels
+    screen([base, blinking, base, blinking])
+    stable, _, _ = agent.wait_for_screen_stable(timeout_s=2.0, stable_ms=30, poll_interval_s=0.01)
+    assert stable
+
+
+def test_animated_screen_times_out(agent, monkeypatch):
+    colors = itertools.cycle([(0, 0, 0), (255, 255, 255)])
+    monkeypatch.setattr(agent.screen_geometry, "grab_native", lambda: Image.new("RGB", (320, 200), next(colors)))
+    stable, elapsed, frame = agent.wait_for_screen_stable(timeout_s=0.15, stable_ms=40, poll_interval_s=0.01)
+    assert not stable and elapsed >= 0.15 and frame is not None
+
+
+def test_capture_failure_falls_back_to_fixed_pause(agent, monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(agent.time, "sleep", sleeps.append)
+    monkeypatch.setattr(agent.screen_geometry, "grab_native", lambda: (_ for _ in ()).throw(OSError("pas d'écran")))
+    assert agent.wait_for_screen_stable(timeout_s=2.0)[::2] == (False, None)
+    assert sleeps == [min(2.0, agent.PRE_CAPTURE_FIXED_DELAY_S)]
@@ -0,0 +1,55 @@
+import pytest
+from PIL import Image
+
+
+@pytest.fixture
+def prefetcher(agent, monkeypatch):
+    requests = []
+    def fake_request_vlm_completion(endpoint_pool, messages, on_micro_action=None, cancel_event=None):
+        requests.append((messages, cancel_event))
+        if endpoint_pool == "lent":
+            cancel_event.wait(5.0) # Streaming interrompu par discard()
+            return {"raw": "", "total_ms": 0.0, "cancelled": True}
+        return {"raw": '{"action_sequence": []}', "total_ms": 250.0, "cancelled": False}
+    monkeypatch.setattr(agent, "request_vlm_completion", fake_request_vlm_completion)
+    monkeypatch.setattr(agent, "SETTLE_DETECTOR_ENABLED", False)
+    monkeypatch.setattr(agent, "PRE_CAPTURE_FIXED_DELAY_S", 0.0)
+    monkeypatch.setattr(agent.screen_geometry, "grab", lambda: Image.new("RGB", (640, 400), (50, 60, 70)))
+    instance = agent.SpeculativeVlmPrefetcher(enabled=True)
+    yield instance, requests
+    instance.close()
+
+
+def _window(agent, *instructions):
+    history = agent.InteractionHistory()
+    for step, instruction in enumerate(instructions, 1):
+        history.append(agent.InteractionRecord(step, instruction, {"decision_type": "EXECUTE_VLM_SEQUENCE", "reasoning": "ok"},
+                                               [{"action_type": "CLICK", "position": [0.1 * step, 0.5]}]))
+    return history.vlm_prompt_window()
+
+
+def test_matching_step_uses_the_speculative_response(agent, prefetcher):
+    instance, requests = prefetcher
+    window = _window(agent, "Ouvrir les réglages")
+    instance.launch("pool", "Continuer", window)
+    pending = instance.claim("Continuer", _window(agent, "Ouvrir les réglages")) # Fenêtre égale, recalculée
+    assert pending is not None
+    assert instance.collect(pending)["raw"] == '{"action_sequence": []}'
+    assert (instance.launched, instance.hits, instance.discarded) == (1, 1, 0)
+    assert "Continuer" in str(requests[0][0])
+
+
+def test_different_instruction_discards_and_cancels(agent, prefetcher):
+    instance, requests = prefetcher
+    instance.launch("lent", "Continuer", _window(agent, "h"))
+    assert instance.claim("Ouvrir le menu", _window(agent, "h")) is None
+    assert requests and requests[0][1].is_set()
+    assert (instance.hits, instance.discarded) == (0, 1)
+    assert instance.claim("Continuer", _window(agent, "h")) is None # Plus rien en attente
+
+
+def test_different_history_is_not_reused(agent, prefetcher):
+    instance, _ = prefetcher
+    instance.launch("pool", "Continuer", _window(agent, "étape 1"))
+    assert instance.claim("Continuer", _window(agent, "étape 1", "étape 2")) is None
+    assert instance.discarded == 1
@@ -0,0 +1,57 @@
+import json
+import re
+
+
+def _tracer(agent, **kwargs):
+    options = dict(enabled=True, jsonl_path="", prometheus_file="", prometheus_port=0, window_size=100)
+    options.update(kwargs)
+    return agent.StageTracer(**options)
+
+
+def test_percentiles_use_nearest_rank(agent):
+    values = sorted(float(v) for v in range(1, 101))
+    assert (agent._percentile(values, 0.5), agent._percentile(values, 0.95), agent._percentile(values, 0.99)) == (50.0, 95.0, 99.0)
+    stats = agent.summarize_stage_durations({"capture": [10.0, 30.0, 20.0], "vlm": [900.0]})
+    assert list(stats) == ["vlm", "capture"] # Par temps total décroissant
+    assert stats["capture"] == {"n": 3, "p50": 20.0, "p95": 30.0, "p99": 30.0, "total": 60.0}
+
+
+def test_steps_are_written_as_jsonl(agent, tmp_path):
+    trace_path = str(tmp_path / "trace.jsonl")
+    tracer = _tracer(agent, jsonl_path=trace_path)
+    tracer.begin_step("Objectif", 1)
+    with tracer.span("capture", source="test"):
+        pass
+    tracer.record("vlm.request", duration_ms=120.0)
+    step = tracer.end_step()
+    assert agent.persistence_worker.flush()
+    with open(trace_path, encoding="utf-8") as trace_file:
+        written = json.loads(trace_file.readline())
+    assert written == step and written["step"] == 1
+    assert [span["stage"] for span in written["spans"]] == ["capture", "vlm.request"]
+    assert written["spans"][0]["source"] == "test"
+    assert set(tracer.task_durations()) == {"capture", "vlm.request", "step.total"}
+    tracer.reset_task()
+    assert tracer.task_durations() == {}
+
+
+def test_prometheus_exposition(agent):
+    tracer = _tracer(agent)
+    for duration_ms in (100.0, 200.0, 300.0):
+        tracer.record("qwen.request", duration_ms=duration_ms)
+    text = tracer.render_prometheus()
+    assert "# TYPE gui_agent_stage_duration_seconds summary" in text
+    assert 'gui_agent_stage_duration_seconds{stage="qwen.request",quantile="0.5"} 0.200000' in text
+    assert 'gui_agent_stage_duration_seconds_sum{stage="qwen.request"} 0.600000' in text
+    assert 'gui_agent_stage_duration_seconds_count{stage="qwen.request"} 3' in text
+    assert all(re.match(r'^(#|gui_agent_stage_duration_seconds(_sum|_count)?\{)', line) for line in text.splitlines())
+
+
+def test_disabled_tracer_records_nothing(agent):
+    tracer = _tracer(agent, enabled=False)
+    with tracer.span("capture"):
+        pass
+    tracer.record("vlm", duration_ms=5.0)
+    tracer.begin_step("Objectif", 1)
+    assert tracer.end_step() is None and tracer.task_durations() == {}
+    assert tracer.traced("x")(lambda: 42)() == 42
@@ -0,0 +1,71 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+
+def test_importing_the_agent_does_not_load_heavy_modules(tmp_path):
+    # Processus séparé: les autres tests ont pu déjà importer ces modules
+    script = ("import sys, autonomous_gui_agent as agent\n"
+              "heavy = ('pyautogui', 'pynput', 'openai', 'tkinter', 'numpy', 'sounddevice', 'Quartz')\n"
+              "print(','.join(name for name in heavy if name in sys.modules))\n"
+              "print(agent.startup_profiler.as_dict()['lazy_imports_ms'])\n")
+    completed = subprocess.run([sys.executable, "-c", script], cwd=tmp_path, capture_output=True, text=True, timeout=60,
+                               env={**os.environ, "PYTHONPATH": os.pathsep.join(sys.path)})
+    assert completed.returncode == 0, completed.stderr[-2000:]
+    loaded, lazy_imports = completed.stdout.strip().splitlines()[-2:]
+    assert loaded == "" and lazy_imports == "{}"
+
+
+def test_lazy_module_imports_on_first_use_and_records_the_time(agent, monkeypatch):
+    profiler = agent.StartupProfiler(agent.time.perf_counter())
+    monkeypatch.setattr(agent, "startup_profiler", profiler)
+    loaded = []
+    lazy_json = agent._LazyModule("json", on_load=loaded.append)
+    assert not lazy_json._is_loaded()
+    assert lazy_json.dumps([1]) == "[1]"
+    assert lazy_json.loads("2") == 2
+    assert lazy_json._is_loaded() and len(loaded) == 1 # on_load appelé une seule fois
+    assert list(profiler.as_dict()["lazy_imports_ms"]) == ["json"]
+    assert "json" in profiler.summary()
+
+
+def test_missing_lazy_module_fails_on_every_use(agent, monkeypatch):
+    warnings = []
+    monkeypatch.setattr(agent.logging, "warning", warnings.append)
+    missing = agent._LazyModule("module_absent_pour_les_tests")
+    for _ in range(2):
+        with pytest.raises(ModuleNotFoundError):
+            missing.anything
+    assert len(warnings) == 1 and not missing._is_loaded()
+
+
+def test_startup_phases_are_reported_in_order(agent):
+    profiler = agent.StartupProfiler(agent.time.perf_counter())
+    profiler.mark("configuration")
+    profiler.mark("prêt")
+    profiler.record_import("openai", 120.0, background=True)
+    phases = profiler.as_dict()["phases_ms"]
+    assert list(phases) == ["configuration", "prêt"] and phases["configuration"] <= phases["prêt"]
+    assert "openai 120 ms (arrière-plan)" in profiler.summary()
+
+
+def test_sound_cues_are_synthesized_in_memory(agent):
+    sounds = agent.SoundBank(sample_rate=8000, duration_s=0.1, fade_s=0.02)._synthesize()
+    assert set(sounds) == set(agent.SOUND_CUE_FREQUENCIES)
+    for data in sounds.values():
+        assert len(data) == 800 and data.dtype.name == "float32"
+        assert abs(float(data[-1])) < 1e-3 # Fondu en sortie
+        assert float(abs(data).max()) <= 0.3 + 1e-6
+
+
+def test_sound_bank_disables_itself_without_an_audio_backend(agent, monkeypatch):
+    monkeypatch.setattr(agent, "sounddevice", agent._LazyModule("module_audio_absent_pour_les_tests"))
+    bank = agent.SoundBank()
+    bank.play("ok.wav")
+    bank._thread.join(timeout=10)
+    assert bank.disabled and bank.played == 0
+    thread = bank._thread
+    bank.play("ok.wav") # Ignoré, sans relancer de thread
+    assert bank._thread is thread and bank._queue.qsize() == 1 # Seul le premier son est resté en file
@@ -0,0 +1,82 @@
+import re
+
+import pytest
+
+
+class FakeStatusError(Exception):
+    def __init__(self, status_code, message):
+        super().__init__(message)
+        self.status_code = status_code
+        self.body = {"error": {"message": message}}
+
+
+def _rules(grammar):
+    return dict(line.split(" ::= ", 1) for line in grammar.splitlines())
+
+
+@pytest.mark.parametrize("schema_name", ["VLM_OUTPUT_JSON_SCHEMA", "QWEN_DECISION_JSON_SCHEMA"])
+def test_grammar_references_only_defined_rules(agent, schema_name):
+    rules = _rules(agent.json_schema_to_gbnf(getattr(agent, schema_name)))
+    assert "root" in rules
+    for body in rules.values():
+        without_literals = re.sub(r'"(?:[^"\\]|\\.)*"|\[(?:[^\]\\]|\\.)*\]', "", body)
+        for reference in re.findall(r"[a-z][a-z0-9-]*", without_literals):
+            assert reference in rules, f"règle non définie: {reference}"
+
+
+def test_whitespace_is_bounded(agent):
+    ws = _rules(agent.json_schema_to_gbnf(agent.QWEN_DECISION_JSON_SCHEMA))["ws"]
+    assert "ws" not in ws # Pas de récursion: la quantité d'espaces générables est bornée
+    assert "{0,20}" in ws
+
+
+def test_enum_and_fixed_length_arrays(agent):
+    schema = {"type": "object", "required": ["kind", "position"],
+              "properties": {"kind": {"enum": ["CLICK", "SCROLL"]},
+                             "position": {"type": "array", "items": {"type": "number"}, "minItems": 2, "maxItems": 2},
+                             "note": {"type": ["string", "null"]}}}
+    rules = _rules(agent.json_schema_to_gbnf(schema))
+    assert rules["value-kind"] == '( "\\"CLICK\\"" | "\\"SCROLL\\"" ) ws'
+    assert rules["value-position"] == '"[" ws number "," ws number "]" ws'
+    assert '( "," ws "\\"note\\"" ws ":" ws value-note )?' in rules["value"]
+
+
+def test_first_property_must_be_required(agent):
+    with pytest.raises(ValueError):
+        agent.json_schema_to_gbnf({"type": "object", "properties": {"a": {"type": "string"}}})
+
+
+@pytest.fixture
+def controller(agent, monkeypatch):
+    monkeypatch.setattr(agent, "rich_print", lambda *args, **kwargs: None)
+    return agent.StructuredOutputController({"VLM": "json_schema"}, {"VLM": ("vlm", agent.VLM_OUTPUT_JSON_SCHEMA)})
+
+
+def _create_fn(error):
+    sent = []
+    def create_fn(constraint_kwargs):
+        sent.append(constraint_kwargs)
+        if constraint_kwargs:
+            raise error
+        return "réponse"
+    return create_fn, sent
+
+
+def test_constraint_rejection_falls_back_once(controller):
+    create_fn, sent = _create_fn(FakeStatusError(400, "Unsupported parameter: 'response_format.json_schema'"))
+    assert controller.create("VLM", create_fn) == ("réponse", None)
+    assert len(sent) == 2 and controller.constraint_for("VLM") is None
+
+
+def test_unrelated_bad_request_is_raised(controller):
+    create_fn, sent = _create_fn(FakeStatusError(400, "This model's maximum context length is 8192 tokens"))
+    with pytest.raises(FakeStatusError):
+        controller.create("VLM", create_fn)
+    assert len(sent) == 1 and controller.constraint_for("VLM") == "json_schema"
+
+
+def test_server_errors_are_not_constraint_rejections(controller):
+    create_fn, sent = _create_fn(FakeStatusError(503, "grammar worker busy"))
+    with pytest.raises(FakeStatusError):
+        controller.create("VLM", create_fn)
+    assert controller.constraint_for("VLM") == "json_schema"
@@ -0,0 +1,73 @@
+def _cache(agent, **kwargs):
+    options = dict(enabled=True, persist_path="", max_entries=8, hamming_tolerance=4)
+    options.update(kwargs)
+    return agent.TrajectoryReplayCache(**options)
+
+
+CLICK = {"action_type": "CLICK", "position": [0.2, 0.3], "description": "Réglages"}
+INPUT = {"action_type": "INPUT", "value": "sombre", "description": "Recherche"}
+
+
+def _complete_task(cache, goal="Active le mode sombre"):
+    cache.begin_task(goal)
+    cache.record_step(0x00FF, [CLICK], model_ms=2500.0)
+    cache.record_step(0x0F0F, [], model_ms=1000.0) # Étape sans action: ignorée
+    cache.record_step(0xF0F0, [INPUT, {"action_type": "FINISHED"}], model_ms=3000.0)
+    cache.end_task("TASK_COMPLETED")
+
+
+def test_goal_normalization(agent):
+    assert agent.TrajectoryReplayCache.normalize_goal("  Ouvre  Safari, STP ! ") == "ouvre safari stp"
+    assert agent.TrajectoryReplayCache.normalize_goal("Écris « été »") == "ecris ete"
+
+
+def test_completed_task_is_replayed_while_screen_matches(agent):
+    cache = _cache(agent)
+    _complete_task(cache)
+    cache.begin_task("active le MODE sombre !")
+    step = cache.next_replay_step(0x00FE) # 1 bit de différence
+    decision = cache.build_decision(step)
+    assert decision["decision_type"] == "EXECUTE_MODIFIED_SEQUENCE" and decision["action_sequence_to_execute"] == [CLICK]
+    decision["action_sequence_to_execute"][0]["position"] = [0, 0]
+    assert CLICK["position"] == [0.2, 0.3] # La trajectoire stockée n'est pas modifiée
+    cache.record_step(0x00FE, [CLICK], model_ms=0.0, replayed_step=step)
+    assert cache.next_replay_step(0xF0F0)["actions"] == [INPUT] # FINISHED jamais rejoué
+    assert not cache.replay_pending
+    assert cache.task_replayed_steps == 1 and cache.task_saved_ms == 2500.0
+
+
+def test_divergence_hands_back_to_the_models(agent):
+    cache = _cache(agent)
+    _complete_task(cache)
+    cache.begin_task("Active le mode sombre")
+    assert cache.next_replay_step(0xFFFF_0000) is None
+    assert cache.divergences == 1 and not cache.replay_pending
+    assert cache.next_replay_step(0x00FF) is None # Plus de rejeu pour cette tâche
+
+
+def test_failed_tasks_are_not_stored(agent):
+    cache = _cache(agent)
+    cache.begin_task("Objectif")
+    cache.record_step(0x1, [CLICK], model_ms=100.0)
+    cache.end_task("TASK_FAILED")
+    cache.begin_task("Objectif")
+    assert not cache.replay_pending and cache.stores == 0
+
+
+def test_trajectories_persist_across_sessions(agent, tmp_path):
+    path = str(tmp_path / "trajectoires.json")
+    _complete_task(_cache(agent, persist_path=path))
+    assert agent.persistence_worker.flush()
+    reloaded = _cache(agent, persist_path=path)
+    reloaded.begin_task("Active le mode sombre")
+    assert reloaded.next_replay_step(0x00FF)["actions"] == [CLICK]
+
+
+def test_least_recently_stored_goal_is_evicted(agent):
+    cache = _cache(agent, max_entries=2)
+    for goal in ("premier", "second", "troisième"):
+        _complete_task(cache, goal)
+    cache.begin_task("premier")
+    assert not cache.replay_pending
+    cache.begin_task("troisième")
+    assert cache.replay_pending
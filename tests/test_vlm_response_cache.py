@@ -0,0 +1,57 @@
+def _cache(agent, **kwargs):
+    options = dict(enabled=True, max_entries=16, max_bytes=1 << 20, hamming_tolerance=4, persist_path="")
+    options.update(kwargs)
+    return agent.VlmResponseCache(**options)
+
+
+def test_near_duplicate_screenshot_hits_same_instruction_only(agent):
+    cache = _cache(agent)
+    key = cache.store(0b1011_0000, "Ouvre les réglages", "vlm", '{"action_sequence": []}')
+    response, hit_key = cache.lookup(0b1011_0111, "Ouvre les réglages", "vlm") # 3 bits de différence
+    assert response == '{"action_sequence": []}' and hit_key == key
+    assert cache.lookup(0b1011_0000, "Ferme la fenêtre", "vlm") == (None, None)
+    assert cache.lookup(0b1011_0000, "Ouvre les réglages", "autre-vlm") == (None, None)
+    assert cache.lookup(0b0100_1111, "Ouvre les réglages", "vlm") == (None, None) # 8 bits > tolérance
+    assert (cache.hits, cache.misses) == (1, 3)
+
+
+def test_invalidated_entry_is_no_longer_served(agent):
+    cache = _cache(agent)
+    key = cache.store(42, "Clique sur OK", "vlm", "réponse")
+    cache.invalidate(key)
+    assert cache.lookup(42, "Clique sur OK", "vlm") == (None, None)
+    assert cache.invalidations == 1
+
+
+def test_lru_eviction_by_count_and_size(agent):
+    cache = _cache(agent, max_entries=2, hamming_tolerance=0)
+    for phash in (1 << 10, 1 << 20, 1 << 30):
+        cache.store(phash, "instruction", "vlm", "réponse")
+    assert cache.evictions == 1
+    assert cache.lookup(1 << 10, "instruction", "vlm") == (None, None) # La plus ancienne
+
+    cache = _cache(agent, max_bytes=10, hamming_tolerance=0)
+    cache.store(1, "instruction", "vlm", "x" * 8)
+    cache.store(1 << 40, "instruction", "vlm", "y" * 8)
+    assert cache.lookup(1, "instruction", "vlm") == (None, None)
+    assert cache.lookup(1 << 40, "instruction", "vlm")[0] == "y" * 8
+
+
+def test_disabled_cache_is_bypassed(agent):
+    cache = _cache(agent, enabled=False)
+    assert cache.store(1, "instruction", "vlm", "réponse") is None
+    assert cache.lookup(1, "instruction", "vlm") == (None, None)
+    assert cache.bypassed == 1
+
+
+def test_persisted_cache_is_reloaded_in_lru_order(agent, tmp_path):
+    path = str(tmp_path / "vlm_cache.json")
+    cache = _cache(agent, persist_path=path, save_every=100, hamming_tolerance=0)
+    cache.store(0xABCDEF, "Ouvre le menu", "vlm", "première")
+    cache.store(0x123456, "Ouvre le menu", "vlm", "seconde")
+    cache.close() # Écrit par le PersistenceWorker
+    assert agent.persistence_worker.flush()
+
+    reloaded = _cache(agent, persist_path=path, max_entries=1, hamming_tolerance=0)
+    assert reloaded.lookup(0x123456, "Ouvre le menu", "vlm")[0] == "seconde"
+    assert reloaded.lookup(0xABCDEF, "Ouvre le menu", "vlm") == (None, None) # La plus ancienne, évincée au chargement
@@ -0,0 +1,59 @@
+import json
+
+import pytest
+
+RESPONSE = ("```json\n" + json.dumps({
+    "global_thought": {"Current State Summary": "Un { dans le texte, et un \\\"guillemet\\\" échappé ]"},
+    "action_sequence": [
+        {"action_type": "KEY_PRESS", "keys": ["ctrl", "l"], "description": "barre d'adresse {focus}"},
+        {"action_type": "INPUT", "value": "exemple.fr}", "description": "URL"},
+    ],
+}, ensure_ascii=False) + "\n```\nTexte après l'objet")
+
+
+def _feed(parser, text, chunk_size):
+    emitted = []
+    for i in range(0, len(text), chunk_size):
+        emitted.append(parser.feed(text[i:i + chunk_size]))
+    return emitted
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 17, len(RESPONSE)])
+def test_actions_are_emitted_as_soon_as_they_close(agent, chunk_size):
+    parser = agent.IncrementalVlmJsonParser()
+    emitted = _feed(parser, RESPONSE, chunk_size)
+    actions = [action for batch in emitted for action in batch]
+    assert [a["action_type"] for a in actions] == ["KEY_PRESS", "INPUT"]
+    assert actions[1]["value"] == "exemple.fr}"
+    assert parser.done and parser.completed_actions == actions
+    assert json.loads(parser.text[parser.text.index("{"):parser.end_index + 1])["action_sequence"] == actions
+
+
+def test_first_action_is_available_before_the_response_ends(agent):
+    parser = agent.IncrementalVlmJsonParser()
+    first_close = RESPONSE.index('"}', RESPONSE.index("KEY_PRESS")) + 2
+    assert [a["action_type"] for a in parser.feed(RESPONSE[:first_close])] == ["KEY_PRESS"]
+    assert not parser.done
+
+
+def test_nested_objects_outside_action_sequence_are_not_actions(agent):
+    parser = agent.IncrementalVlmJsonParser()
+    parser.feed('{"global_thought": {"a": {"b": 1}}, "other": [{"x": 1}], "action_sequence": []}')
+    assert parser.done and parser.completed_actions == []
+    assert parser.feed('{"action_sequence": [{"action_type": "CLICK"}]}') == [] # Après la fin: ignoré
+
+
+@pytest.mark.parametrize("action, index, dispatched, failures, expected", [
+    ({"action_type": "KEY_PRESS"}, 0, [], 0, True),
+    ({"action_type": "CLICK"}, 0, [], 0, False),           # Type hors liste
+    ({"action_type": "KEY_PRESS"}, 1, [], 0, False),       # Pas un préfixe contigu
+    ({"action_type": "KEY_PRESS"}, 0, [], 1, False),       # Échec VLM en cours
+])
+def test_early_dispatch_allowlist(agent, monkeypatch, action, index, dispatched, failures, expected):
+    monkeypatch.setattr(agent, "VLM_EARLY_DISPATCH_POLICY", "allowlist")
+    assert agent.should_dispatch_micro_action_early(action, index, dispatched, failures) is expected
+
+
+def test_early_dispatch_is_off_by_default(agent):
+    assert agent.VLM_EARLY_DISPATCH_POLICY == "qwen_first"
+    assert not agent.should_dispatch_micro_action_early({"action_type": "KEY_PRESS"}, 0, [], 0)